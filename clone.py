@@ -9,7 +9,7 @@ import hashlib
 
 from ws.client import API
 import ws.ArchWiki.lang
-from ws.utils import is_ascii, list_chunks
+from ws.utils import is_ascii
 
 class Downloader:
     extension = "mediawiki"
@@ -95,27 +95,23 @@ class Downloader:
 
         # sort by title (first item in tuple)
         to_be_updated.sort()
-
-        for snippet in list_chunks(to_be_updated, api.max_ids_per_query):
-            # unzip the list of tuples
-            titles, pageids, fnames = zip(*snippet)
-            print("  [downloading]   '{}' ... '{}'".format(titles[0], titles[-1]))
-            result = api.call_api(action="query", pageids="|".join(str(pid) for pid in pageids), prop="revisions", rvprop="content")
-
-            for page in result["pages"].values():
-                pageid = page["pageid"]
-                fname = fnames[pageids.index(pageid)]
-                text = page["revisions"][0]["*"]
-
-                # ensure that target directory exists (necessary for subpages)
-                try:
-                    os.makedirs(os.path.split(fname)[0])
-                except FileExistsError:
-                    pass
-
-                f = open(fname, "w")
-                f.write(text)
-                f.close()
+        fnames = dict((pageid, fname) for _, pageid, fname in to_be_updated)
+
+        pages = self.api.query_pages(pageids=[pageid for _, pageid, _ in to_be_updated], prop="revisions", rvprop="content")
+        for page in pages:
+            print("  [downloading]   %s" % page["title"])
+            fname = fnames[page["pageid"]]
+            text = page["revisions"][0]["*"]
+
+            # ensure that target directory exists (necessary for subpages)
+            try:
+                os.makedirs(os.path.split(fname)[0])
+            except FileExistsError:
+                pass
+
+            f = open(fname, "w")
+            f.write(text)
+            f.close()
 
     def clean_output_directory(self):
         """
@@ -128,7 +128,7 @@ def check_recentchanges(api, db):
 
     # FIXME: some deleted pages stay in recentchanges, although according to the tests they should be deleted
     s = sa.select([db.page.c.page_id])
-    current_pageids = {page["page_id"] for page in db.engine.execute(s)}
+    current_pageids = {page["page_id"] for page in db.execute(s)}
     new_api_list = []
     for rc in api_list:
         if "logid" in rc or rc["pageid"] in current_pageids:
@@ -555,6 +555,8 @@ if __name__ == "__main__":
             help="synchronize the SQL database with the remote wiki API (default: %(default)s)")
     argparser.add_argument("--no-sync", dest="sync", action="store_false",
             help="opposite of --sync")
+    argparser.add_argument("--sync-workers", type=int, default=1, metavar="N",
+            help="number of parallel workers for the initial synchronization of revisions and log events (default: %(default)s)")
     argparser.add_argument("--parser-cache", dest="parser_cache", action="store_true", default=False,
             help="update parser cache (default: %(default)s)")
     argparser.add_argument("--no-parser-cache", dest="parser_cache", action="store_false",
@@ -571,7 +573,7 @@ if __name__ == "__main__":
     if args.sync:
         require_login(api)
 
-        db.sync_with_api(api)
+        db.sync_with_api(api, workers=args.sync_workers)
         db.sync_latest_revisions_content(api)
 
         check_titles(api, db)
@@ -0,0 +1,111 @@
+#! /usr/bin/env python3
+
+"""
+Measures the catch-up time of :py:class:`ws.cache.AllRevisionsProps` when
+merging fetched revisions into the sorted collections: the per-revision
+insertion with :py:func:`ws.utils.bisect_insert_or_replace` is compared with
+the bulk merge (:py:func:`ws.utils.merge_sorted` for lists and
+:py:meth:`ws.cache.columnar.RevisionTable.merge_sorted` for the columnar
+storage).
+
+The revisions arrive in chunks of 500 revision IDs (like the API responses),
+grouped by pages in each chunk, i.e. almost but not exactly sorted. Every
+100th chunk contains also some revisions which are already in the database.
+
+The per-revision insertion into a :py:class:`RevisionTable` copies the whole
+table for each revision, so it is measured only for the first ``--old-limit``
+revisions.
+"""
+
+import argparse
+import datetime
+import os.path
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from ws.utils import bisect_insert_or_replace, merge_sorted, ListOfDictsAttrWrapper
+
+try:
+    from ws.cache.columnar import RevisionTable
+except ImportError:
+    RevisionTable = None
+
+def make_chunks(count, existing, chunk_size=500, seed=0):
+    rnd = random.Random(seed)
+    base = datetime.datetime(2010, 1, 1)
+    chunks = []
+    for first in range(existing + 1, existing + count + 1, chunk_size):
+        chunk = []
+        for revid in range(first, min(first + chunk_size, existing + count + 1)):
+            chunk.append({
+                "revid": revid,
+                "parentid": revid - 1,
+                "user": "User {}".format(rnd.randrange(1000)),
+                "timestamp": base + datetime.timedelta(seconds=revid),
+                "comment": "edit summary",
+                "size": rnd.randrange(100000),
+            })
+        # the API groups the revisions by pages
+        rnd.shuffle(chunk)
+        if len(chunks) % 100 == 99 and existing > 0:
+            chunk.append({"revid": rnd.randrange(1, existing), "user": "Updated", "comment": ""})
+        chunks.append(chunk)
+    return chunks
+
+def initial(existing):
+    if not existing:
+        return []
+    return sorted(make_chunks(existing, 0, chunk_size=existing)[0], key=lambda r: r["revid"])
+
+def bisect_path(data, chunks):
+    wrapped = ListOfDictsAttrWrapper(data, "revid")
+    for chunk in chunks:
+        for r in chunk:
+            bisect_insert_or_replace(data, r["revid"], data_element=r, index_list=wrapped)
+
+def merge_path(data, chunks):
+    for chunk in chunks:
+        merge_sorted(data, chunk, attr="revid")
+
+def table_bisect_path(table, chunks):
+    wrapped = table.column_view("revid")
+    for chunk in chunks:
+        for r in chunk:
+            bisect_insert_or_replace(table, r["revid"], data_element=r, index_list=wrapped)
+
+def table_merge_path(table, chunks):
+    for chunk in chunks:
+        table.merge_sorted(chunk)
+
+def measure(name, func, data, chunks, count):
+    start = time.perf_counter()
+    func(data, chunks)
+    elapsed = time.perf_counter() - start
+    print("{:<40} {:>9} revisions {:10.2f} s {:10.2f} µs per revision".format(name, count, elapsed, elapsed / count * 1e6))
+    return data
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--count", type=int, default=1000000, help="number of fetched revisions")
+    parser.add_argument("--existing", type=int, default=100000, help="number of revisions already in the database")
+    parser.add_argument("--old-limit", type=int, default=20000, help="number of revisions for the per-revision insertion into RevisionTable")
+    args = parser.parse_args()
+
+    chunks = make_chunks(args.count, args.existing)
+    limit_chunks = make_chunks(args.old_limit, args.existing)
+
+    old = measure("list: bisect_insert_or_replace", bisect_path, initial(args.existing), chunks, args.count)
+    new = measure("list: merge_sorted", merge_path, initial(args.existing), chunks, args.count)
+    assert old == new
+
+    if RevisionTable is not None:
+        measure("RevisionTable: bisect_insert_or_replace", table_bisect_path,
+                RevisionTable.from_records(initial(args.existing)), limit_chunks, args.old_limit)
+        measure("RevisionTable: merge_sorted", table_merge_path,
+                RevisionTable.from_records(initial(args.existing)), chunks, args.count)
+
+if __name__ == "__main__":
+    main()
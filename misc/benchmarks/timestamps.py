@@ -0,0 +1,72 @@
+#! /usr/bin/env python3
+
+"""
+Compares the generic conversion of timestamps in API responses and parameters
+(:py:func:`ws.utils.parse_timestamps_in_struct`,
+:py:func:`ws.utils.serialize_timestamps_in_struct`) with the schema-aware
+functions (:py:func:`ws.utils.parse_api_timestamps`,
+:py:func:`ws.utils.serialize_api_params`) on a synthetic response of
+``prop=revisions`` with content.
+"""
+
+import copy
+import datetime
+import os.path
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from ws.utils import parse_timestamps_in_struct, serialize_timestamps_in_struct, \
+                     parse_api_timestamps, serialize_api_params
+
+def make_response(pages=50, revisions=10, content_length=20000):
+    text = "Lorem ipsum dolor sit amet, [[consectetur]] adipiscing elit. " * (content_length // 62)
+    result = {"batchcomplete": "", "query": {"pages": {}}}
+    for pageid in range(1, pages + 1):
+        page = {
+            "pageid": pageid,
+            "ns": 0,
+            "title": "Page {}".format(pageid),
+            "touched": "2017-01-01T00:00:00Z",
+            "revisions": [],
+        }
+        for i in range(revisions):
+            page["revisions"].append({
+                "revid": pageid * revisions + i,
+                "parentid": pageid * revisions + i - 1,
+                "user": "User",
+                "timestamp": "2016-{:02}-01T12:00:00Z".format(i % 12 + 1),
+                "comment": "edit summary",
+                "*": text,
+            })
+        result["query"]["pages"][str(pageid)] = page
+    return result
+
+def main():
+    response = make_response()
+    params = {"action": "query", "prop": "revisions", "rvprop": "content|timestamp", "rvlimit": "max",
+              "rvstart": datetime.datetime(2016, 1, 1), "rvend": datetime.datetime(2017, 1, 1)}
+    number = 20
+
+    def old_parse():
+        parse_timestamps_in_struct(copy.deepcopy(response))
+    def new_parse():
+        parse_api_timestamps(copy.deepcopy(response))
+    def copy_only():
+        copy.deepcopy(response)
+    def old_serialize():
+        serialize_timestamps_in_struct(copy.deepcopy(params))
+    def new_serialize():
+        serialize_api_params(params)
+
+    baseline = min(timeit.repeat(copy_only, number=number, repeat=3))
+    for name, func in [("parse_timestamps_in_struct", old_parse), ("parse_api_timestamps", new_parse)]:
+        t = min(timeit.repeat(func, number=number, repeat=3)) - baseline
+        print("{:<40} {:8.3f} ms per response".format(name, t / number * 1000))
+    for name, func in [("deepcopy + serialize_timestamps_in_struct", old_serialize), ("serialize_api_params", new_serialize)]:
+        t = min(timeit.repeat(func, number=10000, repeat=3))
+        print("{:<40} {:8.3f} µs per call".format(name, t / 10000 * 1e6))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#! /usr/bin/env python3
+
+"""
+Measures the parsing of wiki link targets with :py:class:`ws.parser_helpers.title.Title`
+with and without the parse cache of :py:class:`ws.parser_helpers.title.Context`.
+
+The corpus imitates the links on ArchWiki: a few thousand distinct targets in
+the main, ``Help``, ``Category``, ``Template``, ``ArchWiki`` and ``User``
+namespaces, some with language or interwiki prefixes, subpages and sections,
+written with various capitalization and underscores. The links are drawn from
+a Zipf-like distribution, so that popular targets (e.g. ``Category:Arch Linux``)
+are parsed many times. Alternatively, a file with one link target per line can
+be passed with ``--corpus``.
+"""
+
+import argparse
+import os.path
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from ws.parser_helpers.title import Context, Title
+
+INTERWIKIMAP = {
+    prefix: {"prefix": prefix, "url": "https://wiki.archlinux.org/index.php/$1", "local": ""}
+    for prefix in ["ar", "cs", "de", "en", "es", "fr", "it", "ja", "pl", "pt", "ru", "zh-hans"]
+}
+INTERWIKIMAP.update({
+    prefix: {"prefix": prefix, "url": "https://example.org/{}/$1".format(prefix)}
+    for prefix in ["wikipedia", "wikibooks", "gentoo", "debian", "mw", "meta", "w", "flyspray", "bbs", "aur"]
+})
+
+NAMESPACES = {
+    -2: "Media", -1: "Special", 0: "", 1: "Talk", 2: "User", 3: "User talk",
+    4: "ArchWiki", 5: "ArchWiki talk", 6: "File", 7: "File talk",
+    8: "MediaWiki", 9: "MediaWiki talk", 10: "Template", 11: "Template talk",
+    12: "Help", 13: "Help talk", 14: "Category", 15: "Category talk",
+}
+NAMESPACENAMES = dict((name, id) for id, name in NAMESPACES.items())
+NAMESPACENAMES.update({"Project": 4, "Project talk": 5, "Image": 6, "Image talk": 7})
+
+LEGALTITLECHARS = " %!\"$&'()*,\\-.\\/0-9:;=?@A-Z\\\\^_`a-z~\\x80-\\xFF+"
+
+WORDS = ["arch", "linux", "installation", "guide", "network", "configuration",
+         "systemd", "boot", "loader", "kernel", "module", "xorg", "wayland",
+         "audio", "firmware", "graphics", "security", "pacman", "mirrors",
+         "power", "management", "display", "manager", "font", "locale", "ssh",
+         "tips", "and", "tricks", "troubleshooting", "laptop", "dell", "lenovo"]
+SECTIONS = ["Installation", "Configuration", "Usage", "Troubleshooting",
+            "Tips and tricks", "See also", "Known issues", "Network configuration",
+            "Boot loader", "Kernel modules", "Graphical user interface"]
+LANGUAGES = ["Česky", "Deutsch", "Español", "Français", "Italiano", "日本語",
+             "Polski", "Português", "Русский", "简体中文"]
+
+def make_context(parse_cache_size=None):
+    namespaces = dict((id, {"id": id, "*": name, "case": "first-letter"}) for id, name in NAMESPACES.items())
+    return Context(INTERWIKIMAP, NAMESPACENAMES, namespaces, LEGALTITLECHARS, parse_cache_size=parse_cache_size)
+
+def make_target(rnd):
+    title = " ".join(rnd.choice(WORDS) for _ in range(rnd.choice([1, 1, 2, 2, 3])))
+    r = rnd.random()
+    if r < 0.15:
+        title += " ({})".format(rnd.choice(LANGUAGES))
+    elif r < 0.2:
+        title += "/" + rnd.choice(WORDS)
+    r = rnd.random()
+    if r < 0.6:
+        ns = ""
+    elif r < 0.75:
+        ns = "Category:"
+    elif r < 0.85:
+        ns = "Template:"
+    elif r < 0.9:
+        ns = "Help:"
+    elif r < 0.95:
+        ns = "User:"
+    else:
+        ns = "ArchWiki:"
+    title = ns + title
+    r = rnd.random()
+    if r < 0.05:
+        title = rnd.choice(list(INTERWIKIMAP)) + ":" + title
+    return title
+
+def make_variant(rnd, target):
+    # the same target is written in different ways in the wikitext
+    r = rnd.random()
+    if r < 0.1:
+        target = target.replace(" ", "_")
+    elif r < 0.2:
+        target = target[0].lower() + target[1:]
+    r = rnd.random()
+    if r < 0.2:
+        target += "#" + rnd.choice(SECTIONS)
+    elif r < 0.25:
+        target = ":" + target
+    return target
+
+def make_corpus(count, distinct, seed=0):
+    rnd = random.Random(seed)
+    targets = set()
+    while len(targets) < distinct:
+        targets.add(make_target(rnd))
+    targets = sorted(targets)
+    rnd.shuffle(targets)
+    weights = [1 / (rank + 1) for rank in range(len(targets))]
+    variants = [make_variant(rnd, t) for t in rnd.choices(targets, weights=weights, k=count)]
+    return variants
+
+def per_title(context, corpus):
+    return [Title(context, link) for link in corpus]
+
+def batch(context, corpus):
+    return [Title.from_parsed(context, parsed) for parsed in context.parse_many(corpus)]
+
+def measure(name, func, context, corpus):
+    start = time.perf_counter()
+    titles = func(context, corpus)
+    elapsed = time.perf_counter() - start
+    print("{:<32} {:>9} links {:10.2f} s {:10.2f} µs per link".format(name, len(corpus), elapsed, elapsed / len(corpus) * 1e6))
+    return [str(t) for t in titles]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--count", type=int, default=1000000, help="number of parsed links")
+    parser.add_argument("--distinct", type=int, default=5000, help="number of distinct link targets")
+    parser.add_argument("--corpus", metavar="PATH", help="file with one link target per line (overrides --count and --distinct)")
+    args = parser.parse_args()
+
+    if args.corpus:
+        with open(args.corpus) as f:
+            corpus = [line.rstrip("\n") for line in f if line.strip()]
+    else:
+        corpus = make_corpus(args.count, args.distinct)
+    print("{} links, {} distinct strings".format(len(corpus), len(set(corpus))))
+
+    old = measure("Title: no cache", per_title, make_context(parse_cache_size=0), corpus)
+    context = make_context()
+    new = measure("Title: parse cache", per_title, context, corpus)
+    print("  {}".format(context.parse_cache_info()))
+    assert old == new
+    context = make_context()
+    new = measure("Context.parse_many", batch, context, corpus)
+    assert old == new
+
+if __name__ == "__main__":
+    main()
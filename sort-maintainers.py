@@ -13,16 +13,13 @@ logger = logging.getLogger(__name__)
 class SortMaintainers:
     edit_summary = "automatically sort members by their recent activity"
 
-    def __init__(self, api, cache_dir, pagename, days, min_edits):
+    def __init__(self, api, cache_dir, pagename, days, min_edits, cache_max_age=None):
         self.api = api
         self.pagename = pagename
         self.days = days
         self.min_edits = min_edits
 
-        self.db_userprops = ws.cache.AllUsersProps(api, cache_dir, active_days=days, round_to_midnight=True)
-
-        # fetch recenteditcount
-        self.recenteditcount = dict((user["name"], user["recenteditcount"]) for user in self.db_userprops)
+        self.db_userprops = ws.cache.AllUsersProps(api, cache_dir, active_days=days, round_to_midnight=True, max_age=cache_max_age)
 
     @staticmethod
     def set_argparser(argparser):
@@ -42,7 +39,7 @@ class SortMaintainers:
     def from_argparser(klass, args, api=None):
         if api is None:
             api = API.from_argparser(args)
-        return klass(api, args.cache_dir, args.page_name, args.days, args.min_edits)
+        return klass(api, args.cache_dir, args.page_name, args.days, args.min_edits, args.cache_max_age)
 
     def run(self):
         require_login(self.api)
@@ -63,6 +60,9 @@ class SortMaintainers:
         rows = self.extract_rows(table_active)
         rows += self.extract_rows(table_inactive)
 
+        # fetch recenteditcount (only the part of the database containing the users is loaded)
+        self.users = self.db_userprops.find_many(self._get_user_name(row) for row in rows)
+
         # sort
         def sort_key(row):
             return self._get_editcount(row), self._get_last_edit_timestamp(row)
@@ -101,8 +101,8 @@ class SortMaintainers:
 
     def _get_editcount(self, row):
         username = self._get_user_name(row)
-        recenteditcount = self.recenteditcount.get(username, 0)
-        return recenteditcount
+        user = self.users.get(username, {})
+        return user.get("recenteditcount", 0)
 
     def _get_last_edit_timestamp(self, row):
         username = self._get_user_name(row)
@@ -15,7 +15,7 @@ from ws.autopage import AutoPage
 from ws.wikitable import Wikitable
 import ws.cache
 
-from ws.statistics.UserStatsModules import UserStatsModules
+from ws.statistics.UserStatsAggregates import UserStatsAggregates
 
 
 logger = logging.getLogger(__name__)
@@ -107,7 +107,7 @@ class Statistics:
     def _compose_page(self):
         userstats = _UserStats(self.api, self.cliargs.cache_dir, self.page,
                     self.cliargs.us_days, self.cliargs.us_mintotedits,
-                    self.cliargs.us_minrecedits)
+                    self.cliargs.us_minrecedits, self.cliargs.cache_max_age)
         userstats.update()
 
     def _output_page(self):
@@ -206,7 +206,7 @@ divided by the number of days between the user's first and last edits.
     STREAK_FORMAT = '<span title="{length} days, from {start} to {end} ({editcount} edits)">{length}</span>'
     REGISTRATION_FORMAT = "%Y-%m-%d %H:%M:%S"
 
-    def __init__(self, api, cache_dir, autopage, days, mintotedits, minrecedits):
+    def __init__(self, api, cache_dir, autopage, days, mintotedits, minrecedits, cache_max_age=None):
         self.api = api
         self.text = autopage.wikicode.get_sections(matches="User statistics",
                     flat=True, include_lead=False, include_headings=False)[0]
@@ -216,9 +216,9 @@ divided by the number of days between the user's first and last edits.
         self.MINTOTEDITS = mintotedits
         self.MINRECEDITS = minrecedits
 
-        self.db_userprops = ws.cache.AllUsersProps(api, cache_dir, active_days=days, round_to_midnight=True)
-        self.db_allrevsprops = ws.cache.AllRevisionsProps(api, cache_dir)
-        self.modules = UserStatsModules(self.db_allrevsprops, round_to_midnight=True)
+        self.db_userprops = ws.cache.AllUsersProps(api, cache_dir, active_days=days, round_to_midnight=True, max_age=cache_max_age)
+        self.db_allrevsprops = ws.cache.AllRevisionsProps(api, cache_dir, max_age=cache_max_age)
+        self.modules = UserStatsAggregates(self.db_allrevsprops, cache_dir, round_to_midnight=True, max_age=cache_max_age)
 
     def update(self):
         rows = self._compose_rows()
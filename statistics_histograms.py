@@ -9,7 +9,6 @@ import logging
 
 from ws.client import API
 import ws.cache
-from ws.utils import range_by_months
 
 logger = logging.getLogger(__name__)
 
@@ -53,52 +52,26 @@ def create_histograms(revisions):
     Build some histograms from the revisions data:
       - count of total edits per month since the wiki has been created
       - count of active users in each month
-
-    Reference: http://stackoverflow.com/a/3035824 (highly adjusted)
     """
-    import numpy as np
-    from matplotlib.dates import date2num
+    from ws.statistics.histograms import histogram
 
-    # list of timestamps for each revision
-    timestamps = [revision["timestamp"] for revision in revisions]
+    # one bin per calendar month
+    hist = histogram(revisions, period="month")
     # alternatively exclude bots
-#    timestamps = [revision["timestamp"] for revision in revisions if revision["user"] not in ["Kynikos.bot", "Lahwaacz.bot", "Strcat"]]
-
-    # construct an array of bin edges, one bin per calendar month
-    bin_edges = range_by_months(timestamps[0], timestamps[-1])
-
-    # "bin" the timestamps (this will implicitly bin also the revisions)
-    # NOTE: np.digitize returns a list of bin indexes for each revision
-    bin_indexes = np.digitize(date2num(timestamps), date2num(bin_edges))
-
-    # the returned indexes are 1-based indices!!! so let's turn them into 0-based
-    bin_indexes = np.subtract(bin_indexes, 1)
-
+#    hist = histogram([revision for revision in revisions if revision.get("user") not in ["Kynikos.bot", "Lahwaacz.bot", "Strcat"]], period="month")
 
     # histogram for all edits
     logger.info("Plotting hist_alledits.png")
-    # since it is calculated by counting revisions in each bin, it is enough to count
-    # the indexes
-    hist_alledits, _ = np.histogram(bin_indexes, bins=range(len(bin_edges)))
-
-    plot_date_bars(hist_alledits, bin_edges, title="ArchWiki edits per month",
+    plot_date_bars(hist.edits, hist.bin_edges, title="ArchWiki edits per month",
             ylabel="edit count", fname="stub/hist_alledits.png")
-#    plot_date_bars(hist_alledits, bin_edges,
+#    plot_date_bars(hist.edits, hist.bin_edges,
 #            title="ArchWiki edits per month (without bots)", ylabel="edit count",
 #            fname="stub/hist_alledits_nobots.png")
 
 
     # histogram for active users
     logger.info("Plotting hist_active_users.png")
-    hist_active_users = []
-    num_bins = len(bin_edges) - 1
-    for i in range(num_bins):
-        # array of indexes for revisions in current bin
-        current_bin, = np.where(bin_indexes == i)
-        active_users = list(set([revisions[ii]["user"] for ii in current_bin]))
-        hist_active_users.append(len(active_users))
-
-    plot_date_bars(hist_active_users, bin_edges,
+    plot_date_bars(hist.users, hist.bin_edges,
             title="ArchWiki active users per month", ylabel="active users",
             fname="stub/hist_active_users.png")
 
@@ -116,6 +89,6 @@ if __name__ == "__main__":
     ws.logging.init(args)
 
     api = API.from_argparser(args)
-    db = ws.cache.AllRevisionsProps(api, args.cache_dir)
+    db = ws.cache.AllRevisionsProps(api, args.cache_dir, max_age=args.cache_max_age)
 
     create_histograms(db["revisions"])
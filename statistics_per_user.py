@@ -91,7 +91,7 @@ if __name__ == "__main__":
     ws.logging.init(args)
 
     api = API.from_argparser(args)
-    db = ws.cache.AllRevisionsProps(api, args.cache_dir)
+    db = ws.cache.AllRevisionsProps(api, args.cache_dir, max_age=args.cache_max_age)
 
     users = ["Alad", "Fengchao", "Indigo", "Kynikos", "Lahwaacz", "Lonaowna"]
 
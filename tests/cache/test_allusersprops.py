@@ -0,0 +1,189 @@
+#! /usr/bin/env python3
+
+import datetime
+
+import pytest
+
+from ws.cache import AllUsersProps
+
+from fixtures.cache import FakeAPI
+
+def _parse_continue(value):
+    timestamp, id_ = value.split("|")
+    return datetime.datetime.strptime(timestamp, "%Y%m%d%H%M%S"), int(id_)
+
+class UsersAPI(FakeAPI):
+    """
+    A wiki with users, recent changes and logs, providing the API queries
+    used by AllUsersProps.
+    """
+    max_ids_per_query = 50
+
+    def __init__(self):
+        self.users = {}
+        self.changes = []
+        self.logs = []
+        self.calls = []
+        self.purged = None
+
+    @property
+    def oldest_rc_timestamp(self):
+        if self.purged is not None:
+            return self.purged
+        if not self.changes:
+            return None
+        return min(c["timestamp"] for c in self.changes)
+
+    def add_user(self, name, groups=("*", "user")):
+        self.users[name] = {"userid": len(self.users) + 1, "name": name, "editcount": 0,
+                            "groups": list(groups), "registration": datetime.datetime(2018, 1, 1)}
+
+    def edit(self, user, ago, type="edit"):
+        timestamp = datetime.datetime.utcnow().replace(microsecond=0) - ago
+        change = {"rcid": len(self.changes) + 1, "type": type, "user": user, "timestamp": timestamp}
+        if user in self.users:
+            self.users[user]["editcount"] += 1
+        else:
+            change["anon"] = ""
+        self.changes.append(change)
+
+    def log(self, type, user, params=None):
+        self.logs.append({"logid": len(self.logs) + 1, "type": type, "title": "User:" + user,
+                          "timestamp": datetime.datetime.utcnow().replace(microsecond=0), "params": params or {}})
+
+    def list(self, **params):
+        self.calls.append(params)
+        if params["list"] == "allusers":
+            for name in sorted(self.users):
+                yield dict(self.users[name])
+        elif params["list"] == "users":
+            for name in params["ususers"].split("|"):
+                if name in self.users:
+                    yield dict(self.users[name])
+                else:
+                    yield {"name": name, "missing": ""}
+        elif params["list"] == "recentchanges":
+            types = params["rctype"].split("|")
+            changes = [c for c in self.changes if c["type"] in types]
+            if "rccontinue" in params:
+                start = _parse_continue(params["rccontinue"])
+                changes = [c for c in changes if (c["timestamp"], c["rcid"]) >= start]
+                changes.sort(key=lambda c: (c["timestamp"], c["rcid"]))
+            else:
+                changes = [c for c in changes if params["rcend"] <= c["timestamp"] <= params["rcstart"]]
+                changes.sort(key=lambda c: (c["timestamp"], c["rcid"]), reverse=True)
+            for change in changes:
+                yield dict(change)
+        elif params["list"] == "logevents":
+            start = _parse_continue(params["lecontinue"])
+            for event in self.logs:
+                if event["type"] == params["letype"] and (event["timestamp"], event["logid"]) >= start:
+                    yield dict(event)
+        else:
+            raise NotImplementedError(params["list"])
+
+    def calls_of(self, list_):
+        return [call for call in self.calls if call["list"] == list_]
+
+def make_api():
+    api = UsersAPI()
+    for name in ["Alice", "Bob", "Carol"]:
+        api.add_user(name)
+    for days in [40, 20, 10, 1]:
+        api.edit("Alice", datetime.timedelta(days=days))
+    api.edit("Bob", datetime.timedelta(days=5), type="new")
+    api.edit("Bob", datetime.timedelta(days=2))
+    api.edit("127.0.0.1", datetime.timedelta(days=3))
+    return api
+
+def expected_recent(api, days=30):
+    first = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+    counts = {}
+    for change in api.changes:
+        if change["type"] == "edit" and change["timestamp"] >= first:
+            counts[change["user"]] = counts.get(change["user"], 0) + 1
+    return counts
+
+def check(db, api):
+    recent = expected_recent(api, db.active_days)
+    users = list(db)
+    assert [user["name"] for user in users] == sorted(api.users)
+    for user in users:
+        expected = api.users[user["name"]]
+        assert user["editcount"] == expected["editcount"]
+        assert sorted(user["groups"]) == sorted(expected["groups"])
+        assert user["recenteditcount"] == recent.get(user["name"], 0)
+    assert db.activeuserscount == len(recent)
+
+@pytest.mark.parametrize("storage", ["json", "keyed"])
+def test_change_feed(tmpdir, storage):
+    api = make_api()
+    db = AllUsersProps(api, str(tmpdir), storage=storage)
+    check(db, api)
+
+    api.edit("Carol", datetime.timedelta(seconds=10))
+    api.edit("Alice", datetime.timedelta(seconds=5))
+    api.edit("Alice", datetime.timedelta(seconds=1), type="new")
+    api.edit("10.0.0.1", datetime.timedelta(seconds=1))
+    api.calls = []
+    db = AllUsersProps(api, str(tmpdir), storage=storage)
+    check(db, api)
+
+    # only the new changes are read, no user is queried again
+    assert api.calls_of("allusers") == []
+    assert api.calls_of("users") == []
+    assert [call["rccontinue"] for call in api.calls_of("recentchanges")] != []
+
+    # nothing changed
+    api.calls = []
+    db = AllUsersProps(api, str(tmpdir), storage=storage)
+    check(db, api)
+    assert api.calls_of("users") == []
+
+def test_logs(tmpdir):
+    api = make_api()
+    db = AllUsersProps(api, str(tmpdir))
+    check(db, api)
+
+    # group changes are applied from the log
+    api.users["Bob"]["groups"] = ["*", "user", "sysop"]
+    api.log("rights", "Bob", {"oldgroups": [], "newgroups": ["sysop"]})
+    # new users are queried
+    api.add_user("Dave")
+    api.log("newusers", "Dave")
+    api.edit("Dave", datetime.timedelta(seconds=1))
+    api.calls = []
+    db = AllUsersProps(api, str(tmpdir))
+    check(db, api)
+    assert [call["ususers"] for call in api.calls_of("users")] == ["Dave"]
+
+    api.users["Bob"]["groups"] = ["*", "user"]
+    api.log("rights", "Bob", {"oldgroups": ["sysop"], "newgroups": []})
+    db = AllUsersProps(api, str(tmpdir))
+    check(db, api)
+
+def test_window(tmpdir):
+    api = make_api()
+    db = AllUsersProps(api, str(tmpdir))
+    check(db, api)
+
+    # the edits older than the window are dropped
+    db = AllUsersProps(api, str(tmpdir), active_days=4)
+    api.edit("Carol", datetime.timedelta(seconds=1))
+    check(db, api)
+    assert sorted(db.meta["recentedits"]) == ["127.0.0.1", "Alice", "Bob", "Carol"]
+    assert db.meta["recentusers"] == ["127.0.0.1", "Alice", "Bob", "Carol"]
+
+def test_purged_recent_changes(tmpdir):
+    api = make_api()
+    db = AllUsersProps(api, str(tmpdir))
+    check(db, api)
+
+    # the changes since the last update are not available anymore
+    api.purged = datetime.datetime.utcnow() + datetime.timedelta(seconds=1)
+    api.edit("Carol", datetime.timedelta(seconds=1))
+    api.calls = []
+    db = AllUsersProps(api, str(tmpdir))
+    list(db)
+    assert len(api.calls_of("allusers")) == 1
+    assert db.find("Carol")["editcount"] == 1
@@ -0,0 +1,199 @@
+#! /usr/bin/env python3
+
+import datetime
+import json
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from ws.cache import CacheDb
+from ws.cache.columnar import RevisionTable, ColumnarStorage
+from ws.cache.storage import SegmentedStorage
+
+RECORD_KEYS = {"badrevids": None, "revisions": "revid", "deletedrevisions": "revid"}
+
+def apply_changes(data, changes):
+    for collection, record in changes:
+        CacheDb._merge_records(data[collection], [record], RECORD_KEYS[collection])
+
+def make_revisions(count):
+    revisions = []
+    for revid in range(1, count + 1):
+        rev = {
+            "revid": revid,
+            "parentid": revid - 1,
+            "user": "User {}".format(revid % 7),
+            "timestamp": datetime.datetime(2018, 1, 1) + datetime.timedelta(minutes=revid),
+            "comment": "édit {}".format(revid),
+        }
+        if revid % 3 == 0:
+            rev["minor"] = ""
+        if revid % 10 == 0:
+            del rev["user"]
+            rev["userhidden"] = ""
+        if revid % 11 == 0:
+            del rev["comment"]
+            rev["commenthidden"] = ""
+        revisions.append(rev)
+    # a property which does not have a column
+    revisions[4]["tags"] = ["foo"]
+    return revisions
+
+def test_records():
+    revisions = make_revisions(100)
+    table = RevisionTable.from_records(revisions)
+    assert len(table) == 100
+    assert list(table) == revisions
+    assert table[-1] == revisions[-1]
+    assert table[10:13] == revisions[10:13]
+    with pytest.raises(IndexError):
+        table[100]
+    assert table.column("revid").tolist() == list(range(1, 101))
+    users = table.user_column()
+    assert users[0] == "User 1"
+    assert users[9] is None
+
+def test_modification():
+    revisions = make_revisions(10)
+    table = RevisionTable.from_records(revisions[:5] + revisions[6:])
+    table.insert(5, revisions[5])
+    assert list(table) == revisions
+    new = dict(revisions[2], comment="changed", user="New user")
+    table[2] = new
+    assert table[2] == new
+    assert table[3] == revisions[3]
+
+def test_merge_sorted():
+    revisions = make_revisions(100)
+    table = RevisionTable.from_records(revisions[::2])
+    # replace some revisions, insert the missing ones and append new ones
+    new = revisions[1:60:2] + [dict(r, comment="changed") for r in revisions[20:40:2]] + make_revisions(110)[100:]
+    expected = revisions[:20] + [dict(r, comment="changed") if r["revid"] % 2 else r for r in revisions[20:40]] + revisions[40:60] + revisions[60::2] + make_revisions(110)[100:]
+    expected.sort(key=lambda r: r["revid"])
+    table.merge_sorted(reversed(new))
+    assert list(table) == expected
+
+def test_storage(tmpdir):
+    revisions = make_revisions(1000)
+    storage = ColumnarStorage(str(tmpdir), "Revisions", None)
+    assert not storage.exists()
+    meta = {"timestamp": datetime.datetime(2018, 2, 3, 4, 5, 6)}
+    storage.save({"revisions": revisions, "badrevids": [1, 2]}, meta)
+    assert storage.exists()
+
+    data, meta2 = storage.load()
+    assert meta2 == meta
+    assert data["badrevids"] == [1, 2]
+    table = data["revisions"]
+    assert isinstance(table, RevisionTable)
+    assert isinstance(table.column("revid"), np.memmap)
+    assert list(table) == revisions
+
+    # merge into a memory-mapped table
+    loaded, _ = storage.load()
+    loaded["revisions"].merge_sorted([dict(revisions[0], comment="changed"), {"revid": 2000}])
+    assert loaded["revisions"][0]["comment"] == "changed"
+    assert loaded["revisions"][1:1000] == revisions[1:]
+    assert loaded["revisions"][-1] == {"revid": 2000}
+
+    # modify the memory-mapped table and save a new version
+    table.extend_sorted(make_revisions(1001)[1000:])
+    storage.save(data, meta)
+    data, _ = storage.load()
+    assert list(data["revisions"]) == make_revisions(1001)[:4] + [revisions[4]] + make_revisions(1001)[5:]
+    assert sorted(p.basename for p in tmpdir.join("Revisions.columnar").listdir()) == ["00000002", "CURRENT"]
+
+def test_size():
+    revisions = make_revisions(10000)
+    table = RevisionTable.from_records(revisions)
+    size_json = len(json.dumps(revisions, default=str))
+    assert table.nbytes < size_json / 2
+
+def test_migration(tmpdir):
+    revisions = make_revisions(10)
+    SegmentedStorage(str(tmpdir), "Revisions", None).save({"revisions": revisions}, {})
+    storage = ColumnarStorage(str(tmpdir), "Revisions", None)
+    assert storage.exists()
+    data, _ = storage.load()
+    assert isinstance(data["revisions"], RevisionTable)
+    assert list(data["revisions"]) == revisions
+
+def test_empty_collections(tmpdir):
+    storage = ColumnarStorage(str(tmpdir), "Revisions", apply_changes, RECORD_KEYS)
+    storage.save({"badrevids": [], "revisions": [], "deletedrevisions": []}, {})
+    data, _ = storage.load()
+    assert data["badrevids"] == []
+    assert isinstance(data["revisions"], RevisionTable)
+    assert isinstance(data["deletedrevisions"], RevisionTable)
+    CacheDb._merge_records(data["badrevids"], [5, 3], None)
+    CacheDb._merge_records(data["revisions"], make_revisions(10), "revid")
+    assert data["badrevids"] == [3, 5]
+    assert list(data["revisions"]) == make_revisions(10)
+
+def test_incremental_save(tmpdir):
+    revisions = make_revisions(1000)
+    storage = ColumnarStorage(str(tmpdir), "Revisions", apply_changes, RECORD_KEYS)
+    storage.save({"badrevids": [], "revisions": revisions[:900]}, {"n": 1})
+    version = storage.version()
+
+    changes = [["revisions", rev] for rev in revisions[900:]]
+    changes.append(["revisions", dict(revisions[0], comment="changed")])
+    changes.append(["badrevids", 7])
+    storage.save(None, {"n": 2}, changes)
+    assert storage.version() != version
+    path = tmpdir.join("Revisions.columnar")
+    assert sorted(p.basename for p in path.listdir()) == ["00000001", "CURRENT"]
+    assert "delta.00000001.json.gz" in [p.basename for p in path.join("00000001").listdir()]
+
+    data, meta = storage.load()
+    assert meta == {"n": 2}
+    assert data["badrevids"] == [7]
+    assert list(data["revisions"]) == [dict(revisions[0], comment="changed")] + revisions[1:]
+
+    # too many deltas trigger a full save
+    storage.max_deltas = 1
+    for revid in [8, 9]:
+        changes = [["badrevids", revid]]
+        apply_changes(data, changes)
+        storage.save(data, meta, changes)
+    assert sorted(p.basename for p in path.listdir()) == ["00000002", "CURRENT"]
+    data, _ = storage.load()
+    assert data["badrevids"] == [7, 8, 9]
+    assert len(data["revisions"]) == 1000
+
+def test_load_deltas_keeps_mapping(tmpdir):
+    revisions = make_revisions(1000)
+    storage = ColumnarStorage(str(tmpdir), "Revisions", apply_changes, RECORD_KEYS)
+    storage.save({"badrevids": [], "revisions": revisions[:900:2]}, {})
+    changes = [["revisions", rev] for rev in revisions[1:900:2] + revisions[900:]]
+    changes.append(["revisions", dict(revisions[0], comment="changed", user="New user", tags=["bar"])])
+    changes.append(["revisions", dict(revisions[4], comment="changed")])
+    storage.save(None, {}, changes)
+
+    data, _ = storage.load()
+    table = data["revisions"]
+    expected = [dict(revisions[0], comment="changed", user="New user", tags=["bar"])] + revisions[1:4] + \
+               [dict(revisions[4], comment="changed")] + revisions[5:]
+    # the deltas are kept in the overlay, the columns are still memory-mapped
+    for column in table._columns.values():
+        assert isinstance(column, np.memmap)
+    assert not isinstance(table._comments, list)
+    assert len(table) == 1000
+    assert list(table) == expected
+    assert table[-1] == expected[-1]
+    assert table.column("revid").tolist() == list(range(1, 1001))
+    assert table.user_column()[0] == "New user"
+    assert table.column_view("timestamp")[999] == np.datetime64(revisions[999]["timestamp"])
+
+    # the overlay is merged on the next full save
+    storage.save(data, {})
+    data, _ = storage.load()
+    assert table._overlay is not None
+    assert data["revisions"]._overlay is None
+    assert list(data["revisions"]) == expected
+
+    # in-place modifications merge the overlay first
+    table[1] = dict(revisions[1], comment="changed")
+    assert table._overlay is None
+    assert list(table) == expected[:1] + [dict(revisions[1], comment="changed")] + expected[2:]
@@ -0,0 +1,126 @@
+#! /usr/bin/env python3
+
+import gzip
+
+import pytest
+
+from ws.cache import CacheDb, CacheDbError
+from ws.cache.keyed import KeyedStorage, LazyRecords
+
+class UsersDb(CacheDb):
+    record_keys = {
+        None: "name",
+    }
+
+    def __init__(self, api, cache_dir, storage="keyed", new_users=()):
+        self.new_users = list(new_users)
+        super().__init__(api, cache_dir, "UsersDb", storage=storage)
+
+    def init(self, key=None):
+        self.data = []
+        self.update()
+
+    def update(self, key=None):
+        if not self.new_users:
+            return
+        users = [{"name": name, "editcount": len(name)} for name in self.new_users]
+        self._merge_records(self.data, users, "name")
+        for user in users:
+            self._record_change(None, user)
+        self.new_users = []
+        self._update_timestamp()
+        self.dump()
+
+def names(count):
+    return ["User {:05d}".format(i) for i in range(count)]
+
+def _blocks(tmpdir):
+    path = tmpdir.join("wiki.example.org", "UsersDb.keyed")
+    return sorted(p.basename for p in path.listdir() if p.basename != "index.json")
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    monkeypatch.setattr(KeyedStorage, "block_size", 10)
+    monkeypatch.setattr(KeyedStorage, "obsolete_grace", 0)
+
+def test_lazy_load(tmpdir, fake_api, small_blocks):
+    db = UsersDb(fake_api, str(tmpdir), new_users=names(100))
+    list(db)
+    assert len(_blocks(tmpdir)) == 10
+
+    db = UsersDb(fake_api, str(tmpdir))
+    user = db.find("User 00042")
+    assert user == {"name": "User 00042", "editcount": 10}
+    assert isinstance(db.data, LazyRecords)
+    assert db.data.loaded_blocks == 1
+    assert len(db) == 100
+    assert db.data.loaded_blocks == 1
+
+    records = db.find_range("User 00015", "User 00034")
+    assert [r["name"] for r in records] == names(35)[15:]
+    assert db.data.loaded_blocks == 4
+
+    assert set(db.find_many(["User 00001", "Nobody"])) == {"User 00001"}
+    with pytest.raises(KeyError):
+        db.find("Nobody")
+
+    assert [r["name"] for r in db] == names(100)
+    assert db.data[-1]["name"] == "User 00099"
+
+def test_update(tmpdir, fake_api, small_blocks):
+    db = UsersDb(fake_api, str(tmpdir), new_users=names(100))
+    list(db)
+    before = _blocks(tmpdir)
+
+    # insert into the middle and append at the end
+    db = UsersDb(fake_api, str(tmpdir), new_users=["User 00050a", "User 00200"])
+    db.find("User 00000")
+    assert db.data.loaded_blocks == 4
+    after = _blocks(tmpdir)
+    # only the modified block is rewritten, a new block is added
+    assert len(set(before) - set(after)) == 1
+    assert len(set(after) - set(before)) == 2
+
+    db = UsersDb(fake_api, str(tmpdir))
+    assert [r["name"] for r in db] == sorted(names(100) + ["User 00050a", "User 00200"])
+
+def test_split(tmpdir, fake_api, small_blocks):
+    db = UsersDb(fake_api, str(tmpdir), new_users=names(100)[::10])
+    list(db)
+    assert len(_blocks(tmpdir)) == 1
+    db = UsersDb(fake_api, str(tmpdir), new_users=names(100))
+    list(db)
+    # the grown block is split into 10 blocks, the users past the end are in a new block
+    assert len(_blocks(tmpdir)) == 11
+    db = UsersDb(fake_api, str(tmpdir))
+    assert [r["name"] for r in db] == names(100)
+
+def test_migration(tmpdir, fake_api):
+    db = UsersDb(fake_api, str(tmpdir), storage="json", new_users=["B", "A"])
+    list(db)
+    db = UsersDb(fake_api, str(tmpdir), new_users=["C"])
+    assert [r["name"] for r in db] == ["A", "B", "C"]
+    assert len(_blocks(tmpdir)) == 1
+    db = UsersDb(fake_api, str(tmpdir))
+    assert db.find("B")["editcount"] == 1
+
+def test_corrupted_block(tmpdir, fake_api):
+    db = UsersDb(fake_api, str(tmpdir), new_users=["A", "B"])
+    list(db)
+    block, = _blocks(tmpdir)
+    path = str(tmpdir.join("wiki.example.org", "UsersDb.keyed", block))
+    with gzip.open(path, "wb") as f:
+        f.write(b"[]")
+    db = UsersDb(fake_api, str(tmpdir))
+    with pytest.raises(CacheDbError):
+        db.find("A")
+
+def test_obsolete_grace(tmpdir, fake_api):
+    db = UsersDb(fake_api, str(tmpdir), new_users=["A"])
+    list(db)
+    old, = _blocks(tmpdir)
+    db.new_users = ["B"]
+    list(db)
+    # the replaced block is kept for readers of the previous version
+    assert old in _blocks(tmpdir)
+    assert len(_blocks(tmpdir)) == 2
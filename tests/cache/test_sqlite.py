@@ -0,0 +1,131 @@
+#! /usr/bin/env python3
+
+import datetime
+
+import pytest
+
+from ws.cache.sqlite import SQLiteRecords, SQLiteStorage, format_timestamp
+from ws.statistics.UserStatsModules import UserStatsModules
+
+def make_revisions(count, users=5):
+    base = datetime.datetime(2018, 1, 1)
+    revisions = []
+    for revid in range(1, count + 1):
+        revisions.append({
+            "revid": revid,
+            "user": "User {}".format(revid % users),
+            # a few revisions share the timestamp
+            "timestamp": base + datetime.timedelta(hours=(revid * 7) % 100 * 5),
+            "deleted": revid % 10 == 0,
+        })
+    return revisions
+
+def test_records(revisions_db):
+    revisions = make_revisions(100)
+    db = revisions_db("sqlite", revisions)
+    db["revisions"]
+
+    db = revisions_db("sqlite")
+    assert isinstance(db["revisions"], SQLiteRecords)
+    assert list(db["revisions"]) == [r for r in revisions if not r["deleted"]]
+    assert len(db["revisions"]) == 90
+    assert db["revisions"][0]["revid"] == 1
+    assert db["revisions"][-1]["revid"] == 99
+    assert [r["revid"] for r in db["deletedrevisions"][2:4]] == [30, 40]
+    with pytest.raises(IndexError):
+        db["deletedrevisions"][10]
+
+    assert db.find(42, "revisions") == revisions[41]
+    with pytest.raises(KeyError):
+        db.find(40, "revisions")
+    assert [r["revid"] for r in db.find_range(15, 25, "revisions")] == [15, 16, 17, 18, 19, 21, 22, 23, 24, 25]
+
+def test_upsert(revisions_db):
+    db = revisions_db("sqlite", make_revisions(10))
+    db["revisions"]
+    db.new_revisions = [{"revid": 5, "user": "Renamed", "timestamp": datetime.datetime(2018, 2, 1)},
+                        {"revid": 11, "user": "User 1", "timestamp": datetime.datetime(2018, 2, 2)}]
+    db["revisions"]
+
+    db = revisions_db("sqlite")
+    assert [r["revid"] for r in db["revisions"]] == [1, 2, 3, 4, 5, 6, 7, 8, 9, 11]
+    assert db.find(5, "revisions")["user"] == "Renamed"
+
+    # records modified in place are saved when the change is reported
+    record = db.find(6, "revisions")
+    record["user"] = "Modified"
+    db._record_change("revisions", record)
+    db.dump()
+    db = revisions_db("sqlite")
+    assert db.find(6, "revisions")["user"] == "Modified"
+
+def test_uncommitted_changes(revisions_db):
+    db = revisions_db("sqlite", make_revisions(10))
+    db["revisions"]
+    db.autocommit = False
+    db._merge_records(db.data["revisions"], [{"revid": 11, "user": "User 1"}], "revid")
+    assert len(db.data["revisions"]) == 10
+
+    other = revisions_db("sqlite")
+    assert len(other["revisions"]) == 9
+    # the changes are discarded on reload
+    db.data = None
+    assert len(db["revisions"]) == 9
+
+def test_queries(revisions_db):
+    revisions = make_revisions(100)
+    db = revisions_db("sqlite", revisions)
+    db["revisions"]
+    table = revisions_db("sqlite")["revisions"]
+
+    start = datetime.datetime(2018, 1, 5)
+    selected = list(table.select("user = ? AND timestamp >= ?", ("User 2", format_timestamp(start)), order_by="timestamp, key"))
+    expected = sorted((r for r in revisions if not r["deleted"] and r["user"] == "User 2" and r["timestamp"] >= start),
+                      key=lambda r: (r["timestamp"], r["revid"]))
+    assert selected == expected
+
+    counts = table.group_by("user")
+    assert counts == [("User {}".format(i), 10 if i == 0 else 20) for i in range(5)]
+    first = dict(table.group_by("user", "MIN(timestamp)", where="key > ?", params=(50, )))
+    assert first["User 1"] == format_timestamp(min(r["timestamp"] for r in revisions[50:] if r["user"] == "User 1"))
+
+def test_indexes(revisions_db):
+    db = revisions_db("sqlite", make_revisions(10))
+    db["revisions"]
+    plan = db.storage.connection.execute("EXPLAIN QUERY PLAN SELECT record FROM records_revisions WHERE user = ? ORDER BY timestamp", ("User 1", )).fetchall()
+    assert "records_revisions_user" in plan[0][-1]
+
+def test_migration(revisions_db):
+    revisions = make_revisions(20)
+    db = revisions_db("segmented", new_revisions=revisions)
+    db["revisions"]
+    db = revisions_db("sqlite", make_revisions(21)[20:])
+    assert len(db["revisions"]) == 19
+    db = revisions_db("sqlite")
+    assert isinstance(db["revisions"], SQLiteRecords)
+    assert list(db["deletedrevisions"]) == [r for r in make_revisions(21) if r["deleted"]]
+
+def test_record_keys_required(tmpdir):
+    with pytest.raises(ValueError):
+        SQLiteStorage(str(tmpdir), "db", None)
+
+@pytest.mark.parametrize("round_to_midnight", [False, True])
+def test_user_stats_parity(tmpdir, revisions_db, round_to_midnight):
+    revisions = make_revisions(200, users=7)
+    # a revision in the future to test round_to_midnight
+    revisions.append({"revid": 201, "user": "User 3", "timestamp": datetime.datetime(2100, 1, 1)})
+    list_db = revisions_db("json", revisions, cache_dir=str(tmpdir.join("list")))
+    revisions_db("sqlite", revisions, cache_dir=str(tmpdir.join("sqlite")))["revisions"]
+    sqlite_db = revisions_db("sqlite", cache_dir=str(tmpdir.join("sqlite")))
+
+    expected = UserStatsModules(list_db, round_to_midnight=round_to_midnight)
+    usm = UserStatsModules(sqlite_db, round_to_midnight=round_to_midnight)
+    assert not isinstance(usm.revisions_groups, dict)
+    assert list(usm.revisions_groups) == sorted(expected.revisions_groups)
+    for user in expected.revisions_groups:
+        assert usm.revisions_groups[user] == expected.revisions_groups[user]
+        assert usm.get_streaks(user) == expected.get_streaks(user)
+        assert usm.active_edits_per_day(user) == expected.active_edits_per_day(user)
+        assert usm.total_edit_count(user) == expected.total_edit_count(user)
+    with pytest.raises(KeyError):
+        usm.revisions_groups["Nobody"]
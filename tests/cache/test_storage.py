@@ -0,0 +1,168 @@
+#! /usr/bin/env python3
+
+import datetime
+import multiprocessing
+import os
+
+import pytest
+
+from ws.cache import CacheDbError
+from ws.cache.storage import FileLock
+
+from fixtures.cache import FakeAPI, RevisionsDb
+
+def _revisions(revids):
+    return [{"revid": revid, "timestamp": datetime.datetime(2018, 1, 1, 0, 0, revid % 60)} for revid in revids]
+
+def _revids(db):
+    return [r["revid"] for r in db["revisions"]]
+
+def _segments(tmpdir):
+    return sorted(os.listdir(str(tmpdir.join("wiki.example.org", "RevisionsDb.segments"))))
+
+@pytest.mark.parametrize("storage", ["json", "segmented", "keyed", "sqlite"])
+def test_roundtrip(revisions_db, storage):
+    db = revisions_db(storage, _revisions([1, 3, 2]))
+    assert _revids(db) == [1, 2, 3]
+    db = revisions_db(storage, _revisions([5, 4, 2]))
+    assert _revids(db) == [1, 2, 3, 4, 5]
+    assert [r["revid"] for r in db["revisions"]] == [1, 2, 3, 4, 5]
+    db = revisions_db(storage)
+    assert _revids(db) == [1, 2, 3, 4, 5]
+    assert db["revisions"][3] == {"revid": 4, "timestamp": datetime.datetime(2018, 1, 1, 0, 0, 4)}
+    assert isinstance(db.timestamp, datetime.datetime)
+
+def test_append_only(tmpdir, revisions_db):
+    db = revisions_db("segmented", _revisions(range(1, 1001)))
+    db["revisions"]
+    assert _segments(tmpdir) == ["00000001.snapshot.json.gz", "index.json"]
+    db = revisions_db("segmented", _revisions([1001, 1002]))
+    db["revisions"]
+    assert _segments(tmpdir) == ["00000001.snapshot.json.gz", "00000002.delta.json.gz", "index.json"]
+    size = os.path.getsize(str(tmpdir.join("wiki.example.org", "RevisionsDb.segments", "00000002.delta.json.gz")))
+    assert size < 200
+
+def test_compaction(tmpdir, revisions_db):
+    db = revisions_db("segmented", _revisions(range(1, 101)))
+    db["revisions"]
+    db.storage.max_deltas = 2
+    for revid in range(101, 104):
+        db.new_revisions = _revisions([revid])
+        db["revisions"]
+    db.storage.wait()
+    assert _segments(tmpdir) == ["00000005.snapshot.json.gz", "index.json"]
+    db = revisions_db("segmented")
+    assert _revids(db) == list(range(1, 104))
+
+def test_compaction_keeps_version(tmpdir, revisions_db, monkeypatch):
+    db = revisions_db("segmented", _revisions(range(1, 101)))
+    db["revisions"]
+    db.new_revisions = _revisions([101])
+    db["revisions"]
+    version = db.storage.version()
+    db.storage.compact()
+    assert _segments(tmpdir) == ["00000003.snapshot.json.gz", "index.json"]
+    assert db.storage.version() == version
+
+    # the data in memory is still current, it must not be loaded again
+    def fail():
+        raise AssertionError("unexpected reload after compaction")
+    monkeypatch.setattr(db.storage, "load", fail)
+    assert _revids(db) == list(range(1, 102))
+
+def test_corrupted_segment(tmpdir, revisions_db):
+    db = revisions_db("segmented", _revisions(range(1, 1001)))
+    db["revisions"]
+    db.new_revisions = _revisions([1001])
+    db["revisions"]
+    db.storage.wait()
+    path = str(tmpdir.join("wiki.example.org", "RevisionsDb.segments", "00000002.delta.json.gz"))
+    with open(path, "ab") as f:
+        f.write(b"garbage")
+    db = revisions_db("segmented")
+    with pytest.raises(CacheDbError):
+        db["revisions"]
+
+def test_migration(tmpdir, revisions_db):
+    db = revisions_db("json", _revisions([1, 2]))
+    db["revisions"]
+    db = revisions_db("segmented", _revisions([3]))
+    assert _revids(db) == [1, 2, 3]
+    assert _segments(tmpdir) == ["00000001.snapshot.json.gz", "index.json"]
+    db = revisions_db("segmented")
+    assert _revids(db) == [1, 2, 3]
+
+def test_unknown_storage(revisions_db):
+    with pytest.raises(ValueError):
+        revisions_db("foo")
+
+def test_file_lock(tmpdir):
+    path = str(tmpdir.join("db.lock"))
+    lock1 = FileLock(path)
+    lock2 = FileLock(path)
+    with lock1():
+        # shared locks do not exclude each other
+        assert lock2.acquire(blocking=False)
+        lock2.release()
+        assert not lock2.acquire(exclusive=True, blocking=False)
+        # upgrading is not allowed
+        with pytest.raises(RuntimeError):
+            lock1.acquire(exclusive=True)
+    with lock1(exclusive=True):
+        # reentrant
+        with lock1():
+            pass
+        assert not lock2.acquire(blocking=False)
+    assert lock2.acquire(exclusive=True, blocking=False)
+    lock2.release()
+    with pytest.raises(RuntimeError):
+        lock2.release()
+
+@pytest.mark.parametrize("storage", ["json", "segmented", "keyed", "sqlite"])
+def test_fresh_snapshot(revisions_db, storage):
+    writer = revisions_db(storage, _revisions([1, 2]))
+    assert _revids(writer) == [1, 2]
+
+    reader = revisions_db(storage, _revisions([3]))
+    reader.max_age = datetime.timedelta(minutes=5)
+    # the data updated by the writer is fresh enough
+    assert _revids(reader) == [1, 2]
+    assert reader.new_revisions == _revisions([3])
+
+    reader.meta["timestamp"] -= datetime.timedelta(minutes=10)
+    assert _revids(reader) == [1, 2, 3]
+
+@pytest.mark.parametrize("storage", ["json", "segmented", "keyed", "sqlite"])
+def test_reload_after_other_writer(revisions_db, storage):
+    db1 = revisions_db(storage, _revisions([1]))
+    assert _revids(db1) == [1]
+    db2 = revisions_db(storage, _revisions([2]))
+    assert _revids(db2) == [1, 2]
+
+    # db1 sees the changes saved by db2 before its own update
+    db1.new_revisions = _revisions([3])
+    assert _revids(db1) == [1, 2, 3]
+    db = revisions_db(storage)
+    assert _revids(db) == [1, 2, 3]
+
+def _worker(cache_dir, storage, revids):
+    for revid in revids:
+        db = RevisionsDb(FakeAPI(), cache_dir, storage, _revisions([revid]))
+        db["revisions"]
+
+@pytest.mark.parametrize("storage", ["json", "segmented", "keyed", "columnar", "sqlite"])
+def test_concurrent_writers(tmpdir, revisions_db, storage):
+    if storage == "columnar":
+        pytest.importorskip("numpy")
+    ctx = multiprocessing.get_context("fork")
+    processes = []
+    for i in range(4):
+        revids = range(i * 10 + 1, i * 10 + 11)
+        p = ctx.Process(target=_worker, args=(str(tmpdir), storage, revids))
+        p.start()
+        processes.append(p)
+    for p in processes:
+        p.join()
+        assert p.exitcode == 0
+    db = revisions_db(storage)
+    assert _revids(db) == list(range(1, 41))
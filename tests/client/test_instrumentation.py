@@ -0,0 +1,114 @@
+#! /usr/bin/env python3
+
+import asyncio
+import http.server
+import json
+import threading
+import urllib.parse
+
+import pytest
+
+from ws.client.api import API
+from ws.client.async_api import AsyncAPI
+from ws.client.instrumentation import RequestMetrics, request_labels
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        query = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(self.path).query))
+        offset = int(query.get("apcontinue", 0))
+        result = {"query": {"allpages": [{"pageid": offset, "title": "Page {}".format(offset)}]}}
+        if offset < 2:
+            result["continue"] = {"apcontinue": str(offset + 1), "continue": "-||"}
+        body = json.dumps(result).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture(scope="module")
+def server_url():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:{}/api.php".format(server.server_port)
+    server.shutdown()
+    server.server_close()
+
+def test_request_labels():
+    assert request_labels({"action": "query", "list": "allrevisions"}) == ("query", "list=allrevisions")
+    assert request_labels({"action": "query", "generator": "allpages", "prop": {"revisions", "info"}}) \
+            == ("query", "generator=allpages&prop=info|revisions")
+    assert request_labels({"action": "edit", "title": "Foo"}) == ("edit", "")
+    assert request_labels(None) == ("", "")
+
+def test_histograms():
+    metrics = RequestMetrics(latency_buckets=[0.1, 1])
+    for latency in [0.05, 0.1, 0.5, 5]:
+        metrics.record_request("query", "list=allpages", latency, 100, 0.5, 200)
+    metrics.record_request("query", "list=allpages", 0.01, 10, 0, 503)
+    metrics.record_continuation("query", "list=allpages", 3)
+    item, = metrics.as_list()
+    assert item["requests"] == 5
+    assert item["errors"] == 1
+    assert item["response_bytes"] == 410
+    assert item["throttled_seconds"] == 2
+    assert item["latency_seconds"]["buckets"] == {"0.1": 3, "1": 4, "+Inf": 5}
+    assert item["continuation_depth"]["count"] == 1
+    assert item["continuation_depth"]["sum"] == 3
+
+def test_prometheus():
+    metrics = RequestMetrics(latency_buckets=[1])
+    metrics.record_request("query", 'list="x"', 0.5, 100, 0, 200)
+    text = metrics.to_prometheus()
+    assert "# TYPE wikiscripts_api_requests_total counter" in text
+    assert 'wikiscripts_api_requests_total{action="query",module="list=\\"x\\""} 1' in text
+    assert 'wikiscripts_api_latency_seconds_bucket{action="query",module="list=\\"x\\"",le="+Inf"} 1' in text
+    # empty histograms are omitted
+    assert "wikiscripts_api_continuation_depth_count" not in text
+
+def test_dump(tmpdir):
+    metrics = RequestMetrics()
+    metrics.record_request("query", "list=allpages", 0.5, 100, 0, 200)
+    path = str(tmpdir.join("metrics.json"))
+    metrics.dump(path)
+    with open(path) as f:
+        assert json.load(f) == metrics.as_list()
+    path = str(tmpdir.join("metrics.prom"))
+    metrics.dump(path)
+    with open(path) as f:
+        assert f.read() == metrics.to_prometheus()
+
+def test_connection_hook(server_url):
+    metrics = RequestMetrics()
+    api = API(server_url, server_url.replace("api.php", "index.php"), API.make_session(), instrumentation=metrics)
+    pages = list(api.list(list="allpages", aplimit="max"))
+    assert len(pages) == 3
+    item, = metrics.as_list()
+    assert item["action"] == "query"
+    assert item["module"] == "list=allpages"
+    assert item["requests"] == 3
+    assert item["response_bytes"] > 0
+    assert item["latency_seconds"]["count"] == 3
+    assert item["continuation_depth"]["buckets"]["5"] == 1
+    assert item["continuation_depth"]["sum"] == 3
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_async_continuation(server_url, stream):
+    async def collect(aapi):
+        return [page async for page in aapi.list(list="allpages", aplimit="max", stream=stream)]
+
+    metrics = RequestMetrics()
+    api = API(server_url, server_url.replace("api.php", "index.php"), API.make_session(), instrumentation=metrics)
+    with AsyncAPI(api) as aapi:
+        pages = asyncio.run(collect(aapi))
+    assert [page["pageid"] for page in pages] == [0, 1, 2]
+    item, = metrics.as_list()
+    assert item["requests"] == 3
+    assert item["continuation_depth"]["count"] == 1
+    assert item["continuation_depth"]["sum"] == 3
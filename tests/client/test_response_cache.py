@@ -0,0 +1,119 @@
+#! /usr/bin/env python3
+
+import json
+import os
+
+from ws.client.response_cache import ResponseCache
+from ws.client.connection import Connection
+
+class test_response_cache:
+    url = "https://wiki.example.org/api.php"
+
+    def test_key_normalization(self):
+        k1 = ResponseCache.make_key(self.url, {"action": "query", "list": "allpages", "aplimit": 10})
+        k2 = ResponseCache.make_key(self.url, {"aplimit": "10", "list": "allpages", "action": "query"})
+        k3 = ResponseCache.make_key(self.url, {"action": "query", "list": "allpages", "aplimit": 11})
+        assert k1 == k2
+        assert k1 != k3
+        k4 = ResponseCache.make_key(self.url, {"prop": ["info", "revisions"]})
+        k5 = ResponseCache.make_key(self.url, {"prop": "info|revisions"})
+        assert k4 == k5
+
+    def test_hit_miss(self, tmp_path):
+        cache = ResponseCache(str(tmp_path))
+        key = ResponseCache.make_key(self.url, {"action": "query"})
+        assert cache.get(key) is None
+        cache.set(key, b'{"query": {}}')
+        assert cache.get(key) == b'{"query": {}}'
+        assert cache.stats == {"hits": 1, "misses": 1}
+
+    def test_ttl(self, tmp_path):
+        cache = ResponseCache(str(tmp_path), ttl=60)
+        cache.set("foo", b"foo")
+        path = os.path.join(str(tmp_path), "foo.json.gz")
+        st = os.stat(path)
+        os.utime(path, (st.st_atime, st.st_mtime - 61))
+        assert cache.get("foo") is None
+        assert not os.path.exists(path)
+
+    def test_size_eviction(self, tmp_path):
+        cache = ResponseCache(str(tmp_path))
+        for i, key in enumerate(["first", "second", "third", "fourth"]):
+            cache.set(key, os.urandom(1000))
+            path = os.path.join(str(tmp_path), key + ".json.gz")
+            st = os.stat(path)
+            # make the insertion order visible in the modification times
+            os.utime(path, (st.st_atime, st.st_mtime - 10 + i))
+            if i == 0:
+                cache.max_size = st.st_size * 3
+        assert cache.get("first") is None
+        assert cache.get("fourth") is not None
+
+    def test_validate(self, tmp_path):
+        cache = ResponseCache(str(tmp_path))
+        cache.validate(42)
+        cache.set("foo", b"foo")
+        cache.validate(42)
+        assert cache.get("foo") == b"foo"
+        cache.validate(43)
+        assert cache.get("foo") is None
+
+def test_is_cacheable():
+    assert Connection._is_cacheable({"action": "query", "list": "allpages"})
+    assert Connection._is_cacheable({"action": "parse", "page": "Foo"})
+    assert not Connection._is_cacheable({"action": "query", "meta": "siteinfo|tokens"})
+    assert not Connection._is_cacheable({"action": "query", "meta": "userinfo"})
+    assert not Connection._is_cacheable({"action": "edit"})
+    assert not Connection._is_cacheable({"action": "query", "meta": ["siteinfo", "tokens"]})
+    assert Connection._is_cacheable({"action": "query", "meta": ["siteinfo"]})
+    assert not Connection._is_cacheable({"action": "query", "list": "recentchanges", "rclimit": "1"})
+    assert not Connection._is_cacheable({"action": "query", "list": {"allpages", "logevents"}})
+    assert not Connection._is_cacheable({"action": "query", "generator": "recentchanges", "prop": "info"})
+
+class FakeResponse:
+    def __init__(self, content):
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content)
+
+class test_invalidation:
+    url = "https://wiki.example.org/api.php"
+
+    def _connection(self, tmp_path):
+        cache = ResponseCache(str(tmp_path))
+        conn = Connection(self.url, "https://wiki.example.org/index.php", None, response_cache=cache)
+        conn.requests = []
+        conn.latest_revid = 1
+
+        def request_api(method, **kwargs):
+            conn.requests.append((method, kwargs.get("params") or kwargs.get("data")))
+            if method == "POST":
+                conn.latest_revid += 1
+                return FakeResponse(b'{"edit": {"result": "Success"}}')
+            return FakeResponse(('{"query": {"revid": %d}}' % conn.latest_revid).encode("utf-8"))
+
+        def request(method, url, **kwargs):
+            return FakeResponse(('{"query": {"recentchanges": [{"revid": %d}]}}' % conn.latest_revid).encode("utf-8"))
+
+        conn._request_api = request_api
+        conn.request = request
+        return conn
+
+    def test_write_invalidates(self, tmp_path):
+        conn = self._connection(tmp_path)
+        params = {"action": "query", "prop": "info", "titles": "Foo"}
+        assert conn.call_api(dict(params)) == {"revid": 1}
+        assert conn.call_api(dict(params)) == {"revid": 1}
+        assert len(conn.requests) == 1
+        conn.call_api(action="edit", title="Foo", text="bar", token="+\\")
+        assert conn.call_api(dict(params)) == {"revid": 2}
+        assert len(conn.requests) == 3
+
+    def test_login_does_not_invalidate(self, tmp_path):
+        conn = self._connection(tmp_path)
+        conn.response_cache.set("foo", b"foo")
+        conn._invalidate_response_cache("login")
+        assert conn.response_cache.get("foo") == b"foo"
+        conn._invalidate_response_cache("move")
+        assert conn.response_cache.get("foo") is None
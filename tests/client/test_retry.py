@@ -0,0 +1,24 @@
+#! /usr/bin/env python3
+
+from ws.client.connection import Connection
+
+class test_retry_delay:
+    def _connection(self):
+        return Connection("https://wiki.example.org/api.php", "https://wiki.example.org/index.php", None)
+
+    def test_retry_after(self):
+        conn = self._connection()
+        for attempt in range(5):
+            delay = conn._get_retry_delay(attempt, "7")
+            assert 7 <= delay <= 8
+
+    def test_invalid_retry_after(self):
+        conn = self._connection()
+        delay = conn._get_retry_delay(0, "Wed, 21 Oct 2015 07:28:00 GMT")
+        assert 0 <= delay <= conn.backoff_base
+
+    def test_backoff(self):
+        conn = self._connection()
+        for attempt in range(20):
+            delay = conn._get_retry_delay(attempt)
+            assert 0 <= delay <= min(conn.backoff_max, conn.backoff_base * 2 ** attempt)
@@ -0,0 +1,57 @@
+#! /usr/bin/env python3
+
+import pytest
+
+from ws.client.api import API
+from ws.client.site import Site
+
+pytest.importorskip("mwparserfromhell")
+
+SITEINFO = {
+    "general": {"legaltitlechars": " %!\"$&'()*,\\-.\\/0-9:;=?@A-Z\\\\^_`a-z~\\x80-\\xFF+"},
+    "namespaces": {
+        "0": {"id": 0, "case": "first-letter", "*": ""},
+        "2": {"id": 2, "case": "first-letter", "*": "User", "canonical": "User"},
+    },
+    "namespacealiases": [],
+    "interwikimap": [{"prefix": "wikipedia", "url": "https://en.wikipedia.org/wiki/$1"}],
+    "statistics": {"pages": 1},
+}
+
+class FakeAPI:
+    """
+    Provides the siteinfo queries and the Title method of the API class.
+    """
+    Title = API.Title
+
+    def __init__(self):
+        self.site = Site(self)
+        self.calls = []
+
+    def call_api(self, params):
+        self.calls.append(params)
+        props = params.get("siprop")
+        props = props.split("|") if props else list(SITEINFO)
+        return {"siteinfo": dict((prop, SITEINFO[prop]) for prop in props)}
+
+class test_title_context:
+    def test_cached(self):
+        api = FakeAPI()
+        title = api.Title("user:foo")
+        assert title.namespace == "User"
+        calls = len(api.calls)
+        context = api.site.title_context
+        for name in ["Foo", "User:Bar", "wikipedia:Baz"]:
+            assert api.Title(name).context is context
+        assert len(api.calls) == calls
+
+    def test_refresh(self):
+        api = FakeAPI()
+        context = api.site.title_context
+        api.site.fetch("statistics")
+        assert api.site.title_context is context
+        api.site.fetch(["namespaces", "statistics"])
+        assert api.site.title_context is not context
+        context = api.site.title_context
+        api.site.fetch()
+        assert api.site.title_context is not context
@@ -0,0 +1,91 @@
+#! /usr/bin/env python3
+
+import gzip
+import http.server
+import json
+import threading
+
+import pytest
+
+from ws.client.connection import Connection
+from ws.client.transport import TransportStats, HTTPAdapter
+
+BODY = json.dumps({"query": {"allpages": [{"pageid": i, "title": "Page {}".format(i)} for i in range(1000)]}}).encode("utf-8")
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = BODY
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture(scope="module")
+def server_url():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:{}/api.php".format(server.server_port)
+    server.shutdown()
+    server.server_close()
+
+def _connection(url, **kwargs):
+    session = Connection.make_session(**kwargs)
+    return Connection(url, url.replace("api.php", "index.php"), session)
+
+def test_stats():
+    stats = TransportStats()
+    assert stats.compression_ratio is None
+    stats.add(responses=3, new_connections=1, wire_bytes=10, decoded_bytes=40)
+    assert stats.reused_connections == 2
+    assert stats.compression_ratio == 4
+    assert stats.as_dict()["reused_connections"] == 2
+    stats.reset()
+    assert stats.as_dict() == dict.fromkeys(stats.as_dict(), 0)
+
+def test_adapter_pool_size():
+    session = Connection.make_session(pool_connections=2, pool_maxsize=16, pool_block=True)
+    adapter = session.get_adapter("https://wiki.example.org/")
+    assert isinstance(adapter, HTTPAdapter)
+    assert adapter.poolmanager.connection_pool_kw["maxsize"] == 16
+    assert adapter.poolmanager.connection_pool_kw["block"] is True
+
+def test_compression(server_url):
+    conn = _connection(server_url)
+    assert conn.transport_stats is conn.session.get_adapter(server_url).stats
+    for i in range(3):
+        response = conn.request("GET", server_url)
+        assert response.content == BODY
+    stats = conn.transport_stats.as_dict()
+    assert stats["responses"] == 3
+    assert stats["compressed_responses"] == 3
+    assert stats["decoded_bytes"] == 3 * len(BODY)
+    assert stats["wire_bytes"] < stats["decoded_bytes"]
+    assert stats["new_connections"] == 1
+    assert stats["reused_connections"] == 2
+
+def test_no_compression(server_url):
+    conn = _connection(server_url, compression=False)
+    response = conn.request("GET", server_url)
+    assert "Content-Encoding" not in response.headers
+    stats = conn.transport_stats.as_dict()
+    assert stats["compressed_responses"] == 0
+    assert stats["wire_bytes"] == stats["decoded_bytes"] == len(BODY)
+
+def test_stream(server_url):
+    conn = _connection(server_url)
+    items = list(conn.call_api_stream("query.allpages", action="query", list="allpages"))
+    assert len(items) == 1000
+    stats = conn.transport_stats.as_dict()
+    assert stats["responses"] == 1
+    assert stats["decoded_bytes"] == len(BODY)
+    assert 0 < stats["wire_bytes"] < len(BODY)
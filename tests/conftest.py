@@ -8,6 +8,7 @@ from ws.db.database import Database
 import ws.db.schema as schema
 
 from fixtures.postgresql import *
+from fixtures.cache import *
 from fixtures.mediawiki import *
 
 # disable rate-limiting for tests
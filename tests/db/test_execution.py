@@ -0,0 +1,36 @@
+#! /usr/bin/env python3
+
+import datetime
+
+from ws.db.execution import _CopyStream, _copy_value
+
+def test_copy_value():
+    assert _copy_value(None) == "\\N"
+    assert _copy_value(True) == "t"
+    assert _copy_value(False) == "f"
+    assert _copy_value(42) == "42"
+    assert _copy_value(b"\x01\xff") == "\\\\x01ff"
+    assert _copy_value(datetime.datetime(2018, 1, 2, 3, 4, 5)) == "2018-01-02T03:04:05"
+    assert _copy_value("infinity") == "infinity"
+
+def test_copy_value_escapes():
+    assert _copy_value("a\tb\nc\rd\\e") == "a\\tb\\nc\\rd\\\\e"
+    assert _copy_value("\\N") == "\\\\N"
+
+def test_copy_stream():
+    lines = ["{}\tfoo\n".format(i) for i in range(100)]
+    stream = _CopyStream(iter(lines))
+    chunks = []
+    while True:
+        chunk = stream.read(7)
+        if not chunk:
+            break
+        assert len(chunk) <= 7
+        chunks.append(chunk)
+    assert "".join(chunks) == "".join(lines)
+
+def test_copy_stream_read_all():
+    stream = _CopyStream(iter(["a\n", "b\n"]))
+    assert stream.read(1) == "a"
+    assert stream.read() == "\nb\n"
+    assert stream.read() == ""
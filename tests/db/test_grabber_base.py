@@ -0,0 +1,75 @@
+#! /usr/bin/env python3
+
+import datetime
+import threading
+import time
+
+import pytest
+
+from ws.db.grabbers.GrabberBase import GrabberBase
+
+class FakeAPI:
+    """
+    Serves a list of log events with one event every hour.
+    """
+    def __init__(self, count=200, fail_at=None):
+        self.first = datetime.datetime(2018, 1, 1)
+        self.events = [{"logid": i + 1, "timestamp": self.first + datetime.timedelta(hours=i)} for i in range(count)]
+        self.fail_at = fail_at
+        self.threads = set()
+
+    def call_api(self, params):
+        assert params["ledir"] == "newer"
+        return {"logevents": self.events[:params["lelimit"]]}
+
+    def list(self, params, stream=False):
+        self.threads.add(threading.get_ident())
+        assert params["ledir"] == "newer"
+        end = params.get("leend", datetime.datetime.max)
+        for event in self.events:
+            if params["lestart"] <= event["timestamp"] <= end:
+                if event["logid"] == self.fail_at:
+                    raise ValueError("failed")
+                # simulate latency
+                time.sleep(0.001)
+                yield event
+
+class test_partitioned_list:
+    params = {"list": "logevents", "leprop": "ids|timestamp", "lelimit": "max"}
+
+    def test_order(self):
+        api = FakeAPI()
+        g = GrabberBase(api, None)
+        items = list(g._gen_partitioned_list(self.params, "le", 4))
+        assert items == api.events
+        assert len(api.threads) > 1
+
+    def test_empty(self):
+        api = FakeAPI(count=0)
+        g = GrabberBase(api, None)
+        assert list(g._gen_partitioned_list(self.params, "le", 4)) == []
+
+    def test_small_buffer(self):
+        api = FakeAPI()
+        g = GrabberBase(api, None)
+        g.PARTITION_BUFFER_SIZE = 2
+        items = list(g._gen_partitioned_list(self.params, "le", 3))
+        assert items == api.events
+
+    def test_error(self):
+        api = FakeAPI(fail_at=150)
+        g = GrabberBase(api, None)
+        items = []
+        with pytest.raises(ValueError):
+            for item in g._gen_partitioned_list(self.params, "le", 4):
+                items.append(item)
+        assert items == api.events[:149]
+
+    def test_early_close(self):
+        api = FakeAPI()
+        g = GrabberBase(api, None)
+        g.PARTITION_BUFFER_SIZE = 1
+        gen = g._gen_partitioned_list(self.params, "le", 4)
+        assert next(gen) == api.events[0]
+        # must not hang on the blocked workers
+        gen.close()
@@ -0,0 +1,53 @@
+#! /usr/bin/env python3
+
+import sqlalchemy as sa
+
+from ws.db.database import PoolStatistics
+
+def make_engine(tmpdir):
+    url = "sqlite:///{}".format(tmpdir.join("test.db"))
+    return sa.create_engine(url, poolclass=sa.pool.QueuePool, pool_size=2, max_overflow=1)
+
+def test_checkouts(tmpdir):
+    engine = make_engine(tmpdir)
+    stats = PoolStatistics(engine)
+    conn1 = engine.connect()
+    conn2 = engine.connect()
+    info = stats.info()
+    assert info.checkouts == 2
+    assert info.checked_out == 2
+    assert info.connections == 2
+    conn1.close()
+    conn2.close()
+    info = stats.info()
+    assert info.checked_out == 0
+    assert info.max_checked_out == 2
+    # the connections are kept in the pool
+    assert info.connections == 2
+
+def test_reuse(tmpdir):
+    engine = make_engine(tmpdir)
+    stats = PoolStatistics(engine)
+    for i in range(5):
+        with engine.connect() as conn:
+            conn.execute("SELECT 1")
+    info = stats.info()
+    assert info.checkouts == 5
+    assert info.max_checked_out == 1
+    assert info.connections == 1
+
+def test_dispose(tmpdir):
+    engine = make_engine(tmpdir)
+    stats = PoolStatistics(engine)
+    engine.connect().close()
+    assert stats.info().connections == 1
+    engine.pool.dispose()
+    assert stats.info().connections == 0
+
+def test_record_wait(tmpdir):
+    stats = PoolStatistics(make_engine(tmpdir))
+    stats.record_wait(0.5)
+    stats.record_wait(0.25)
+    info = stats.info()
+    assert info.wait_time == 0.75
+    assert info.max_wait_time == 0.5
@@ -0,0 +1,56 @@
+#! /usr/bin/env python3
+
+from ws.db.database import TitleContextCache
+from ws.parser_helpers.title import Context, Title
+
+class FakeTables:
+    """
+    Simulates the content of the ``interwiki`` and ``namespace`` tables.
+    """
+    def __init__(self):
+        self.interwikimap = {"wikipedia": {"prefix": "wikipedia", "url": "https://en.wikipedia.org/wiki/$1"}}
+        self.namespacenames = {"": 0, "Talk": 1}
+        self.namespaces = {0: {"id": 0, "case": "first-letter", "*": ""},
+                           1: {"id": 1, "case": "first-letter", "*": "Talk"}}
+        self.loads = 0
+
+    def load(self):
+        self.loads += 1
+        return Context(dict(self.interwikimap), dict(self.namespacenames), dict(self.namespaces), " %!\"$&'()*,\\-.\\/0-9:;=?@A-Z\\\\^_`a-z~\\x80-\\xFF+")
+
+def test_hits():
+    tables = FakeTables()
+    cache = TitleContextCache(tables.load)
+    for i in range(10):
+        title = Title(cache.get(), "Talk:Foo")
+        assert title.namespace == "Talk"
+    assert tables.loads == 1
+    assert cache.info() == (9, 1, 0)
+
+def test_refresh_unchanged():
+    tables = FakeTables()
+    cache = TitleContextCache(tables.load)
+    # nothing to invalidate before the first access
+    assert cache.refresh() is False
+    context = cache.get()
+    assert cache.refresh() is False
+    assert cache.get() is context
+    assert cache.info().invalidations == 0
+
+def test_refresh_changed():
+    tables = FakeTables()
+    cache = TitleContextCache(tables.load)
+    assert Title(cache.get(), "foo:Bar").iwprefix == ""
+    tables.interwikimap["foo"] = {"prefix": "foo", "url": "https://foo.example.org/$1"}
+    assert cache.refresh() is True
+    assert Title(cache.get(), "foo:Bar").iwprefix == "foo"
+    assert cache.info() == (1, 1, 1)
+
+def test_clear():
+    tables = FakeTables()
+    cache = TitleContextCache(tables.load)
+    cache.get()
+    cache.clear()
+    cache.get()
+    assert tables.loads == 2
+    assert cache.info() == (0, 2, 1)
@@ -0,0 +1,60 @@
+#! /usr/bin/env python3
+
+import pytest
+
+from ws.cache import CacheDb
+
+class FakeAPI:
+    """
+    The part of the API interface needed to create a :py:class:`ws.cache.CacheDb`.
+    """
+    def get_hostname(self):
+        return "wiki.example.org"
+
+class RevisionsDb(CacheDb):
+    """
+    A database with the same structure as :py:class:`ws.cache.AllRevisionsProps`.
+    The revisions assigned to ``new_revisions`` are added on the next update,
+    revisions with a true ``deleted`` property go into ``deletedrevisions``.
+    """
+    record_keys = {
+        "badrevids": None,
+        "revisions": "revid",
+        "deletedrevisions": "revid",
+    }
+
+    def __init__(self, api, cache_dir, storage, new_revisions=()):
+        self.new_revisions = list(new_revisions)
+        super().__init__(api, cache_dir, "RevisionsDb", storage=storage)
+
+    def init(self, key=None):
+        self.data = {"badrevids": [], "revisions": [], "deletedrevisions": []}
+        self.update()
+
+    def update(self, key=None):
+        if not self.new_revisions:
+            return
+        for collection in ["revisions", "deletedrevisions"]:
+            records = [r for r in self.new_revisions if r.get("deleted", False) == (collection == "deletedrevisions")]
+            self._merge_records(self.data[collection], records, "revid")
+            for record in records:
+                self._record_change(collection, record)
+        self.new_revisions = []
+        self._update_timestamp()
+        self.dump()
+
+@pytest.fixture(scope="function")
+def fake_api():
+    return FakeAPI()
+
+@pytest.fixture(scope="function")
+def revisions_db(tmpdir, fake_api):
+    """
+    Return a function ``make(storage, new_revisions=(), cache_dir=None)``
+    creating a :py:class:`RevisionsDb` instance stored in ``tmpdir``.
+    """
+    def make(storage, new_revisions=(), cache_dir=None):
+        return RevisionsDb(fake_api, cache_dir or str(tmpdir), storage, new_revisions)
+    return make
+
+__all__ = ("fake_api", "revisions_db")
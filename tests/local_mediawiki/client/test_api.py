@@ -138,3 +138,48 @@ class test_query_continue:
     def test_query_continue_params_kwargs(self, mediawiki):
         with pytest.raises(ValueError):
             next(mediawiki.api.query_continue(params={"foo": 0}, bar=1))
+
+class test_query_pages:
+    titles = ["Test {}".format(i) for i in range(10)]
+
+    def test_query_pages_dummy(self, mediawiki):
+        with pytest.raises(ValueError):
+            next(mediawiki.api.query_pages(prop="info"))
+        with pytest.raises(ValueError):
+            next(mediawiki.api.query_pages(titles=["Foo"], pageids=[1], prop="info"))
+        with pytest.raises(ValueError):
+            next(mediawiki.api.query_pages(titles=["Foo"], params={"titles": "Bar"}))
+
+    def test_query_pages(self, mediawiki):
+        mediawiki.clear()
+        api = mediawiki.api
+
+        for title in self.titles:
+            api.create(title, title, title)
+
+        pages = list(api.query_pages(titles=self.titles, prop="revisions|info", rvprop="content", max_workers=2))
+        assert [p["title"] for p in pages] == self.titles
+        for page in pages:
+            assert page["revisions"][0]["*"] == page["title"]
+            assert "touched" in page
+
+class test_stream:
+    titles = ["Test {}".format(i) for i in range(10)]
+
+    def test_list_stream(self, mediawiki):
+        mediawiki.clear()
+        api = mediawiki.api
+
+        for title in self.titles:
+            api.create(title, title, title)
+
+        params = {"list": "allrevisions", "arvprop": "ids|timestamp|content", "arvlimit": 3}
+        expected = list(api.list(params))
+        assert list(api.list(params, stream=True)) == expected
+
+    def test_generator_stream(self, mediawiki):
+        api = mediawiki.api
+        params = {"generator": "allpages", "gaplimit": 3}
+        expected = list(api.generator(params))
+        pages = list(api.generator(params, stream=True))
+        assert sorted(pages, key=lambda p: p["title"]) == expected
@@ -0,0 +1,49 @@
+#! /usr/bin/env python3
+
+import asyncio
+
+import pytest
+
+from ws.client.async_api import AsyncAPI
+
+async def _collect(aiter):
+    return [item async for item in aiter]
+
+class test_async_api:
+    titles = ["Test {}".format(i) for i in range(10)]
+
+    def test_invalid_concurrency(self, mediawiki):
+        with pytest.raises(ValueError):
+            AsyncAPI(mediawiki.api, max_concurrency=0)
+
+    def test_list_dummy(self, mediawiki):
+        with AsyncAPI(mediawiki.api) as aapi:
+            with pytest.raises(ValueError):
+                asyncio.run(_collect(aapi.list()))
+
+    def test_generator_dummy(self, mediawiki):
+        with AsyncAPI(mediawiki.api) as aapi:
+            with pytest.raises(ValueError):
+                asyncio.run(_collect(aapi.generator()))
+
+    def test_call_api(self, mediawiki):
+        with AsyncAPI(mediawiki.api) as aapi:
+            result = asyncio.run(aapi.call_api(action="query", meta="siteinfo"))
+        assert result == mediawiki.api.call_api(action="query", meta="siteinfo")
+
+    def test_concurrent_streams(self, mediawiki):
+        mediawiki.clear()
+        api = mediawiki.api
+
+        for title in self.titles:
+            api.create(title, title, title)
+
+        async def main(aapi):
+            lists = [_collect(aapi.list(list="allpages", aplimit=1)) for i in range(3)]
+            generators = [_collect(aapi.generator(generator="allpages", gaplimit=2)) for i in range(3)]
+            return await asyncio.gather(*lists, *generators)
+
+        with AsyncAPI(api, max_concurrency=3) as aapi:
+            results = asyncio.run(main(aapi))
+        for pages in results:
+            assert [p["title"] for p in pages] == self.titles
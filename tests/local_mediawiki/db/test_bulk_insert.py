@@ -0,0 +1,213 @@
+#! /usr/bin/env python3
+
+import datetime
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import insert
+
+from ws.db.execution import DeferrableExecutionQueue, BulkExecutionQueue
+from ws.db.grabbers.GrabberBase import GrabberBase
+import ws.db.grabbers.GrabberBase as grabber_base
+
+def _execute(db, queue_class, statements, chunk_size=1000):
+    with db.begin() as conn:
+        with queue_class(conn, chunk_size) as queue:
+            for statement, row in statements:
+                queue.execute(statement, row)
+
+def _select(db, table):
+    query = table.select().order_by(*table.primary_key.columns)
+    return [dict(row) for row in db.execute(query)]
+
+def _delete(db, *tables):
+    with db.begin() as conn:
+        for table in tables:
+            conn.execute(table.delete())
+
+def _compare(db, statements, *tables, chunk_size=1000):
+    """
+    Execute the statements with both execution queues and return the content
+    of the tables after the bulk load.
+    """
+    _execute(db, DeferrableExecutionQueue, statements, chunk_size)
+    expected = [_select(db, table) for table in tables]
+    _delete(db, *reversed(tables))
+    _execute(db, BulkExecutionQueue, statements, chunk_size)
+    result = [_select(db, table) for table in tables]
+    assert result == expected
+    return result
+
+def _user(user_id, name, **kwargs):
+    user = {
+        "user_id": user_id,
+        "user_name": name,
+        "user_registration": datetime.datetime(2018, 1, 1, 12, 0, user_id),
+        "user_password_expires": None,
+        "user_editcount": 0,
+    }
+    user.update(kwargs)
+    return user
+
+def test_do_update_last_row_wins(db):
+    ins = insert(db.user)
+    stmt = ins.on_conflict_do_update(
+                index_elements=[db.user.c.user_id],
+                set_={
+                    "user_name": ins.excluded.user_name,
+                    "user_editcount": ins.excluded.user_editcount,
+                })
+    rows = [_user(1, "A"), _user(2, "B"), _user(1, "C", user_editcount=3), _user(2, "D"), _user(1, "E", user_editcount=5)]
+    users, = _compare(db, [(stmt, row) for row in rows], db.user)
+    assert [(u["user_id"], u["user_name"], u["user_editcount"]) for u in users] == [(1, "E", 5), (2, "D", 0)]
+
+def test_do_update_across_chunks(db):
+    ins = insert(db.user)
+    stmt = ins.on_conflict_do_update(
+                index_elements=[db.user.c.user_id],
+                set_={"user_name": ins.excluded.user_name})
+    rows = [_user(i % 5, "User {}".format(i)) for i in range(23)]
+    users, = _compare(db, [(stmt, row) for row in rows], db.user, chunk_size=4)
+    assert [u["user_name"] for u in users] == ["User 20", "User 21", "User 22", "User 18", "User 19"]
+
+def test_do_update_first_row_for_other_columns(db):
+    ins = insert(db.user)
+    stmt = ins.on_conflict_do_update(
+                index_elements=[db.user.c.user_id],
+                set_={"user_name": ins.excluded.user_name})
+    # the duplicates differ in columns which are not updated
+    rows = [_user(1, "A", user_editcount=1), _user(1, "B", user_editcount=2, user_registration=None),
+            _user(3, "C", user_editcount=3), _user(1, "D", user_editcount=4)]
+    users, = _compare(db, [(stmt, row) for row in rows], db.user)
+    assert [(u["user_id"], u["user_name"], u["user_editcount"]) for u in users] == [(1, "D", 1), (3, "C", 3)]
+    assert users[0]["user_registration"] == rows[0]["user_registration"]
+
+def test_do_update_other_values(db):
+    ins = insert(db.user)
+    # the update depends on the preceding rows, COPY is not used
+    stmt = ins.on_conflict_do_update(
+                index_elements=[db.user.c.user_id],
+                set_={"user_editcount": db.user.c.user_editcount + ins.excluded.user_editcount})
+    with db.begin() as conn:
+        queue = BulkExecutionQueue(conn, 1000)
+        assert queue._is_copyable(stmt) is False
+    rows = [_user(1, "A", user_editcount=1), _user(2, "B", user_editcount=2), _user(1, "C", user_editcount=3)]
+    users, = _compare(db, [(stmt, row) for row in rows], db.user)
+    assert [(u["user_id"], u["user_name"], u["user_editcount"]) for u in users] == [(1, "A", 4), (2, "B", 2)]
+
+def test_do_nothing_first_row_wins(db):
+    stmt = insert(db.user).on_conflict_do_nothing(index_elements=[db.user.c.user_id])
+    rows = [_user(1, "A"), _user(2, "B"), _user(1, "C"), _user(3, "D"), _user(2, "E")]
+    users, = _compare(db, [(stmt, row) for row in rows], db.user)
+    assert [u["user_name"] for u in users] == ["A", "B", "D"]
+
+def test_type_decorators(db):
+    with db.begin() as conn:
+        conn.execute(db.namespace.insert(), {"ns_id": 0, "ns_case": "first-letter"})
+
+    users = [
+        _user(1, "Tab\tand\nnewline", user_password_expires=datetime.datetime.max),
+        _user(2, "Back\\slash", user_registration=None, user_password_expires=datetime.datetime(2030, 1, 1, 0, 0, 0, 700000)),
+    ]
+    archive = []
+    for revid, sha1 in enumerate(["da39a3ee5e6b4b0d3255bfef95601890afd80709", "0000000000000000000000000000000000000001"], start=1):
+        archive.append({
+            "ar_namespace": 0,
+            "ar_title": "Page {}".format(revid),
+            "ar_rev_id": revid,
+            "ar_comment": "",
+            "ar_user": 1,
+            "ar_user_text": "Tab\tand\nnewline",
+            "ar_timestamp": datetime.datetime(2018, 1, 1, 0, 0, revid),
+            "ar_sha1": sha1,
+        })
+    statements = [(db.user.insert(), row) for row in users]
+    statements += [(insert(db.archive).on_conflict_do_nothing(index_elements=[db.archive.c.ar_rev_id]), row) for row in archive]
+    users, archived = _compare(db, statements, db.user, db.archive)
+
+    assert users[0]["user_name"] == "Tab\tand\nnewline"
+    assert users[0]["user_password_expires"] == datetime.datetime.max
+    assert users[1]["user_name"] == "Back\\slash"
+    assert users[1]["user_registration"] is None
+    # MWTimestamp rounds to seconds
+    assert users[1]["user_password_expires"] == datetime.datetime(2030, 1, 1, 0, 0, 1)
+    assert [r["ar_sha1"] for r in archived] == [r["ar_sha1"] for r in archive]
+
+class UsersGrabber(GrabberBase):
+    """
+    Inserts the users and their groups, including a duplicate user.
+    """
+    INSERT_PREDELETE_TABLES = ["user_groups", "user"]
+
+    def __init__(self, api, db, users, fail=False):
+        super().__init__(api, db)
+        self.users = users
+        self.fail = fail
+
+        ins_user = insert(db.user)
+        ins_user_groups = insert(db.user_groups)
+        self.sql = {
+            ("insert", "user"):
+                ins_user.on_conflict_do_update(
+                    index_elements=[db.user.c.user_id],
+                    set_={
+                        "user_name": ins_user.excluded.user_name,
+                        "user_editcount": ins_user.excluded.user_editcount,
+                    }),
+            ("insert", "user_groups"):
+                ins_user_groups.on_conflict_do_nothing(),
+        }
+
+    def gen_insert(self):
+        for user in self.users:
+            yield self.sql["insert", "user"], _user(user["user_id"], user["user_name"], user_editcount=user["user_editcount"])
+            for group in user["groups"]:
+                yield self.sql["insert", "user_groups"], {"ug_user": user["user_id"], "ug_group": group, "ug_expiry": datetime.datetime.max}
+        if self.fail:
+            raise ValueError("failed")
+
+USERS = [{"user_id": i, "user_name": "User {}".format(i), "user_editcount": i, "groups": ["user", "bot"] if i % 3 else ["user"]}
+         for i in range(1, 50)]
+USERS.append({"user_id": 7, "user_name": "Renamed", "user_editcount": 100, "groups": ["sysop", "user"]})
+
+def _index_names(db, table):
+    return set(index["name"] for index in sa.inspect(db.engine).get_indexes(table))
+
+def test_grabber_insert(db, monkeypatch):
+    created = []
+    def create_indexes(conn, indexes):
+        created.extend(index.name for index in indexes)
+        return create_indexes_orig(conn, indexes)
+    create_indexes_orig = grabber_base.create_indexes
+    monkeypatch.setattr(grabber_base, "create_indexes", create_indexes)
+
+    indexes = {"user": _index_names(db, "user"), "user_groups": _index_names(db, "user_groups")}
+    db.chunk_size = 16
+
+    g = UsersGrabber(None, db, USERS)
+    g.BULK_INSERT = False
+    g.insert()
+    expected = [_select(db, db.user), _select(db, db.user_groups)]
+    assert created == []
+
+    g.BULK_INSERT = True
+    g.insert()
+    assert [_select(db, db.user), _select(db, db.user_groups)] == expected
+    assert expected[0][6]["user_name"] == "Renamed"
+
+    # the non-unique indexes were dropped and created again in the transaction
+    assert sorted(created) == ["ug_expiry", "ug_group", "user_email", "user_email_token"]
+    assert {"user": _index_names(db, "user"), "user_groups": _index_names(db, "user_groups")} == indexes
+
+def test_grabber_insert_rollback(db):
+    indexes = {"user": _index_names(db, "user"), "user_groups": _index_names(db, "user_groups")}
+    db.chunk_size = 16
+
+    g = UsersGrabber(None, db, USERS, fail=True)
+    with pytest.raises(ValueError):
+        g.insert()
+
+    # the rows and the dropped indexes are rolled back with the transaction
+    assert _select(db, db.user) == []
+    assert _select(db, db.user_groups) == []
+    assert {"user": _index_names(db, "user"), "user_groups": _index_names(db, "user_groups")} == indexes
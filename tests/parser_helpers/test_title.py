@@ -508,3 +508,71 @@ def test_format(title_context):
     assert title.format(sectionname=True) == "Main page#section"
     assert title.format(colon=True, iwprefix=True) == ":en:Talk:Main page"
     assert title.format(colon=True, iwprefix=True, sectionname=True) == ":en:Talk:Main page#section"
+
+
+class test_parse_cache:
+    def test_cached(self, title_context):
+        a = Title(title_context, "Talk:Foo#bar")
+        b = Title(title_context, "Talk:Foo#bar")
+        assert a == b
+        # the parsed results are shared
+        assert a._parsed is b._parsed
+        info = title_context.parse_cache_info()
+        assert info.hits == 1
+        assert info.misses == 1
+
+    def test_copy_on_write(self, title_context):
+        a = Title(title_context, "Talk:Foo#bar")
+        b = Title(title_context, "Talk:Foo#bar")
+        b.sectionname = "baz"
+        b.pagename = "Other"
+        assert str(a) == "Talk:Foo#bar"
+        assert str(b) == "Talk:Other#baz"
+        assert str(Title(title_context, "Talk:Foo#bar")) == "Talk:Foo#bar"
+
+    def test_leading_colon_kept(self, title_context):
+        title = Title(title_context, ":Category:Foo")
+        title.parse("Category:Bar")
+        assert title.leading_colon == ":"
+        assert str(Title(title_context, "Category:Bar")) == "Category:Bar"
+        assert Title(title_context, "Category:Bar").leading_colon == ""
+
+    def test_invalid(self, title_context):
+        for i in range(2):
+            with pytest.raises(InvalidTitleCharError):
+                Title(title_context, "Foo[bar]")
+
+    def test_bounded(self, title_context):
+        c = title_context
+        context = Context(c.interwikimap, c.namespacenames, c.namespaces, c.legaltitlechars, parse_cache_size=2)
+        for title in ["A", "B", "C", "A"]:
+            Title(context, title)
+        info = context.parse_cache_info()
+        assert info.currsize == 2
+        assert info.misses == 4
+
+    def test_parse_many(self, title_context):
+        titles = ["Talk:Foo", "en:Help:Bar", "Talk:Foo", "wikipedia:Baz#qux"]
+        parsed = title_context.parse_many(titles)
+        assert [str(Title.from_parsed(title_context, p)) for p in parsed] == \
+               [str(Title(title_context, t)) for t in titles]
+        assert parsed[0] is parsed[2]
+        assert title_context.parse_cache_info().misses == 3
+
+
+class test_caseless_lookup:
+    def test_find_caseless_parity(self, title_context):
+        from ws.utils import find_caseless
+        for names in [title_context.interwikimap, title_context.namespacenames]:
+            for name in names:
+                for variant in [name, name.lower(), name.upper(), name.swapcase()]:
+                    expected = find_caseless(variant, names, from_target=True)
+                    title = Title(title_context, "{}:Foo".format(variant))
+                    assert expected in {title.iwprefix, title.namespace}
+
+    def test_first_name_wins(self, title_context):
+        c = title_context
+        namespacenames = {"Foo": 100, "FOO": 101}
+        namespacenames.update(c.namespacenames)
+        context = Context(c.interwikimap, namespacenames, c.namespaces, c.legaltitlechars)
+        assert Title(context, "foo:Bar").namespace == "Foo"
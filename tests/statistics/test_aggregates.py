@@ -0,0 +1,106 @@
+#! /usr/bin/env python3
+
+import datetime
+import random
+
+import pytest
+
+from ws.statistics.UserStatsAggregates import UserStatsAggregates
+from ws.statistics.UserStatsModules import UserStatsModules
+
+def make_revisions(first, count, seed=0):
+    rnd = random.Random(seed)
+    now = datetime.datetime.utcnow()
+    timestamp = now - datetime.timedelta(days=60)
+    revisions = []
+    for revid in range(first, first + count):
+        # occasional gaps break the streaks
+        timestamp += datetime.timedelta(hours=rnd.choice([1, 5, 20, 30, 50]))
+        timestamp = min(timestamp, now)
+        revisions.append({"revid": revid, "user": "User {}".format(rnd.randrange(4)), "timestamp": timestamp,
+                          "deleted": revid % 7 == 0})
+    return revisions
+
+def assert_parity(aggregates, db, round_to_midnight):
+    expected = UserStatsModules(db, round_to_midnight=round_to_midnight)
+    aggregates.today = expected.today
+    for user in expected.revisions_groups:
+        assert aggregates.get_streaks(user) == expected.get_streaks(user)
+        assert aggregates.total_edit_count(user) == expected.total_edit_count(user)
+        assert aggregates.active_edits_per_day(user) == expected.active_edits_per_day(user)
+        registration = datetime.datetime(2017, 1, 1)
+        assert aggregates.edits_per_day(user, registration) == expected.edits_per_day(user, registration)
+    assert [r["user"] for r in aggregates] == sorted(expected.revisions_groups)
+
+@pytest.mark.parametrize("round_to_midnight", [False, True])
+def test_incremental(tmpdir, revisions_db, round_to_midnight):
+    revisions = make_revisions(1, 300)
+    cache_dir = str(tmpdir)
+    for start in range(0, 300, 100):
+        db = revisions_db("json", revisions[start:start + 100])
+        aggregates = UserStatsAggregates(db, cache_dir, round_to_midnight=round_to_midnight)
+        assert_parity(aggregates, db, round_to_midnight)
+        assert aggregates.lastrevid == start + 100
+
+def test_update_only_new(tmpdir, revisions_db, monkeypatch):
+    cache_dir = str(tmpdir)
+    db = revisions_db("json", make_revisions(1, 100))
+    UserStatsAggregates(db, cache_dir).total_edit_count("User 1")
+
+    db.new_revisions = make_revisions(101, 10, seed=1)
+    for r in db.new_revisions:
+        r["timestamp"] = datetime.datetime.utcnow()
+    aggregates = UserStatsAggregates(db, cache_dir)
+    # the aggregates must not be recomputed from all revisions
+    def fail(collections, users):
+        raise AssertionError("unexpected recomputation of {}".format(users))
+    monkeypatch.setattr(aggregates, "_user_revisions", fail)
+    assert_parity(aggregates, db, False)
+
+def test_imported_revisions(tmpdir, revisions_db):
+    cache_dir = str(tmpdir)
+    db = revisions_db("json", make_revisions(1, 100))
+    UserStatsAggregates(db, cache_dir).total_edit_count("User 1")
+
+    # a new revision older than the last edit of the user
+    old = {"revid": 101, "user": "User 1", "timestamp": datetime.datetime.utcnow() - datetime.timedelta(days=100)}
+    db = revisions_db("json", [old])
+    aggregates = UserStatsAggregates(db, cache_dir)
+    assert_parity(aggregates, db, False)
+    assert aggregates.find("User 1")["first"] == old["timestamp"]
+
+def test_pending(tmpdir, revisions_db):
+    cache_dir = str(tmpdir)
+    revisions = make_revisions(1, 100)
+    midnight = datetime.datetime(*datetime.datetime.utcnow().timetuple()[:3])
+    revisions[-1]["timestamp"] = midnight + datetime.timedelta(microseconds=1)
+    db = revisions_db("json", revisions)
+
+    aggregates = UserStatsAggregates(db, cache_dir, round_to_midnight=True)
+    # pretend that the previous update ran a day earlier
+    aggregates.today -= datetime.timedelta(days=1)
+    aggregates.total_edit_count("User 1")
+    assert aggregates.pending == sorted(r["revid"] for r in revisions if r["timestamp"] > aggregates.today)
+
+    # the pending revisions are added when they become older than the midnight
+    aggregates = UserStatsAggregates(db, cache_dir, round_to_midnight=True)
+    aggregates.today += datetime.timedelta(days=1)
+    aggregates.total_edit_count("User 1")
+    assert aggregates.pending == []
+    expected = UserStatsModules(db, round_to_midnight=False)
+    for user in expected.revisions_groups:
+        assert aggregates.total_edit_count(user) == expected.total_edit_count(user)
+
+def test_single_update(tmpdir, revisions_db, monkeypatch):
+    db = revisions_db("json", make_revisions(1, 100))
+    aggregates = UserStatsAggregates(db, str(tmpdir))
+    aggregates.total_edit_count("User 0")
+    # the accessors must not update the database of revisions again for each user
+    def fail(key=None):
+        raise AssertionError("unexpected update of the revisions database")
+    monkeypatch.setattr(db, "update", fail)
+    for user in ["User {}".format(i) for i in range(4)]:
+        aggregates.get_streaks(user)
+        aggregates.total_edit_count(user)
+        aggregates.active_edits_per_day(user)
+        aggregates.edits_per_day(user, datetime.datetime(2017, 1, 1))
@@ -0,0 +1,77 @@
+#! /usr/bin/env python3
+
+import datetime
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from ws.cache.columnar import RevisionTable
+from ws.statistics.UserStatsArrays import UserStatsArrays, compute_user_stats
+from ws.statistics.UserStatsModules import UserStatsModules
+
+def make_revisions(count, users=10, seed=0):
+    rnd = random.Random(seed)
+    now = datetime.datetime.utcnow().replace(microsecond=0)
+    revisions = []
+    for revid in range(1, count + 1):
+        # clustered edits with random gaps, some of them in the future
+        ago = datetime.timedelta(days=rnd.choice([0, 1, 2, 3, 5, 30, 200]), hours=rnd.randrange(48), seconds=rnd.randrange(3600))
+        revisions.append({
+            "revid": revid,
+            "user": "User {}".format(rnd.randrange(users)),
+            "timestamp": now - ago + datetime.timedelta(hours=2),
+        })
+    return revisions
+
+def split(revisions):
+    return {
+        "revisions": [r for r in revisions if r["revid"] % 5 != 0],
+        "deletedrevisions": [r for r in revisions if r["revid"] % 5 == 0],
+    }
+
+def assert_parity(arrays, expected):
+    arrays.today = expected.today
+    assert list(arrays.stats["users"]) == sorted(expected.revisions_groups)
+    registration = datetime.datetime(2017, 1, 1)
+    for user, revisions in expected.revisions_groups.items():
+        assert arrays.get_streaks(user) == expected.get_streaks(user)
+        assert arrays.total_edit_count(user) == expected.total_edit_count(user)
+        assert arrays.active_edits_per_day(user) == expected.active_edits_per_day(user)
+        assert arrays.edits_per_day(user, registration) == expected.edits_per_day(user, registration)
+        assert arrays.active_days(user) == len(set(r["timestamp"].date() for r in revisions))
+
+@pytest.mark.parametrize("round_to_midnight", [False, True])
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_parity(round_to_midnight, seed):
+    db = split(make_revisions(2000, seed=seed))
+    expected = UserStatsModules(db, round_to_midnight=round_to_midnight)
+    arrays = UserStatsArrays(db, round_to_midnight=round_to_midnight)
+    assert_parity(arrays, expected)
+
+def test_columnar():
+    db = split(make_revisions(1000))
+    expected = UserStatsModules(db)
+    tables = dict((name, RevisionTable.from_records(revisions)) for name, revisions in db.items())
+    assert_parity(UserStatsArrays(tables), expected)
+
+def test_fractional_seconds():
+    base = datetime.datetime(2018, 1, 1)
+    revisions = [
+        {"revid": 1, "user": "A", "timestamp": base + datetime.timedelta(microseconds=500000)},
+        {"revid": 2, "user": "A", "timestamp": base + datetime.timedelta(days=1, microseconds=400000)},
+    ]
+    db = {"revisions": revisions, "deletedrevisions": []}
+    assert_parity(UserStatsArrays(db), UserStatsModules(db))
+
+def test_hidden_users():
+    revisions = make_revisions(100)
+    hidden = {"revid": 101, "timestamp": revisions[0]["timestamp"], "userhidden": ""}
+    arrays = UserStatsArrays({"revisions": revisions + [hidden], "deletedrevisions": []})
+    assert arrays.stats["editcount"].sum() == 100
+
+def test_empty():
+    stats = compute_user_stats(np.array([], dtype=object), np.array([], dtype="datetime64[s]"), datetime.datetime.utcnow())
+    assert len(stats["users"]) == 0
+    assert len(stats["longest_length"]) == 0
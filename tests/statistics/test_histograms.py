@@ -0,0 +1,99 @@
+#! /usr/bin/env python3
+
+import datetime
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from ws.cache.columnar import RevisionTable
+from ws.statistics.histograms import bin_timestamps, histogram
+
+def make_revisions(count, seed=0):
+    rnd = random.Random(seed)
+    base = datetime.datetime(2016, 11, 20)
+    revisions = []
+    for revid in range(1, count + 1):
+        revision = {
+            "revid": revid,
+            "user": "User {}".format(rnd.randrange(30)),
+            "timestamp": base + datetime.timedelta(minutes=rnd.randrange(60 * 24 * 400)),
+        }
+        if revid % 50 == 0:
+            del revision["user"]
+            revision["userhidden"] = ""
+        revisions.append(revision)
+    revisions.sort(key=lambda r: r["timestamp"])
+    return revisions
+
+def period_start(timestamp, period):
+    date = timestamp.date()
+    if period == "day":
+        return date
+    if period == "week":
+        return date - datetime.timedelta(days=date.weekday())
+    return date.replace(day=1)
+
+def naive_histogram(revisions, period):
+    edits = {}
+    users = {}
+    for revision in revisions:
+        start = period_start(revision["timestamp"], period)
+        edits[start] = edits.get(start, 0) + 1
+        users.setdefault(start, set())
+        if "user" in revision:
+            users[start].add(revision["user"])
+    return edits, dict((start, len(names)) for start, names in users.items())
+
+def as_dict(bin_edges, values):
+    return dict((edge, value) for edge, value in zip(bin_edges[:-1], values) if value > 0)
+
+@pytest.mark.parametrize("period", ["day", "week", "month"])
+def test_histogram(period):
+    revisions = make_revisions(3000)
+    hist = histogram(revisions, period=period)
+    edits, users = naive_histogram(revisions, period)
+    assert as_dict(hist.bin_edges, hist.edits) == edits
+    assert as_dict(hist.bin_edges, hist.users) == dict((k, v) for k, v in users.items() if v > 0)
+    assert len(hist.bin_edges) == len(hist.edits) + 1
+    assert all(isinstance(edge, datetime.date) for edge in hist.bin_edges)
+    assert hist.bin_edges[0] == period_start(revisions[0]["timestamp"], period)
+    assert hist.bin_edges[-2] == period_start(revisions[-1]["timestamp"], period)
+    assert hist.categories is None
+
+def test_week_edges():
+    timestamps = np.array(["2018-01-07T23:59:59", "2018-01-08T00:00:00"], dtype="datetime64[s]")
+    bins, edges = bin_timestamps(timestamps, "week")
+    assert list(bins) == [0, 1]
+    assert list(edges.astype(datetime.date)) == [datetime.date(2018, 1, 1), datetime.date(2018, 1, 8), datetime.date(2018, 1, 15)]
+    with pytest.raises(ValueError):
+        bin_timestamps(timestamps, "year")
+
+def test_split():
+    revisions = make_revisions(3000)
+    split_by = lambda r: r["revid"] % 3
+    hist = histogram(revisions, period="month", split_by=split_by)
+    assert list(hist.categories) == [0, 1, 2]
+    assert hist.edits.shape == (3, len(hist.bin_edges) - 1)
+    assert (hist.edits.sum(axis=0) == histogram(revisions, period="month").edits).all()
+    for i, category in enumerate(hist.categories):
+        subset = [r for r in revisions if split_by(r) == category]
+        edits, users = naive_histogram(subset, "month")
+        assert as_dict(hist.bin_edges, hist.edits[i]) == edits
+        assert as_dict(hist.bin_edges, hist.users[i]) == dict((k, v) for k, v in users.items() if v > 0)
+
+def test_revision_table():
+    revisions = make_revisions(1000)
+    table = RevisionTable.from_records(sorted(revisions, key=lambda r: r["revid"]))
+    hist = histogram(table, period="week")
+    expected = histogram(revisions, period="week")
+    assert list(hist.bin_edges) == list(expected.bin_edges)
+    assert (hist.edits == expected.edits).all()
+    assert (hist.users == expected.users).all()
+
+def test_empty():
+    hist = histogram([], period="day")
+    assert len(hist.bin_edges) == 0
+    assert len(hist.edits) == 0
+    assert len(hist.users) == 0
@@ -1,5 +1,7 @@
 #! /usr/bin/env python3
 
+import datetime
+
 import pytest
 
 from ws.utils import *
@@ -85,6 +87,34 @@ class test_bisect_insert_or_replace:
         bisect_insert_or_replace(l, "Daisy", {"name": "Daisy", "id": 2}, wrapped_names)
         assert l == expected
 
+class test_merge_sorted:
+    def test_values(self):
+        l = [1, 3, 5]
+        merge_sorted(l, [4, 0, 3, 7])
+        assert l == [0, 1, 3, 4, 5, 7]
+        merge_sorted(l, [])
+        assert l == [0, 1, 3, 4, 5, 7]
+        merge_sorted(l, [9, 8])
+        assert l == [0, 1, 3, 4, 5, 7, 8, 9]
+
+    @pytest.mark.parametrize("seed", range(5))
+    def test_parity(self, seed):
+        import random
+        rnd = random.Random(seed)
+        l1 = [{"id": i, "v": 0} for i in sorted(rnd.sample(range(100), 30))]
+        l2 = list(l1)
+        new = [{"id": rnd.randrange(120), "v": i} for i in range(40)]
+        for element in new:
+            bisect_insert_or_replace(l1, element["id"], element, ListOfDictsAttrWrapper(l1, "id"))
+        merge_sorted(l2, new, attr="id")
+        assert l1 == l2
+
+    def test_append(self):
+        l = [{"id": 1}]
+        merged = [{"id": 3}, {"id": 2}]
+        merge_sorted(l, merged, attr="id")
+        assert l == [{"id": 1}, {"id": 2}, {"id": 3}]
+
 class test_dmerge:
     def test_type(self):
         with pytest.raises(TypeError):
@@ -184,3 +214,123 @@ class test_gen_nested_values:
             ([1, "c", "f", 1, "j"], "k"),
         ]
         assert result == expected
+
+class test_parse_api_timestamps:
+    response = {
+        "batchcomplete": "",
+        "continue": {"arvcontinue": "20140825142659|42", "continue": "-||"},
+        "query": {
+            "allrevisions": [
+                {
+                    "pageid": 1,
+                    "title": "2014-08-25T14:26:59Z",
+                    "touched": "2015-01-02T03:04:05Z",
+                    "revisions": [
+                        {"revid": 1, "timestamp": "2014-08-25T14:26:59Z", "comment": "infinity", "*": "text"},
+                        {"revid": 2, "timestamp": "2014-08-25T14:27:00Z", "comment": "", "*": ""},
+                    ],
+                    "protection": [{"type": "edit", "level": "sysop", "expiry": "infinity"}],
+                },
+            ],
+            "logevents": [
+                {"logid": 1, "timestamp": "2014-08-25T14:26:59Z",
+                 "params": {"mergepoint": "2014-08-25T14:00:00Z", "expiry": "indefinite",
+                            "details": [{"type": "edit", "expiry": "2099-01-01T00:00:00Z"}]}},
+            ],
+            "users": [
+                {"name": "Foo", "registration": "2010-10-10T10:10:10Z", "blockexpiry": "-infinity",
+                 "groupmemberships": [{"group": "sysop", "expiry": "infinity"}]},
+            ],
+        },
+    }
+
+    def _expected(self):
+        import copy
+        expected = copy.deepcopy(self.response)
+        parse_timestamps_in_struct(expected)
+        # values of other keys are not converted
+        expected["query"]["allrevisions"][0]["title"] = "2014-08-25T14:26:59Z"
+        expected["query"]["allrevisions"][0]["revisions"][0]["comment"] = "infinity"
+        return expected
+
+    def test_parity(self):
+        import copy
+        result = copy.deepcopy(self.response)
+        parse_api_timestamps(result)
+        assert result == self._expected()
+        assert result["query"]["allrevisions"][0]["revisions"][0]["timestamp"] == datetime.datetime(2014, 8, 25, 14, 26, 59)
+        assert result["query"]["logevents"][0]["params"]["expiry"] is None
+        assert result["query"]["users"][0]["blockexpiry"] == datetime.datetime.min
+        assert result["query"]["users"][0]["groupmemberships"][0]["expiry"] == datetime.datetime.max
+
+    def test_keys(self):
+        import copy
+        result = copy.deepcopy(self.response)
+        parse_api_timestamps(result, keys={"registration"})
+        assert result["query"]["users"][0]["registration"] == datetime.datetime(2010, 10, 10, 10, 10, 10)
+        assert result["query"]["allrevisions"][0]["touched"] == "2015-01-02T03:04:05Z"
+        # suffixes are always recognized
+        assert result["query"]["allrevisions"][0]["revisions"][0]["timestamp"] == datetime.datetime(2014, 8, 25, 14, 26, 59)
+
+    def test_list_elements(self):
+        import copy
+        result = {"query": {"foo": ["2014-08-25T14:26:59Z", "infinity", "-Infinity", "indefinite", "Foo"]}}
+        expected = copy.deepcopy(result)
+        parse_timestamps_in_struct(expected)
+        parse_api_timestamps(result)
+        assert result == expected
+        assert result["query"]["foo"] == [datetime.datetime(2014, 8, 25, 14, 26, 59), datetime.datetime.max,
+                                          datetime.datetime.min, None, "Foo"]
+
+    @pytest.mark.parametrize("params, response", [
+        ({"action": "query", "list": "logevents"},
+         {"query": {"logevents": [
+             {"logid": 1, "type": "merge", "timestamp": "2014-08-25T14:26:59Z",
+              "params": {"dest_ns": 0, "dest_title": "Foo", "mergepoint": "2014-08-25T14:00:00Z"}},
+             {"logid": 2, "type": "block", "timestamp": "2014-08-25T14:27:00Z",
+              "params": {"duration": "infinity", "flags": ["nocreate"]}},
+             {"logid": 3, "type": "rights", "timestamp": "2014-08-25T14:28:00Z",
+              "params": {"oldgroups": [], "newgroups": ["sysop"], "newmetadata": [{"group": "sysop", "expiry": "infinity"}]}},
+         ]}}),
+        ({"action": "query", "list": "recentchanges"},
+         {"query": {"recentchanges": [
+             {"type": "log", "rcid": 1, "timestamp": "2014-08-25T14:26:59Z", "logtype": "merge",
+              "logparams": {"dest_ns": 0, "dest_title": "Foo", "mergepoint": "2014-08-25T14:00:00Z"}},
+             {"type": "log", "rcid": 2, "timestamp": "2014-08-25T14:27:00Z", "logtype": "block",
+              "logparams": {"duration": "infinity", "expiry": "indefinite", "flags": ["nocreate"]}},
+             {"type": "log", "rcid": 3, "timestamp": "2014-08-25T14:28:00Z", "logtype": "protect",
+              "logparams": {"description": "[edit=sysop] (indefinite)", "details": [{"type": "edit", "level": "sysop", "expiry": "infinity"}]}},
+         ]}}),
+    ])
+    def test_log_params(self, params, response):
+        import copy
+        expected = copy.deepcopy(response)
+        parse_timestamps_in_struct(expected)
+        parse_api_timestamps(response, keys=api_timestamp_keys(params))
+        assert response == expected
+
+    def test_module_keys(self):
+        import copy
+        result = copy.deepcopy(self.response)
+        keys = api_timestamp_keys({"action": "query", "list": "allrevisions", "prop": ["info"]})
+        assert keys == API_TIMESTAMP_KEYS["allrevisions"] | API_TIMESTAMP_KEYS["info"]
+        parse_api_timestamps(result, keys=keys)
+        assert result["query"]["allrevisions"][0]["touched"] == datetime.datetime(2015, 1, 2, 3, 4, 5)
+        # registration is not a key of the queried modules
+        assert result["query"]["users"][0]["registration"] == "2010-10-10T10:10:10Z"
+
+def test_api_timestamp_keys():
+    assert api_timestamp_keys({"action": "query", "list": "users|allusers"}) == API_TIMESTAMP_KEYS["users"]
+    assert api_timestamp_keys({"action": "query", "meta": "siteinfo"}) == {"time"}
+    assert api_timestamp_keys({"action": "edit"}) == {"newtimestamp"}
+    # unknown modules fall back to all keys
+    assert api_timestamp_keys({"action": "query", "list": "allpages"}) is None
+    assert api_timestamp_keys({"action": "parse"}) is None
+
+def test_serialize_api_params():
+    ts = datetime.datetime(2014, 8, 25, 14, 26, 59)
+    params = {"action": "query", "arvstart": ts, "titles": ["Foo", "Bar"], "foo": (ts, "bar")}
+    result = serialize_api_params(params)
+    assert result == {"action": "query", "arvstart": "2014-08-25T14:26:59Z", "titles": ["Foo", "Bar"], "foo": ("2014-08-25T14:26:59Z", "bar")}
+    # the original is not modified
+    assert params["arvstart"] is ts
@@ -0,0 +1,42 @@
+#! /usr/bin/env python3
+
+import io
+
+import pytest
+
+from ws.utils.json import iter_json_items
+
+pytest.importorskip("ijson")
+
+def _decode(document, path):
+    items = []
+    gen = iter_json_items(io.BytesIO(document.encode("utf-8")), path)
+    while True:
+        try:
+            items.append(next(gen))
+        except StopIteration as e:
+            return items, e.value
+
+def test_array():
+    doc = '{"continue": {"continue": "-||", "arvcontinue": "5"}, "query": {"allrevisions": [{"pageid": 1, "revisions": [{"revid": 1}]}, {"pageid": 2, "revisions": []}]}}'
+    items, rest = _decode(doc, "query.allrevisions")
+    assert items == [{"pageid": 1, "revisions": [{"revid": 1}]}, {"pageid": 2, "revisions": []}]
+    assert rest == {"continue": {"continue": "-||", "arvcontinue": "5"}, "query": {"allrevisions": []}}
+
+def test_object():
+    doc = '{"query": {"pages": {"12": {"title": "Foo"}, "-1": {"title": "Bar", "missing": ""}}}, "batchcomplete": ""}'
+    items, rest = _decode(doc, "query.pages")
+    assert items == [{"title": "Foo"}, {"title": "Bar", "missing": ""}]
+    assert rest == {"query": {"pages": {}}, "batchcomplete": ""}
+
+def test_scalars_and_numbers():
+    doc = '{"query": {"list": [1, 2.5, "foo", null, [true, false]]}}'
+    items, rest = _decode(doc, "query.list")
+    assert items == [1, 2.5, "foo", None, [True, False]]
+    assert isinstance(items[1], float)
+
+def test_missing_path():
+    doc = '{"error": {"code": "badvalue", "info": "..."}}'
+    items, rest = _decode(doc, "query.allrevisions")
+    assert items == []
+    assert rest == {"error": {"code": "badvalue", "info": "..."}}
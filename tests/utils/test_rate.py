@@ -35,3 +35,143 @@
 #    def test_4(self):
 #        for i in range(round(self.rate * 2.5)):
 #            self.func()
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from ws.utils.rate import TokenBucket, RateLimiter, AdaptiveThrottle
+
+class test_token_bucket:
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            TokenBucket(0, 1)
+
+    def test_burst(self):
+        bucket = TokenBucket(10, 100)
+        for i in range(10):
+            assert bucket.reserve() == 0
+        assert bucket.budget < 1
+        assert bucket.throttled_time == 0
+
+    def test_smoothing(self):
+        bucket = TokenBucket(10, 100)
+        for i in range(10):
+            bucket.reserve()
+        # one token is refilled every 10 seconds, the waiting callers are queued
+        first = bucket.reserve()
+        second = bucket.reserve()
+        assert 9 < first <= 10
+        assert 19 < second <= 20
+        assert bucket.throttled_time == pytest.approx(first + second)
+
+    def test_acquire(self):
+        bucket = TokenBucket(100, 1, burst=1)
+        assert bucket.acquire() == 0
+        assert 0 < bucket.acquire() <= 0.01
+        assert 0 < asyncio.run(bucket.acquire_async()) <= 0.01
+
+class test_rate_limiter:
+    def test_buckets(self):
+        limiter = RateLimiter()
+        assert limiter.get_bucket("a", "read") is limiter.get_bucket("a", "read")
+        assert limiter.get_bucket("a", "read") is not limiter.get_bucket("b", "read")
+        assert limiter.get_bucket("a", "read") is not limiter.get_bucket("a", "edit")
+        assert limiter.budget("a", "edit") == pytest.approx(1)
+        with pytest.raises(ValueError):
+            limiter.get_bucket("a", "foo")
+
+    def test_set_limit(self):
+        limiter = RateLimiter()
+        limiter.set_limit("read", 5, 1)
+        limiter.set_limit("read", 20, 1, host="b")
+        assert limiter.get_bucket("a", "read").rate == 5
+        assert limiter.get_bucket("b", "read").rate == 20
+
+    def test_throttled_time(self):
+        limiter = RateLimiter({"read": (1, 100), "edit": (1, 100)})
+        for host in ["a", "b"]:
+            for action_class in ["read", "edit"]:
+                bucket = limiter.get_bucket(host, action_class)
+                bucket.reserve()
+                bucket.reserve()
+        assert limiter.throttled_time() == pytest.approx(400, rel=1e-3)
+        assert limiter.throttled_time(host="a") == pytest.approx(200, rel=1e-3)
+        assert limiter.throttled_time(action_class="edit") == pytest.approx(200, rel=1e-3)
+
+class test_adaptive_throttle:
+    def test_increase(self):
+        bucket = TokenBucket(10, 1)
+        throttle = AdaptiveThrottle(bucket, target_latency=1, allow_increase=True, max_concurrency=3)
+        for i in range(100):
+            throttle.on_success(0.1)
+        assert bucket.rate == throttle.max_rate == 50
+        assert throttle.concurrency == 3
+
+    def test_no_increase_by_default(self):
+        bucket = TokenBucket(10, 1)
+        throttle = AdaptiveThrottle(bucket, target_latency=1)
+        for i in range(100):
+            throttle.on_success(0.1)
+        assert bucket.rate == throttle.max_rate == 10
+        # the rate recovers after a back-off, but only up to the configured rate
+        throttle.on_overload()
+        assert bucket.rate == 5
+        for i in range(100):
+            throttle.on_success(0.1)
+        assert bucket.rate == 10
+
+    def test_initial_concurrency(self):
+        assert AdaptiveThrottle(TokenBucket(10, 1)).concurrency == 4
+        assert AdaptiveThrottle(TokenBucket(10, 1), max_concurrency=2).concurrency == 2
+
+    def test_shared_throttle(self):
+        limiter = RateLimiter()
+        throttle = limiter.get_throttle("a", "read", allow_increase=True)
+        assert limiter.get_throttle("a", "read") is throttle
+        assert limiter.get_throttle("b", "read") is not throttle
+        for i in range(100):
+            throttle.on_success(0.1)
+        # the bounds are computed from the configured rate, not the current one
+        assert limiter.get_bucket("a", "read").rate == 50
+        assert throttle.max_rate == 50
+        limiter.set_limit("read", 5, 1, host="a")
+        assert limiter.get_throttle("a", "read") is not throttle
+        assert limiter.get_throttle("a", "read").max_rate == 5
+
+    def test_slow(self):
+        bucket = TokenBucket(10, 1)
+        throttle = AdaptiveThrottle(bucket, target_latency=1)
+        throttle.on_success(5)
+        assert bucket.rate == pytest.approx(9)
+        for i in range(100):
+            throttle.on_success(5)
+        assert bucket.rate == throttle.min_rate == 1
+
+    def test_overload(self):
+        bucket = TokenBucket(10, 1)
+        throttle = AdaptiveThrottle(bucket, max_concurrency=8)
+        throttle.concurrency = 8
+        throttle.on_overload()
+        assert bucket.rate == 5
+        assert throttle.concurrency == 4
+
+    def test_concurrency_limit(self):
+        throttle = AdaptiveThrottle(TokenBucket(10, 1), max_concurrency=2)
+        throttle.concurrency = 2
+        entered = []
+
+        def worker(i):
+            with throttle:
+                entered.append(throttle._in_flight)
+                time.sleep(0.01)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(entered) == 6
+        assert max(entered) <= 2
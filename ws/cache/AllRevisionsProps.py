@@ -3,6 +3,7 @@
 import logging
 
 from . import CacheDb, CacheDbError
+from .storage import STORAGE_BACKENDS
 from .. import utils
 
 logger = logging.getLogger(__name__)
@@ -19,7 +20,24 @@ __all__ = ["AllRevisionsProps"]
 # to also check the merge log.
 
 class AllRevisionsProps(CacheDb):
-    def __init__(self, api, cache_dir, autocommit=True):
+    """
+    Properties of all revisions on the wiki.
+
+    The ``"revisions"`` and ``"deletedrevisions"`` collections are lists of
+    revision dictionaries sorted by the revision ID. With the ``"columnar"``
+    storage (the default when :py:mod:`numpy` is available), they are
+    :py:class:`ws.cache.columnar.RevisionTable` objects which behave like
+    lists, but provide also fast access to whole columns. Otherwise the
+    ``"segmented"`` storage is used by default.
+    """
+
+    record_keys = {
+        "badrevids": None,
+        "revisions": "revid",
+        "deletedrevisions": "revid",
+    }
+
+    def __init__(self, api, cache_dir, autocommit=True, storage=None, max_age=None):
         # check for necessary rights
         if "deletedhistory" in api.user.rights:
             self.deletedrevisions = True
@@ -27,7 +45,9 @@ class AllRevisionsProps(CacheDb):
             logger.warning("The current user does not have the 'deletedhistory' right. Properties of deleted revisions will not be available.")
             self.deletedrevisions = False
 
-        super().__init__(api, cache_dir, "AllRevisionsProps", autocommit)
+        if storage is None:
+            storage = "columnar" if "columnar" in STORAGE_BACKENDS else "segmented"
+        super().__init__(api, cache_dir, "AllRevisionsProps", autocommit, storage, max_age)
 
     def init(self, key=None):
         """
@@ -77,10 +97,6 @@ class AllRevisionsProps(CacheDb):
         :param first: (int) revision ID to start fetching from
         :param last: (int) revision ID to end fetching
         """
-        # not necessary to wrap in each iteration since lists are mutable
-        wrapped_revids = utils.ListOfDictsAttrWrapper(self.data["revisions"], "revid")
-        wrapped_deletedrevids = utils.ListOfDictsAttrWrapper(self.data["deletedrevisions"], "revid")
-
         for chunk in utils.list_chunks(range(first, last + 1), self.api.max_ids_per_query):
             logger.info("Fetching revids %s-%s" % (chunk[0], chunk[-1]))
             revids = "|".join(str(x) for x in chunk)
@@ -90,18 +106,16 @@ class AllRevisionsProps(CacheDb):
                 result = self.api.call_api(action="query", revids=revids, prop="revisions")
 
             # TODO: what is the meaning of badrevids?
-            badrevids = result.get("badrevids", {})
-            for _, badrev in badrevids.items():
-                utils.bisect_insert_or_replace(self.data["badrevids"], badrev["revid"])
-
-            pages = result.get("pages", {})
-            for _, page in pages.items():
-                # handle normal revisions
-                revisions = page.get("revisions", [])
-                for r in revisions:
-                    utils.bisect_insert_or_replace(self.data["revisions"], r["revid"], data_element=r, index_list=wrapped_revids)
-
-                # handle deleted revisions
-                deletedrevisions = page.get("deletedrevisions", [])
-                for r in deletedrevisions:
-                    utils.bisect_insert_or_replace(self.data["deletedrevisions"], r["revid"], data_element=r, index_list=wrapped_deletedrevids)
+            badrevids = [badrev["revid"] for badrev in result.get("badrevids", {}).values()]
+
+            # gather the whole chunk and merge it into the sorted collections at once
+            revisions = []
+            deletedrevisions = []
+            for page in result.get("pages", {}).values():
+                revisions.extend(page.get("revisions", []))
+                deletedrevisions.extend(page.get("deletedrevisions", []))
+
+            for collection, records in [("badrevids", badrevids), ("revisions", revisions), ("deletedrevisions", deletedrevisions)]:
+                self._merge_records(self.data[collection], records, self.record_keys[collection])
+                for record in records:
+                    self._record_change(collection, record)
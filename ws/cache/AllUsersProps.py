@@ -11,10 +11,60 @@ logger = logging.getLogger(__name__)
 
 __all__ = ["AllUsersProps"]
 
+# format of the timestamps in the continuation parameters of the API
+_CONTINUE_FORMAT = "%Y%m%d%H%M%S"
+# format of the timestamps of the recent edits in the meta data
+_RECENT_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+def _format_continue(timestamp, id_):
+    """
+    Format a continuation parameter (``rccontinue`` or ``lecontinue``)
+    pointing to the first entry at or after the given timestamp and ID.
+    """
+    return "{}|{}".format(timestamp.strftime(_CONTINUE_FORMAT), id_)
+
+def _parse_continue(value):
+    timestamp, id_ = value.split("|")
+    return datetime.datetime.strptime(timestamp, _CONTINUE_FORMAT), int(id_)
+
 class AllUsersProps(CacheDb):
+    """
+    Properties of all users on the wiki. The database is a list of users
+    sorted by the name, individual users can be looked up with
+    :py:meth:`find() <ws.cache.CacheDb.find>`. The database is saved in the
+    ``"keyed"`` storage by default, so the lookups load only the necessary
+    parts of the database.
+
+    After the initialization, the database is updated from a change feed: the
+    recent changes and the log events since the last update are read using
+    the ``rccontinue`` and ``lecontinue`` cursors persisted in the meta data.
+    The edits are applied as deltas to the ``"editcount"`` and
+    ``"recenteditcount"`` properties, the changes of user groups from the
+    ``rights`` log are applied to the ``"groups"`` property and only the
+    users affected by the ``newusers`` and ``block`` logs are queried again.
+    The timestamps of the edits in the active window are kept in the meta
+    data to update the recent edit counts when the window moves.
+
+    Since the edit counts in MediaWiki include also some log actions, the
+    ``"editcount"`` property may slightly differ from the value which would
+    be queried from the API; it is corrected whenever the user is queried
+    again.
+    """
+
+    record_keys = {
+        None: "name",
+    }
+
+    #: log types which affect the properties of the users
+    log_types = ["newusers", "rights", "block"]
 
-    def __init__(self, api, cache_dir, autocommit=True, active_days=30, round_to_midnight=False):
+    def __init__(self, api, cache_dir, autocommit=True, active_days=30, round_to_midnight=False, storage="keyed", max_age=None):
         """
+        :param storage:
+            name of the storage backend, see :py:class:`ws.cache.CacheDb`
+        :param max_age:
+            maximum age of the data which is used without an update, see
+            :py:class:`ws.cache.CacheDb`
         :param active_days:
             the time span in days to consider users as active
         :param round_to_midnight:
@@ -25,20 +75,24 @@ class AllUsersProps(CacheDb):
         self.round_to_midnight = round_to_midnight
         self.active_days = active_days
 
-        super().__init__(api, cache_dir, "AllUsersProps", autocommit)
+        super().__init__(api, cache_dir, "AllUsersProps", autocommit, storage, max_age)
 
     def init(self, key=None):
         """
         :param key: ignored
         """
         logger.info("Initializing AllUsersProps cache...")
+        start = datetime.datetime.utcnow()
+        # the log events since now are applied in the next update
+        self.meta["lecontinue"] = dict((letype, _format_continue(start, 0)) for letype in self.log_types)
         allusers = self.api.list(list="allusers", aulimit="max", auprop="blockinfo|groups|editcount|registration")
         # the generator yields data sorted by user name
         self.data = list(allusers)
+        self.meta.pop("recentusers", None)
 
+        self._init_recent_changes()
         try:
-            rcusers = self._find_active_users()
-            self._update_recent_edit_counts(rcusers)
+            self._update_recent_edit_counts()
         except ShortRecentChangesError:
             pass
 
@@ -51,96 +105,210 @@ class AllUsersProps(CacheDb):
         """
         :param key: ignored
         """
-        users = self._find_changed_users()
+        if "rccontinue" not in self.meta or "lecontinue" not in self.meta:
+            logger.info("The AllUsersProps cache does not have the change feed cursors, starting from scratch.")
+            self.init()
+            return
+
         try:
-            rcusers = self._find_active_users()
-            # extend the list to update editcount for active users
-            users += list(rcusers)
+            editcounts = self._read_recent_changes()
         except ShortRecentChangesError:
-            logger.warning("The recent changes table on the wiki has been recently purged, starting from scratch. The recent edit count will not be available.")
+            logger.warning("The recent changes table on the wiki has been purged since the last update, starting from scratch.")
             self.init()
             return
+        modified = self._read_log_events()
 
-        if len(users) > 0:
-            logger.info("Fetching properties of {} possibly modified user accounts...".format(len(users)))
-            wrapped_names = utils.ListOfDictsAttrWrapper(self.data, "name")
+        for name, count in sorted(editcounts.items()):
+            try:
+                user = self._find_record(self.data, name, "name")
+            except KeyError:
+                # new users are fetched from the newusers log
+                continue
+            user["editcount"] += count
+            self._record_change(None, user)
 
-            for snippet in utils.list_chunks(users, self.api.max_ids_per_query):
+        fetched = []
+        if modified:
+            logger.info("Fetching properties of {} possibly modified user accounts...".format(len(modified)))
+            for snippet in utils.list_chunks(sorted(modified), self.api.max_ids_per_query):
                 for user in self.api.list(list="users", ususers="|".join(snippet), usprop="blockinfo|groups|editcount|registration"):
                     # skip invalid users (the logs might point to non-existing users)
                     if "invalid" in user or "missing" in user:
                         continue
-                    utils.bisect_insert_or_replace(self.data, user["name"], data_element=user, index_list=wrapped_names)
-
-            self._update_recent_edit_counts(rcusers)
-
-            self._update_timestamp()
+                    # keep the recent edit count until it is updated below
+                    try:
+                        old = self._find_record(self.data, user["name"], "name")
+                        if "recenteditcount" in old:
+                            user["recenteditcount"] = old["recenteditcount"]
+                    except KeyError:
+                        pass
+                    fetched.append(user)
+            self._merge_records(self.data, fetched, "name")
+            for user in fetched:
+                self._record_change(None, user)
 
-            if self.autocommit is True:
-                self.dump()
+        # only the users who were recently active or whose records were
+        # replaced may have a different recent edit count
+        names = self.meta.get("recentusers")
+        if names is not None:
+            names = set(names) | set(self.meta["recentedits"]) | set(user["name"] for user in fetched)
+        try:
+            self._update_recent_edit_counts(names)
+        except ShortRecentChangesError:
+            logger.warning("The recent changes do not cover the last {} days yet, the recent edit count will not be available.".format(self.active_days))
 
-    # NOTE:
-    # this is not available in recentchanges - although there is rctype=log
-    # parameter, rcprop=loginfo provides only user IDs, which can't be used
-    # in list=users
-    def _find_changed_users(self):
-        """
-        Find users whose properties may have changed since the last update.
-        Changes to edit counts are not taken into account.
+        self._update_timestamp()
 
-        :returns: list of user names
-        """
-        lestart = self.timestamp
-        users = []
-        for letype in ["newusers", "rights", "block"]:
-            for user in self.api.list(list="logevents", letype=letype, lelimit="max", ledir="newer", lestart=lestart):
-                # extract target user name
-                username = user["title"].split(":", maxsplit=1)[1]
-                users.append(username)
-        return users
+        if self.autocommit is True:
+            self.dump()
 
-    def _find_active_users(self):
+    def _window(self):
         """
-        Find the users who were active in the last :py:attr:`active_days` days
-        and count their recent edits.
-
-        :returns: a mapping of user names to their recenteditcount
+        :returns: a tuple ``(firstday, today)`` delimiting the active window
         """
         today = datetime.datetime.utcnow()
         if self.round_to_midnight:
             # round to midnight, keep the datetime.datetime type
             today = datetime.datetime(*(today.timetuple()[:3]))
         firstday = today - datetime.timedelta(days=self.active_days)
+        return firstday, today
 
-        rc = self.api.list(action="query", list="recentchanges", rctype="edit", rcprop="user|timestamp", rclimit="max", rcstart=today, rcend=firstday)
+    def _add_recent_edit(self, change):
+        self.meta["recentedits"].setdefault(change["user"], []).append(change["timestamp"].strftime(_RECENT_FORMAT))
 
-        rcusers = {}
-        for change in rc:
-            try:
-                rcusers[change["user"]] += 1
-            except KeyError:
-                rcusers[change["user"]] = 1
+    def _init_recent_changes(self):
+        """
+        Scan the recent changes in the active window to find the timestamps of
+        the recent edits and initialize the ``rccontinue`` cursor.
+        """
+        firstday, _ = self._window()
+        now = datetime.datetime.utcnow()
+        self.meta["recentedits"] = {}
+        self.meta["rccontinue"] = _format_continue(now, 0)
+
+        rc = self.api.list(action="query", list="recentchanges", rctype="edit|new", rcprop="user|timestamp|ids", rclimit="max", rcstart=now, rcend=firstday)
+        for i, change in enumerate(rc):
+            if i == 0:
+                # the changes are sorted from the newest
+                self.meta["rccontinue"] = _format_continue(change["timestamp"], change["rcid"] + 1)
+            if change["type"] == "edit" and "user" in change:
+                self._add_recent_edit(change)
+        for timestamps in self.meta["recentedits"].values():
+            timestamps.sort()
 
         # Items in the recentchanges table are periodically purged according to
         # http://www.mediawiki.org/wiki/Manual:$wgRCMaxAge
         # By default the max age is 90 days: if a larger timespan is requested
-        # here, it's very important to warn that the changes are not available
-        if self.api.oldest_rc_timestamp > firstday:
+        # here, the recent edits are complete only since the oldest change
+        oldest = self.api.oldest_rc_timestamp
+        if oldest is not None and oldest > firstday:
+            firstday = oldest
+        self.meta["recentsince"] = firstday.strftime(_RECENT_FORMAT)
+
+    def _read_recent_changes(self):
+        """
+        Read the recent changes since the ``rccontinue`` cursor and record
+        the recent edits.
+
+        :returns: a mapping of user names to the number of their new edits
+        :raises ShortRecentChangesError:
+            when the recent changes since the cursor are not available anymore
+        """
+        cursor = self.meta["rccontinue"]
+        oldest = self.api.oldest_rc_timestamp
+        if oldest is not None and oldest > _parse_continue(cursor)[0]:
+            raise ShortRecentChangesError()
+
+        editcounts = {}
+        rc = self.api.list(action="query", list="recentchanges", rctype="edit|new", rcprop="user|timestamp|ids", rclimit="max", rcdir="newer", rccontinue=cursor)
+        for change in rc:
+            cursor = _format_continue(change["timestamp"], change["rcid"] + 1)
+            if "user" not in change:
+                # hidden user name
+                continue
+            if "anon" not in change:
+                editcounts[change["user"]] = editcounts.get(change["user"], 0) + 1
+            if change["type"] == "edit":
+                self._add_recent_edit(change)
+        self.meta["rccontinue"] = cursor
+        return editcounts
+
+    def _read_log_events(self):
+        """
+        Read the log events since the ``lecontinue`` cursors. Changes of the
+        user groups are applied directly.
+
+        :returns: a set of the names of the users whose properties have to be queried again
+        """
+        modified = set()
+        for letype in self.log_types:
+            cursor = self.meta["lecontinue"][letype]
+            events = self.api.list(list="logevents", letype=letype, leprop="ids|title|type|timestamp|details", lelimit="max", ledir="newer", lecontinue=cursor)
+            for event in events:
+                cursor = _format_continue(event["timestamp"], event["logid"] + 1)
+                # extract target user name
+                username = event["title"].split(":", maxsplit=1)[1]
+                params = event.get("params", {})
+                if letype == "rights" and "oldgroups" in params and "newgroups" in params:
+                    try:
+                        user = self._find_record(self.data, username, "name")
+                    except KeyError:
+                        modified.add(username)
+                        continue
+                    groups = [group for group in user["groups"] if group not in params["oldgroups"]]
+                    groups += [group for group in params["newgroups"] if group not in groups]
+                    user["groups"] = groups
+                    self._record_change(None, user)
+                else:
+                    modified.add(username)
+            self.meta["lecontinue"][letype] = cursor
+        return modified
+
+    def _update_recent_edit_counts(self, names=None):
+        """
+        Update the ``"recenteditcount"`` property from the recent edits in
+        the active window. The edits older than the window are dropped.
+
+        :param names: the names of the users to update, by default all users
+        :raises ShortRecentChangesError:
+            when the recent edits do not cover the whole active window
+        """
+        firstday, today = self._window()
+        first = firstday.strftime(_RECENT_FORMAT)
+        last = today.strftime(_RECENT_FORMAT)
+
+        rcusers = {}
+        for name, timestamps in list(self.meta["recentedits"].items()):
+            timestamps = [ts for ts in timestamps if ts >= first]
+            if timestamps:
+                self.meta["recentedits"][name] = timestamps
+            else:
+                del self.meta["recentedits"][name]
+            count = sum(1 for ts in timestamps if ts <= last)
+            if count > 0:
+                rcusers[name] = count
+
+        if self.meta["recentsince"] > first:
             raise ShortRecentChangesError()
 
         # save as meta data, only when not raising
-        # TODO: figure out a way to transparently (de)serialize datetime.datetime objects in JSON format
-        # FIXME: time is dropped when self.round_to_midnight is False (depends on the above)
+        # FIXME: time is dropped when self.round_to_midnight is False
         self.meta["firstdate"] = firstday.strftime("%Y-%m-%d")
         self.meta["lastdate"] = today.strftime("%Y-%m-%d")
         self.meta["activeuserscount"] = len(rcusers)
 
-        return rcusers
-
-    def _update_recent_edit_counts(self, rcusers):
-        for user in self.data:
-            # update recent edit count
-            if user["name"] in rcusers:
-                user["recenteditcount"] = rcusers[user["name"]]
-            else:
-                user["recenteditcount"] = 0
+        if names is None:
+            users = self.data
+        else:
+            users = []
+            for name in sorted(names):
+                try:
+                    users.append(self._find_record(self.data, name, "name"))
+                except KeyError:
+                    pass
+        for user in users:
+            recenteditcount = rcusers.get(user["name"], 0)
+            if user.get("recenteditcount") != recenteditcount:
+                user["recenteditcount"] = recenteditcount
+                self._record_change(None, user)
+        self.meta["recentusers"] = sorted(rcusers)
@@ -6,21 +6,14 @@
 #   implement some database versioning: either epoch, version number or timestamp of the database initialization
 
 import os
-import gzip
-import json
-import hashlib
+import bisect
 import datetime
 import logging
 
-from ws.utils import parse_timestamps_in_struct, DatetimeEncoder, datetime_parser
+from ws import utils
 
 logger = logging.getLogger(__name__)
 
-def md5sum(bytes_):
-    h = hashlib.md5()
-    h.update(bytes_)
-    return h.hexdigest()
-
 class CacheDb:
     """
     Base class for caching databases. The database is saved on disk in the
@@ -35,6 +28,16 @@ class CacheDb:
     can be accessed as attributes (e.g. ``db.attribute``), which does not
     trigger an update.
 
+    The storage format is determined by the ``storage`` parameter, see the
+    :py:mod:`ws.cache.storage` module. Subclasses which define the
+    :py:attr:`record_keys` attribute and report the modified records with
+    :py:meth:`_record_change` are saved incrementally by the ``"segmented"``
+    storage, otherwise the whole database is saved on each :py:meth:`dump()`.
+    With the ``"keyed"`` storage, the collections listed in
+    :py:attr:`record_keys` are loaded lazily and the records can be looked up
+    with :py:meth:`find()` and :py:meth:`find_range()` without loading the
+    whole database.
+
     :param ws.client.api.API api:
         an instance of the API to work with
     :param str dbname:
@@ -42,23 +45,57 @@ class CacheDb:
     :param bool autocommit:
         whether to automatically call :py:meth:`dump()` after each update of
         the database
+    :param str storage:
+        name of the storage backend (e.g. ``"json"``, ``"segmented"`` or ``"keyed"``), see
+        :py:data:`ws.cache.storage.STORAGE_BACKENDS`
+    :param max_age:
+        maximum age of the data (:py:class:`datetime.timedelta` or number of
+        seconds) which is used without an update. By default the database is
+        updated on each access.
+
+    Multiple processes can work with the same database: the files are replaced
+    atomically and protected by an advisory lock (see
+    :py:class:`ws.cache.storage.FileLock`), so only one process updates the
+    database at a time and the other processes wait for the result. With
+    ``max_age``, the processes reuse the data updated by another process
+    instead of repeating the update.
     """
 
     meta = {}
     data = None
 
-    #: format for JSON (de)serialization of datetime.datetime timestamps
-    ts_format = "%Y-%m-%dT%H:%M:%S.%f"
+    #: Mapping of the names of the collections in :py:attr:`data` to the
+    #: names of the keys of their records, which are used to apply the
+    #: changes reported by :py:meth:`_record_change`. The collections are
+    #: lists sorted by the key. The name ``None`` stands for :py:attr:`data`
+    #: itself and the key ``None`` for collections of plain values. If the
+    #: attribute is ``None``, the changes are not tracked.
+    record_keys = None
 
-    def __init__(self, api, cache_dir, dbname, autocommit=True):
+    def __init__(self, api, cache_dir, dbname, autocommit=True, storage="json", max_age=None):
         self.api = api
         self.dbname = dbname
         #: period for automatic database commits
         self.autocommit = autocommit
+        self.meta = {}
+        if max_age is not None and not isinstance(max_age, datetime.timedelta):
+            max_age = datetime.timedelta(seconds=max_age)
+        #: maximum age of the data which is used without an update
+        self.max_age = max_age
 
         dbdir = os.path.join(cache_dir, self.api.get_hostname())
-        self.dbpath = os.path.join(dbdir, self.dbname + ".db.json.gz")
-        self.metapath = os.path.join(dbdir, self.dbname + ".meta")
+        try:
+            storage_class = STORAGE_BACKENDS[storage]
+        except KeyError:
+            raise ValueError("unknown storage backend: {}".format(storage))
+        self.storage = storage_class(dbdir, self.dbname, self._apply_changes, self.record_keys)
+        #: advisory lock shared by all processes working with the database
+        self.lock = database_lock(dbdir, self.dbname)
+
+        # changes since the last dump, None if the whole database has to be saved
+        self._changes = None
+        # version of the database on disk corresponding to self.data
+        self._version = None
 
     def load(self, key=None):
         """
@@ -72,31 +109,16 @@ class CacheDb:
         :param key: passed to :py:meth:`init()`, necessary for proper lazy
                     initialization in case of multi-key database
         """
-        if os.path.isfile(self.dbpath):
-            logger.info("Loading data from {} ...".format(self.dbpath))
-            db = gzip.open(self.dbpath, mode="rb")
-            s = db.read()
-            md5_new = md5sum(s)
-
-            # TODO: make meta file mandatory at some point
-            if os.path.isfile(self.metapath):
-                meta = open(self.metapath, mode="rt", encoding="utf-8")
-                self.meta.update(json.loads(meta.read()))
-
-                # parse timestamp
-                if "timestamp" in self.meta:
-                    self.meta["timestamp"] = datetime.datetime.strptime(self.meta["timestamp"], self.ts_format)
-
-                if md5_new != self.md5:
-                    raise CacheDbError("md5sums of the database {} differ. Please investigate...".format(self.dbpath))
+        with self.lock(exclusive=not self.storage.exists()):
+            if self.storage.exists():
+                self.data, meta = self.storage.load()
+                self.meta.update(meta)
+                self._version = self.storage.version()
+                if self.record_keys is not None:
+                    self._changes = []
             else:
-                self.meta["md5"] = md5_new
-
-            self.data = json.loads(s.decode("utf-8"), object_hook=datetime_parser)
-            # manual conversion is necessary only for migration
-            parse_timestamps_in_struct(self.data)
-        else:
-            self.init(key)
+                self._changes = None
+                self.init(key)
 
     def dump(self):
         """
@@ -106,29 +128,51 @@ class CacheDb:
         After manual modification of the ``self.data`` structure it is necessary to
         call it manually if the change is to be persistent.
         """
-        logger.info("Saving data to {} ...".format(self.dbpath))
+        with self.lock(exclusive=True):
+            self.storage.save(self.data, self.meta, self._changes)
+            self._version = self.storage.version()
+        if self.record_keys is not None:
+            self._changes = []
 
-        # create leading directories
-        try:
-            os.makedirs(os.path.split(self.dbpath)[0])
-        except OSError as e:
-            if e.errno != 17:
-                raise e
-
-        # update hashes
-        s = json.dumps(self.data, cls=DatetimeEncoder).encode("utf-8")
-        self.meta["md5"] = md5sum(s)
-
-        # create copy and serialize timestamp (the type of the "real" timestamp
-        # in self.meta should always be datetime.datetime)
-        m = self.meta.copy()
-        if "timestamp" in m:
-            m["timestamp"] = m["timestamp"].strftime(self.ts_format)
-
-        db = gzip.open(self.dbpath, mode="wb", compresslevel=3)
-        db.write(s)
-        meta = open(self.metapath, mode="wt", encoding="utf-8")
-        meta.write(json.dumps(m, indent=4, sort_keys=True))
+    def _record_change(self, collection, record):
+        """
+        Report a record which was added or replaced in a collection of
+        :py:attr:`data` since the last :py:meth:`dump()`.
+
+        :param collection: a key of :py:attr:`record_keys`
+        :param record: the new record
+        """
+        if self._changes is not None:
+            self._changes.append([collection, record])
+
+    def _apply_changes(self, data, changes):
+        """
+        Apply changes reported by :py:meth:`_record_change` to a data structure
+        loaded from disk. The records are merged into the sorted collections,
+        existing records with the same key are replaced.
+        """
+        grouped = {}
+        for collection, record in changes:
+            grouped.setdefault(collection, []).append(record)
+        for collection, records in grouped.items():
+            target = data if collection is None else data[collection]
+            self._merge_records(target, records, self.record_keys[collection])
+
+    @staticmethod
+    def _merge_records(target, records, key):
+        """
+        Merge records into a sorted collection in one pass, see
+        :py:func:`ws.utils.merge_sorted`.
+
+        :param target: the collection, either a list or an object providing
+                       its own ``merge_sorted(records)`` method
+        :param records: an iterable of the new records
+        :param key: the attribute of the records used as the sort key
+        """
+        if isinstance(target, list):
+            utils.merge_sorted(target, records, attr=key)
+        else:
+            target.merge_sorted(records)
 
     def init(self, key=None):
         """
@@ -171,16 +215,39 @@ class CacheDb:
     def _update_timestamp(self):
         self.meta["timestamp"] = datetime.datetime.utcnow()
 
+    def _is_fresh(self):
+        """
+        :returns: ``True`` if the data is younger than :py:attr:`max_age`
+        """
+        if self.max_age is None or self.meta.get("timestamp") is None:
+            return False
+        return datetime.datetime.utcnow() - self.meta["timestamp"] < self.max_age
+
     # TODO: make some decorator to actually run the code only every minute or so
     #       ...or maybe not necessary. The accessed data is mutable anyway, so
     #       the accessors are not actually called very often -- at least for dict.
     def _load_and_update(self, key=None):
         """
         Helper method called from the accessors.
+
+        Multiple processes can share the database: the data is loaded under a
+        shared lock and updated under an exclusive lock. When the data (either
+        in memory or saved by another process in the meantime) is younger
+        than :py:attr:`max_age`, the update is skipped.
         """
-        if self.data is None:
+        if self.data is None and self.storage.exists():
             self.load(key)
-        self.update(key)
+        if self._is_fresh():
+            return
+        with self.lock(exclusive=True):
+            # reload the data saved by another process while we were waiting
+            if self.data is None or (self.autocommit is True and self.storage.version() != self._version):
+                self.data = None
+                self.meta = {}
+                self.load(key)
+                if self._is_fresh():
+                    return
+            self.update(key)
 
     def __getitem__(self, key):
         self._load_and_update(key)
@@ -201,6 +268,69 @@ class CacheDb:
     def __len__(self):
         return self.data.__len__()
 
+    def find(self, key, collection=None):
+        """
+        Find a record by its key in a sorted collection of the database (see
+        :py:attr:`record_keys`). With the ``"keyed"`` storage, only the part
+        of the database which may contain the record is loaded.
+
+        :param key: the key of the record
+        :param collection: name of the collection
+        :raises KeyError: when the record is not found
+        """
+        self._load_and_update(collection)
+        target = self.data if collection is None else self.data[collection]
+        return self._find_record(target, key, self.record_keys[collection])
+
+    def find_many(self, keys, collection=None):
+        """
+        Find multiple records by their keys, see :py:meth:`find()`. The
+        database is updated only once.
+
+        :param keys: an iterable of the keys
+        :param collection: name of the collection
+        :returns: a dictionary mapping the keys to the records, missing keys are omitted
+        """
+        self._load_and_update(collection)
+        target = self.data if collection is None else self.data[collection]
+        records = {}
+        for key in keys:
+            try:
+                records[key] = self._find_record(target, key, self.record_keys[collection])
+            except KeyError:
+                pass
+        return records
+
+    def find_range(self, first, last, collection=None):
+        """
+        Find all records whose keys are in the closed interval ``[first, last]``
+        in a sorted collection of the database (see :py:attr:`record_keys`).
+        With the ``"keyed"`` storage, only the part of the database which may
+        contain the records is loaded.
+
+        :param first: the first key
+        :param last: the last key
+        :param collection: name of the collection
+        :returns: a list of records
+        """
+        self._load_and_update(collection)
+        target = self.data if collection is None else self.data[collection]
+        if hasattr(target, "find_range"):
+            return target.find_range(first, last)
+        wrapped = utils.ListOfDictsAttrWrapper(target, self.record_keys[collection])
+        start = bisect.bisect_left(wrapped, first)
+        end = bisect.bisect_right(wrapped, last)
+        return target[start:end]
+
+    @staticmethod
+    def _find_record(target, key, record_key):
+        if hasattr(target, "find"):
+            return target.find(key)
+        try:
+            return utils.bisect_find(target, key, index_list=utils.ListOfDictsAttrWrapper(target, record_key))
+        except IndexError:
+            raise KeyError(key)
+
 
     def __getattr__(self, name):
         """
@@ -217,6 +347,7 @@ class CacheDbError(Exception):
     pass
 
 
+from .storage import STORAGE_BACKENDS, database_lock
 from .AllRevisionsProps import *
 from .AllUsersProps import *
 
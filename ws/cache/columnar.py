@@ -0,0 +1,708 @@
+#! /usr/bin/env python3
+
+"""
+Columnar representation of revision properties, see
+:py:class:`ws.cache.AllRevisionsProps`. Requires :py:mod:`numpy`.
+
+A :py:class:`RevisionTable` stores the properties of revisions in NumPy arrays
+(one array per property), the user names are dictionary-encoded and the
+comments are stored as one UTF-8 encoded buffer with an array of offsets. The
+:py:class:`ColumnarStorage` backend saves the arrays in the ``.npy`` format
+and maps them into memory when loading, so the load is almost instant and the
+pages are read from disk only when accessed. Revisions merged into a
+memory-mapped table (e.g. from the delta files of an incremental save) are kept
+in a small in-memory overlay, which is merged with the mapped columns only when
+the table is saved again.
+
+For compatibility with code written for the list-of-dicts representation, a
+:py:class:`RevisionTable` behaves like a list of revision dictionaries, which
+are created on demand. Code working with whole columns should use the
+:py:meth:`RevisionTable.column` method instead.
+"""
+
+import bisect
+import collections.abc
+import gzip
+import json
+import os
+import shutil
+import logging
+
+import numpy as np
+
+from ws.utils import DatetimeEncoder, datetime_parser
+
+from .storage import SegmentedStorage, _encode, _decode, _file_version, _replace_file, _serialize_meta, _parse_meta
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["RevisionTable", "ColumnarStorage"]
+
+class RevisionTable(collections.abc.MutableSequence):
+    """
+    A sequence of revisions sorted by the revision ID, stored by columns.
+
+    :param columns:
+        a dictionary of the arrays holding the columns (see :py:attr:`dtypes`),
+        all arrays must have the same length
+    :param list users: the user names, the ``user`` column holds indexes into this list
+    :param comments: the comments, either a list of strings or a tuple
+        ``(offsets, buffer)`` of arrays
+    :param dict extra:
+        properties which do not fit into the columns, keyed by the revision
+        ID (only for rarely used properties)
+    """
+
+    #: types of the columns
+    dtypes = collections.OrderedDict([
+        ("revid", np.int64),
+        ("parentid", np.int64),
+        ("userid", np.int64),
+        ("size", np.int64),
+        ("timestamp", "datetime64[s]"),
+        ("user", np.int32),
+        # bit mask of the present properties, see present_bits
+        ("present", np.uint32),
+    ])
+
+    #: properties stored in the columns, the bits of the "present" column
+    #: indicate which of them are present in a revision
+    present_bits = collections.OrderedDict((name, 1 << i) for i, name in enumerate([
+        "revid", "parentid", "userid", "size", "timestamp", "user", "comment",
+        # flags (the API sets them to "")
+        "minor", "anon", "userhidden", "commenthidden", "suppressed", "texthidden", "sha1hidden",
+    ]))
+
+    flags = ("minor", "anon", "userhidden", "commenthidden", "suppressed", "texthidden", "sha1hidden")
+
+    def __init__(self, columns=None, users=None, comments=None, extra=None):
+        if columns is None:
+            columns = dict((name, np.empty(0, dtype=dtype)) for name, dtype in self.dtypes.items())
+        self._columns = columns
+        # over-allocated buffers for appending, the columns are their prefixes
+        self._buffers = {}
+        self.users = users if users is not None else []
+        self._user_codes = None
+        self._comments = comments if comments is not None else []
+        self.extra = extra if extra is not None else {}
+        # revisions merged into a memory-mapped table, see merge_sorted
+        self._overlay = None
+        self._overlay_index = None
+
+    @classmethod
+    def from_records(klass, records):
+        """
+        Create a table from an iterable of revision dictionaries.
+        """
+        table = klass()
+        table.extend_sorted(records)
+        return table
+
+    def __len__(self):
+        if self._overlay is None:
+            return len(self._columns["revid"])
+        return len(self._columns["revid"]) + len(self._get_overlay_index()["inserted"])
+
+    def column(self, name):
+        """
+        Get a whole column as a NumPy array. For properties which may be
+        missing, the values of missing elements are ``-1`` (``NaT`` for the
+        timestamps); use the ``"present"`` column to distinguish them.
+
+        :param str name: name of the column (see :py:attr:`dtypes`)
+        """
+        if self._overlay is None:
+            return self._columns[name]
+        merged = self._get_overlay_index()["columns"]
+        if name not in merged:
+            merged[name] = self._merge_column(name)
+        return merged[name]
+
+    def column_view(self, name):
+        """
+        A list-like view of a column which stays valid when the table is
+        modified, suitable as ``index_list`` for :py:func:`ws.utils.bisect_insert_or_replace`.
+        """
+        return _ColumnView(self, name)
+
+    def user_column(self):
+        """
+        :returns:
+            the ``user`` column decoded as an array of strings (``None`` for
+            hidden users)
+        """
+        users = np.array(self.users + [None], dtype=object)
+        # the code -1 selects the last element
+        return users[self.column("user")]
+
+    # the comments are decoded only when a revision is modified, otherwise
+    # they are read directly from the buffer
+    def _get_comment(self, i):
+        if isinstance(self._comments, list):
+            return self._comments[i]
+        offsets, buffer = self._comments
+        return bytes(buffer[offsets[i]:offsets[i + 1]]).decode("utf-8")
+
+    def _materialize_comments(self):
+        if not isinstance(self._comments, list):
+            self._comments = [self._get_comment(i) for i in range(len(self._columns["revid"]))]
+        return self._comments
+
+    def encode_comments(self):
+        """
+        :returns: the comments as a tuple ``(offsets, buffer)`` of arrays
+        """
+        if not isinstance(self._comments, list):
+            return self._comments
+        encoded = [c.encode("utf-8") for c in self._comments]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(c) for c in encoded], out=offsets[1:])
+        buffer = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return offsets, buffer
+
+    def _user_code(self, user):
+        if self._user_codes is None:
+            self._user_codes = dict((name, i) for i, name in enumerate(self.users))
+        code = self._user_codes.get(user)
+        if code is None:
+            code = self._user_codes[user] = len(self.users)
+            self.users.append(user)
+        return code
+
+    def _encode(self, record):
+        """
+        Convert a revision dictionary into a tuple of the column values, the
+        comment and the extra properties.
+        """
+        present = 0
+        extra = {}
+        for key, value in record.items():
+            bit = self.present_bits.get(key)
+            if bit is None:
+                extra[key] = value
+            else:
+                present |= bit
+        row = []
+        for name in self.dtypes:
+            if name == "present":
+                row.append(present)
+            elif name == "user":
+                row.append(self._user_code(record["user"]) if "user" in record else -1)
+            elif name == "timestamp":
+                # None is converted to NaT
+                row.append(record.get("timestamp"))
+            else:
+                row.append(record.get(name, -1))
+        return row, record.get("comment", ""), extra
+
+    def _decode(self, i):
+        present = int(self._columns["present"][i])
+        record = {}
+        for key, bit in self.present_bits.items():
+            if not present & bit:
+                continue
+            if key == "user":
+                record["user"] = self.users[self._columns["user"][i]]
+            elif key == "timestamp":
+                record["timestamp"] = self._columns["timestamp"][i].item()
+            elif key == "comment":
+                record["comment"] = self._get_comment(i)
+            elif key in self.flags:
+                record[key] = ""
+            else:
+                record[key] = int(self._columns[key][i])
+        record.update(self.extra.get(record.get("revid"), {}))
+        return record
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._get(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("RevisionTable index out of range")
+        return self._get(index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._get(i)
+
+    def _get(self, i):
+        table, j = self._locate(i)
+        return table._decode(j)
+
+    def _locate(self, i):
+        """
+        Find the ``i``-th revision of the table including the overlay.
+
+        :returns: a tuple ``(table, index)``, where ``table`` is either
+            ``self`` or the overlay
+        """
+        if self._overlay is None:
+            return self, i
+        index = self._get_overlay_index()
+        # number of inserted revisions before i
+        k = bisect.bisect_left(index["merged"], i)
+        if k < len(index["merged"]) and index["merged"][k] == i:
+            return self._overlay, index["inserted"][k]
+        i -= k
+        if i in index["replaced"]:
+            return self._overlay, index["replaced"][i]
+        return self, i
+
+    @staticmethod
+    def _search(revids, new_revids):
+        """
+        Find the positions of sorted revision IDs in a sorted column.
+
+        :returns: a tuple ``(positions, found)`` of arrays, see :py:func:`numpy.searchsorted`
+        """
+        positions = np.searchsorted(revids, new_revids)
+        found = positions < len(revids)
+        found[found] = revids[positions[found]] == new_revids[found]
+        return positions, found
+
+    def _get_overlay_index(self):
+        """
+        Get the positions of the overlay revisions in the table, the index is
+        computed again when the overlay is modified.
+        """
+        if self._overlay_index is None:
+            positions, found = self._search(self._columns["revid"], self._overlay._columns["revid"])
+            inserted = np.flatnonzero(~found)
+            self._overlay_index = {
+                # positions of the inserted revisions in the overlay and in the base columns
+                "inserted": inserted.tolist(),
+                "positions": positions[inserted],
+                # positions of the inserted revisions in the merged table
+                "merged": (positions[inserted] + np.arange(len(inserted))).tolist(),
+                # base positions mapped to the overlay positions of the replacements
+                "replaced": dict(zip(positions[found].tolist(), np.flatnonzero(found).tolist())),
+                # cache for the merged columns
+                "columns": {},
+            }
+        return self._overlay_index
+
+    def _merge_column(self, name):
+        index = self._get_overlay_index()
+        values = self._overlay._columns[name]
+        column = np.array(self._columns[name])
+        if index["replaced"]:
+            column[list(index["replaced"])] = values[list(index["replaced"].values())]
+        # np.insert interprets all positions relative to the original array
+        return np.insert(column, index["positions"], values[index["inserted"]])
+
+    def _merged(self):
+        """
+        :returns: a table with the overlay merged into the columns (``self``
+            if there is no overlay)
+        """
+        if self._overlay is None:
+            return self
+        columns = collections.OrderedDict((name, self.column(name)) for name in self.dtypes)
+        comments = []
+        for i in range(len(self)):
+            table, j = self._locate(i)
+            comments.append(table._get_comment(j))
+        overlay_revids = set(self._overlay._columns["revid"].tolist())
+        extra = dict((revid, value) for revid, value in self.extra.items() if revid not in overlay_revids)
+        extra.update(self._overlay.extra)
+        return RevisionTable(columns, self.users, comments, extra)
+
+    def _flatten(self):
+        """
+        Merge the overlay into the columns before an in-place modification.
+        """
+        if self._overlay is None:
+            return
+        merged = self._merged()
+        self._columns = merged._columns
+        self._comments = merged._comments
+        self.extra = merged.extra
+        self._buffers = {}
+        # the overlay added users to the shared list
+        self._user_codes = None
+        self._overlay = None
+        self._overlay_index = None
+
+    def _merge_into_overlay(self):
+        """
+        :returns: ``True`` if new revisions should go into the overlay instead
+            of copying the memory-mapped columns
+        """
+        if self._overlay is None:
+            if not isinstance(self._columns["revid"], np.memmap):
+                return False
+            self._overlay = RevisionTable(users=self.users)
+        self._overlay_index = None
+        return True
+
+    def _set_extra(self, record, extra):
+        if extra:
+            self.extra[record["revid"]] = extra
+        else:
+            self.extra.pop(record["revid"], None)
+
+    def __setitem__(self, index, record):
+        if isinstance(index, slice):
+            raise TypeError("RevisionTable does not support slice assignment")
+        self._flatten()
+        row, comment, extra = self._encode(record)
+        for (name, column), value in zip(self._columns.items(), row):
+            if not column.flags.writeable:
+                column = self._columns[name] = np.array(column)
+            column[index] = value
+        self._materialize_comments()[index] = comment
+        self._set_extra(record, extra)
+
+    def __delitem__(self, index):
+        raise TypeError("RevisionTable does not support deletion")
+
+    def insert(self, index, record):
+        """
+        Insert a revision before ``index``. Note that this is an O(n)
+        operation like for :py:class:`list`.
+        """
+        self._flatten()
+        row, comment, extra = self._encode(record)
+        for (name, column), value in zip(list(self._columns.items()), row):
+            self._columns[name] = np.insert(column, index, np.array(value, dtype=column.dtype))
+        self._materialize_comments().insert(index, comment)
+        self._set_extra(record, extra)
+
+    def extend_sorted(self, records):
+        """
+        Append revisions whose IDs are greater than the IDs of all revisions
+        in the table.
+
+        :param records: an iterable of revision dictionaries sorted by the revision ID
+        """
+        if self._merge_into_overlay():
+            self._overlay.extend_sorted(records)
+            return
+        columns, comments = self._encode_records(records)
+        if not comments:
+            return
+        self._materialize_comments().extend(comments)
+        length = len(self._columns["revid"])
+        new_length = length + len(comments)
+        for name, values in columns.items():
+            buffer = self._reserve(name, new_length)
+            buffer[length:new_length] = values
+            self._columns[name] = buffer[:new_length]
+
+    def _reserve(self, name, length):
+        """
+        Get a buffer for the column which has space for at least ``length``
+        elements and whose prefix holds the current column. The capacity grows
+        geometrically, so repeated appending has amortized linear cost.
+        """
+        column = self._columns[name]
+        buffer = self._buffers.get(name)
+        if buffer is None or column.base is not buffer or len(buffer) < length:
+            buffer = np.empty(max(length, 2 * len(column)), dtype=column.dtype)
+            buffer[:len(column)] = column
+            self._buffers[name] = buffer
+        return buffer
+
+    def _encode_records(self, records):
+        """
+        Encode revision dictionaries into arrays of the column values and a
+        list of comments. The extra properties are stored immediately.
+        """
+        rows = []
+        comments = []
+        for record in records:
+            row, comment, extra = self._encode(record)
+            rows.append(row)
+            comments.append(comment)
+            self._set_extra(record, extra)
+        columns = collections.OrderedDict()
+        for (name, dtype), values in zip(self.dtypes.items(), zip(*rows) if rows else [()] * len(self.dtypes)):
+            columns[name] = np.array(values, dtype=dtype)
+        return columns, comments
+
+    def merge_sorted(self, records):
+        """
+        Merge revisions into the table in one pass, see
+        :py:func:`ws.utils.merge_sorted`. Revisions whose IDs are already
+        present in the table are replaced, the others are inserted. When all
+        new revision IDs are greater than the IDs in the table, the revisions
+        are simply appended. The revisions merged into a memory-mapped table are
+        kept in an in-memory overlay, so that the mapped columns are not copied.
+
+        :param records: an iterable of revision dictionaries, not necessarily sorted
+        """
+        unique = {}
+        for record in records:
+            unique[record["revid"]] = record
+        if not unique:
+            return
+        records = [unique[revid] for revid in sorted(unique)]
+
+        if self._merge_into_overlay():
+            self._overlay.merge_sorted(records)
+            return
+
+        revids = self._columns["revid"]
+        if len(revids) == 0 or revids[-1] < records[0]["revid"]:
+            self.extend_sorted(records)
+            return
+
+        # must be materialized before the columns change
+        comments = self._materialize_comments()
+        columns, new_comments = self._encode_records(records)
+        positions, found = self._search(revids, columns["revid"])
+        replaced = positions[found]
+        inserted = positions[~found]
+
+        for name, values in columns.items():
+            column = self._columns[name]
+            if len(replaced) > 0:
+                if not column.flags.writeable:
+                    column = np.array(column)
+                column[replaced] = values[found]
+            # np.insert interprets all positions relative to the original array
+            self._columns[name] = np.insert(column, inserted, values[~found])
+
+        merged = []
+        last = 0
+        for position, comment, is_found in zip(positions.tolist(), new_comments, found.tolist()):
+            if is_found:
+                comments[position] = comment
+            else:
+                merged.extend(comments[last:position])
+                merged.append(comment)
+                last = position
+        merged.extend(comments[last:])
+        self._comments = merged
+
+    @property
+    def nbytes(self):
+        """
+        Approximate size of the table in bytes (including the memory-mapped
+        parts).
+        """
+        size = sum(column.nbytes for column in self._columns.values())
+        if isinstance(self._comments, list):
+            size += sum(len(c) for c in self._comments)
+        else:
+            size += sum(a.nbytes for a in self._comments)
+        if self._overlay is not None:
+            size += self._overlay.nbytes
+        return size
+
+    def save(self, path, prefix):
+        """
+        Save the table into files ``<path>/<prefix>.*``. The overlay is merged
+        into the saved columns.
+        """
+        table = self._merged()
+        for name, column in table._columns.items():
+            np.save(os.path.join(path, "{}.{}.npy".format(prefix, name)), column)
+        offsets, buffer = table.encode_comments()
+        np.save(os.path.join(path, "{}.comment_offsets.npy".format(prefix)), offsets)
+        np.save(os.path.join(path, "{}.comment_buffer.npy".format(prefix)), buffer)
+        with open(os.path.join(path, "{}.users.json".format(prefix)), "wt", encoding="utf-8") as f:
+            json.dump(table.users, f)
+        with open(os.path.join(path, "{}.extra.json".format(prefix)), "wt", encoding="utf-8") as f:
+            json.dump(list(table.extra.items()), f, cls=DatetimeEncoder)
+
+    @classmethod
+    def load(klass, path, prefix, mmap_mode="r"):
+        """
+        Load a table saved by :py:meth:`save`. The arrays are memory-mapped
+        (read-only, they are copied on the first modification).
+        """
+        def load_array(name):
+            return np.load(os.path.join(path, "{}.{}.npy".format(prefix, name)), mmap_mode=mmap_mode)
+        columns = collections.OrderedDict((name, load_array(name)) for name in klass.dtypes)
+        comments = (load_array("comment_offsets"), load_array("comment_buffer"))
+        with open(os.path.join(path, "{}.users.json".format(prefix)), "rt", encoding="utf-8") as f:
+            users = json.load(f)
+        with open(os.path.join(path, "{}.extra.json".format(prefix)), "rt", encoding="utf-8") as f:
+            extra = dict((int(k), v) for k, v in json.load(f, object_hook=datetime_parser))
+        return klass(columns, users, comments, extra)
+
+class _ColumnView:
+    def __init__(self, table, name):
+        self.table = table
+        self.name = name
+
+    def __getitem__(self, index):
+        return self.table.column(self.name)[index]
+
+    def __len__(self):
+        return len(self.table)
+
+class ColumnarStorage:
+    """
+    Storage backend for :py:class:`ws.cache.CacheDb` databases whose data is
+    a dictionary of revision collections (lists of revision dictionaries or
+    :py:class:`RevisionTable` objects) and other JSON-serializable values.
+    The revision collections are loaded as memory-mapped
+    :py:class:`RevisionTable` objects.
+
+    A full :py:meth:`save` writes a new version of the database into a
+    separate directory and switches the ``CURRENT`` pointer to it. When the
+    changes since the last save are known, they are appended to the current
+    version as a compressed delta file (like in
+    :py:class:`ws.cache.storage.SegmentedStorage`), which is applied on load
+    into the overlays of the memory-mapped tables (see
+    :py:meth:`RevisionTable.merge_sorted`).
+    A new full version is written when there are too many deltas. Databases
+    saved by the other backends are loaded and converted on the next save.
+
+    :param str dbdir: path to the directory where the files are stored
+    :param str dbname: name of the database
+    :param apply_changes:
+        a function ``apply_changes(data, changes)`` applying a list of changes
+        (as passed to :py:meth:`save`) to the data structure in place
+    :param record_keys:
+        the ``record_keys`` of the database, the collections sorted by
+        ``"revid"`` are stored as :py:class:`RevisionTable` objects (by
+        default ``"revisions"`` and ``"deletedrevisions"``)
+    """
+
+    #: maximum number of delta files before a full version is written
+    max_deltas = 32
+    #: maximum ratio of the size of the delta files to the size of the version before a full version is written
+    max_delta_ratio = 0.5
+
+    def __init__(self, dbdir, dbname, apply_changes, record_keys=None):
+        self.dbdir = dbdir
+        self.dbname = dbname
+        self.apply_changes = apply_changes
+        self.path = os.path.join(dbdir, dbname + ".columnar")
+        self.currentpath = os.path.join(self.path, "CURRENT")
+        self._fallback = SegmentedStorage(dbdir, dbname, apply_changes)
+        if record_keys is None:
+            self.table_keys = {"revisions", "deletedrevisions"}
+        else:
+            self.table_keys = set(key for key, attr in record_keys.items() if attr == "revid")
+
+    def _current(self):
+        try:
+            with open(self.currentpath, "rt", encoding="utf-8") as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def exists(self):
+        """
+        :returns: ``True`` if the database exists on disk
+        """
+        return self._current() is not None or self._fallback.exists()
+
+    def version(self):
+        """
+        :returns: a value which changes whenever the database is saved
+        """
+        current = self._current()
+        if current is None:
+            return self._fallback.version()
+        # the index is replaced by both full and incremental saves
+        return (current, _file_version(os.path.join(self.path, current, "index.json")))
+
+    def load(self):
+        """
+        Load the database from disk.
+
+        :returns: a tuple ``(data, meta)``
+        """
+        version = self._current()
+        if version is None:
+            logger.info("Migrating the {} database to the columnar storage.".format(self.dbname))
+            data, meta = self._fallback.load()
+            for key, value in data.items():
+                if key in self.table_keys and isinstance(value, list):
+                    data[key] = RevisionTable.from_records(value)
+            return data, meta
+
+        logger.info("Loading data from {} ...".format(self.path))
+        path = os.path.join(self.path, version)
+        index = self._read_index(path)
+        data = index["data"]
+        for key in index["tables"]:
+            data[key] = RevisionTable.load(path, key)
+        for delta in index.get("deltas", []):
+            with open(os.path.join(path, delta["file"]), "rb") as f:
+                self.apply_changes(data, _decode(gzip.decompress(f.read())))
+        return data, _parse_meta(index["meta"])
+
+    @staticmethod
+    def _read_index(path):
+        with open(os.path.join(path, "index.json"), "rt", encoding="utf-8") as f:
+            return json.load(f, object_hook=datetime_parser)
+
+    @staticmethod
+    def _write_index(path, index):
+        _replace_file(os.path.join(path, "index.json"), json.dumps(index, cls=DatetimeEncoder), mode="wt")
+
+    def _needs_full_save(self, index):
+        deltas = index.get("deltas", [])
+        return (len(deltas) > self.max_deltas or
+                sum(delta["size"] for delta in deltas) > self.max_delta_ratio * index.get("size", 0))
+
+    def _append_changes(self, version, meta, changes):
+        """
+        Append the changes to the current version as a delta file.
+
+        :returns: ``False`` if a full version has to be written instead
+        """
+        path = os.path.join(self.path, version)
+        index = self._read_index(path)
+        deltas = index.setdefault("deltas", [])
+        if changes:
+            name = "delta.{:08d}.json.gz".format(len(deltas) + 1)
+            raw = gzip.compress(_encode(changes), compresslevel=3)
+            if self._needs_full_save(dict(index, deltas=deltas + [{"size": len(raw)}])):
+                return False
+            logger.info("Appending {} records to {} ...".format(len(changes), path))
+            _replace_file(os.path.join(path, name), raw)
+            deltas.append({"file": name, "size": len(raw)})
+        index["meta"] = _serialize_meta(meta)
+        # the atomic replacement of the index is the commit point
+        self._write_index(path, index)
+        return True
+
+    def save(self, data, meta, changes=None):
+        """
+        Save the database.
+
+        :param data: the data structure of the database
+        :param dict meta: the meta data
+        :param list changes:
+            a list of changes since the last save, which is appended to the
+            current version as a delta file. If ``None``, a new version with
+            the whole data structure is written.
+        """
+        current = self._current()
+        if changes is not None and current is not None:
+            if self._append_changes(current, meta, changes):
+                return
+
+        os.makedirs(self.path, exist_ok=True)
+        version = "{:08d}".format(int(current) + 1 if current else 1)
+        path = os.path.join(self.path, version)
+        logger.info("Saving data to {} ...".format(path))
+        shutil.rmtree(path, ignore_errors=True)
+        os.mkdir(path)
+
+        index = {"data": {}, "tables": [], "deltas": [], "meta": _serialize_meta(meta)}
+        for key, value in data.items():
+            if key in self.table_keys and isinstance(value, list):
+                value = RevisionTable.from_records(value)
+            if isinstance(value, RevisionTable):
+                value.save(path, key)
+                index["tables"].append(key)
+            else:
+                index["data"][key] = value
+        index["size"] = sum(entry.stat().st_size for entry in os.scandir(path))
+        self._write_index(path, index)
+
+        # the atomic replacement of the pointer is the commit point
+        _replace_file(self.currentpath, version, mode="wt")
+        if current is not None:
+            # the memory-mapped files stay accessible until they are unmapped
+            shutil.rmtree(os.path.join(self.path, current), ignore_errors=True)
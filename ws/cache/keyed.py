@@ -0,0 +1,417 @@
+#! /usr/bin/env python3
+
+"""
+Keyed storage backend for the :py:class:`ws.cache.CacheDb` databases, which
+allows to load only the parts of a database which are actually accessed.
+
+The sorted collections listed in :py:attr:`ws.cache.CacheDb.record_keys` are
+split into compressed *blocks* of consecutive records. A small index file
+holds the first and last key, the number of records and the checksum of each
+block, the other values of the database are stored directly in the index.
+Loading a database reads only the index and the collections are represented
+by :py:class:`LazyRecords` objects, which load the blocks on demand. Lookups
+by key (:py:meth:`LazyRecords.find`, :py:meth:`LazyRecords.find_range`) load
+only the blocks which may contain the keys, so the startup time does not
+depend on the size of the database.
+
+When saving, only the blocks which were loaded are encoded again and only the
+blocks whose content has changed are written.
+"""
+
+import bisect
+import collections.abc
+import gzip
+import json
+import os
+import time
+import logging
+
+from ws import utils
+
+from . import CacheDbError
+from .storage import JsonStorage, md5sum, _file_version, _encode, _decode, _replace_file, _serialize_meta, _parse_meta
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["LazyRecords", "KeyedStorage"]
+
+class _Block:
+    """
+    A block of records. ``entry`` is the index entry of the block on disk
+    (``None`` for a new block), ``records`` is the list of records or
+    ``None`` if the block was not loaded yet.
+    """
+    def __init__(self, entry=None, records=None):
+        self.entry = entry
+        self.records = records
+
+    def __len__(self):
+        if self.records is not None:
+            return len(self.records)
+        return self.entry["count"]
+
+class LazyRecords(collections.abc.MutableSequence):
+    """
+    A sorted list of records whose blocks are loaded from a
+    :py:class:`KeyedStorage` on demand. Once loaded, the blocks stay in
+    memory.
+
+    :param KeyedStorage storage: the storage from which the blocks are loaded
+    :param str key: the key of the records by which the list is sorted
+    :param list entries: the index entries of the blocks
+    """
+
+    def __init__(self, storage, key, entries):
+        self.storage = storage
+        self.key = key
+        self._set_blocks([_Block(entry) for entry in entries])
+
+    def _set_blocks(self, blocks):
+        self._blocks = blocks
+        self._starts = None
+
+    def _load(self, block):
+        if block.records is None:
+            block.records = self.storage._read_block(block.entry)
+        return block.records
+
+    @property
+    def loaded_blocks(self):
+        """
+        Number of the blocks which were loaded from disk or created in memory.
+        """
+        return sum(1 for block in self._blocks if block.records is not None)
+
+    def _block_starts(self):
+        if self._starts is None:
+            starts = []
+            total = 0
+            for block in self._blocks:
+                starts.append(total)
+                total += len(block)
+            self._starts = starts
+            self._length = total
+        return self._starts
+
+    def __len__(self):
+        self._block_starts()
+        return self._length
+
+    def _locate(self, index):
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("LazyRecords index out of range")
+        starts = self._block_starts()
+        i = bisect.bisect_right(starts, index) - 1
+        # skip empty blocks
+        while len(self._blocks[i]) == 0:
+            i += 1
+        return self._blocks[i], index - starts[i]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        block, offset = self._locate(index)
+        return self._load(block)[offset]
+
+    def __setitem__(self, index, record):
+        if isinstance(index, slice):
+            raise TypeError("LazyRecords does not support slice assignment")
+        block, offset = self._locate(index)
+        self._load(block)[offset] = record
+
+    def __delitem__(self, index):
+        block, offset = self._locate(index)
+        del self._load(block)[offset]
+        self._starts = None
+
+    def insert(self, index, record):
+        if index < 0:
+            index = max(0, index + len(self))
+        if index >= len(self):
+            if not self._blocks:
+                self._blocks.append(_Block(records=[]))
+            self._load(self._blocks[-1]).append(record)
+        else:
+            block, offset = self._locate(index)
+            self._load(block).insert(offset, record)
+        self._starts = None
+
+    def __iter__(self):
+        for block in self._blocks:
+            yield from self._load(block)
+
+    def _first_key(self, block):
+        if block.records is not None:
+            return block.records[0][self.key] if block.records else None
+        return block.entry["first"]
+
+    def _find_block(self, key):
+        """
+        :returns: index of the last non-empty block whose first key is not
+                  greater than ``key`` (0 if there is no such block)
+        """
+        lo = 0
+        hi = len(self._blocks)
+        result = 0
+        while lo < hi:
+            mid = (lo + hi) // 2
+            # find a non-empty block near mid
+            i = mid
+            while i < hi and len(self._blocks[i]) == 0:
+                i += 1
+            if i == hi:
+                hi = mid
+                continue
+            if self._first_key(self._blocks[i]) <= key:
+                result = i
+                lo = i + 1
+            else:
+                hi = mid
+        return result
+
+    def find(self, key):
+        """
+        Find a record by its key. Only the block which may contain the record
+        is loaded.
+
+        :raises KeyError: when the record is not found
+        """
+        if not self._blocks:
+            raise KeyError(key)
+        records = self._load(self._blocks[self._find_block(key)])
+        try:
+            return utils.bisect_find(records, key, index_list=utils.ListOfDictsAttrWrapper(records, self.key))
+        except IndexError:
+            raise KeyError(key)
+
+    def find_range(self, first, last):
+        """
+        Find all records whose keys are in the closed interval ``[first, last]``.
+        Only the blocks which may contain the records are loaded.
+
+        :returns: a list of records
+        """
+        result = []
+        if not self._blocks:
+            return result
+        for block in self._blocks[self._find_block(first):]:
+            if len(block) == 0:
+                continue
+            if self._first_key(block) > last:
+                break
+            for record in self._load(block):
+                if first <= record[self.key] <= last:
+                    result.append(record)
+        return result
+
+    def merge_sorted(self, records):
+        """
+        Merge records into the list, see :py:func:`ws.utils.merge_sorted`.
+        Only the blocks into which the records belong are loaded; records
+        whose keys are greater than all keys in the list are appended as new
+        blocks.
+        """
+        records = sorted(records, key=lambda record: record[self.key])
+        if not records:
+            return
+        # records past the end of the list
+        last_block = None
+        for block in reversed(self._blocks):
+            if len(block) > 0:
+                last_block = block
+                break
+        if last_block is None:
+            tail = records
+            records = []
+        else:
+            last_key = self._load(last_block)[-1][self.key]
+            i = bisect.bisect_right(utils.ListOfDictsAttrWrapper(records, self.key), last_key)
+            records, tail = records[:i], records[i:]
+
+        groups = {}
+        for record in records:
+            groups.setdefault(self._find_block(record[self.key]), []).append(record)
+        for i, group in groups.items():
+            utils.merge_sorted(self._load(self._blocks[i]), group, attr=self.key)
+        if tail:
+            # deduplicate via merge_sorted
+            new = []
+            utils.merge_sorted(new, tail, attr=self.key)
+            # fill the last block first to avoid creating many small blocks
+            if last_block is not None and len(last_block) < self.storage.block_size:
+                space = self.storage.block_size - len(last_block)
+                last_block.records.extend(new[:space])
+                new = new[space:]
+            for chunk in utils.list_chunks(new, self.storage.block_size):
+                self._blocks.append(_Block(records=chunk))
+        self._starts = None
+
+class KeyedStorage:
+    """
+    Storage backend which splits the sorted collections of the database into
+    blocks, see the module description.
+
+    :param str dbdir: path to the directory where the files are stored
+    :param str dbname: name of the database
+    :param apply_changes: ignored, the changed blocks are detected when saving
+    :param dict record_keys:
+        the collections of the database which are split into blocks, see
+        :py:attr:`ws.cache.CacheDb.record_keys`. Other values are stored in
+        the index.
+    """
+
+    #: name of the index file inside the database directory
+    index_name = "index.json"
+    #: number of records in a block
+    block_size = 1000
+    #: time in seconds after which the blocks which are no longer referenced are removed
+    obsolete_grace = 3600
+
+    def __init__(self, dbdir, dbname, apply_changes=None, record_keys=None):
+        self.dbdir = dbdir
+        self.dbname = dbname
+        self.record_keys = record_keys or {}
+        self.path = os.path.join(dbdir, dbname + ".keyed")
+        self.indexpath = os.path.join(self.path, self.index_name)
+
+    def exists(self):
+        """
+        :returns: ``True`` if the database exists on disk
+        """
+        return os.path.isfile(self.indexpath) or JsonStorage(self.dbdir, self.dbname).exists()
+
+    def version(self):
+        """
+        :returns: a value which changes whenever the database is saved
+        """
+        return _file_version(self.indexpath) or JsonStorage(self.dbdir, self.dbname).version()
+
+    def _read_index(self):
+        with open(self.indexpath, mode="rt", encoding="utf-8") as f:
+            return json.load(f, object_hook=utils.datetime_parser)
+
+    def _read_block(self, entry):
+        path = os.path.join(self.path, entry["file"])
+        logger.debug("Loading block {} ...".format(path))
+        with gzip.open(path, mode="rb") as f:
+            raw = f.read()
+        if md5sum(raw) != entry["md5"]:
+            raise CacheDbError("md5sum of the block {} differs. Please investigate...".format(path))
+        return _decode(raw)
+
+    def load(self):
+        """
+        Load the index of the database. The collections are returned as
+        :py:class:`LazyRecords`. If only a database saved by
+        :py:class:`ws.cache.storage.JsonStorage` exists, it is loaded
+        instead and converted on the next :py:meth:`save`.
+
+        :returns: a tuple ``(data, meta)``
+        """
+        if not os.path.isfile(self.indexpath):
+            logger.info("Migrating the {} database to the keyed storage.".format(self.dbname))
+            return JsonStorage(self.dbdir, self.dbname).load()
+
+        logger.info("Loading index from {} ...".format(self.indexpath))
+        index = self._read_index()
+        collections_ = dict((c["name"], c) for c in index["collections"])
+        if None in collections_:
+            c = collections_[None]
+            data = LazyRecords(self, c["key"], c["blocks"])
+        else:
+            data = index["data"]
+            for name, c in collections_.items():
+                data[name] = LazyRecords(self, c["key"], c["blocks"])
+        return data, _parse_meta(index["meta"])
+
+    def _save_blocks(self, value, key, index, old_entries):
+        """
+        Split a collection into blocks and write the blocks which have changed.
+
+        :returns: the list of blocks
+        """
+        if isinstance(value, LazyRecords) and value.storage is self:
+            blocks = value._blocks
+        else:
+            blocks = [_Block(records=list(chunk)) for chunk in utils.list_chunks(list(value), self.block_size)]
+
+        new_blocks = []
+        for block in blocks:
+            if block.records is None:
+                new_blocks.append(block)
+                continue
+            if not block.records:
+                continue
+            # split blocks which have grown too much
+            for chunk in utils.list_chunks(block.records, self.block_size if len(block.records) > 2 * self.block_size else len(block.records)):
+                raw = _encode(chunk)
+                md5 = md5sum(raw)
+                entry = block.entry if len(chunk) == len(block.records) else None
+                if entry is None or entry["md5"] != md5 or entry["file"] not in old_entries:
+                    index["last_id"] += 1
+                    entry = {"file": "{:08d}.json.gz".format(index["last_id"]), "md5": md5}
+                    _replace_file(os.path.join(self.path, entry["file"]), gzip.compress(raw, compresslevel=3))
+                entry = dict(entry, first=chunk[0][key], last=chunk[-1][key], count=len(chunk))
+                new_blocks.append(_Block(entry, chunk))
+
+        if isinstance(value, LazyRecords) and value.storage is self:
+            value._set_blocks(new_blocks)
+        return [block.entry for block in new_blocks]
+
+    def save(self, data, meta, changes=None):
+        """
+        Save the database to disk.
+
+        :param data: the data structure of the database
+        :param dict meta: the meta data
+        :param changes: ignored, the changed blocks are detected by their checksums
+        """
+        logger.info("Saving data to {} ...".format(self.path))
+        os.makedirs(self.path, exist_ok=True)
+        if os.path.isfile(self.indexpath):
+            old_index = self._read_index()
+        else:
+            old_index = {"last_id": 0, "collections": []}
+        old_entries = set(entry["file"] for c in old_index["collections"] for entry in c["blocks"])
+        index = {"last_id": old_index["last_id"], "collections": [], "data": None}
+
+        if None in self.record_keys:
+            index["collections"].append({"name": None, "key": self.record_keys[None],
+                                         "blocks": self._save_blocks(data, self.record_keys[None], index, old_entries)})
+        else:
+            index["data"] = {}
+            for name, value in data.items():
+                key = self.record_keys.get(name)
+                if key is None:
+                    index["data"][name] = value
+                else:
+                    index["collections"].append({"name": name, "key": key,
+                                                 "blocks": self._save_blocks(value, key, index, old_entries)})
+        index["meta"] = _serialize_meta(meta)
+
+        # Readers in other processes may still load blocks of the previous
+        # version lazily, so the obsolete blocks are removed only after a
+        # grace period.
+        now = time.time()
+        new_entries = set(entry["file"] for c in index["collections"] for entry in c["blocks"])
+        index["obsolete"] = []
+        expired = []
+        for name, since in old_index.get("obsolete", []) + [[name, now] for name in sorted(old_entries - new_entries)]:
+            if name in new_entries:
+                continue
+            if now - since < self.obsolete_grace:
+                index["obsolete"].append([name, since])
+            else:
+                expired.append(name)
+
+        # the atomic replacement of the index is the commit point
+        _replace_file(self.indexpath, json.dumps(index, cls=utils.DatetimeEncoder, indent=1), mode="wt")
+
+        for name in expired:
+            try:
+                os.remove(os.path.join(self.path, name))
+            except FileNotFoundError:
+                pass
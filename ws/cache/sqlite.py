@@ -0,0 +1,358 @@
+#! /usr/bin/env python3
+
+"""
+SQLite storage backend for the :py:class:`ws.cache.CacheDb` databases.
+
+Each sorted collection listed in :py:attr:`ws.cache.CacheDb.record_keys` is
+stored in a table with one row per record. Besides the record key (the
+primary key) and the JSON-encoded record, the ``user`` and ``timestamp``
+properties of the records are stored in separate indexed columns, so the
+records can be queried by user and time range. The other values of the
+database are stored as JSON documents in the ``data`` table.
+
+Loading the database does not read the records: the collections are
+represented by :py:class:`SQLiteRecords` objects, which run queries on
+demand. The changes reported by :py:meth:`ws.cache.CacheDb._record_change`
+are saved as row upserts and committed by :py:meth:`SQLiteStorage.save` in one
+transaction.
+
+Consumers can use :py:meth:`SQLiteRecords.select` and
+:py:meth:`SQLiteRecords.group_by` for range and group-by queries:
+
+.. code-block:: python
+
+    db = AllRevisionsProps(api, cache_dir, storage="sqlite")
+    revisions = db["revisions"]
+    for user, count in revisions.group_by("user", where="timestamp >= ?", params=["2018-01-01"]):
+        ...
+"""
+
+import collections.abc
+import datetime
+import json
+import os
+import sqlite3
+import logging
+
+from ws import utils
+
+from .storage import SegmentedStorage, _serialize_meta, _parse_meta
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["SQLiteRecords", "SQLiteStorage", "format_timestamp"]
+
+def format_timestamp(timestamp):
+    """
+    Format a timestamp the way it is stored in the ``timestamp`` column, e.g.
+    for comparisons in :py:meth:`SQLiteRecords.select`.
+
+    :param timestamp: a :py:class:`datetime.datetime` object or a string
+    """
+    if isinstance(timestamp, datetime.datetime):
+        return timestamp.strftime("%Y-%m-%d %H:%M:%S")
+    return timestamp
+
+def _quote(name):
+    return '"{}"'.format(name.replace('"', '""'))
+
+class SQLiteRecords(collections.abc.MutableSequence):
+    """
+    A sorted collection of records stored in an SQLite table. It behaves like
+    a list of records sorted by the key, but each access runs a query, so code
+    which needs only a part of the records should use :py:meth:`find`,
+    :py:meth:`find_range`, :py:meth:`select` or :py:meth:`group_by`.
+
+    The records are decoded on each access, modifications of the returned
+    dictionaries are saved only when reported by
+    :py:meth:`ws.cache.CacheDb._record_change`.
+
+    :param SQLiteStorage storage: the storage holding the table
+    :param str table: name of the table
+    :param str key: the key of the records by which the collection is sorted
+    """
+
+    def __init__(self, storage, table, key):
+        self.storage = storage
+        self.table = table
+        self.key = key
+
+    @property
+    def _conn(self):
+        return self.storage.connection
+
+    def _query(self, sql, params=()):
+        return self._conn.execute(sql.format(table=_quote(self.table)), params)
+
+    @staticmethod
+    def _decode(row):
+        return json.loads(row[0], object_hook=utils.datetime_parser)
+
+    def __len__(self):
+        return self._query("SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return list(self)[index]
+            rows = self._query("SELECT record FROM {table} ORDER BY key LIMIT ? OFFSET ?", (max(0, stop - start), start))
+            return [self._decode(row) for row in rows]
+        if index < 0:
+            # the last records are accessed often (e.g. the last revision ID)
+            row = self._query("SELECT record FROM {table} ORDER BY key DESC LIMIT 1 OFFSET ?", (-index - 1,)).fetchone()
+        else:
+            row = self._query("SELECT record FROM {table} ORDER BY key LIMIT 1 OFFSET ?", (index,)).fetchone()
+        if row is None:
+            raise IndexError("SQLiteRecords index out of range")
+        return self._decode(row)
+
+    def __iter__(self):
+        for row in self._query("SELECT record FROM {table} ORDER BY key"):
+            yield self._decode(row)
+
+    def __setitem__(self, index, record):
+        if isinstance(index, slice):
+            raise TypeError("SQLiteRecords does not support slice assignment")
+        self.upsert([record])
+
+    def insert(self, index, record):
+        # the position is determined by the key
+        self.upsert([record])
+
+    def __delitem__(self, index):
+        record = self[index]
+        self._query("DELETE FROM {table} WHERE key = ?", (record[self.key],))
+
+    def upsert(self, records):
+        """
+        Insert the records or replace the existing records with the same key.
+        The changes are committed by :py:meth:`SQLiteStorage.save`.
+        """
+        rows = []
+        for record in records:
+            timestamp = record.get("timestamp")
+            rows.append((record[self.key], record.get("user"), format_timestamp(timestamp),
+                         json.dumps(record, cls=utils.DatetimeEncoder)))
+        self._conn.executemany("INSERT OR REPLACE INTO {} (key, user, timestamp, record) VALUES (?, ?, ?, ?)"
+                               .format(_quote(self.table)), rows)
+
+    def merge_sorted(self, records):
+        """
+        Merge records into the collection, see :py:func:`ws.utils.merge_sorted`.
+        """
+        self.upsert(records)
+
+    def find(self, key):
+        """
+        Find a record by its key.
+
+        :raises KeyError: when the record is not found
+        """
+        row = self._query("SELECT record FROM {table} WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return self._decode(row)
+
+    def find_range(self, first, last):
+        """
+        Find all records whose keys are in the closed interval ``[first, last]``.
+
+        :returns: a list of records
+        """
+        return list(self.select("key BETWEEN ? AND ?", (first, last)))
+
+    def select(self, where=None, params=(), order_by="key"):
+        """
+        Iterate over the records matching a condition. The records are read
+        from the database incrementally.
+
+        :param str where:
+            an SQL condition on the columns ``key``, ``user`` and ``timestamp``
+            (see :py:func:`format_timestamp`), e.g. ``"user = ?"``
+        :param params: parameters for the placeholders in ``where``
+        :param str order_by: an SQL ordering expression
+        :yields: the records
+        """
+        sql = "SELECT record FROM {table}"
+        if where:
+            sql += " WHERE " + where
+        if order_by:
+            sql += " ORDER BY " + order_by
+        for row in self._query(sql, params):
+            yield self._decode(row)
+
+    def group_by(self, column, aggregate="COUNT(*)", where=None, params=()):
+        """
+        Run a group-by query over the records.
+
+        :param str column: the column (or SQL expression) to group by, e.g. ``"user"``
+        :param str aggregate: an SQL aggregate expression, e.g. ``"MIN(timestamp)"``
+        :param str where: an SQL condition, see :py:meth:`select`
+        :param params: parameters for the placeholders in ``where``
+        :returns: a list of tuples ``(value, aggregate)`` sorted by the value
+        """
+        sql = "SELECT {column}, {aggregate} FROM {{table}}".format(column=column, aggregate=aggregate)
+        if where:
+            sql += " WHERE " + where
+        sql += " GROUP BY {column} ORDER BY {column}".format(column=column)
+        return self._query(sql, params).fetchall()
+
+class SQLiteStorage:
+    """
+    Storage backend keeping the database in an SQLite file, see the module
+    description.
+
+    :param str dbdir: path to the directory where the files are stored
+    :param str dbname: name of the database
+    :param apply_changes:
+        used when loading a database saved by
+        :py:class:`ws.cache.storage.SegmentedStorage`
+    :param dict record_keys:
+        the collections of the database which are stored in tables, see
+        :py:attr:`ws.cache.CacheDb.record_keys`
+    """
+
+    def __init__(self, dbdir, dbname, apply_changes, record_keys=None):
+        if not record_keys:
+            raise ValueError("the sqlite storage requires a database with record_keys")
+        self.dbdir = dbdir
+        self.dbname = dbname
+        self.record_keys = record_keys
+        self.dbpath = os.path.join(dbdir, dbname + ".sqlite")
+        self._fallback = SegmentedStorage(dbdir, dbname, apply_changes)
+        self._connection = None
+
+    @property
+    def connection(self):
+        """
+        The :py:class:`sqlite3.Connection` to the database file.
+        """
+        if self._connection is None:
+            os.makedirs(self.dbdir, exist_ok=True)
+            self._connection = sqlite3.connect(self.dbpath)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._create_schema()
+        return self._connection
+
+    @staticmethod
+    def _table(name):
+        # the name None stands for the data itself
+        return "records" if name is None else "records_" + name
+
+    def _create_schema(self):
+        conn = self._connection
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS data (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        for name, key in self.record_keys.items():
+            if key is None:
+                continue
+            table = _quote(self._table(name))
+            conn.execute("CREATE TABLE IF NOT EXISTS {} (key PRIMARY KEY, user TEXT, timestamp TEXT, record TEXT NOT NULL)".format(table))
+            conn.execute("CREATE INDEX IF NOT EXISTS {} ON {} (user, timestamp)".format(_quote(self._table(name) + "_user"), table))
+            conn.execute("CREATE INDEX IF NOT EXISTS {} ON {} (timestamp)".format(_quote(self._table(name) + "_timestamp"), table))
+        conn.commit()
+
+    def _get_meta(self, name):
+        row = self.connection.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def exists(self):
+        """
+        :returns: ``True`` if the database exists on disk
+        """
+        if os.path.isfile(self.dbpath) and self._get_meta("commit") is not None:
+            return True
+        return self._fallback.exists()
+
+    def version(self):
+        """
+        :returns: a value which changes whenever the database is saved
+        """
+        if os.path.isfile(self.dbpath):
+            commit = self._get_meta("commit")
+            if commit is not None:
+                return commit
+        return self._fallback.version()
+
+    def close(self):
+        """
+        Close the connection to the database. Uncommitted changes are lost.
+        """
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def load(self):
+        """
+        Load the database. The collections are returned as
+        :py:class:`SQLiteRecords`, no records are read. If the database was
+        saved by another backend, it is loaded from there and converted on
+        the next :py:meth:`save`.
+
+        :returns: a tuple ``(data, meta)``
+        """
+        if not os.path.isfile(self.dbpath) or self._get_meta("commit") is None:
+            logger.info("Migrating the {} database to the sqlite storage.".format(self.dbname))
+            return self._fallback.load()
+
+        logger.info("Opening database {} ...".format(self.dbpath))
+        # discard uncommitted changes
+        self.connection.rollback()
+        meta = _parse_meta(self._get_meta("meta") or {})
+        if None in self.record_keys:
+            return SQLiteRecords(self, self._table(None), self.record_keys[None]), meta
+        data = {}
+        for name, value in self.connection.execute("SELECT name, value FROM data"):
+            data[name] = json.loads(value, object_hook=utils.datetime_parser)
+        for name, key in self.record_keys.items():
+            if key is not None:
+                data[name] = SQLiteRecords(self, self._table(name), key)
+        return data, meta
+
+    def _save_collection(self, name, value, changes):
+        records = SQLiteRecords(self, self._table(name), self.record_keys[name])
+        if isinstance(value, SQLiteRecords) and value.storage is self:
+            # the records were upserted already, but the dictionaries might
+            # have been modified in place since
+            if changes is not None:
+                records.upsert(record for collection, record in changes if collection == name)
+        else:
+            self.connection.execute("DELETE FROM {}".format(_quote(records.table)))
+            records.upsert(value)
+
+    def save(self, data, meta, changes=None):
+        """
+        Commit the changes to the database.
+
+        :param data: the data structure of the database
+        :param dict meta: the meta data
+        :param list changes:
+            the changes since the last save, the records are upserted. If
+            ``None``, the tables are replaced with the content of ``data``
+            (unless the collections are :py:class:`SQLiteRecords` of this
+            storage).
+        """
+        logger.info("Saving data to {} ...".format(self.dbpath))
+        conn = self.connection
+        try:
+            if None in self.record_keys:
+                self._save_collection(None, data, changes)
+            else:
+                for name, value in data.items():
+                    if self.record_keys.get(name) is not None:
+                        self._save_collection(name, value, changes)
+                    else:
+                        conn.execute("INSERT OR REPLACE INTO data (name, value) VALUES (?, ?)",
+                                     (name, json.dumps(value, cls=utils.DatetimeEncoder)))
+            commit = (self._get_meta("commit") or 0) + 1
+            conn.executemany("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", [
+                ("meta", json.dumps(_serialize_meta(meta))),
+                ("commit", json.dumps(commit)),
+            ])
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
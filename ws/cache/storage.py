@@ -0,0 +1,471 @@
+#! /usr/bin/env python3
+
+"""
+Storage backends for the :py:class:`ws.cache.CacheDb` databases.
+
+:py:class:`JsonStorage` saves the whole database in one gzipped JSON file,
+which is rewritten on each :py:meth:`dump() <ws.cache.CacheDb.dump>`.
+
+:py:class:`SegmentedStorage` is an append-only storage: the records changed
+since the last dump are appended as a new compressed *delta segment*, so the
+cost of an update is proportional to the size of the change rather than the
+size of the database. The segments are listed in a small index file together
+with their checksums, which are verified per segment when loading. When the
+delta segments grow too big, they are merged with the last *snapshot segment*
+into a new snapshot by a background thread.
+
+:py:class:`ws.cache.keyed.KeyedStorage` splits the sorted collections into
+blocks which are loaded on demand, see the :py:mod:`ws.cache.keyed` module.
+"""
+
+import os
+import gzip
+import json
+import hashlib
+import datetime
+import tempfile
+import threading
+import contextlib
+import logging
+
+try:
+    import fcntl
+    _has_fcntl = True
+except ImportError:
+    _has_fcntl = False
+
+from ws.utils import parse_timestamps_in_struct, DatetimeEncoder, datetime_parser
+
+from . import CacheDbError
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["FileLock", "database_lock", "JsonStorage", "SegmentedStorage", "STORAGE_BACKENDS"]
+
+def md5sum(bytes_):
+    h = hashlib.md5()
+    h.update(bytes_)
+    return h.hexdigest()
+
+#: format for JSON (de)serialization of datetime.datetime timestamps in the meta data
+ts_format = "%Y-%m-%dT%H:%M:%S.%f"
+
+def _serialize_meta(meta):
+    # create copy and serialize timestamp (the type of the "real" timestamp
+    # in meta should always be datetime.datetime)
+    m = meta.copy()
+    if "timestamp" in m:
+        m["timestamp"] = m["timestamp"].strftime(ts_format)
+    return m
+
+def _parse_meta(meta):
+    if "timestamp" in meta:
+        meta["timestamp"] = datetime.datetime.strptime(meta["timestamp"], ts_format)
+    return meta
+
+def _encode(data):
+    return json.dumps(data, cls=DatetimeEncoder).encode("utf-8")
+
+def _decode(bytes_):
+    data = json.loads(bytes_.decode("utf-8"), object_hook=datetime_parser)
+    # manual conversion is necessary only for migration
+    parse_timestamps_in_struct(data)
+    return data
+
+def _replace_file(path, content, mode="wb"):
+    """
+    Atomically replace the content of a file.
+    """
+    dirname, basename = os.path.split(path)
+    fd, tmppath = tempfile.mkstemp(dir=dirname, prefix="." + basename + ".")
+    try:
+        with os.fdopen(fd, mode=mode) as f:
+            f.write(content)
+        os.replace(tmppath, path)
+    except BaseException:
+        os.remove(tmppath)
+        raise
+
+def _file_version(path):
+    """
+    :returns: a value which changes whenever the file is replaced or modified
+              (``None`` if the file does not exist)
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+class FileLock:
+    """
+    Advisory lock on a file, shared by all processes working with the same
+    database. Any number of readers can hold the lock in the shared mode, a
+    writer holds it in the exclusive mode. The lock is reentrant for the same
+    :py:class:`FileLock` object (an exclusive lock satisfies nested shared
+    requests), separate objects for the same file exclude each other even
+    inside one process.
+
+    On platforms without :py:mod:`fcntl`, the lock does nothing.
+
+    :param str path: path to the lock file, created if necessary
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._exclusive = False
+        self._depth = 0
+
+    def acquire(self, exclusive=False, blocking=True):
+        """
+        Acquire the lock.
+
+        :param bool exclusive: whether to acquire an exclusive lock
+        :param bool blocking: whether to wait until the lock is available
+        :returns: ``True`` if the lock was acquired, ``False`` otherwise
+        """
+        if self._depth > 0:
+            if exclusive and not self._exclusive:
+                # upgrading a shared lock would deadlock with other readers
+                # which are waiting for an upgrade too
+                raise RuntimeError("cannot upgrade a shared lock to an exclusive lock")
+            self._depth += 1
+            return True
+        if _has_fcntl:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            f = open(self.path, "a")
+            flags = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+            if not blocking:
+                flags |= fcntl.LOCK_NB
+            try:
+                fcntl.flock(f.fileno(), flags)
+            except BlockingIOError:
+                f.close()
+                return False
+            except BaseException:
+                f.close()
+                raise
+            self._file = f
+        self._exclusive = exclusive
+        self._depth = 1
+        return True
+
+    def release(self):
+        """
+        Release the lock.
+        """
+        if self._depth == 0:
+            raise RuntimeError("the lock is not held")
+        self._depth -= 1
+        if self._depth == 0 and self._file is not None:
+            # closing the file releases the lock
+            self._file.close()
+            self._file = None
+
+    @contextlib.contextmanager
+    def __call__(self, exclusive=False):
+        """
+        Context manager acquiring the lock for the duration of the block.
+        """
+        self.acquire(exclusive)
+        try:
+            yield self
+        finally:
+            self.release()
+
+def database_lock(dbdir, dbname):
+    """
+    :returns: the :py:class:`FileLock` protecting the database files
+    """
+    return FileLock(os.path.join(dbdir, dbname + ".lock"))
+
+class JsonStorage:
+    """
+    The whole database is saved in one gzipped JSON file, the meta data are
+    saved in a separate file.
+
+    :param str dbdir: path to the directory where the files are stored
+    :param str dbname: name of the database
+    :param apply_changes: ignored, the whole database is always saved
+    :param record_keys: ignored
+    """
+
+    def __init__(self, dbdir, dbname, apply_changes=None, record_keys=None):
+        self.dbpath = os.path.join(dbdir, dbname + ".db.json.gz")
+        self.metapath = os.path.join(dbdir, dbname + ".meta")
+
+    def exists(self):
+        """
+        :returns: ``True`` if the database exists on disk
+        """
+        return os.path.isfile(self.dbpath)
+
+    def version(self):
+        """
+        :returns: a value which changes whenever the database is saved
+        """
+        return _file_version(self.metapath)
+
+    def load(self):
+        """
+        Load the database from disk.
+
+        :returns: a tuple ``(data, meta)``
+        """
+        logger.info("Loading data from {} ...".format(self.dbpath))
+        with gzip.open(self.dbpath, mode="rb") as db:
+            s = db.read()
+        md5_new = md5sum(s)
+
+        meta = {}
+        # TODO: make meta file mandatory at some point
+        if os.path.isfile(self.metapath):
+            with open(self.metapath, mode="rt", encoding="utf-8") as f:
+                meta.update(_parse_meta(json.loads(f.read())))
+            if md5_new != meta.get("md5"):
+                raise CacheDbError("md5sums of the database {} differ. Please investigate...".format(self.dbpath))
+        else:
+            meta["md5"] = md5_new
+
+        return _decode(s), meta
+
+    def save(self, data, meta, changes=None):
+        """
+        Save the database to disk.
+
+        :param data: the data structure of the database
+        :param dict meta: the meta data, the ``"md5"`` key is updated
+        :param changes: ignored, the whole database is always saved
+        """
+        logger.info("Saving data to {} ...".format(self.dbpath))
+        os.makedirs(os.path.dirname(self.dbpath), exist_ok=True)
+
+        s = _encode(data)
+        meta["md5"] = md5sum(s)
+
+        _replace_file(self.dbpath, gzip.compress(s, compresslevel=3))
+        _replace_file(self.metapath, json.dumps(_serialize_meta(meta), indent=4, sort_keys=True), mode="wt")
+
+class SegmentedStorage:
+    """
+    Append-only storage consisting of compressed segments listed in an index.
+
+    :param str dbdir: path to the directory where the files are stored
+    :param str dbname: name of the database
+    :param apply_changes:
+        a function ``apply_changes(data, changes)`` applying a list of changes
+        (as passed to :py:meth:`save`) to the data structure in place
+    :param record_keys: ignored, the changes are applied by ``apply_changes``
+    """
+
+    #: name of the index file inside the segments directory
+    index_name = "index.json"
+    #: maximum number of delta segments before a compaction is triggered
+    max_deltas = 32
+    #: maximum ratio of the size of the delta segments to the snapshot size before a compaction is triggered
+    max_delta_ratio = 0.5
+
+    def __init__(self, dbdir, dbname, apply_changes, record_keys=None):
+        self.dbdir = dbdir
+        self.dbname = dbname
+        self.apply_changes = apply_changes
+        self.path = os.path.join(dbdir, dbname + ".segments")
+        self.indexpath = os.path.join(self.path, self.index_name)
+        # serializes the modifications of the index
+        self._lock = threading.Lock()
+        self._compaction = None
+
+    def exists(self):
+        """
+        :returns: ``True`` if the database exists on disk
+        """
+        return os.path.isfile(self.indexpath) or JsonStorage(self.dbdir, self.dbname).exists()
+
+    def version(self):
+        """
+        :returns: a value which changes whenever the database is saved
+        """
+        # the index is rewritten by the compaction too, which does not change
+        # the content of the database, so it cannot be versioned by the file
+        try:
+            with self._lock:
+                index = self._read_index()
+        except FileNotFoundError:
+            return JsonStorage(self.dbdir, self.dbname).version()
+        return ("commit", index.get("commit", 0))
+
+    def _read_index(self):
+        with open(self.indexpath, mode="rt", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_index(self, index):
+        # the atomic replacement of the index is the commit point
+        _replace_file(self.indexpath, json.dumps(index, indent=4, sort_keys=True), mode="wt")
+
+    def _segment_path(self, segment):
+        return os.path.join(self.path, segment["file"])
+
+    def _read_segment(self, segment):
+        path = self._segment_path(segment)
+        with open(path, mode="rb") as f:
+            raw = f.read()
+        if md5sum(raw) != segment["md5"]:
+            raise CacheDbError("md5sum of the segment {} differs. Please investigate...".format(path))
+        return _decode(gzip.decompress(raw))
+
+    def _write_segment(self, index, kind, content, segment_id=None):
+        if segment_id is None:
+            index["last_id"] += 1
+            segment_id = index["last_id"]
+        name = "{:08d}.{}.json.gz".format(segment_id, kind)
+        raw = gzip.compress(_encode(content), compresslevel=3)
+        segment = {"file": name, "type": kind, "md5": md5sum(raw), "size": len(raw)}
+        _replace_file(self._segment_path(segment), raw)
+        return segment
+
+    def _replay(self, segments):
+        data = None
+        for segment in segments:
+            content = self._read_segment(segment)
+            if segment["type"] == "snapshot":
+                data = content
+            else:
+                self.apply_changes(data, content)
+        return data
+
+    def load(self):
+        """
+        Load the database from disk. If only a database saved by
+        :py:class:`JsonStorage` exists, it is loaded instead and converted on
+        the next :py:meth:`save`.
+
+        :returns: a tuple ``(data, meta)``
+        """
+        if not os.path.isfile(self.indexpath):
+            logger.info("Migrating the {} database to the segmented storage.".format(self.dbname))
+            return JsonStorage(self.dbdir, self.dbname).load()
+
+        logger.info("Loading data from {} ...".format(self.path))
+        with self._lock:
+            index = self._read_index()
+        data = self._replay(index["segments"])
+        return data, _parse_meta(index["meta"])
+
+    def save(self, data, meta, changes=None):
+        """
+        Save the database to disk.
+
+        :param data: the data structure of the database
+        :param dict meta: the meta data
+        :param list changes:
+            a list of changes since the last save, which is appended as a
+            delta segment. If ``None``, the whole data structure is saved as
+            a new snapshot and the previous segments are removed.
+        """
+        os.makedirs(self.path, exist_ok=True)
+
+        with self._lock:
+            if changes is not None and os.path.isfile(self.indexpath):
+                index = self._read_index()
+                if not changes:
+                    logger.info("Saving meta data to {} ...".format(self.indexpath))
+                else:
+                    logger.info("Appending {} records to {} ...".format(len(changes), self.path))
+                    index["segments"].append(self._write_segment(index, "delta", changes))
+                obsolete = []
+            else:
+                logger.info("Saving data to {} ...".format(self.path))
+                index = self._read_index() if os.path.isfile(self.indexpath) else {"last_id": 0, "segments": []}
+                obsolete = index["segments"]
+                index["segments"] = [self._write_segment(index, "snapshot", data)]
+            index["meta"] = _serialize_meta(meta)
+            index["commit"] = index.get("commit", 0) + 1
+            self._write_index(index)
+            self._remove_segments(obsolete)
+
+            if self._needs_compaction(index["segments"]):
+                self._compaction = threading.Thread(target=self._compact_background, name="compaction-" + self.dbname)
+                self._compaction.start()
+
+    def _remove_segments(self, segments):
+        for segment in segments:
+            try:
+                os.remove(self._segment_path(segment))
+            except FileNotFoundError:
+                pass
+
+    def _needs_compaction(self, segments):
+        deltas = [s for s in segments if s["type"] == "delta"]
+        if not deltas:
+            return False
+        snapshot_size = sum(s["size"] for s in segments if s["type"] == "snapshot")
+        return len(deltas) > self.max_deltas or sum(s["size"] for s in deltas) > self.max_delta_ratio * snapshot_size
+
+    def _compact_background(self):
+        try:
+            self.compact()
+        except Exception:
+            # the segments are still valid, the compaction will be retried after the next save
+            logger.exception("Compaction of {} failed.".format(self.path))
+
+    def compact(self):
+        """
+        Merge all segments into a new snapshot segment. Segments appended
+        while the compaction is running are kept.
+
+        Called automatically in a background thread from :py:meth:`save`.
+        """
+        # the file lock excludes other processes, it is always acquired before self._lock
+        file_lock = database_lock(self.dbdir, self.dbname)
+        with file_lock(exclusive=True), self._lock:
+            index = self._read_index()
+            # reserve an ID for the new snapshot
+            index["last_id"] += 1
+            snapshot_id = index["last_id"]
+            self._write_index(index)
+        segments = index["segments"]
+        logger.info("Compacting {} segments of {} ...".format(len(segments), self.path))
+        with file_lock():
+            data = self._replay(segments)
+        snapshot = self._write_segment(index, "snapshot", data, segment_id=snapshot_id)
+
+        with file_lock(exclusive=True), self._lock:
+            index = self._read_index()
+            if index["segments"][:len(segments)] != segments:
+                # a new snapshot was saved in the meantime
+                self._remove_segments([snapshot])
+                return
+            # keep the segments appended in the meantime
+            index["segments"] = [snapshot] + index["segments"][len(segments):]
+            self._write_index(index)
+            self._remove_segments(segments)
+        logger.info("Compaction of {} finished.".format(self.path))
+
+    def wait(self):
+        """
+        Wait until the background compaction (if any) is finished.
+        """
+        compaction = self._compaction
+        if compaction is not None and compaction is not threading.current_thread():
+            compaction.join()
+            self._compaction = None
+
+#: storage backends available for :py:class:`ws.cache.CacheDb`
+STORAGE_BACKENDS = {
+    "json": JsonStorage,
+    "segmented": SegmentedStorage,
+}
+
+from .keyed import KeyedStorage
+STORAGE_BACKENDS["keyed"] = KeyedStorage
+
+from .sqlite import SQLiteStorage
+STORAGE_BACKENDS["sqlite"] = SQLiteStorage
+
+# the columnar storage requires numpy
+try:
+    from .columnar import ColumnarStorage
+    STORAGE_BACKENDS["columnar"] = ColumnarStorage
+except ImportError:
+    pass
@@ -2,3 +2,4 @@
 
 from .connection import *
 from .api import *
+from .async_api import *
@@ -2,10 +2,13 @@
 
 import hashlib
 import logging
+import collections
+import concurrent.futures
 
-from ..utils import RateLimited, LazyProperty
+from ..utils import LazyProperty, list_chunks, dmerge
 
 from .connection import Connection, APIError
+from .instrumentation import request_labels
 from .site import Site
 from .user import User
 from .tags import Tags
@@ -175,13 +178,16 @@ class API(Connection):
         """
         Parse a MediaWiki title.
 
+        The context of the parser is cached, see :py:attr:`Site.title_context
+        <ws.client.site.Site.title_context>`.
+
         :param str title: page title to be parsed
         :returns: a :py:class:`ws.parser_helpers.title.Title` object
         """
         # lazy import - ws.parser_helpers.title imports mwparserfromhell which is
         # an optional dependency
-        from ..parser_helpers.title import Context, Title
-        return Title(Context.from_api(self), title)
+        from ..parser_helpers.title import Title
+        return Title(self.site.title_context, title)
 
 
     def query_continue(self, params=None, **kwargs):
@@ -197,6 +203,41 @@ class API(Connection):
 
         .. _`query-continue feature`: https://www.mediawiki.org/wiki/API:Query#Continuing_queries
         """
+        params = self._query_params(params, kwargs)
+        last_continue = {"continue": ""}
+        depth = 0
+
+        try:
+            while True:
+                # clone the original params to clean up old continue params
+                params_copy = params.copy()
+                # and update with the last continue -- it may involve multiple params,
+                # hence the clean up with params.copy()
+                params_copy.update(last_continue)
+                # call the API and handle the result
+                result = self.call_api(params_copy, expand_result=False)
+                depth += 1
+                if "query" in result:
+                    yield result["query"]
+                if "continue" not in result:
+                    break
+                last_continue = result["continue"]
+        finally:
+            self._record_continuation(params, depth)
+
+    def _record_continuation(self, params, depth):
+        """
+        Notify the :py:attr:`instrumentation` hook about a finished continuation stream.
+        """
+        if self.instrumentation is not None and depth > 0:
+            self.instrumentation.record_continuation(*request_labels(params), depth)
+
+    @staticmethod
+    def _query_params(params, kwargs):
+        """
+        Check the parameters passed to :py:meth:`query_continue` and return a
+        copy with ``action`` set to ``"query"``.
+        """
         if params is None:
             params = kwargs
         elif not isinstance(params, dict):
@@ -207,24 +248,32 @@ class API(Connection):
             # create copy before adding action=query
             params = params.copy()
         params["action"] = "query"
+        return params
 
+    def _query_continue_stream(self, params, kwargs, path):
+        """
+        Like :py:meth:`query_continue`, but the responses are decoded
+        incrementally by :py:meth:`ws.client.connection.Connection.call_api_stream`
+        and the items of the container at ``path`` are yielded.
+        """
+        params = self._query_params(params, kwargs)
         last_continue = {"continue": ""}
+        depth = 0
 
-        while True:
-            # clone the original params to clean up old continue params
-            params_copy = params.copy()
-            # and update with the last continue -- it may involve multiple params,
-            # hence the clean up with params.copy()
-            params_copy.update(last_continue)
-            # call the API and handle the result
-            result = self.call_api(params_copy, expand_result=False)
-            if "query" in result:
-                yield result["query"]
-            if "continue" not in result:
-                break
-            last_continue = result["continue"]
-
-    def generator(self, params=None, **kwargs):
+        try:
+            while True:
+                # see query_continue for the handling of the continue params
+                params_copy = params.copy()
+                params_copy.update(last_continue)
+                depth += 1
+                result = yield from self.call_api_stream(path, params_copy)
+                if "continue" not in result:
+                    break
+                last_continue = result["continue"]
+        finally:
+            self._record_continuation(params, depth)
+
+    def generator(self, params=None, *, stream=False, **kwargs):
         """
         Interface to API:Generators, conveniently implemented as Python
         generator.
@@ -232,6 +281,11 @@ class API(Connection):
         Parameter ``generator`` must be supplied.
 
         :param params: same as :py:meth:`API.query_continue`
+        :param bool stream:
+            if ``True``, the responses are decoded incrementally (see
+            :py:meth:`ws.client.connection.Connection.call_api_stream`) and
+            the pages are yielded in the order of the response instead of
+            being sorted by title
         :param kwargs: same as :py:meth:`API.query_continue`
         :yields: from ``"pages"`` part of the API response
 
@@ -247,12 +301,18 @@ class API(Connection):
         point of API:Generators). As a result, a page may be yielded multiple
         times. For applications where this matters, see
         :py:meth:`ws.interlanguage.InterlanguageLinks.InterlanguageLinks._get_allpages`
-        for an example of proper handling of this case.
+        for an example of proper handling of this case. When the pages are
+        specified by titles, page IDs or revision IDs, the :py:meth:`query_pages`
+        method squashes the fragments automatically.
         """
         generator_ = kwargs.get("generator") if params is None else params.get("generator")
         if generator_ is None:
             raise ValueError("param 'generator' must be supplied")
 
+        if stream is True:
+            yield from self._query_continue_stream(params, kwargs, "query.pages")
+            return
+
         for snippet in self.query_continue(params, **kwargs):
             # API generator returns dict !!!
             # for example:  snippet === {"pages":
@@ -261,13 +321,85 @@ class API(Connection):
             snippet = sorted(snippet["pages"].values(), key=lambda d: d["title"])
             yield from snippet
 
-    def list(self, params=None, **kwargs):
+    def query_pages(self, params=None, *, titles=None, pageids=None, revids=None, max_workers=4, **kwargs):
+        """
+        Query properties of pages specified by titles, page IDs or revision IDs.
+
+        Exactly one of the ``titles``, ``pageids`` and ``revids`` parameters
+        must be supplied, the number of values is not limited. The values are
+        split into chunks of :py:attr:`max_ids_per_query` items and the chunks
+        are fetched concurrently by at most ``max_workers`` threads. The
+        continuation of each chunk is resolved via :py:meth:`query_continue`
+        and the fragments of the same page are merged, so each page is yielded
+        exactly once with all requested properties.
+
+        Other parts of the responses (e.g. ``badrevids``, ``normalized`` or
+        ``redirects``) are not returned.
+
+        :param params: same as :py:meth:`API.query_continue`
+        :param titles: an iterable of page titles
+        :param pageids: an iterable of page IDs
+        :param revids: an iterable of revision IDs
+        :param int max_workers: maximum number of chunks fetched at the same time
+        :param kwargs: same as :py:meth:`API.query_continue`
+        :yields:
+            complete page objects from the ``"pages"`` part of the API
+            response, chunk by chunk in the order of the supplied values and
+            sorted by title within each chunk
+        """
+        ids = [(name, values) for name, values in [("titles", titles), ("pageids", pageids), ("revids", revids)]
+               if values is not None]
+        if len(ids) != 1:
+            raise ValueError("exactly one of the 'titles', 'pageids' and 'revids' parameters must be supplied")
+        ids_param, values = ids[0]
+
+        if params is None:
+            params = kwargs
+        elif not isinstance(params, dict):
+            raise ValueError("params must be dict or None")
+        elif kwargs and params:
+            raise ValueError("specifying 'params' and 'kwargs' at the same time is not supported")
+        if ids_param in params:
+            raise ValueError("parameter '{}' must not be specified in 'params' or 'kwargs'".format(ids_param))
+
+        def fetch_chunk(chunk):
+            chunk_params = params.copy()
+            chunk_params[ids_param] = "|".join(str(value) for value in chunk)
+            pages = {}
+            for snippet in self.query_continue(chunk_params):
+                # the keys are page IDs (negative for missing pages)
+                for key, page in snippet.get("pages", {}).items():
+                    dmerge(page, pages.setdefault(key, {}))
+            return sorted(pages.values(), key=lambda page: page["title"])
+
+        chunks = list_chunks(list(values), self.max_ids_per_query)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # keep at most max_workers chunks in flight to bound the memory
+            # usage when the consumer is slower than the API
+            futures = collections.deque()
+            try:
+                for chunk in chunks:
+                    futures.append(executor.submit(fetch_chunk, chunk))
+                    if len(futures) >= max_workers:
+                        yield from futures.popleft().result()
+                while futures:
+                    yield from futures.popleft().result()
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def list(self, params=None, *, stream=False, **kwargs):
         """
         Interface to API:Lists, implemented as Python generator.
 
         Parameter ``list`` must be supplied.
 
         :param params: same as :py:meth:`API.query_continue`
+        :param bool stream:
+            if ``True``, the responses are decoded incrementally, see
+            :py:meth:`ws.client.connection.Connection.call_api_stream`. This
+            is useful for lists returning big data, e.g. ``list=allrevisions``
+            with ``arvprop=content``.
         :param kwargs: same as :py:meth:`API.query_continue`
         :yields: from ``"list"`` part of the API response
         """
@@ -275,6 +407,14 @@ class API(Connection):
         if list_ is None:
             raise ValueError("param 'list' must be supplied")
 
+        if stream is True:
+            if list_ == "querypage":
+                path = "query.querypage.results"
+            else:
+                path = "query." + list_
+            yield from self._query_continue_stream(params, kwargs, path)
+            return
+
         for snippet in self.query_continue(params, **kwargs):
             if list_ == "querypage":
                 # list=querypage needs special treatment, the structure is:
@@ -341,13 +481,13 @@ class API(Connection):
         # don't catch the exception for the last try
         return self.call_api(params)
 
-    @RateLimited(1, 3)
     def edit(self, title, pageid, text, basetimestamp, summary, **kwargs):
         """
         Interface to `API:Edit`_. MD5 hash of the new text is computed
-        automatically and added to the query. This method is rate-limited with
-        the :py:class:`@RateLimited <ws.utils.rate.RateLimited>` decorator to
-        allow 1 call per 3 seconds.
+        automatically and added to the query. This method is subject to the
+        ``"edit"`` budget of the :py:attr:`rate_limiter
+        <ws.client.connection.Connection.rate_limiter>` (1 call per 3 seconds
+        by default).
 
         :param str title: the title of the page (used only for logging)
         :param pageid: page ID of the page to be edited
@@ -390,6 +530,7 @@ class API(Connection):
             logger.warning("Your account does not have the 'applychangetags' right, removing tags from the parameter list: {}".format(kwargs["tags"]))
             del kwargs["tags"]
 
+        self.rate_limiter.acquire(self.get_hostname(), "edit")
         logger.info("Editing page [[{}]] ...".format(title))
 
         try:
@@ -398,13 +539,13 @@ class API(Connection):
             logger.error("Failed to edit page [[{}]] due to APIError (code '{}': {})".format(title, e.server_response["code"], e.server_response["info"]))
             raise
 
-    @RateLimited(1, 10)
     def create(self, title, text, summary, **kwargs):
         """
         Specialization of :py:meth:`edit` for creating pages. The ``createonly``
-        parameter is always added to the query. This method is rate-limited with
-        the :py:class:`@RateLimited <ws.utils.rate.RateLimited>` decorator to
-        allow 1 call per 10 seconds.
+        parameter is always added to the query. This method is subject to the
+        ``"create"`` budget of the :py:attr:`rate_limiter
+        <ws.client.connection.Connection.rate_limiter>` (1 call per 10 seconds
+        by default).
 
         :param str title: the title of the page to be created
         :param str text: new page content
@@ -442,6 +583,7 @@ class API(Connection):
             logger.warning("Your account does not have the 'applychangetags' right, removing tags from the parameter list: {}".format(kwargs["tags"]))
             del kwargs["tags"]
 
+        self.rate_limiter.acquire(self.get_hostname(), "create")
         logger.info("Creating page [[{}]] ...".format(title))
 
         try:
@@ -450,12 +592,12 @@ class API(Connection):
             logger.error("Failed to create page [[{}]] due to APIError (code '{}': {})".format(title, e.server_response["code"], e.server_response["info"]))
             raise
 
-    @RateLimited(1, 10)
     def move(self, from_title, to_title, reason, *, movetalk=True, movesubpages=True, noredirect=False, **kwargs):
         """
-        Interface to `API:Move`_. This method is rate-limited with the
-        :py:class:`@RateLimited <ws.utils.rate.RateLimited>` decorator to allow
-        1 call per 10 seconds.
+        Interface to `API:Move`_. This method is subject to the ``"move"``
+        budget of the :py:attr:`rate_limiter
+        <ws.client.connection.Connection.rate_limiter>` (1 call per 10 seconds
+        by default).
 
         :param str from_title: the original title of the page to be renamed
         :param str to_title: the new title of the page to be renamed
@@ -486,6 +628,7 @@ class API(Connection):
             logger.warning("Your account does not have the 'applychangetags' right, removing tags from the parameter list: {}".format(kwargs["tags"]))
             del kwargs["tags"]
 
+        self.rate_limiter.acquire(self.get_hostname(), "move")
         logger.info("Moving page [[{}]] to [[{}]] ...".format(from_title, to_title))
 
         try:
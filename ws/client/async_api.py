@@ -0,0 +1,157 @@
+#! /usr/bin/env python3
+
+"""
+The :py:mod:`ws.client.async_api` module provides an :py:mod:`asyncio` flavour
+of the :py:class:`ws.client.api.API` class.
+
+The HTTP requests are still made by the :py:class:`requests.Session` of the
+wrapped :py:class:`API <ws.client.api.API>` instance, so all cookies, the
+authentication and the pooled connections are shared. The blocking calls are
+delegated to a bounded pool of worker threads, which means that several
+independent continuation streams can be processed concurrently:
+
+.. code-block:: python
+
+    async def titles(aapi, ns):
+        return [page["title"] async for page in aapi.generator(generator="allpages", gapnamespace=ns, gaplimit="max")]
+
+    async def main(api):
+        with AsyncAPI(api, max_concurrency=4) as aapi:
+            return await asyncio.gather(*(titles(aapi, ns) for ns in ["0", "4", "12"]))
+
+    asyncio.run(main(api))
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["AsyncAPI"]
+
+class AsyncAPI:
+    """
+    Asynchronous interface to MediaWiki's API with the same surface as
+    :py:class:`ws.client.api.API`. The :py:meth:`query_continue`,
+    :py:meth:`generator` and :py:meth:`list` methods are asynchronous
+    generators, :py:meth:`call_api` is a coroutine.
+
+    :param api: a :py:class:`ws.client.api.API` instance used for the requests
+    :param int max_concurrency:
+        Maximum number of requests in flight at the same time. It should not
+        exceed the connection pool size of the underlying session (10 by
+        default), otherwise the connections over the limit are not reused.
+    """
+
+    def __init__(self, api, max_concurrency=4):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be a positive integer")
+        self.api = api
+        self.max_concurrency = max_concurrency
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency,
+                                                               thread_name_prefix="AsyncAPI")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Shut down the worker threads. Pending requests are completed first.
+        """
+        self._executor.shutdown(wait=True)
+
+    async def call_api(self, params=None, expand_result=True, **kwargs):
+        """
+        Asynchronous variant of :py:meth:`ws.client.connection.Connection.call_api`.
+        The parameters and the return value are the same.
+        """
+        loop = asyncio.get_running_loop()
+        func = functools.partial(self.api.call_api, params, expand_result=expand_result, **kwargs)
+        return await loop.run_in_executor(self._executor, func)
+
+    async def _iterate(self, iterator):
+        """
+        Iterate over a blocking iterator of the wrapped API instance, each
+        item is fetched by a worker thread.
+        """
+        loop = asyncio.get_running_loop()
+        done = object()
+        try:
+            while True:
+                item = await loop.run_in_executor(self._executor, next, iterator, done)
+                if item is done:
+                    break
+                yield item
+        finally:
+            # run the cleanup of the generator (e.g. the instrumentation hook)
+            await loop.run_in_executor(self._executor, iterator.close)
+
+    def query_continue(self, params=None, **kwargs):
+        """
+        Asynchronous variant of :py:meth:`ws.client.api.API.query_continue`.
+        Each response is requested by a worker thread, so the parameters and
+        the continuation are handled the same way.
+
+        :param params: same as :py:meth:`ws.client.api.API.query_continue`
+        :param kwargs: same as :py:meth:`ws.client.api.API.query_continue`
+        :yields: from ``"query"`` part of the API response
+        """
+        return self._iterate(self.api.query_continue(params, **kwargs))
+
+    async def generator(self, params=None, *, stream=False, **kwargs):
+        """
+        Asynchronous variant of :py:meth:`ws.client.api.API.generator`. Note
+        that the same page may be yielded multiple times, see the original
+        method for details.
+
+        :param params: same as :py:meth:`ws.client.api.API.query_continue`
+        :param bool stream: same as :py:meth:`ws.client.api.API.generator`
+        :param kwargs: same as :py:meth:`ws.client.api.API.query_continue`
+        :yields: from ``"pages"`` part of the API response
+        """
+        if stream is True:
+            # the pages are decoded incrementally by the worker threads
+            async for page in self._iterate(self.api.generator(params, stream=True, **kwargs)):
+                yield page
+            return
+
+        generator_ = kwargs.get("generator") if params is None else params.get("generator")
+        if generator_ is None:
+            raise ValueError("param 'generator' must be supplied")
+
+        async for snippet in self.query_continue(params, **kwargs):
+            for page in sorted(snippet["pages"].values(), key=lambda d: d["title"]):
+                yield page
+
+    async def list(self, params=None, *, stream=False, **kwargs):
+        """
+        Asynchronous variant of :py:meth:`ws.client.api.API.list`.
+
+        :param params: same as :py:meth:`ws.client.api.API.query_continue`
+        :param bool stream: same as :py:meth:`ws.client.api.API.list`
+        :param kwargs: same as :py:meth:`ws.client.api.API.query_continue`
+        :yields: from ``"list"`` part of the API response
+        """
+        if stream is True:
+            # the items are decoded incrementally by the worker threads
+            async for item in self._iterate(self.api.list(params, stream=True, **kwargs)):
+                yield item
+            return
+
+        list_ = kwargs.get("list") if params is None else params.get("list")
+        if list_ is None:
+            raise ValueError("param 'list' must be supplied")
+
+        async for snippet in self.query_continue(params, **kwargs):
+            if list_ == "querypage":
+                # see API.list for the structure of list=querypage
+                items = snippet[list_]["results"]
+            else:
+                items = snippet[list_]
+            for item in items:
+                yield item
@@ -10,13 +10,20 @@ and making requests.
 # FIXME: query string should be normalized, see https://www.mediawiki.org/wiki/API:Main_page#API_etiquette
 #        + 'token' parameter should be specified last, see https://www.mediawiki.org/wiki/API:Edit
 
+import json
+import random
+import threading
+import time
 import requests
 import http.cookiejar as cookielib
 import logging
-import copy
 
 from ws import __version__, __url__
-from ..utils import RateLimited, parse_timestamps_in_struct, serialize_timestamps_in_struct
+from ..utils import default_rate_limiter, api_timestamp_keys, parse_api_timestamps, serialize_api_params
+from ..utils.json import iter_json_items, JSONStreamError, _has_ijson
+from .response_cache import ResponseCache
+from .transport import TransportStats, HTTPAdapter, HTTP2Adapter, CountingReader, ACCEPT_ENCODING
+from .instrumentation import RequestMetrics, request_labels
 
 logger = logging.getLogger(__name__)
 
@@ -81,6 +88,29 @@ MULTIPART_FORM_DATA = {
     'upload': {'file', 'chunk'},
 }
 API_ACTIONS = GET_ACTIONS | POST_ACTIONS | set(MULTIPART_FORM_DATA.keys())
+# actions whose responses can be stored in the response cache
+CACHEABLE_ACTIONS = {
+    'compare',
+    'expandtemplates',
+    'help',
+    'opensearch',
+    'paraminfo',
+    'parse',
+    'query',
+}
+# query modules which must never be served from the response cache
+UNCACHEABLE_META = {'tokens', 'userinfo'}
+# change feeds which are used to detect new changes, so they must be always fresh
+UNCACHEABLE_LISTS = {'recentchanges', 'logevents'}
+# POST actions which do not modify the content of the wiki, the response cache
+# is invalidated after all other POST actions
+READONLY_POST_ACTIONS = {'clientlogin', 'cspreport', 'login', 'validatepassword'}
+# HTTP status codes for which GET requests are retried
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# HTTP status codes for which all requests are retried (the request was not processed)
+RETRY_STATUS_CODES_POST = {429, 503}
+# size of uncompressed responses (in bytes) above which a warning is logged
+UNCOMPRESSED_WARNING_SIZE = 64 * 1024
 
 class Connection:
     """
@@ -90,18 +120,69 @@ class Connection:
     :param str index_url: URL path to the wiki's ``index.php`` entry point
     :param requests.Session session: session created by :py:meth:`make_session`
     :param int timeout: connection timeout in seconds
+    :param response_cache:
+        an optional :py:class:`ws.client.response_cache.ResponseCache` instance
+        for caching the responses of read-only queries
+    :param rate_limiter:
+        a :py:class:`ws.utils.rate.RateLimiter` instance, by default
+        :py:data:`ws.utils.rate.default_rate_limiter` is shared by all
+        connections
+    :param int maxlag:
+        value of the `maxlag`_ parameter sent with each API call (``None``
+        disables the parameter)
+    :param int max_retries:
+        maximum number of retries of an API call after a maxlag error, an HTTP
+        429 or 5xx response or a connection error (the latter two only for
+        read-only calls)
+    :param throttle:
+        a :py:class:`ws.utils.rate.AdaptiveThrottle` instance adjusting the
+        ``"read"`` rate limit and the number of concurrent requests based on the
+        observed latency. By default the throttle of the ``"read"`` bucket
+        shared by all connections to the host is used (see
+        :py:meth:`ws.utils.rate.RateLimiter.get_throttle`).
+    :param instrumentation:
+        an optional :py:class:`ws.client.instrumentation.Instrumentation`
+        hook which is notified about each request
+
+    The statistics of the HTTP traffic are available in the
+    :py:attr:`transport_stats` attribute, which is shared with the transport
+    adapter of the session if it was created by :py:meth:`make_session`.
+
+    .. _`maxlag`: https://www.mediawiki.org/wiki/Manual:Maxlag_parameter
     """
 
-    def __init__(self, api_url, index_url, session, timeout=30):
+    #: base delay in seconds for the exponential backoff
+    backoff_base = 1
+    #: maximum delay in seconds for the exponential backoff
+    backoff_max = 60
+
+    def __init__(self, api_url, index_url, session, timeout=30, response_cache=None, rate_limiter=None,
+                 maxlag=5, max_retries=5, throttle=None, instrumentation=None):
         self.api_url = api_url
         self.index_url = index_url
         self.session = session
         self.timeout = timeout
+        self.rate_limiter = rate_limiter if rate_limiter is not None else default_rate_limiter
+        self.maxlag = maxlag
+        self.max_retries = max_retries
+        if throttle is None:
+            throttle = self.rate_limiter.get_throttle(self.get_hostname(), "read")
+        self.throttle = throttle
+        self.instrumentation = instrumentation
+        self.response_cache = response_cache
+        self._response_cache_validated = False
+        adapter = session.get_adapter(api_url) if session is not None else None
+        #: a :py:class:`ws.client.transport.TransportStats` instance
+        self.transport_stats = getattr(adapter, "stats", None) or TransportStats()
+        self._uncompressed_warning_logged = False
+        self._response_cache_lock = threading.Lock()
 
     @staticmethod
     def make_session(user_agent=DEFAULT_UA, ssl_verify=None, max_retries=0,
                      cookie_file=None, cookiejar=None,
-                     http_user=None, http_password=None):
+                     http_user=None, http_password=None,
+                     pool_connections=10, pool_maxsize=10, pool_block=False,
+                     compression=True, http2=False):
         """
         Creates a :py:class:`requests.Session` object for the connection.
 
@@ -117,6 +198,19 @@ class Connection:
             to requests where data has made it to the server.
         :param str cookie_file: path to a :py:class:`cookielib.FileCookieJar` file
         :param cookiejar: an existing :py:class:`cookielib.CookieJar` object
+        :param int pool_connections: number of hosts for which the connection pools are kept
+        :param int pool_maxsize:
+            maximum number of connections kept open for each host, should be at
+            least the number of threads using the session concurrently
+        :param bool pool_block:
+            whether to wait for a free connection when the pool is exhausted
+            instead of opening a connection which is closed after the request
+        :param bool compression:
+            whether to request gzip/deflate compression of the responses
+        :param bool http2:
+            whether to use the HTTP/2 transport
+            (:py:class:`ws.client.transport.HTTP2Adapter`), which requires the
+            optional :py:mod:`httpx` library
         :returns: :py:class:`requests.Session` object
         """
         session = requests.Session()
@@ -136,11 +230,16 @@ class Connection:
             _auth = (http_user, http_password)
 
         session.headers.update({"user-agent": user_agent})
+        session.headers["accept-encoding"] = ACCEPT_ENCODING if compression else "identity"
         session.auth = _auth
         session.params.update({"format": "json"})
         session.verify = ssl_verify
 
-        adapter = requests.adapters.HTTPAdapter(max_retries=max_retries)
+        if http2 is True:
+            adapter = HTTP2Adapter(pool_maxsize=pool_maxsize, max_retries=max_retries)
+        else:
+            adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                  pool_block=pool_block, max_retries=max_retries)
         session.mount("https://", adapter)
         session.mount("http://", adapter)
         return session
@@ -167,8 +266,27 @@ class Connection:
                 help="maximum number of retries for each connection (default: %(default)s)")
         group.add_argument("--connection-timeout", default=30, type=float,
                 help="connection timeout in seconds (default: %(default)s)")
+        group.add_argument("--connection-pool-size", default=10, type=int, metavar="N",
+                help="maximum number of connections kept open to the wiki (default: %(default)s)")
+        group.add_argument("--http-compression", default=True, type=ws.config.argtype_bool,
+                help="whether to request gzip/deflate compression of the responses (default: %(default)s)")
+        group.add_argument("--http2", default=False, type=ws.config.argtype_bool,
+                help="whether to use HTTP/2 for the connections, requires the httpx library (default: %(default)s)")
+        group.add_argument("--maxlag", default=5, type=int, metavar="SECONDS",
+                help="value of the maxlag parameter sent with each API call (default: %(default)s)")
+        group.add_argument("--api-max-retries", default=5, type=int,
+                help="maximum number of retries of an API call after a maxlag error or a server error (default: %(default)s)")
         group.add_argument("--cookie-file", type=ws.config.argtype_dirname_must_exist, metavar="PATH",
                 help="path to cookie file (default: $cache_dir/$site.cookie)")
+        group.add_argument("--metrics-file", type=ws.config.argtype_dirname_must_exist, metavar="PATH",
+                help="path to a file where the statistics of the API requests are written on exit, "
+                     "in JSON if the file name ends with '.json' and in the Prometheus text format otherwise")
+        group.add_argument("--response-cache", default=False, type=ws.config.argtype_bool,
+                help="whether to cache responses of read-only queries on disk under $cache_dir (default: %(default)s)")
+        group.add_argument("--response-cache-ttl", default=3600, type=float, metavar="SECONDS",
+                help="time-to-live of the cached responses in seconds (default: %(default)s)")
+        group.add_argument("--response-cache-max-size", default=256, type=int, metavar="MiB",
+                help="maximum size of the response cache in MiB (default: %(default)s)")
         # TODO: expose also user_agent, http_user, http_password?
 
     @classmethod
@@ -183,8 +301,8 @@ class Connection:
             it is expected to also contain ``site`` and ``cache_dir`` arguments.
         :returns: an instance of :py:class:`Connection`
         """
+        import os
         if args.cookie_file is None:
-            import os
             if not os.path.exists(args.cache_dir):
                 os.mkdir(args.cache_dir)
             cookie_file = args.cache_dir + "/" + args.site + ".cookie"
@@ -195,10 +313,28 @@ class Connection:
 
         session = Connection.make_session(ssl_verify=args.ssl_verify,
                                           max_retries=args.connection_max_retries,
-                                          cookie_file=cookie_file)
-        return klass(args.api_url, args.index_url, session=session, timeout=args.connection_timeout)
+                                          cookie_file=cookie_file,
+                                          pool_maxsize=args.connection_pool_size,
+                                          compression=args.http_compression,
+                                          http2=args.http2)
+
+        response_cache = None
+        if args.response_cache is True:
+            hostname = requests.packages.urllib3.util.url.parse_url(args.api_url).hostname
+            path = os.path.join(args.cache_dir, hostname, "api-responses")
+            response_cache = ResponseCache(path, ttl=args.response_cache_ttl,
+                                           max_size=args.response_cache_max_size * 1024 * 1024)
+
+        instrumentation = None
+        if args.metrics_file is not None:
+            import atexit
+            instrumentation = RequestMetrics()
+            atexit.register(instrumentation.dump, args.metrics_file)
+
+        return klass(args.api_url, args.index_url, session=session, timeout=args.connection_timeout,
+                     response_cache=response_cache, maxlag=args.maxlag, max_retries=args.api_max_retries,
+                     instrumentation=instrumentation)
 
-    @RateLimited(10, 3)
     def request(self, method, url, **kwargs):
         """
         Simple HTTP request handler. It is basically a wrapper around
@@ -214,18 +350,59 @@ class Connection:
         :py:exc:`requests.exceptions.Timeout` and
         :py:exc:`requests.exceptions.HTTPError`) should be catched by the caller.
 
+        All requests are subject to the ``"read"`` budget of :py:attr:`rate_limiter`
+        and the concurrency limit of :py:attr:`throttle`. The time spent waiting
+        for them is stored in the ``throttled_time`` attribute of the returned
+        response.
+
         .. _`Requests documentation`: http://docs.python-requests.org/en/latest/api/
         """
-        response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+        throttled_time = self.rate_limiter.acquire(self.get_hostname(), "read")
+        start = time.monotonic()
+        with self.throttle:
+            throttled_time += time.monotonic() - start
+            start = time.monotonic()
+            response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            latency = time.monotonic() - start
+        response.throttled_time = throttled_time
+
+        if not kwargs.get("stream"):
+            params = kwargs.get("params") if method == "GET" else kwargs.get("data")
+            self._record_transfer(response, url, params, latency)
 
         # raise HTTPError for bad requests (4XX client errors and 5XX server errors)
         response.raise_for_status()
+        self.throttle.on_success(latency)
 
         if isinstance(self.session.cookies, cookielib.FileCookieJar):
             self.session.cookies.save()
 
         return response
 
+    def _record_transfer(self, response, url, params, latency, decoded_bytes=None):
+        """
+        Update :py:attr:`transport_stats` and notify the :py:attr:`instrumentation`
+        hook about a fully read response. Warn once if the server ignores the
+        request for compression.
+        """
+        self.transport_stats.record(response, decoded_bytes)
+        if decoded_bytes is None:
+            decoded_bytes = len(response.content)
+        if self.instrumentation is not None:
+            if url == self.api_url:
+                action, module = request_labels(params)
+            else:
+                action, module = "index", ""
+            self.instrumentation.record_request(action, module, latency, decoded_bytes,
+                                                response.throttled_time, response.status_code)
+        if (self._uncompressed_warning_logged is False and
+                decoded_bytes > UNCOMPRESSED_WARNING_SIZE and
+                "Content-Encoding" not in response.headers and
+                self.session.headers.get("accept-encoding", "identity") != "identity"):
+            self._uncompressed_warning_logged = True
+            logger.warning("The server at {} sent an uncompressed response of {} bytes despite "
+                           "the Accept-Encoding header.".format(self.get_hostname(), decoded_bytes))
+
     def call_api(self, params=None, expand_result=True, **kwargs):
         """
         Convenient method to call the ``api.php`` entry point.
@@ -244,6 +421,127 @@ class Connection:
         :param kwargs: API parameters passed as keyword arguments
         :returns: a dictionary containing (part of) the API response
         """
+        action, params = self._prepare_params(params, kwargs)
+
+        # select HTTP method and call the API
+        content = None
+        cache_key = None
+        if action in MULTIPART_FORM_DATA:
+            # parameters specified in MULTIPART_FORM_DATA have to be uploaded as "files"
+            files = dict((k, v) for k, v in params.items() if k in MULTIPART_FORM_DATA[action])
+            for k in files:
+                del params[k]
+            content = self._request_api("POST", data=params, files=files).content
+            self._invalidate_response_cache(action)
+        elif action in POST_ACTIONS:
+            # passing `params` to `data` will cause form-encoding to take place,
+            # which is necessary when editing pages longer than 8000 characters
+            content = self._request_api("POST", data=params).content
+            self._invalidate_response_cache(action)
+        else:
+            if self.response_cache is not None and self._is_cacheable(params):
+                self._validate_response_cache()
+                cache_key = self.response_cache.make_key(self.api_url, params)
+                content = self.response_cache.get(cache_key)
+                if content is not None:
+                    # do not store the entry again
+                    cache_key = None
+            if content is None:
+                content = self._request_api("GET", params=params).content
+
+        result = self._decode_json(content)
+
+        # see if there are errors/warnings
+        self._check_result(params, result)
+        if cache_key is not None:
+            self.response_cache.set(cache_key, content)
+
+        # parse timestamps
+        parse_api_timestamps(result, keys=api_timestamp_keys(params))
+
+        if expand_result is True:
+            if action in result:
+                return result[action]
+            else:
+                raise APIExpandResultFailed
+        return result
+
+    def call_api_stream(self, path, params=None, **kwargs):
+        """
+        Call the ``api.php`` entry point with a read-only action and decode
+        the response incrementally.
+
+        The items of the array (or the values of the object) located at
+        ``path`` in the response are yielded as soon as they are decoded, so
+        the memory usage is bounded by the size of one item rather than the
+        whole response. This requires the optional :py:mod:`ijson` library,
+        without it the whole response is decoded at once. The response cache
+        is not used in this mode.
+
+        :param str path:
+            dot-separated path to the container in the full API response,
+            e.g. ``"query.allrevisions"`` or ``"query.pages"``
+        :param params: same as :py:meth:`call_api`
+        :param kwargs: same as :py:meth:`call_api`
+        :yields: the items of the container at ``path``
+        :returns:
+            the rest of the full API response, with the container at ``path``
+            left empty (use ``result = yield from api.call_api_stream(...)``
+            to obtain it)
+        """
+        action, params = self._prepare_params(params, kwargs)
+        if action not in GET_ACTIONS:
+            raise ValueError("streaming is supported only for read-only actions")
+        timestamp_keys = api_timestamp_keys(params)
+
+        if _has_ijson is False:
+            result = self._decode_json(self._request_api("GET", params=params).content)
+            self._check_result(params, result)
+            container = result
+            for key in path.split("."):
+                container = container.get(key, {}) if isinstance(container, dict) else {}
+            items = list(container.values()) if isinstance(container, dict) else container[:]
+            container.clear()
+            parse_api_timestamps(result, keys=timestamp_keys)
+            for item in items:
+                parse_api_timestamps(item, keys=timestamp_keys)
+                yield item
+            return result
+
+        response = self._request_api("GET", params=params, stream=True)
+        # let urllib3 decode gzip/deflate transfer encoding
+        response.raw.decode_content = True
+        reader = CountingReader(response.raw)
+        try:
+            items = iter_json_items(reader, path)
+            while True:
+                try:
+                    item = next(items)
+                except StopIteration as e:
+                    result = e.value
+                    break
+                except JSONStreamError:
+                    raise APIJsonError("Failed to decode server response. Please make sure " +
+                                       "that the API is enabled on the wiki and that the " +
+                                       "API URL is correct.")
+                parse_api_timestamps(item, keys=timestamp_keys)
+                yield item
+        finally:
+            self._record_transfer(response, self.api_url, params, response.elapsed.total_seconds(),
+                                  reader.bytes_read)
+            response.close()
+
+        self._check_result(params, result)
+        parse_api_timestamps(result, keys=timestamp_keys)
+        return result
+
+    def _prepare_params(self, params, kwargs):
+        """
+        Check the parameters passed to :py:meth:`call_api` and create a copy
+        with serialized timestamps and default parameters.
+
+        :returns: a tuple ``(action, params)``
+        """
         if params is None:
             params = kwargs
         elif not isinstance(params, dict):
@@ -263,32 +561,30 @@ class Connection:
         if action == "help":
             params["wrap"] = "1"
 
-        # serialize timestamps
-        params = copy.deepcopy(params)
-        serialize_timestamps_in_struct(params)
+        # serialize timestamps (the API parameters are not nested, so a
+        # shallow copy is enough to avoid modifying the caller's data)
+        params = serialize_api_params(params)
 
-        # select HTTP method and call the API
-        if action in MULTIPART_FORM_DATA:
-            # parameters specified in MULTIPART_FORM_DATA have to be uploaded as "files"
-            files = dict((k, v) for k, v in params.items() if k in MULTIPART_FORM_DATA[action])
-            for k in files:
-                del params[k]
-            result = self.request("POST", self.api_url, data=params, files=files)
-        elif action in POST_ACTIONS:
-            # passing `params` to `data` will cause form-encoding to take place,
-            # which is necessary when editing pages longer than 8000 characters
-            result = self.request("POST", self.api_url, data=params)
-        else:
-            result = self.request("GET", self.api_url, params=params)
+        if self.maxlag is not None:
+            params.setdefault("maxlag", self.maxlag)
+
+        return action, params
 
+    @staticmethod
+    def _decode_json(content):
         try:
-            result = result.json()
+            return json.loads(content)
         except ValueError:
             raise APIJsonError("Failed to decode server response. Please make sure " +
                                "that the API is enabled on the wiki and that the " +
                                "API URL is correct.")
 
-        # see if there are errors/warnings
+    @staticmethod
+    def _check_result(params, result):
+        """
+        Raise :py:exc:`APIError` if the API response contains an error and
+        log the warnings.
+        """
         if "error" in result:
             raise APIError(params, result["error"])
         if "warnings" in result:
@@ -297,15 +593,121 @@ class Connection:
                 msg += "\n* {}".format(warning["*"])
             logger.warning(msg)
 
-        # parse timestamps
-        parse_timestamps_in_struct(result)
+    def _request_api(self, method, **kwargs):
+        """
+        Make a request to the ``api.php`` entry point using :py:meth:`request`.
 
-        if expand_result is True:
-            if action in result:
-                return result[action]
+        The request is retried at most :py:attr:`max_retries` times when the
+        API returns the ``maxlag`` error or the server responds with HTTP 429
+        or 503. Read-only (``GET``) requests are retried also after other 5xx
+        responses and connection errors. The ``Retry-After`` header is
+        honoured, otherwise the delay is computed by exponential backoff with
+        jitter. Each retry is also reported to the :py:attr:`throttle`.
+
+        :returns: a :py:class:`requests.Response` object
+        """
+        attempt = 0
+        while True:
+            retry_after = None
+            try:
+                response = self.request(method, self.api_url, **kwargs)
+            except requests.exceptions.HTTPError as e:
+                status = e.response.status_code
+                retry_codes = RETRY_STATUS_CODES if method == "GET" else RETRY_STATUS_CODES_POST
+                if status not in retry_codes or attempt >= self.max_retries:
+                    raise
+                reason = "HTTP status {}".format(status)
+                retry_after = e.response.headers.get("Retry-After")
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if method != "GET" or attempt >= self.max_retries:
+                    raise
+                reason = "{}: {}".format(type(e).__name__, e)
             else:
-                raise APIExpandResultFailed
-        return result
+                # the API returns the maxlag error with HTTP 200
+                if response.headers.get("MediaWiki-API-Error") != "maxlag" or attempt >= self.max_retries:
+                    return response
+                reason = "maxlag exceeded"
+                retry_after = response.headers.get("Retry-After")
+                response.close()
+
+            self.throttle.on_overload()
+            delay = self._get_retry_delay(attempt, retry_after)
+            attempt += 1
+            logger.warning("API request failed ({}), retrying in {:0.1f} seconds [{}/{}]"
+                           .format(reason, delay, attempt, self.max_retries))
+            time.sleep(delay)
+
+    def _get_retry_delay(self, attempt, retry_after=None):
+        """
+        Compute the delay before the next retry of a request.
+
+        :param int attempt: number of retries done so far
+        :param str retry_after: value of the ``Retry-After`` header, if any
+        :returns: delay in seconds
+        """
+        if retry_after is not None:
+            try:
+                # small jitter to spread the retries of concurrent requests
+                return float(retry_after) + random.uniform(0, 1)
+            except ValueError:
+                # HTTP-date format is not used by MediaWiki
+                pass
+        # exponential backoff with "full jitter"
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    @staticmethod
+    def _is_cacheable(params):
+        """
+        Check if the response to a query with given parameters can be stored in
+        the response cache.
+        """
+        def values(name):
+            value = params.get(name, "")
+            if isinstance(value, (list, tuple, set)):
+                return set(str(v) for v in value)
+            return set(str(value).split("|"))
+
+        if params["action"] not in CACHEABLE_ACTIONS:
+            return False
+        if values("meta") & UNCACHEABLE_META:
+            return False
+        if (values("list") | values("generator")) & UNCACHEABLE_LISTS:
+            return False
+        return True
+
+    def _invalidate_response_cache(self, action):
+        """
+        Clear the response cache after an action which may have modified the
+        wiki and force a new validation before the next cached query.
+        """
+        if self.response_cache is None or action in READONLY_POST_ACTIONS:
+            return
+        with self._response_cache_lock:
+            self.response_cache.clear()
+            self._response_cache_validated = False
+
+    def _validate_response_cache(self):
+        """
+        Invalidate the response cache if the latest revision on the wiki has
+        changed. The check is done once for each :py:class:`Connection`
+        instance and again after each action which modified the wiki.
+        """
+        with self._response_cache_lock:
+            if self._response_cache_validated is True:
+                return
+            params = {
+                "action": "query",
+                "list": "recentchanges",
+                "rcprop": "ids",
+                "rctype": "edit|new",
+                "rclimit": "1",
+                "continue": "",
+            }
+            result = self.request("GET", self.api_url, params=params).json()
+            recentchanges = result.get("query", {}).get("recentchanges", [])
+            revid = recentchanges[0]["revid"] if recentchanges else None
+            self.response_cache.validate(revid)
+            self._response_cache_validated = True
 
     def call_index(self, method="GET", **kwargs):
         """
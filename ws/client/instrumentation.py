@@ -0,0 +1,265 @@
+#! /usr/bin/env python3
+
+"""
+The :py:mod:`ws.client.instrumentation` module provides hooks for observing
+the requests made by :py:class:`ws.client.connection.Connection`.
+
+An instrumentation hook is an instance of :py:class:`Instrumentation` passed
+to the ``instrumentation`` parameter of the connection. The
+:py:class:`RequestMetrics` hook collects statistics about the requests grouped
+by the API action and the query modules and can export them in JSON or in the
+`Prometheus text format`_:
+
+.. code-block:: python
+
+    metrics = RequestMetrics()
+    api = API(api_url, index_url, session, instrumentation=metrics)
+    ...
+    metrics.dump("metrics.prom")
+
+Scripts using :py:meth:`ws.client.connection.Connection.from_argparser` can
+write the metrics on exit with the ``--metrics-file`` option.
+
+.. _`Prometheus text format`: https://prometheus.io/docs/instrumenting/exposition_formats/
+"""
+
+import bisect
+import json
+import threading
+
+__all__ = ["Instrumentation", "RequestMetrics", "request_labels"]
+
+# query parameters identifying the modules of action=query
+QUERY_MODULE_PARAMS = ("generator", "list", "prop", "meta")
+
+def request_labels(params):
+    """
+    Compute the labels identifying the kind of an API request.
+
+    :param dict params: parameters of the request
+    :returns:
+        a tuple ``(action, module)``, where ``module`` describes the query
+        modules, e.g. ``"list=allrevisions"`` or ``"generator=allpages&prop=info"``
+        (empty for other actions than ``query``)
+    """
+    if not params:
+        return "", ""
+    action = str(params.get("action", ""))
+    if action != "query":
+        return action, ""
+    parts = []
+    for name in QUERY_MODULE_PARAMS:
+        value = params.get(name)
+        if value:
+            if not isinstance(value, str):
+                value = "|".join(sorted(str(v) for v in value))
+            parts.append("{}={}".format(name, value))
+    return action, "&".join(parts)
+
+class Instrumentation:
+    """
+    Base class of the instrumentation hooks. The methods are called from the
+    thread which made the request and do nothing by default.
+    """
+
+    def record_request(self, action, module, latency, size, throttled_time, status):
+        """
+        Called for each request when its response was fully read.
+
+        :param str action: the API action (``"index"`` for ``index.php`` requests)
+        :param str module: the query modules (see :py:func:`request_labels`)
+        :param float latency: time in seconds until the response headers were received
+        :param int size: size of the decoded response body in bytes
+        :param float throttled_time:
+            time in seconds the request waited for the rate limiter and the
+            concurrency limit
+        :param int status: the HTTP status code
+        """
+        pass
+
+    def record_continuation(self, action, module, depth):
+        """
+        Called when a query continuation stream is finished.
+
+        :param str action: the API action
+        :param str module: the query modules (see :py:func:`request_labels`)
+        :param int depth: number of requests made in the stream
+        """
+        pass
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # the last count is for the +Inf bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for le, count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            total += count
+            yield le, total
+
+    def as_dict(self):
+        return {
+            "buckets": dict((str(le), count) for le, count in self.cumulative()),
+            "sum": self.sum,
+            "count": self.count,
+        }
+
+class _RequestStats:
+    def __init__(self, latency_buckets, continuation_buckets):
+        self.requests = 0
+        self.errors = 0
+        self.response_bytes = 0
+        self.throttled_seconds = 0.0
+        self.latency = _Histogram(latency_buckets)
+        self.continuation = _Histogram(continuation_buckets)
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "response_bytes": self.response_bytes,
+            "throttled_seconds": self.throttled_seconds,
+            "latency_seconds": self.latency.as_dict(),
+            "continuation_depth": self.continuation.as_dict(),
+        }
+
+class RequestMetrics(Instrumentation):
+    """
+    An instrumentation hook collecting the request count, latency histogram,
+    response bytes, continuation depth histogram and time spent rate-limited
+    for each combination of the API action and query modules.
+
+    :param latency_buckets: upper bounds of the latency histogram buckets in seconds
+    :param continuation_buckets: upper bounds of the continuation depth histogram buckets
+    """
+
+    #: default upper bounds of the latency histogram buckets
+    default_latency_buckets = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+    #: default upper bounds of the continuation depth histogram buckets
+    default_continuation_buckets = (1, 2, 5, 10, 20, 50, 100, 500, 1000)
+    #: prefix of the metric names in the Prometheus format
+    prometheus_prefix = "wikiscripts_api"
+
+    def __init__(self, latency_buckets=None, continuation_buckets=None):
+        self.latency_buckets = tuple(latency_buckets or self.default_latency_buckets)
+        self.continuation_buckets = tuple(continuation_buckets or self.default_continuation_buckets)
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _get(self, action, module):
+        stats = self._stats.get((action, module))
+        if stats is None:
+            stats = self._stats[action, module] = _RequestStats(self.latency_buckets, self.continuation_buckets)
+        return stats
+
+    def record_request(self, action, module, latency, size, throttled_time, status):
+        with self._lock:
+            stats = self._get(action, module)
+            stats.requests += 1
+            if status >= 400:
+                stats.errors += 1
+            stats.response_bytes += size
+            stats.throttled_seconds += throttled_time
+            stats.latency.observe(latency)
+
+    def record_continuation(self, action, module, depth):
+        with self._lock:
+            self._get(action, module).continuation.observe(depth)
+
+    def reset(self):
+        """
+        Discard all collected data.
+        """
+        with self._lock:
+            self._stats.clear()
+
+    def as_list(self):
+        """
+        :returns:
+            a list of dictionaries with the statistics for each action and
+            module, sorted by the action and module
+        """
+        with self._lock:
+            result = []
+            for (action, module), stats in sorted(self._stats.items()):
+                d = {"action": action, "module": module}
+                d.update(stats.as_dict())
+                result.append(d)
+            return result
+
+    def to_json(self, **kwargs):
+        """
+        :param kwargs: passed to :py:func:`json.dumps`
+        :returns: the statistics serialized as JSON
+        """
+        return json.dumps(self.as_list(), **kwargs)
+
+    def to_prometheus(self):
+        """
+        :returns: the statistics in the Prometheus text exposition format
+        """
+        p = self.prometheus_prefix
+        metrics = [
+            ("requests_total", "counter", "Number of API requests."),
+            ("errors_total", "counter", "Number of API requests which failed with an HTTP error."),
+            ("response_bytes_total", "counter", "Size of the decoded response bodies in bytes."),
+            ("throttled_seconds_total", "counter", "Time spent waiting for the rate limits."),
+            ("latency_seconds", "histogram", "Latency of the API requests."),
+            ("continuation_depth", "histogram", "Number of requests in a query continuation stream."),
+        ]
+        items = self.as_list()
+
+        def labels(item, **extra):
+            pairs = [("action", item["action"]), ("module", item["module"])] + list(extra.items())
+            return ",".join('{}="{}"'.format(k, _escape_label(v)) for k, v in pairs)
+
+        lines = []
+        for name, type_, help_ in metrics:
+            full_name = "{}_{}".format(p, name)
+            lines.append("# HELP {} {}".format(full_name, help_))
+            lines.append("# TYPE {} {}".format(full_name, type_))
+            key = name[:-len("_total")] if name.endswith("_total") else name
+            for item in items:
+                if type_ == "counter":
+                    lines.append("{}{{{}}} {}".format(full_name, labels(item), item[key]))
+                else:
+                    hist = item[key]
+                    if hist["count"] == 0:
+                        continue
+                    for le, count in hist["buckets"].items():
+                        lines.append("{}_bucket{{{}}} {}".format(full_name, labels(item, le=le), count))
+                    lines.append("{}_sum{{{}}} {}".format(full_name, labels(item), hist["sum"]))
+                    lines.append("{}_count{{{}}} {}".format(full_name, labels(item), hist["count"]))
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path, format=None):
+        """
+        Write the statistics into a file.
+
+        :param str path: path to the output file
+        :param str format:
+            either ``"json"`` or ``"prometheus"``, by default it is determined
+            by the file extension (``.json`` for JSON, Prometheus otherwise)
+        """
+        if format is None:
+            format = "json" if path.endswith(".json") else "prometheus"
+        if format == "json":
+            text = self.to_json(indent=2)
+        elif format == "prometheus":
+            text = self.to_prometheus()
+        else:
+            raise ValueError("unknown format: {}".format(format))
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
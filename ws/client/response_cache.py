@@ -0,0 +1,207 @@
+#! /usr/bin/env python3
+
+"""
+The :py:mod:`ws.client.response_cache` module provides a persistent on-disk
+cache for the responses of read-only ``api.php`` calls.
+
+The cache is opt-in, see the ``response_cache`` parameter of
+:py:class:`ws.client.connection.Connection`. Each response is stored as a
+separate gzipped file named by the hash of the normalized query parameters.
+Entries expire after a fixed time-to-live, the oldest entries are evicted when
+the total size of the cache exceeds the limit and the whole cache is
+invalidated when the ID of the latest revision on the wiki changes or when the
+connection performs an action which modifies the wiki. The change feeds
+(``list=recentchanges`` and ``list=logevents``) are never cached.
+
+.. note::
+    The cache key does not include the identity of the logged-in user, so the
+    cache should be used only for read-only scripts which always run under the
+    same account.
+"""
+
+import os
+import gzip
+import hashlib
+import tempfile
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["ResponseCache"]
+
+class ResponseCache:
+    """
+    On-disk cache for raw API responses.
+
+    :param str path: path to the directory where the responses are stored
+    :param float ttl: time-to-live of the cache entries in seconds
+    :param int max_size: maximum total size of the stored entries in bytes
+    """
+
+    #: name of the file holding the revision ID the cache is valid for
+    revision_file = "latest-revid"
+
+    def __init__(self, path, ttl=3600, max_size=256 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+
+        #: number of successful lookups
+        self.hits = 0
+        #: number of failed lookups (including expired entries)
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._size = None
+
+        os.makedirs(self.path, exist_ok=True)
+
+    @staticmethod
+    def make_key(url, params):
+        """
+        Compute the cache key for an API query.
+
+        The parameters are normalized (sorted by name and values converted to
+        strings, lists are joined with ``|`` like in the query string), so the
+        key does not depend on the order of parameters or the type of their
+        values.
+
+        :param str url: URL of the ``api.php`` entry point
+        :param dict params: query parameters
+        :returns: hexadecimal digest identifying the query
+        """
+        def normalize(value):
+            if isinstance(value, (list, tuple, set)):
+                return "|".join(str(v) for v in value)
+            return str(value)
+
+        items = sorted((str(k), normalize(v)) for k, v in params.items())
+        h = hashlib.sha256()
+        h.update(url.encode("utf-8"))
+        for key, value in items:
+            h.update(b"\0")
+            h.update(key.encode("utf-8"))
+            h.update(b"=")
+            h.update(value.encode("utf-8"))
+        return h.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key + ".json.gz")
+
+    def _iter_entries(self):
+        with os.scandir(self.path) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(".json.gz"):
+                    yield entry
+
+    def get(self, key):
+        """
+        Look up an entry in the cache.
+
+        :param str key: a key computed by :py:meth:`make_key`
+        :returns: the raw response body as :py:class:`bytes`, or ``None`` if
+                  the entry does not exist or has expired
+        """
+        path = self._entry_path(key)
+        try:
+            stat = os.stat(path)
+            if time.time() - stat.st_mtime > self.ttl:
+                with self._lock:
+                    self._remove(path, stat.st_size)
+                raise FileNotFoundError(path)
+            with gzip.open(path, mode="rb") as f:
+                content = f.read()
+        except (OSError, EOFError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return content
+
+    def set(self, key, content):
+        """
+        Store an entry in the cache. The oldest entries are evicted if the
+        size limit is exceeded.
+
+        :param str key: a key computed by :py:meth:`make_key`
+        :param bytes content: the raw response body
+        """
+        # write into a temporary file and rename it so that concurrent readers
+        # never see a partially written entry
+        fd, tmppath = tempfile.mkstemp(dir=self.path, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, mode="wb") as raw:
+                with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=3) as f:
+                    f.write(content)
+            size = os.path.getsize(tmppath)
+            os.replace(tmppath, self._entry_path(key))
+        except OSError:
+            logger.exception("Failed to store a response in the cache {}".format(self.path))
+            if os.path.exists(tmppath):
+                os.remove(tmppath)
+            return
+
+        with self._lock:
+            if self._size is None:
+                self._size = sum(entry.stat().st_size for entry in self._iter_entries())
+            else:
+                self._size += size
+            if self._size > self.max_size:
+                self._evict()
+
+    def _remove(self, path, size):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        if self._size is not None:
+            self._size -= size
+
+    def _evict(self):
+        # evict the oldest entries until only 90% of the limit is used
+        entries = sorted(self._iter_entries(), key=lambda entry: entry.stat().st_mtime)
+        self._size = sum(entry.stat().st_size for entry in entries)
+        target = self.max_size * 0.9
+        for entry in entries:
+            if self._size <= target:
+                break
+            self._remove(entry.path, entry.stat().st_size)
+        logger.debug("Evicted old entries from the response cache {}, current size is {} bytes".format(self.path, self._size))
+
+    def clear(self):
+        """
+        Remove all entries from the cache.
+        """
+        with self._lock:
+            for entry in self._iter_entries():
+                os.remove(entry.path)
+            self._size = 0
+
+    def validate(self, revid):
+        """
+        Check that the cache is valid for the given revision ID. If the ID
+        differs from the one stored with the cache, all entries are removed.
+
+        :param revid: ID of the latest revision on the wiki (may be ``None``)
+        """
+        path = os.path.join(self.path, self.revision_file)
+        try:
+            with open(path, mode="rt", encoding="utf-8") as f:
+                cached_revid = f.read().strip()
+        except FileNotFoundError:
+            cached_revid = None
+        if cached_revid != str(revid):
+            if cached_revid is not None:
+                logger.info("Latest revision ID changed from {} to {}, invalidating the response cache {}"
+                            .format(cached_revid, revid, self.path))
+            self.clear()
+            with open(path, mode="wt", encoding="utf-8") as f:
+                f.write(str(revid))
+
+    @property
+    def stats(self):
+        """
+        A dictionary with the ``hits`` and ``misses`` counters.
+        """
+        return {"hits": self.hits, "misses": self.misses}
@@ -13,7 +13,8 @@ class Site(Meta):
     name in this class.
 
     All :py:attr:`properties` are evaluated lazily and cached. The cache is
-    never automatically invalidated, you should create a new instance for this.
+    never automatically invalidated, you should create a new instance for this
+    (or refresh the properties explicitly with :py:meth:`fetch`).
 
     .. _`MediaWiki API`: https://www.mediawiki.org/wiki/API:Siteinfo
     """
@@ -25,8 +26,44 @@ class Site(Meta):
             "languages", "languagevariants", "skins", "extensiontags", "functionhooks",
             "showhooks", "variables", "protocols", "defaultoptions", "uploaddialog"}
 
+    #: properties used by the :py:attr:`title_context`
+    title_context_properties = {"general", "namespaces", "namespacealiases", "interwikimap"}
+
     def __init__(self, api):
         super().__init__(api)
+        self._title_context = None
+
+    def fetch(self, prop=None):
+        """
+        Auxiliary method for querying properties. The cached
+        :py:attr:`title_context` is dropped when a property which it is built
+        from is refreshed.
+        """
+        result = super().fetch(prop)
+        if prop is None or isinstance(prop, str):
+            props = self.title_context_properties if prop is None else {prop}
+        else:
+            props = set(prop)
+        if props & self.title_context_properties:
+            self._title_context = None
+        return result
+
+    @property
+    def title_context(self):
+        """
+        The :py:class:`Context <ws.parser_helpers.title.Context>` object used
+        by :py:meth:`API.Title <ws.client.api.API.Title>`. It is built from the
+        siteinfo on first access and cached until the siteinfo is refreshed.
+        """
+        if self._title_context is None:
+            # lazy import - ws.parser_helpers.title imports mwparserfromhell which is
+            # an optional dependency
+            from ..parser_helpers.title import Context
+            context = Context.from_api(self._api)
+            # fetching the properties for the new context drops the cached one,
+            # so it must be assigned afterwards
+            self._title_context = context
+        return self._title_context
 
     @property
     def interwikimap(self):
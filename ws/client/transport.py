@@ -0,0 +1,282 @@
+#! /usr/bin/env python3
+
+"""
+The :py:mod:`ws.client.transport` module provides the HTTP transport adapters
+mounted by :py:meth:`ws.client.connection.Connection.make_session`.
+
+:py:class:`HTTPAdapter` is the default transport. It is a
+:py:class:`requests.adapters.HTTPAdapter` with configurable connection pool
+sizes which keeps track of the opened connections. :py:class:`HTTP2Adapter`
+is an alternative transport for servers supporting HTTP/2, it requires the
+optional `httpx`_ library with the ``http2`` extra.
+
+Both adapters collect statistics about the transferred data in a
+:py:class:`TransportStats` object available as their ``stats`` attribute:
+
+.. code-block:: python
+
+    api = API.from_argparser(args)
+    ...
+    print(api.transport_stats.as_dict())
+
+.. _httpx: https://www.python-httpx.org/
+"""
+
+import http.client
+import io
+import threading
+import types
+import logging
+
+import requests
+from requests.packages.urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+try:
+    import httpx
+    _has_httpx = True
+except ImportError:
+    _has_httpx = False
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["TransportStats", "HTTPAdapter", "HTTP2Adapter"]
+
+#: value of the ``Accept-Encoding`` header sent when compression is enabled
+ACCEPT_ENCODING = "gzip, deflate"
+
+class TransportStats:
+    """
+    Thread-safe counters of the HTTP traffic going through a transport adapter.
+    """
+
+    #: names of the counters
+    counters = (
+        "responses",
+        "compressed_responses",
+        "wire_bytes",
+        "decoded_bytes",
+        "new_connections",
+        "http2_responses",
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Set all counters to zero.
+        """
+        with self._lock:
+            for name in self.counters:
+                setattr(self, name, 0)
+
+    def add(self, **kwargs):
+        """
+        Increment the counters given as keyword arguments.
+        """
+        with self._lock:
+            for name, value in kwargs.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def record(self, response, decoded_bytes=None):
+        """
+        Record a response whose body was fully read.
+
+        :param requests.Response response: the response
+        :param int decoded_bytes:
+            size of the decoded body, by default the length of
+            ``response.content`` (must be passed for streamed responses)
+        """
+        if decoded_bytes is None:
+            decoded_bytes = len(response.content)
+        wire_bytes = getattr(response.raw, "wire_bytes", None)
+        if wire_bytes is None:
+            try:
+                # urllib3 counts the bytes read from the socket, i.e. before decoding
+                wire_bytes = response.raw.tell()
+            except (AttributeError, OSError):
+                wire_bytes = decoded_bytes
+        encoding = response.headers.get("Content-Encoding", "identity")
+        self.add(responses=1,
+                 compressed_responses=int(encoding != "identity"),
+                 wire_bytes=wire_bytes,
+                 decoded_bytes=decoded_bytes)
+
+    @property
+    def reused_connections(self):
+        """
+        Number of responses received over a kept-alive connection opened for a
+        previous request (counted only by :py:class:`HTTPAdapter`).
+        """
+        return max(0, self.responses - self.new_connections)
+
+    @property
+    def compression_ratio(self):
+        """
+        Ratio of the decoded and transferred bytes (``None`` if nothing was
+        transferred yet).
+        """
+        if self.wire_bytes == 0:
+            return None
+        return self.decoded_bytes / self.wire_bytes
+
+    def as_dict(self):
+        """
+        :returns: a dictionary with the values of all counters
+        """
+        with self._lock:
+            d = dict((name, getattr(self, name)) for name in self.counters)
+        d["reused_connections"] = max(0, d["responses"] - d["new_connections"])
+        return d
+
+    def __repr__(self):
+        return "<{} {}>".format(self.__class__.__name__, self.as_dict())
+
+class CountingReader:
+    """
+    A wrapper of a file-like object which counts the bytes read from it. Used
+    to measure the size of decoded streamed responses.
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.bytes_read += len(data)
+        return data
+
+def _counting_pool_class(base, stats):
+    class CountingPool(base):
+        def _new_conn(self):
+            stats.add(new_connections=1)
+            return super()._new_conn()
+    CountingPool.__name__ = "Counting" + base.__name__
+    return CountingPool
+
+class HTTPAdapter(requests.adapters.HTTPAdapter):
+    """
+    HTTP/1.1 transport adapter with keep-alive connection pools.
+
+    :param int pool_connections: number of hosts for which the pools are kept
+    :param int pool_maxsize:
+        maximum number of connections kept open for each host. It should be at
+        least the number of threads using the session concurrently, otherwise
+        the connections over the limit are closed after each request.
+    :param bool pool_block:
+        whether to wait for a free connection instead of opening a new
+        (non-pooled) one when the pool is exhausted
+    :param int max_retries: see :py:class:`requests.adapters.HTTPAdapter`
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, pool_block=False, max_retries=0):
+        #: the :py:class:`TransportStats` of this adapter
+        self.stats = TransportStats()
+        super().__init__(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                         pool_block=pool_block, max_retries=max_retries)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _counting_pool_class(HTTPConnectionPool, self.stats),
+            "https": _counting_pool_class(HTTPSConnectionPool, self.stats),
+        }
+
+    def __setstate__(self, state):
+        # the stats are not pickled by requests
+        self.stats = TransportStats()
+        super().__setstate__(state)
+
+class _HTTP2RawResponse(io.BytesIO):
+    """
+    Body of a response received by :py:class:`HTTP2Adapter`, mimicking the
+    parts of :py:class:`urllib3.response.HTTPResponse` used by :py:mod:`requests`.
+    """
+
+    def __init__(self, response):
+        super().__init__(response.content)
+        self.wire_bytes = response.num_bytes_downloaded
+        self.decode_content = True
+        # requests extracts the cookies from the headers of the original response
+        msg = http.client.HTTPMessage()
+        for name, value in response.headers.multi_items():
+            msg[name] = value
+        self._original_response = types.SimpleNamespace(msg=msg)
+
+    def release_conn(self):
+        pass
+
+class HTTP2Adapter(requests.adapters.BaseAdapter):
+    """
+    HTTP/2 transport adapter based on :py:class:`httpx.Client`. Requests to
+    servers which do not support HTTP/2 fall back to HTTP/1.1.
+
+    The responses are always read completely, ``stream=True`` only defers the
+    decoding. The ``max_retries`` parameter applies to connection errors. The
+    connections opened by :py:mod:`httpx` are not counted, so the
+    ``new_connections`` and ``reused_connections`` statistics are not
+    available with this adapter.
+
+    :param int pool_maxsize: maximum number of open connections
+    :param int max_retries: number of retries after a failed connection
+    """
+
+    def __init__(self, pool_maxsize=10, max_retries=0):
+        if not _has_httpx:
+            raise ImportError("The HTTP/2 transport requires the httpx library with the http2 extra.")
+        super().__init__()
+        #: the :py:class:`TransportStats` of this adapter
+        self.stats = TransportStats()
+        self.pool_maxsize = pool_maxsize
+        self.max_retries = max_retries
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def _get_client(self, verify, cert):
+        key = (verify, cert)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                limits = httpx.Limits(max_connections=self.pool_maxsize,
+                                      max_keepalive_connections=self.pool_maxsize)
+                transport = httpx.HTTPTransport(http2=True, verify=verify, cert=cert,
+                                                limits=limits, retries=self.max_retries)
+                client = self._clients[key] = httpx.Client(transport=transport)
+            return client
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        if proxies and any(proxies.values()):
+            raise ValueError("proxies are not supported by the HTTP/2 transport")
+        if isinstance(timeout, tuple):
+            timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+        client = self._get_client(verify, cert)
+        try:
+            r = client.request(request.method, request.url, headers=dict(request.headers),
+                               content=request.body, timeout=timeout)
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(e, request=request)
+        except httpx.TransportError as e:
+            raise requests.exceptions.ConnectionError(e, request=request)
+
+        if r.http_version == "HTTP/2":
+            self.stats.add(http2_responses=1)
+
+        response = requests.Response()
+        response.status_code = r.status_code
+        response.reason = r.reason_phrase
+        response.headers = requests.structures.CaseInsensitiveDict(r.headers.multi_items())
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.raw = _HTTP2RawResponse(r)
+        requests.cookies.extract_cookies_to_jar(response.cookies, request, response.raw)
+        return response
+
+    def close(self):
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients.clear()
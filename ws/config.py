@@ -148,6 +148,8 @@ def getArgParser(subname=None, *args, **kwargs):
     # add other global arguments
     ap.add_argument("--cache-dir", type=argtype_dirname_must_exist, metavar="PATH",
             help="directory for storing cached data (will be created if necessary, but parent directory must exist) (default: %(default)s)")
+    ap.add_argument("--cache-max-age", type=int, metavar="SECONDS",
+            help="maximum age of the cached data which is used without an update, e.g. when the cache is shared by multiple concurrent scripts (default: update on each access)")
 
     ap.set_defaults(**Defaults())
 
@@ -10,7 +10,11 @@ Prerequisites:
 2. One of the many drivers supported by sqlalchemy, e.g. psycopg2.
 """
 
+import collections
+import contextlib
 import os.path
+import threading
+import time
 
 import sqlalchemy as sa
 import alembic.config
@@ -18,31 +22,204 @@ import alembic.config
 from . import schema, selects, grabbers, parser_cache
 from ..parser_helpers.title import Context, Title
 
+ContextCacheInfo = collections.namedtuple("ContextCacheInfo", ["hits", "misses", "invalidations"])
+
+class TitleContextCache:
+    """
+    A cache of the :py:class:`Context <ws.parser_helpers.title.Context>` object
+    used by :py:meth:`Database.Title`.
+
+    The context is loaded from the database on first access and then it is
+    kept until :py:meth:`refresh` finds that the ``interwiki`` or ``namespace``
+    tables actually changed. The grabbers which write into these tables
+    (:py:class:`GrabberNamespaces <ws.db.grabbers.namespace.GrabberNamespaces>`
+    and :py:class:`GrabberInterwiki <ws.db.grabbers.interwiki.GrabberInterwiki>`)
+    call :py:meth:`refresh` after each synchronization.
+
+    :param load:
+        a function returning a new :py:class:`Context <ws.parser_helpers.title.Context>`
+        object built from the current content of the database
+    """
+    def __init__(self, load):
+        self._load = load
+        self._context = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self):
+        """
+        :returns: the cached :py:class:`Context <ws.parser_helpers.title.Context>` object
+        """
+        context = self._context
+        if context is None:
+            self.misses += 1
+            context = self._context = self._load()
+        else:
+            self.hits += 1
+        return context
+
+    def refresh(self):
+        """
+        Reload the context from the database and replace the cached object if
+        the data differs.
+
+        :returns: ``True`` if the cached context was invalidated
+        """
+        if self._context is None:
+            return False
+        context = self._load()
+        if context == self._context:
+            return False
+        self._context = context
+        self.invalidations += 1
+        return True
+
+    def clear(self):
+        """
+        Drop the cached context unconditionally.
+        """
+        if self._context is not None:
+            self._context = None
+            self.invalidations += 1
+
+    def info(self):
+        """
+        :returns:
+            a :py:obj:`ContextCacheInfo` named tuple with the numbers of
+            ``hits``, ``misses`` and ``invalidations``
+        """
+        return ContextCacheInfo(self.hits, self.misses, self.invalidations)
+
+PoolInfo = collections.namedtuple("PoolInfo", ["checkouts", "wait_time", "max_wait_time",
+                                             "checked_out", "max_checked_out", "connections"])
+
+class PoolStatistics:
+    """
+    Instrumentation of the connection pool of a :py:class:`Database`.
+
+    The number of connections checked out of the pool and the number of open
+    DBAPI connections are tracked with the pool events of the engine. The time
+    spent waiting for a connection is measured by :py:meth:`Database.connect`
+    and :py:meth:`Database.begin`, which call :py:meth:`record_wait`.
+
+    :param sqlalchemy.engine.Engine engine: the engine whose pool is observed
+    """
+    def __init__(self, engine):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.connections = 0
+
+        sa.event.listen(engine, "connect", self._on_connect)
+        sa.event.listen(engine, "close", self._on_close)
+        sa.event.listen(engine, "close_detached", self._on_close_detached)
+        sa.event.listen(engine, "checkout", self._on_checkout)
+        sa.event.listen(engine, "checkin", self._on_checkin)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connections += 1
+
+    def _on_close(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connections -= 1
+
+    def _on_close_detached(self, dbapi_connection):
+        with self._lock:
+            self.connections -= 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        # the event is emitted also for invalidated connections, which were
+        # not necessarily checked out
+        if dbapi_connection is None:
+            return
+        with self._lock:
+            self.checked_out -= 1
+
+    def record_wait(self, seconds):
+        """
+        Record the time spent waiting for a connection from the pool.
+
+        :param float seconds: the duration of the checkout
+        """
+        with self._lock:
+            self.wait_time += seconds
+            self.max_wait_time = max(self.max_wait_time, seconds)
+
+    def info(self):
+        """
+        :returns:
+            a :py:obj:`PoolInfo` named tuple with the total number of
+            ``checkouts``, the total and maximum checkout ``wait_time`` in
+            seconds, the current and maximum number of ``checked_out``
+            connections and the current number of open ``connections``
+        """
+        with self._lock:
+            return PoolInfo(self.checkouts, self.wait_time, self.max_wait_time,
+                            self.checked_out, self.max_checked_out, self.connections)
+
 class Database:
     """
+    All access to the database should go through the :py:meth:`connect`,
+    :py:meth:`begin` and :py:meth:`execute` methods, which return the
+    connections to the pool when they are done and record the statistics
+    available in :py:attr:`pool_stats`.
+
     :param engine_or_url:
         either an existing :py:class:`sqlalchemy.engine.Engine` instance or a
         :py:class:`str` representing the URL created by :py:meth:`make_url`
+    :param int pool_size:
+        number of connections kept open in the :py:class:`sqlalchemy.pool.QueuePool`
+    :param int max_overflow:
+        number of connections which can be opened in addition to ``pool_size``
+    :param float pool_timeout:
+        number of seconds to wait for a connection from the pool before giving up
+    :param int pool_recycle:
+        number of seconds after which the pooled connections are replaced
+        (``-1`` means never)
+
+    The pool parameters are ignored if an existing engine is passed.
     """
 
     # it doesn't make sense to even test anything else
     charset = "utf8"
 
-    # TODO: take parameters
-    def __init__(self, engine_or_url):
+    def __init__(self, engine_or_url, *, pool_size=5, max_overflow=10, pool_timeout=30, pool_recycle=-1):
         # limit for continuation
         self.chunk_size = 5000
 
         if isinstance(engine_or_url, sa.engine.Engine):
             self.engine = engine_or_url
         else:
-            self.engine = sa.create_engine(engine_or_url, echo=False)
+            self.engine = sa.create_engine(engine_or_url, echo=False,
+                                           poolclass=sa.pool.QueuePool,
+                                           pool_size=pool_size,
+                                           max_overflow=max_overflow,
+                                           pool_timeout=pool_timeout,
+                                           pool_recycle=pool_recycle,
+                                           pool_pre_ping=True)
 
         assert self.engine.name == "postgresql"
 
+        #: the :py:class:`PoolStatistics` of the engine
+        self.pool_stats = PoolStatistics(self.engine)
+
         self.metadata = sa.MetaData(bind=self.engine)
         schema.create_tables(self.metadata)
 
+        #: the :py:class:`TitleContextCache` used by :py:meth:`Title`
+        self.title_context = TitleContextCache(self._load_title_context)
+
         insp = sa.engine.reflection.Inspector.from_engine(self.engine)
         if not insp.get_table_names():
             # Empty database - create all tables from scratch and stamp the
@@ -80,6 +257,14 @@ class Database:
                 help="port on which the database server listens (default: %(default)s)")
         group.add_argument("--db-name", metavar="DATABASE",
                 help="name of the database (default: %(default)s)")
+        group.add_argument("--db-pool-size", default=5, type=int, metavar="N",
+                help="number of connections kept open to the database (default: %(default)s)")
+        group.add_argument("--db-max-overflow", default=10, type=int, metavar="N",
+                help="number of connections which can be opened in addition to the pool size (default: %(default)s)")
+        group.add_argument("--db-pool-timeout", default=30, type=float, metavar="SECONDS",
+                help="timeout for getting a connection from the pool (default: %(default)s)")
+        group.add_argument("--db-pool-recycle", default=-1, type=int, metavar="SECONDS",
+                help="age after which the pooled connections are replaced, -1 means never (default: %(default)s)")
 
     @classmethod
     def from_argparser(klass, args):
@@ -104,7 +289,11 @@ class Database:
                                 host=args.db_host,
                                 port=args.db_port,
                                 database=args.db_name)
-        return klass(url)
+        return klass(url,
+                     pool_size=args.db_pool_size,
+                     max_overflow=args.db_max_overflow,
+                     pool_timeout=args.db_pool_timeout,
+                     pool_recycle=args.db_pool_recycle)
 
     def __getattr__(self, table_name):
         """
@@ -117,14 +306,66 @@ class Database:
             raise AttributeError("Table '{}' does not exist in the database.".format(table_name))
         return self.metadata.tables[table_name]
 
-    def sync_with_api(self, api, *, with_content=False):
+    def _checkout(self, **kwargs):
+        time1 = time.perf_counter()
+        conn = self.engine.connect(**kwargs)
+        self.pool_stats.record_wait(time.perf_counter() - time1)
+        return conn
+
+    @contextlib.contextmanager
+    def connect(self):
+        """
+        A context manager providing a :py:class:`sqlalchemy.engine.Connection`
+        which is returned to the pool on exit.
+        """
+        conn = self._checkout()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextlib.contextmanager
+    def begin(self):
+        """
+        A context manager providing a :py:class:`sqlalchemy.engine.Connection`
+        with an established transaction. The transaction is committed on
+        normal exit and rolled back if an exception is raised, then the
+        connection is returned to the pool.
+        """
+        with self.connect() as conn:
+            with conn.begin():
+                yield conn
+
+    def execute(self, statement, *multiparams, **params):
+        """
+        Execute a statement outside of an explicit transaction.
+
+        The connection is returned to the pool as soon as the returned
+        :py:class:`sqlalchemy.engine.ResultProxy` is exhausted or closed, so
+        the result can be consumed lazily by the caller.
+
+        The semantics of the parameters is the same as of
+        :py:meth:`sqlalchemy.engine.Connection.execute`.
+        """
+        conn = self._checkout(close_with_result=True)
+        try:
+            return conn.execute(statement, *multiparams, **params)
+        except BaseException:
+            conn.close()
+            raise
+
+    def sync_with_api(self, api, *, with_content=False, workers=1):
         """
         Sync the local data with a remote MediaWiki instance.
 
         :param ws.client.api.API api: interface to the remote MediaWiki instance
         :param bool with_content: whether to synchronize the content of all revisions
+        :param int workers:
+            number of parallel workers fetching the revisions and log events
+            when the database is initially filled (the connection pool of the
+            API session should have at least as many connections)
         """
-        grabbers.synchronize(self, api, with_content=with_content)
+        grabbers.synchronize(self, api, with_content=with_content, workers=workers)
 
     def sync_latest_revisions_content(self, api):
         """
@@ -145,21 +386,36 @@ class Database:
         """
         return selects.query(self, *args, **kwargs)
 
+    def _load_title_context(self):
+        iwmap = selects.get_interwikimap(self)
+        namespacenames = selects.get_namespacenames(self)
+        namespaces = selects.get_namespaces(self)
+        # legaltitlechars are not stored in the database, it will hardly ever
+        # change so let's just hardcode it
+        legaltitlechars = " %!\"$&'()*,\\-.\\/0-9:;=?@A-Z\\\\^_`a-z~\\x80-\\xFF+"
+        return Context(iwmap, namespacenames, namespaces, legaltitlechars)
+
     def Title(self, title):
         """
         Parse a MediaWiki title.
 
+        The context of the parser is cached, see :py:class:`TitleContextCache`.
+
         :param str title: page title to be parsed
         :returns: a :py:class:`ws.parser_helpers.title.Title` object
         """
-        iwmap = selects.get_interwikimap(self)
-        namespacenames = selects.get_namespacenames(self)
-        namespaces = selects.get_namespaces(self)
-        # legaltitlechars are not stored in the database, it will hardly ever
-        # change so let's just hardcode it
-        legaltitlechars = " %!\"$&'()*,\\-.\\/0-9:;=?@A-Z\\\\^_`a-z~\\x80-\\xFF+"
-        context = Context(iwmap, namespacenames, namespaces, legaltitlechars)
-        return Title(context, title)
+        return Title(self.title_context.get(), title)
+
+    def Titles(self, titles):
+        """
+        Parse a batch of MediaWiki titles, see :py:meth:`Context.parse_many
+        <ws.parser_helpers.title.Context.parse_many>`.
+
+        :param titles: an iterable of page titles to be parsed
+        :returns: a list of :py:class:`ws.parser_helpers.title.Title` objects
+        """
+        context = self.title_context.get()
+        return [Title.from_parsed(context, parsed) for parsed in context.parse_many(titles)]
 
     def update_parser_cache(self):
         """
@@ -180,7 +436,7 @@ https://www.postgresql.org/docs/current/static/using-explain.html
 Usage:
 
 >>> from ws.db.database import explain
->>> for row in db.engine.execute(explain(s)):
+>>> for row in db.execute(explain(s)):
 >>>     print(row[0])
 """
 
@@ -1,5 +1,11 @@
 #! /usr/bin/env python3
 
+import datetime
+
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.dialects.postgresql.dml import OnConflictDoNothing, OnConflictDoUpdate
+
 class DeferrableExecutionQueue:
     """
     An execution wrapper which defers the execution of statements until the
@@ -72,3 +78,263 @@ class DeferrableExecutionQueue:
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.execute_deferred()
+
+class _CopyStream:
+    """
+    A file-like object reading lines from an iterator, used as the input of
+    the ``COPY ... FROM STDIN`` command.
+    """
+    def __init__(self, lines):
+        self.lines = lines
+        self.buffer = ""
+
+    def read(self, size=-1):
+        chunks = [self.buffer]
+        length = len(self.buffer)
+        while size < 0 or length < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            chunks.append(line)
+            length += len(line)
+        data = "".join(chunks)
+        if size < 0:
+            self.buffer = ""
+            return data
+        self.buffer = data[size:]
+        return data[:size]
+
+# characters which must be escaped in the text format of the COPY command
+_COPY_ESCAPES = str.maketrans({
+    "\\": "\\\\",
+    "\n": "\\n",
+    "\r": "\\r",
+    "\t": "\\t",
+})
+
+def _copy_value(value):
+    """
+    Format a value for the text format of the COPY command.
+    """
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        # the hex format of bytea with the backslash escaped
+        return "\\\\x" + bytes(value).hex()
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value).translate(_COPY_ESCAPES)
+
+def _is_excluded_column(value, name):
+    """
+    Check if the value in ``set_`` of an ``ON CONFLICT DO UPDATE`` clause is
+    the ``excluded`` value of the column ``name``.
+    """
+    table = getattr(value, "table", None)
+    return isinstance(value, sa.Column) and table is not None and table.name == "excluded" and value.name == name
+
+class BulkExecutionQueue(DeferrableExecutionQueue):
+    """
+    An execution queue which loads the rows of deferred ``INSERT`` statements
+    with PostgreSQL's ``COPY`` command instead of the *executemany* execution
+    strategy.
+
+    Plain ``INSERT`` statements are copied directly into the target table.
+    For ``INSERT ... ON CONFLICT`` statements the rows are copied into a
+    temporary staging table and moved into the target table with a single
+    ``INSERT ... SELECT ... ON CONFLICT`` statement. The order of the rows is
+    preserved, so the result is the same as if the statements were executed
+    one by one: the first row wins for ``ON CONFLICT DO NOTHING``, and for
+    ``ON CONFLICT DO UPDATE`` the updated columns are taken from the last row
+    and the other columns from the first row with the same conflict target.
+    Hence ``ON CONFLICT DO UPDATE`` statements are loaded with ``COPY`` only
+    if all values in ``set_`` are the ``excluded`` values of the same columns.
+
+    Statements which cannot be loaded with ``COPY`` (e.g. ``UPDATE`` or
+    ``INSERT`` statements with subqueries in the values) are executed the
+    same way as in :py:class:`DeferrableExecutionQueue`, in the order of the
+    queues. The same happens for all statements if the DBAPI driver does not
+    support ``COPY`` (only psycopg2 is supported).
+
+    :param sqlalchemy.engine.Connection conn:
+        a connection (with an established transaction) to the database where the
+        statements are executed
+    :param int chunk_size:
+        maximum queue size
+    """
+
+    # name of the column preserving the order of the rows in the staging tables
+    SEQUENCE_COLUMN = "ws_seq"
+
+    def __init__(self, conn, chunk_size):
+        super().__init__(conn, chunk_size)
+        cursor = conn.connection.cursor()
+        self.copy_supported = hasattr(cursor, "copy_expert")
+        cursor.close()
+        self.quote = conn.dialect.identifier_preparer.quote
+        # cached results of _is_copyable for the statements
+        self.copyable = {}
+        # staging tables for the target tables
+        self.staging_tables = {}
+
+    def _is_copyable(self, statement):
+        if not self.copy_supported or not isinstance(statement, sa.sql.expression.Insert):
+            return False
+        # INSERT ... SELECT or INSERT with values set in the statement
+        if statement.select is not None or statement.parameters:
+            return False
+        if statement._returning:
+            return False
+        if any(isinstance(column.type, sa.types.ARRAY) for column in statement.table.c):
+            return False
+        clause = statement._post_values_clause
+        if isinstance(clause, OnConflictDoUpdate):
+            # duplicate rows are eliminated with DISTINCT ON the conflict target,
+            # which is not known for named constraints
+            if clause.inferred_target_elements is None:
+                return False
+            # other values or conditions would depend on the preceding updates
+            if clause.update_whereclause is not None:
+                return False
+            for key, value in clause.update_values_to_set:
+                if not _is_excluded_column(value, getattr(key, "name", key)):
+                    return False
+        elif clause is not None and not isinstance(clause, OnConflictDoNothing):
+            return False
+        return True
+
+    def _get_staging_table(self, table):
+        staging = self.staging_tables.get(table)
+        if staging is None:
+            name = "ws_staging_" + table.name
+            self.conn.execute("CREATE TEMPORARY TABLE {} (LIKE {} INCLUDING DEFAULTS) ON COMMIT DROP"
+                              .format(self.quote(name), self.quote(table.name)))
+            self.conn.execute("ALTER TABLE {} ADD COLUMN {} bigserial"
+                              .format(self.quote(name), self.quote(self.SEQUENCE_COLUMN)))
+            columns = [sa.Column(column.name, column.type) for column in table.c]
+            columns.append(sa.Column(self.SEQUENCE_COLUMN, sa.BigInteger))
+            staging = sa.Table(name, sa.MetaData(), *columns)
+            self.staging_tables[table] = staging
+        return staging
+
+    def _copy_rows(self, table_name, columns, rows):
+        processors = []
+        for column in columns:
+            if isinstance(column.type, sa.types.TypeDecorator):
+                processors.append(column.type.process_bind_param)
+            else:
+                processors.append(None)
+        dialect = self.conn.dialect
+        keys = [column.name for column in columns]
+
+        def gen_lines():
+            for row in rows:
+                values = []
+                for key, process in zip(keys, processors):
+                    value = row[key]
+                    if process is not None:
+                        value = process(value, dialect)
+                    values.append(_copy_value(value))
+                yield "\t".join(values) + "\n"
+
+        sql = "COPY {} ({}) FROM STDIN".format(self.quote(table_name),
+                                                ", ".join(self.quote(key) for key in keys))
+        cursor = self.conn.connection.cursor()
+        try:
+            cursor.copy_expert(sql, _CopyStream(gen_lines()))
+        finally:
+            cursor.close()
+
+    def _copy(self, statement, rows):
+        table = statement.table
+        columns = [table.c[key] for key in rows[0]]
+        clause = statement._post_values_clause
+
+        if clause is None:
+            self._copy_rows(table.name, columns, rows)
+            return
+
+        staging = self._get_staging_table(table)
+        self._copy_rows(staging.name, columns, rows)
+
+        seq = staging.c[self.SEQUENCE_COLUMN]
+        if isinstance(clause, OnConflictDoUpdate):
+            # keep only one row for each conflict target: executed one by one,
+            # the first row would be inserted and the following rows would
+            # update only the set_ columns
+            target = [staging.c[getattr(element, "name", element)] for element in clause.inferred_target_elements]
+            updated = set(getattr(key, "name", key) for key, value in clause.update_values_to_set)
+            values = []
+            for column in columns:
+                value = staging.c[column.name]
+                if not any(value is element for element in target):
+                    order = seq.desc() if column.name in updated else seq
+                    value = sa.func.first_value(value).over(partition_by=target, order_by=order).label(column.name)
+                values.append(value)
+            sel = sa.select(values).distinct(*target).order_by(*target)
+        else:
+            sel = sa.select([staging.c[column.name] for column in columns]).order_by(seq)
+        ins = insert(table).from_select([column.name for column in columns], sel)
+        ins._post_values_clause = clause
+        self.conn.execute(ins)
+        self.conn.execute("TRUNCATE {}".format(self.quote(staging.name)))
+
+    def execute_deferred(self):
+        """
+        Execute all deferred statements and clear the queue.
+        """
+        for statement in self.ordered_keys:
+            if statement in self.stmt_queues:
+                rows = self.stmt_queues[statement]
+                copyable = self.copyable.get(statement)
+                if copyable is None:
+                    copyable = self.copyable[statement] = self._is_copyable(statement)
+                # executemany requires the same keys in all rows as well
+                keys = set(rows[0])
+                if copyable and keys <= set(statement.table.c.keys()) and all(set(row) == keys for row in rows):
+                    self._copy(statement, rows)
+                else:
+                    self.conn.execute(statement, rows)
+
+        # don't clear self.ordered_keys to preserve the order from first execution
+        self.stmt_queues.clear()
+
+def defer_secondary_indexes(conn, tables):
+    """
+    Drop the non-unique indexes of the given tables which are empty, so that
+    they can be created after the tables are filled, which is much faster than
+    updating them with each inserted row. The unique indexes are kept, because
+    they are needed for the ``ON CONFLICT`` clauses.
+
+    The indexes are dropped in the transaction of ``conn``, which holds an
+    exclusive lock on the tables until it is committed.
+
+    :param sqlalchemy.engine.Connection conn:
+        a connection (with an established transaction) to the database
+    :param tables: an iterable of :py:class:`sqlalchemy.schema.Table` objects
+    :returns:
+        a list of the dropped :py:class:`sqlalchemy.schema.Index` objects, to
+        be passed to :py:func:`create_indexes`
+    """
+    dropped = []
+    for table in tables:
+        if conn.execute(sa.select([sa.literal(1)]).select_from(table).limit(1)).first() is not None:
+            continue
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if not index.unique:
+                conn.execute(sa.schema.DropIndex(index))
+                dropped.append(index)
+    return dropped
+
+def create_indexes(conn, indexes):
+    """
+    Create the indexes dropped by :py:func:`defer_secondary_indexes`.
+
+    :param sqlalchemy.engine.Connection conn:
+        a connection (with an established transaction) to the database
+    :param indexes: an iterable of :py:class:`sqlalchemy.schema.Index` objects
+    """
+    for index in indexes:
+        conn.execute(sa.schema.CreateIndex(index))
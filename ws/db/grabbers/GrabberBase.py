@@ -1,13 +1,17 @@
 #!/usr/bin/env python3
 
+import concurrent.futures
 import datetime
 import logging
+import queue
+import threading
 
 from sqlalchemy import select
 from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql.expression import Insert
 
 from ws.client.api import ShortRecentChangesError
-from ws.db.execution import DeferrableExecutionQueue
+from ws.db.execution import DeferrableExecutionQueue, BulkExecutionQueue, defer_secondary_indexes, create_indexes
 
 __all__ = ["GrabberBase"]
 
@@ -22,6 +26,26 @@ class GrabberBase:
     # be here.
     INSERT_PREDELETE_TABLES = []
 
+    # Whether the grabber writes into tables which are used for the context
+    # of the title parser (see ws.db.database.TitleContextCache).
+    REFRESH_TITLE_CONTEXT = False
+
+    # Number of time slices per worker for the partitioned queries. Using more
+    # slices than workers balances the load when the activity on the wiki is
+    # not uniform in time.
+    PARTITIONS_PER_WORKER = 4
+
+    # Maximum number of items buffered for each time slice which is not
+    # consumed yet.
+    PARTITION_BUFFER_SIZE = 1000
+
+    # Whether insert() loads the rows with PostgreSQL's COPY command (see
+    # ws.db.execution.BulkExecutionQueue) and creates the secondary indexes
+    # of the empty tables only after they are filled. Note that the indexes
+    # are dropped in the transaction of the insert, so gen_insert must not
+    # read the tables targeted by self.sql through other connections.
+    BULK_INSERT = True
+
     def __init__(self, api, db):
         self.api = api
         self.db = db
@@ -48,8 +72,10 @@ class GrabberBase:
         }
 
         if conn is None:
-            conn = self.db.engine.connect()
-        conn.execute(ins, entry)
+            with self.db.begin() as conn:
+                conn.execute(ins, entry)
+        else:
+            conn.execute(ins, entry)
 
     def _get_sync_timestamp(self):
         """
@@ -60,12 +86,117 @@ class GrabberBase:
         sel = select([ws_sync.c.wss_timestamp]) \
               .where(ws_sync.c.wss_key == self.__class__.__name__)
 
-        conn = self.db.engine.connect()
-        row = conn.execute(sel).fetchone()
+        with self.db.connect() as conn:
+            row = conn.execute(sel).fetchone()
         if row:
             return row[0]
         return None
 
+    def _get_first_timestamp(self, params, prefix):
+        """
+        Get the timestamp of the oldest item of a ``list=`` query.
+
+        :returns: a :py:class:`datetime.datetime` object or ``None`` if the list is empty
+        """
+        list_ = params["list"]
+        query = {
+            "action": "query",
+            "list": list_,
+            prefix + "dir": "newer",
+            prefix + "limit": 1,
+        }
+        if prefix + "prop" in params:
+            query[prefix + "prop"] = "timestamp"
+        items = self.api.call_api(query)[list_]
+        if not items:
+            return None
+        item = items[0]
+        # list=allrevisions yields pages with revisions
+        if "revisions" in item:
+            item = item["revisions"][0]
+        return item["timestamp"]
+
+    def _gen_partitioned_list(self, params, prefix, workers, *, stream=False):
+        """
+        A generator yielding the items of a ``list=`` query ordered by timestamp
+        (e.g. ``list=allrevisions`` or ``list=logevents``), which are fetched
+        concurrently.
+
+        The time range from the oldest item until now is split into
+        ``workers * PARTITIONS_PER_WORKER`` slices, which are queried with the
+        ``start`` and ``end`` parameters by ``workers`` parallel threads. The
+        items are yielded in chronological order (as with ``dir=newer``), the
+        slices which are fetched ahead are buffered in bounded queues.
+
+        :param dict params: parameters of the query
+        :param str prefix: the prefix of the query module's parameters (e.g. ``"arv"``)
+        :param int workers: number of parallel workers
+        :param bool stream: passed to :py:meth:`ws.client.api.API.list`
+        """
+        first = self._get_first_timestamp(params, prefix)
+        if first is None:
+            return
+        # the API timestamps have a resolution of 1 second
+        first = first.replace(microsecond=0)
+        now = datetime.datetime.utcnow().replace(microsecond=0)
+        seconds = int((now - first).total_seconds())
+        num_slices = max(1, min(workers * self.PARTITIONS_PER_WORKER, seconds))
+        bounds = [first + datetime.timedelta(seconds=seconds * i // num_slices) for i in range(num_slices)]
+
+        slices = []
+        for i, start in enumerate(bounds):
+            slice_params = params.copy()
+            slice_params[prefix + "dir"] = "newer"
+            slice_params[prefix + "start"] = start
+            # the boundaries are inclusive, the last slice is left open so
+            # that nothing is lost
+            if i + 1 < len(bounds):
+                slice_params[prefix + "end"] = bounds[i + 1] - datetime.timedelta(seconds=1)
+            slices.append(slice_params)
+        logger.info("{}: fetching list={} in {} time slices with {} workers"
+                    .format(self.__class__.__name__, params["list"], len(slices), workers))
+
+        stop = threading.Event()
+        end_of_slice = object()
+
+        def put(q, item):
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def fetch(slice_params, q):
+            try:
+                for item in self.api.list(slice_params, stream=stream):
+                    if not put(q, item):
+                        return
+            except Exception as e:
+                put(q, e)
+            else:
+                put(q, end_of_slice)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            queues = [queue.Queue(maxsize=self.PARTITION_BUFFER_SIZE) for _ in slices]
+            # the slices are started in order, so a slice is always being
+            # fetched when its turn to be consumed comes
+            futures = [executor.submit(fetch, slice_params, q) for slice_params, q in zip(slices, queues)]
+            try:
+                for q in queues:
+                    while True:
+                        item = q.get()
+                        if item is end_of_slice:
+                            break
+                        if isinstance(item, Exception):
+                            raise item
+                        yield item
+            finally:
+                stop.set()
+                for future in futures:
+                    future.cancel()
+
     def gen_insert(self):
         """
         A generator for database entries which assumes that the tables are
@@ -106,14 +237,14 @@ class GrabberBase:
     def insert(self):
         # delete everything and start over, otherwise the invalid rows would
         # stay in the tables
-        with self.db.engine.begin() as conn:
+        with self.db.begin() as conn:
             for table in self.INSERT_PREDELETE_TABLES:
                 conn.execute(self.db.metadata.tables[table].delete())
 
         sync_timestamp = datetime.datetime.utcnow()
 
         gen = self.gen_insert()
-        self._execute(gen, sync_timestamp)
+        self._execute(gen, sync_timestamp, bulk=self.BULK_INSERT)
 
     def update(self, *, since=None):
         sync_timestamp = datetime.datetime.utcnow()
@@ -131,9 +262,26 @@ class GrabberBase:
             logger.warning("The recent changes table on the wiki has been recently purged, so {} must start from scratch.".format(self.__class__.__name__))
             self.insert()
 
-    def _execute(self, gen, sync_timestamp):
-        with self.db.engine.begin() as conn:
-            with DeferrableExecutionQueue(conn, self.db.chunk_size) as dfe:
+    def _get_insert_tables(self):
+        """
+        :returns: a list of tables targeted by the ``INSERT`` statements in ``self.sql``
+        """
+        tables = []
+        for statement in getattr(self, "sql", {}).values():
+            if isinstance(statement, Insert) and statement.table not in tables:
+                tables.append(statement.table)
+        return tables
+
+    def _execute(self, gen, sync_timestamp, *, bulk=False):
+        with self.db.begin() as conn:
+            if bulk is True:
+                deferred_indexes = defer_secondary_indexes(conn, self._get_insert_tables())
+                queue_class = BulkExecutionQueue
+            else:
+                deferred_indexes = []
+                queue_class = DeferrableExecutionQueue
+
+            with queue_class(conn, self.db.chunk_size) as dfe:
                 for item in gen:
                     if isinstance(item, tuple):
                         # unpack the tuple
@@ -142,5 +290,12 @@ class GrabberBase:
                         # probably a single value
                         dfe.execute(item)
 
+            if deferred_indexes:
+                logger.info("{}: creating {} deferred indexes".format(self.__class__.__name__, len(deferred_indexes)))
+                create_indexes(conn, deferred_indexes)
+
             # set the sync timestamp, in the same transaction as the data
             self._set_sync_timestamp(sync_timestamp, conn)
+
+        if self.REFRESH_TITLE_CONTEXT:
+            self.db.title_context.refresh()
@@ -16,7 +16,7 @@ from ws.db.grabbers.logging_ import GrabberLogging
 
 logger = logging.getLogger(__name__)
 
-def synchronize(db, api, *, with_content=False):
+def synchronize(db, api, *, with_content=False, workers=1):
     time1 = time.time()
 
     # if no recent change has been added, it's safe to assume that the other tables are up to date as well
@@ -29,12 +29,13 @@ def synchronize(db, api, *, with_content=False):
     GrabberTags(api, db).update()
     GrabberRecentChanges(api, db).update()
     GrabberUsers(api, db).update()
-    GrabberLogging(api, db).update()
+    GrabberLogging(api, db, workers=workers).update()
     GrabberInterwiki(api, db).update()
     GrabberIPBlocks(api, db).update()
     GrabberPages(api, db).update()
     GrabberProtectedTitles(api, db).update()
-    GrabberRevisions(api, db, with_content=with_content).update()
+    GrabberRevisions(api, db, with_content=with_content, workers=workers).update()
 
     time2 = time.time()
     logger.info("Synchronization of the database took {:.2f} seconds.".format(time2 - time1))
+    logger.debug("Database connection pool statistics: {}".format(db.pool_stats.info()))
@@ -7,6 +7,7 @@ from .GrabberBase import *
 class GrabberInterwiki(GrabberBase):
 
     INSERT_PREDELETE_TABLES = ["interwiki"]
+    REFRESH_TITLE_CONTEXT = True
 
     def __init__(self, api, db):
         super().__init__(api, db)
@@ -9,8 +9,9 @@ from .GrabberBase import *
 
 class GrabberLogging(GrabberBase):
 
-    def __init__(self, api, db):
+    def __init__(self, api, db, *, workers=1):
         super().__init__(api, db)
+        self.workers = workers
 
         ins_logging = sa.dialects.postgresql.insert(db.logging)
         ins_tgle = sa.dialects.postgresql.insert(db.tagged_logevent)
@@ -108,7 +109,11 @@ class GrabberLogging(GrabberBase):
             yield self.sql["insert", "tagged_logevent"], db_entry
 
     def gen_insert(self):
-        for logevent in self.api.list(self.le_params):
+        if self.workers > 1:
+            logevents = self._gen_partitioned_list(self.le_params, "le", self.workers)
+        else:
+            logevents = self.api.list(self.le_params)
+        for logevent in logevents:
             yield from self.gen_inserts_from_logevent(logevent)
 
     def gen_update(self, since):
@@ -162,10 +167,10 @@ class GrabberLogging(GrabberBase):
                 }
                 yield self.sql["insert", "tagged_logevent"], db_entry
                 # check if it is a recent change and tag it as well
-                result = self.db.engine.execute(sa.select([
+                exists = self.db.execute(sa.select([
                             sa.exists().where(self.db.recentchanges.c.rc_logid == logid)
-                        ]))
-                if result.fetchone()[0]:
+                        ])).scalar()
+                if exists:
                     yield self.sql["insert", "tagged_recentchange"], db_entry
         for logid, removed in removed_tags.items():
             for tag in removed:
@@ -6,6 +6,8 @@ from .GrabberBase import *
 
 class GrabberNamespaces(GrabberBase):
 
+    REFRESH_TITLE_CONTEXT = True
+
     def __init__(self, api, db):
         super().__init__(api, db)
 
@@ -15,9 +15,10 @@ logger = logging.getLogger(__name__)
 # TODO: are truncated results due to PHP cache reflected by changing the query-continuation parameter accordingly or do we actually lose some revisions?
 class GrabberRevisions(GrabberBase):
 
-    def __init__(self, api, db, *, with_content=False):
+    def __init__(self, api, db, *, with_content=False, workers=1):
         super().__init__(api, db)
         self.with_content = with_content
+        self.workers = workers
 
         ins_text = sa.dialects.postgresql.insert(db.text)
         ins_revision = sa.dialects.postgresql.insert(db.revision)
@@ -178,9 +179,9 @@ class GrabberRevisions(GrabberBase):
 
     # TODO: text.old_id is auto-increment, but revision.rev_text_id has to be set accordingly. SQL should be able to do it automatically.
     def _get_text_id_gen(self):
-        conn = self.db.engine.connect()
-        result = conn.execute(sa.select( [sa.sql.func.max(self.db.text.c.old_id)] ))
-        value = result.fetchone()[0]
+        with self.db.connect() as conn:
+            result = conn.execute(sa.select( [sa.sql.func.max(self.db.text.c.old_id)] ))
+            value = result.fetchone()[0]
         if value is None:
             value = 0
         while True:
@@ -270,9 +271,14 @@ class GrabberRevisions(GrabberBase):
         # we need one instance per transaction
         self.text_id_gen = self._get_text_id_gen()
 
-        for page in self.api.list(self.arv_params):
+        # the responses are decoded incrementally when they contain the content
+        if self.workers > 1:
+            pages = self._gen_partitioned_list(self.arv_params, "arv", self.workers, stream=self.with_content)
+        else:
+            pages = self.api.list(self.arv_params, stream=self.with_content)
+        for page in pages:
             yield from self.gen_revisions(page)
-        for page in self.api.list(self.adr_params):
+        for page in self.api.list(self.adr_params, stream=self.with_content):
             yield from self.gen_deletedrevisions(page)
 
     def gen_update(self, since):
@@ -286,7 +292,7 @@ class GrabberRevisions(GrabberBase):
         arv_params = self.arv_params.copy()
         arv_params["arvdir"] = "newer"
         arv_params["arvstart"] = since
-        for page in self.api.list(arv_params):
+        for page in self.api.list(arv_params, stream=self.with_content):
             yield from self.gen_revisions(page)
             for rev in page["revisions"]:
                 new_revids.add(rev["revid"])
@@ -461,18 +467,18 @@ class GrabberRevisions(GrabberBase):
                     "b_rev_id": revid,
                     "b_tag_name": tag,
                 }
-                result = self.db.engine.execute(sa.select([
+                exists = self.db.execute(sa.select([
                             sa.exists().where(self.db.revision.c.rev_id == revid)
-                        ]))
-                if result.fetchone()[0]:
+                        ])).scalar()
+                if exists:
                     yield self.sql["insert", "tagged_revision"], db_entry
                 else:
                     yield self.sql["insert", "tagged_archived_revision"], db_entry
                 # check if it is a recent change and tag it as well
-                result = self.db.engine.execute(sa.select([
+                exists = self.db.execute(sa.select([
                             sa.exists().where(self.db.recentchanges.c.rc_this_oldid == revid)
-                        ]))
-                if result.fetchone()[0]:
+                        ])).scalar()
+                if exists:
                     yield self.sql["insert", "tagged_recentchange"], db_entry
 
         for revid, removed in removed_tags.items():
@@ -499,8 +505,7 @@ class GrabberRevisions(GrabberBase):
                         rev.join(page, (rev.c.rev_page == page.c.page_id) &
                                        (rev.c.rev_id == page.c.page_latest))
                     ).where(rev.c.rev_text_id == None).order_by(rev.c.rev_id)
-            conn = self.db.engine.connect()
-            result = conn.execute(query)
+            result = self.db.execute(query)
             return (r[0] for r in result)
 
         def gen():
@@ -508,28 +513,21 @@ class GrabberRevisions(GrabberBase):
             # we need one instance per transaction
             self.text_id_gen = self._get_text_id_gen()
 
-            for chunk in ws.utils.iter_chunks(get_latest_revids(), self.api.max_ids_per_query):
-                params = {
-                    "action": "query",
-                    "revids": "|".join(str(i) for i in chunk),
-                    "prop": "revisions",
-                    "rvprop": "ids|content",
-                }
-                result = self.api.call_api(params, expand_result=False)
-                for page in result["query"]["pages"].values():
-                    for rev in page["revisions"]:
-                        text_id = next(self.text_id_gen)
-                        db_entry = {
-                            "b_rev_id": rev["revid"],
-                            "rev_text_id": text_id
-                        }
-                        yield from self.gen_text(rev, text_id)
-                        yield self.sql["update", "revision"], db_entry
-                        counter += 1
+            pages = self.api.query_pages(revids=get_latest_revids(), prop="revisions", rvprop="ids|content")
+            for page in pages:
+                for rev in page["revisions"]:
+                    text_id = next(self.text_id_gen)
+                    db_entry = {
+                        "b_rev_id": rev["revid"],
+                        "rev_text_id": text_id
+                    }
+                    yield from self.gen_text(rev, text_id)
+                    yield self.sql["update", "revision"], db_entry
+                    counter += 1
 
         # snippet copy-pasted from GrabberBase._execute, but without calling _set_sync_timestamp
         from ws.db.execution import DeferrableExecutionQueue
-        with self.db.engine.begin() as conn:
+        with self.db.begin() as conn:
             with DeferrableExecutionQueue(conn, self.db.chunk_size) as dfe:
                 for item in gen():
                     if isinstance(item, tuple):
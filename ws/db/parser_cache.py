@@ -73,7 +73,7 @@ class ParserCache:
     def _execute(self, conn, query, *, explain=False):
         if explain is True:
             from ws.db.database import explain
-            result = self.db.engine.execute(explain(query))
+            result = self.db.execute(explain(query))
             print(query)
             for row in result:
                 print(row[0])
@@ -128,8 +128,7 @@ class ParserCache:
 
     def _insert_templatelinks(self, conn, pageid, transclusions):
         db_entries = []
-        for t in transclusions:
-            title = self.db.Title(t)
+        for title in self.db.Titles(transclusions):
             entry = {
                 "tl_from": pageid,
                 "tl_namespace": title.namespacenumber,
@@ -441,7 +440,7 @@ class ParserCache:
         namespaces = get_namespaces(self.db)
 
         logger.info("ParserCache: Invalidating old entries...")
-        with self.db.engine.begin() as conn:
+        with self.db.begin() as conn:
             self._check_invalidation(conn)
             self._invalidate(conn)
         logger.debug("Invalidated pageids: {}".format(self.invalidated_pageids))
@@ -455,7 +454,7 @@ class ParserCache:
         def parse_namespace(ns):
             for page in self.db.query(generator="allpages", gapnamespace=ns, prop="latestrevisions", rvprop={"content", "ids"}):
                 # one transaction per page
-                with self.db.engine.begin() as conn:
+                with self.db.begin() as conn:
                     if "*" in page["revisions"][0]:
                         if page["pageid"] in self.invalidated_pageids:
                             self._parse_page(conn, page["pageid"], page["title"], page["revisions"][0]["*"])
@@ -471,6 +470,8 @@ class ParserCache:
                 continue
             parse_namespace(ns)
 
+        logger.debug("ParserCache: title context cache statistics: {}".format(self.db.title_context.info()))
+
     def invalidate_all(self):
-        with self.db.engine.begin() as conn:
+        with self.db.begin() as conn:
             conn.execute(self.db.ws_parser_cache_sync.delete())
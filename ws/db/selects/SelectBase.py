@@ -44,9 +44,9 @@ class SelectBase:
     def execute_sql(self, query, *, explain=False):
         if explain is True:
             from ws.db.database import explain
-            result = self.db.engine.execute(explain(query))
+            result = self.db.execute(explain(query))
             print(query)
             for row in result:
                 print(row[0])
 
-        return self.db.engine.execute(query)
+        return self.db.execute(query)
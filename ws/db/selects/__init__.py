@@ -133,7 +133,7 @@ def query_pageset(db, params):
         if isinstance(titles, str):
             titles = {titles}
         assert isinstance(titles, set)
-        titles = [db.Title(t) for t in titles]
+        titles = db.Titles(titles)
         tail, pageset, ex = get_pageset(db, titles=titles)
     elif "pageids" in params:
         pageids = params_copy.pop("pageids")
@@ -3,12 +3,9 @@
 import sqlalchemy as sa
 
 def get_interwikimap(db):
-    conn = db.engine.connect()
-    result = conn.execute(db.interwiki.select())
-
     interwikimap = {}
 
-    for row in result:
+    for row in db.execute(db.interwiki.select()):
         iw = {
             "prefix": row.iw_prefix,
             "url": row.iw_url,
@@ -271,12 +271,10 @@ def oldest_rc_timestamp(db):
     """
     Get timestamp of the oldest change stored in the recentchanges table.
     """
-    result = db.engine.execute(sa.select( [sa.func.min(db.recentchanges.c.rc_timestamp)] ))
-    return result.fetchone()[0]
+    return db.execute(sa.select( [sa.func.min(db.recentchanges.c.rc_timestamp)] )).scalar()
 
 def newest_rc_timestamp(db):
     """
     Get timestamp of the newest change stored in the recentchanges table.
     """
-    result = db.engine.execute(sa.select( [sa.func.max(db.recentchanges.c.rc_timestamp)] ))
-    return result.fetchone()[0]
+    return db.execute(sa.select( [sa.func.max(db.recentchanges.c.rc_timestamp)] )).scalar()
@@ -7,12 +7,14 @@ def get_namespaces(db):
     nss_sel = db.namespace_starname.select()
     nsc_sel = db.namespace_canonical.select()
 
-    conn = db.engine.connect()
-    result = conn.execute(ns_sel)
-
     namespaces = {}
 
-    for row in result:
+    with db.connect() as conn:
+        ns_rows = conn.execute(ns_sel).fetchall()
+        nss_rows = conn.execute(nss_sel).fetchall()
+        nsc_rows = conn.execute(nsc_sel).fetchall()
+
+    for row in ns_rows:
         ns = {
             "id": row.ns_id,
             "case": row.ns_case,
@@ -25,23 +27,18 @@ def get_namespaces(db):
             ns["nonincludable"] = ""
         namespaces[row.ns_id] = ns
 
-    result = conn.execute(nss_sel)
-    for row in result:
+    for row in nss_rows:
         namespaces[row.nss_id]["*"] = row.nss_name
 
-    result = conn.execute(nsc_sel)
-    for row in result:
+    for row in nsc_rows:
         namespaces[row.nsc_id]["canonical"] = row.nsc_name
 
     return namespaces
 
 def get_namespacenames(db):
-    conn = db.engine.connect()
-    result = conn.execute(db.namespace_name.select())
-
     namespacenames = {}
 
-    for row in result:
+    for row in db.execute(db.namespace_name.select()):
         namespacenames[row.nsn_name] = row.nsn_id
 
     return namespacenames
@@ -336,30 +336,27 @@ class InterlanguageLinks:
                 if self._needs_update(page, langlinks):
                     yield page, langlinks
 
-        for chunk in ws.utils.iter_chunks(_updates_gen(self.allpages), self.api.max_ids_per_query):
-            pages_props, pages_langlinks = zip(*list(chunk))
-            pageids = "|".join(str(page["pageid"]) for page in pages_props)
-            result = self.api.call_api(action="query", pageids=pageids, prop="revisions", rvprop="content|timestamp")
-            pages = result["pages"]
-
-            for page, langlinks in zip(pages_props, pages_langlinks):
-                # substitute the dictionary with langlinks with the dictionary with content
-                page = pages[str(page["pageid"])]
-
-                timestamp = page["revisions"][0]["timestamp"]
-                text_old = page["revisions"][0]["*"]
-                try:
-                    text_new = self.update_page(page["title"], text_old, langlinks, weak_update=False)
-                except header.HeaderError:
-                    logger.error("Error: failed to extract header elements. Please investigate.")
-                    continue
+        # mapping of page IDs to the langlinks of the pages to be updated
+        updates = dict((page["pageid"], langlinks) for page, langlinks in _updates_gen(self.allpages))
+
+        # the dictionaries with langlinks are substituted with the dictionaries with content
+        for page in self.api.query_pages(pageids=list(updates), prop="revisions", rvprop="content|timestamp"):
+            langlinks = updates[page["pageid"]]
+
+            timestamp = page["revisions"][0]["timestamp"]
+            text_old = page["revisions"][0]["*"]
+            try:
+                text_new = self.update_page(page["title"], text_old, langlinks, weak_update=False)
+            except header.HeaderError:
+                logger.error("Error: failed to extract header elements. Please investigate.")
+                continue
 
-                if text_old != text_new:
-                    try:
-#                        edit_interactive(self.api, page["title"], page["pageid"], text_old, text_new, timestamp, self.edit_summary, bot="")
-                        self.api.edit(page["title"], page["pageid"], text_new, timestamp, self.edit_summary, bot="")
-                    except APIError:
-                        pass
+            if text_old != text_new:
+                try:
+#                    edit_interactive(self.api, page["title"], page["pageid"], text_old, text_new, timestamp, self.edit_summary, bot="")
+                    self.api.edit(page["title"], page["pageid"], text_new, timestamp, self.edit_summary, bot="")
+                except APIError:
+                    pass
 
     def find_orphans(self):
         """
@@ -1,16 +1,17 @@
 #! /usr/bin/env python3
 
+import collections
 import re
 from copy import copy, deepcopy
+from functools import lru_cache, partial
 import os.path
 
 # only for explicit type check in Title.parse
 import mwparserfromhell
 
 from .encodings import _anchor_preprocess, urldecode
-from ..utils import find_caseless
 
-__all__ = ["canonicalize", "Context", "Title", "TitleError", "InvalidTitleCharError", "InvalidColonError", "DatabaseTitleError"]
+__all__ = ["canonicalize", "Context", "ParsedTitle", "Title", "TitleError", "InvalidTitleCharError", "InvalidColonError", "DatabaseTitleError"]
 
 def canonicalize(title):
     """
@@ -56,19 +57,43 @@ class Context:
     :param str legaltitlechars:
         string of characters which are allowed to occur in page titles
 
+    :param int parse_cache_size:
+        maximum number of parsed titles cached by :py:meth:`parse`, defaults
+        to :py:attr:`PARSE_CACHE_SIZE`
+
     Normally, the user does not interact with the :py:class:`Context` class.
     Both the API and Database classes provide shortcut functions
     (:py:func:`API.Title <ws.client.api.API.Title>` and
     :py:func:`Database.Title <ws.db.database.Database.Title>`, respectively)
     which construct the necessary context and pass it to the
     :py:class:`Title` class.
+
+    .. note::
+        The parsed titles are cached, so the mappings passed to the constructor
+        must not be modified afterwards.
     """
-    def __init__(self, interwikimap, namespacenames, namespaces, legaltitlechars):
+
+    #: default maximum number of parsed titles cached by :py:meth:`parse`
+    PARSE_CACHE_SIZE = 2**14
+
+    def __init__(self, interwikimap, namespacenames, namespaces, legaltitlechars, *, parse_cache_size=None):
         self.interwikimap = interwikimap
         self.namespacenames = namespacenames
         self.namespaces = namespaces
         self.legaltitlechars = legaltitlechars
 
+        # case-folded indexes for the lookup of interwiki prefixes and
+        # namespace names, the first name wins like in find_caseless
+        self._interwiki_index = _caseless_index(interwikimap)
+        self._namespace_index = _caseless_index(namespacenames)
+        # FIXME: how does MediaWiki handle unicode titles?  https://phabricator.wikimedia.org/T139881
+        # as a workaround, any UTF-8 character, which is not an ASCII character, is allowed
+        self._illegal_chars_regex = re.compile("[^{}\\u0100-\\uFFFF]".format(legaltitlechars))
+
+        if parse_cache_size is None:
+            parse_cache_size = self.PARSE_CACHE_SIZE
+        self._cached_parse = lru_cache(maxsize=parse_cache_size)(partial(_parse_title, self))
+
     @classmethod
     def from_api(klass, api):  # pragma: no cover
         """
@@ -101,6 +126,174 @@ class Context:
                self.namespaces == other.namespaces and \
                self.legaltitlechars == other.legaltitlechars
 
+    def parse(self, full_title):
+        """
+        Split a full title into its parts, see :py:meth:`Title.parse`. The
+        results are cached in a bounded LRU cache keyed by the title string.
+
+        :param full_title:
+            The full title to be parsed, either a :py:obj:`str` or
+            :py:class:`mwparserfromhell.wikicode.Wikicode` object.
+        :returns: a :py:class:`ParsedTitle` object
+        :raises:
+            :py:exc:`InvalidTitleCharError` when the page title is not valid
+        """
+        # Wikicode has to be converted to str, but we don't want to convert
+        # numbers or any arbitrary objects.
+        if not isinstance(full_title, str) and not isinstance(full_title, mwparserfromhell.wikicode.Wikicode):
+            raise TypeError("full_title must be either 'str' or 'Wikicode'")
+        return self._cached_parse(str(full_title))
+
+    def parse_many(self, titles):
+        """
+        Parse a batch of titles. Each distinct title is parsed only once, even
+        if the batch is larger than the cache.
+
+        :param titles: an iterable of titles accepted by :py:meth:`parse`
+        :returns: a list of :py:class:`ParsedTitle` objects
+        """
+        parsed = {}
+        result = []
+        for title in titles:
+            key = str(title)
+            if key not in parsed:
+                parsed[key] = self.parse(title)
+            result.append(parsed[key])
+        return result
+
+    def parse_cache_info(self):
+        """
+        :returns: statistics of the cache used by :py:meth:`parse`, see
+                  :py:func:`functools.lru_cache`
+        """
+        return self._cached_parse.cache_info()
+
+def _caseless_index(names):
+    """
+    :returns: a dictionary mapping the lowercase forms of ``names`` to the names
+    """
+    index = {}
+    for name in names:
+        index.setdefault(name.lower(), name)
+    return index
+
+def _find_caseless(index, what):
+    """
+    Same as :py:func:`ws.utils.find_caseless` with ``from_target=True``, but
+    using an index created by :py:func:`_caseless_index`.
+
+    :raises ValueError: when not found
+    """
+    try:
+        return index[what.lower()]
+    except KeyError:
+        raise ValueError
+
+ParsedTitle = collections.namedtuple("ParsedTitle", ["leading_colon", "iw", "ns", "pure", "anchor"])
+ParsedTitle.__doc__ = """
+An immutable result of :py:meth:`Context.parse`. The fields correspond to the
+attributes of the :py:class:`Title` class.
+"""
+
+def _parse_iwprefix(context, iw):
+    try:
+        # strip spaces
+        iw = iw.replace("_", " ").strip()
+        # convert spaces to underscores to make the lookup work
+        # (Note that MediaWiki's Special:Interwiki page does not allow interwiki prefixes
+        # with spaces, but [[foo bar:Some page]] is valid as an interwiki link.)
+        iw = iw.replace(" ", "_")
+        # check if it is valid interwiki prefix
+        return _find_caseless(context._interwiki_index, iw)
+    except ValueError:
+        if iw == "":
+            return iw
+        else:
+            raise ValueError("tried to assign invalid interwiki prefix: {}".format(iw))
+
+def _parse_namespace(context, iw, ns):
+    try:
+        ns = canonicalize(ns)
+        if iw == "" or "local" in context.interwikimap[iw]:
+            # check if it is valid namespace
+            return _find_caseless(context._namespace_index, ns)
+        elif ns:
+            raise ValueError("tried to assign non-empty namespace '{}' to an interwiki link".format(ns))
+        else:
+            return ns
+    except ValueError:
+        raise ValueError("tried to assign invalid namespace: {}".format(ns))
+
+def _parse_pagename(context, pagename):
+    if pagename.startswith(":"):
+        raise InvalidColonError("The ``pagename`` part cannot start with a colon: '{}'".format(pagename))
+
+    # MediaWiki does not treat encoded underscores as spaces (e.g.
+    # [[Main%5Fpage]] is rendered as <a href="...">Main_page</a>),
+    # but we focus on meaning, not rendering.
+    pagename = urldecode(pagename)
+    if context._illegal_chars_regex.search(pagename):
+        raise InvalidTitleCharError("Given title contains illegal character(s): '{}'".format(pagename))
+    # canonicalize title
+    return canonicalize(pagename)
+
+def _parse_title(context, full_title):
+    """
+    The implementation of :py:meth:`Context.parse` without caching.
+    """
+    leading_colon = ":" if full_title.startswith(":") else ""
+
+    def lstrip_one(text, char):
+        if text.startswith(char):
+            return text.replace(char, "", 1)
+        return text
+
+    # parse interwiki prefix
+    try:
+        iw, _rest = lstrip_one(full_title, ":").split(":", maxsplit=1)
+        iw = _parse_iwprefix(context, iw)
+    except ValueError:
+        iw = ""
+
+    if iw:
+        # [[wikipedia::Foo]] is valid
+        _rest = _rest.lstrip(":")
+    else:
+        # reset _rest if the interwiki prefix is empty
+        _rest = lstrip_one(full_title, ":")
+        if _rest.startswith(":"):
+            raise InvalidColonError("The ``pagename`` part cannot start with a colon: '{}'".format(_rest))
+
+    # parse namespace
+    try:
+        ns, _pure = _rest.split(":", maxsplit=1)
+        ns = _parse_namespace(context, iw, ns)
+    except ValueError:
+        ns = ""
+        _pure = _rest
+
+    # split section anchor
+    try:
+        _pure, anchor = _pure.split("#", maxsplit=1)
+    except ValueError:
+        anchor = ""
+
+    pure = _parse_pagename(context, _pure)
+    anchor = _anchor_preprocess(anchor)
+    return ParsedTitle(leading_colon, iw, ns, pure, anchor)
+
+def _parsed_field(name):
+    """
+    A property accessing a field of the :py:class:`ParsedTitle` object of a
+    :py:class:`Title`. Assignment replaces the object (copy-on-write), so the
+    cached parsing results are shared by all titles.
+    """
+    def fget(self):
+        return getattr(self._parsed, name)
+    def fset(self, value):
+        self._parsed = self._parsed._replace(**{name: value})
+    return property(fget, fset)
+
 class Title:
     """
     A helper class intended for easy manipulation with wiki titles. Title
@@ -116,6 +309,18 @@ class Title:
     .. _`magic words`: https://www.mediawiki.org/wiki/Help:Magic_words#Page_names
     """
 
+    # Interwiki prefix (e.g. ``wikipedia``), lowercase
+    iw = _parsed_field("iw")
+    # Namespace, in the canonical form (e.g. ``ArchWiki talk``)
+    ns = _parsed_field("ns")
+    # Pure title (i.e. without interwiki and namespace prefixes), in the
+    # canonical form (see :py:func:`canonicalize`)
+    pure = _parsed_field("pure")
+    # Section anchor
+    anchor = _parsed_field("anchor")
+    # leading colon (":") or empty string ("")
+    _leading_colon = _parsed_field("leading_colon")
+
     def __init__(self, context, title):
         """
         :param Context context:
@@ -126,21 +331,23 @@ class Title:
         The ``title`` is parsed by the :py:meth:`parse` method.
         """
         self.context = context
+        self._parsed = ParsedTitle("", None, None, None, None)
+        self.parse(title)
 
-        # Interwiki prefix (e.g. ``wikipedia``), lowercase
-        self.iw = None
-        # Namespace, in the canonical form (e.g. ``ArchWiki talk``)
-        self.ns = None
-        # Pure title (i.e. without interwiki and namespace prefixes), in the
-        # canonical form (see :py:func:`canonicalize`)
-        self.pure = None
-        # Section anchor
-        self.anchor = None
-
-        # leading colon (":") or empty string ("")
-        self._leading_colon = ""
+    @classmethod
+    def from_parsed(klass, context, parsed):
+        """
+        Create a :py:class:`Title` object from the result of
+        :py:meth:`Context.parse` or :py:meth:`Context.parse_many` without
+        parsing it again.
 
-        self.parse(title)
+        :param Context context: the context which parsed the title
+        :param ParsedTitle parsed: the parsed title
+        """
+        self = klass.__new__(klass)
+        self.context = context
+        self._parsed = parsed
+        return self
 
     # explicit setters are necessary, because methods decorated with
     # @foo.setter are not callable from self.__init__
@@ -150,21 +357,7 @@ class Title:
         """
         if not isinstance(iw, str):
             raise TypeError("iwprefix must be of type 'str'")
-
-        try:
-            # strip spaces
-            iw = iw.replace("_", " ").strip()
-            # convert spaces to underscores to make find_caseless work
-            # (Note that MediaWiki's Special:Interwiki page does not allow interwiki prefixes
-            # with spaces, but [[foo bar:Some page]] is valid as an interwiki link.)
-            iw = iw.replace(" ", "_")
-            # check if it is valid interwiki prefix
-            self.iw = find_caseless(iw, self.context.interwikimap.keys(), from_target=True)
-        except ValueError:
-            if iw == "":
-                self.iw = iw
-            else:
-                raise ValueError("tried to assign invalid interwiki prefix: {}".format(iw))
+        self.iw = _parse_iwprefix(self.context, iw)
 
     def _set_namespace(self, ns):
         """
@@ -172,18 +365,7 @@ class Title:
         """
         if not isinstance(ns, str):
             raise TypeError("namespace must be of type 'str'")
-
-        try:
-            ns = canonicalize(ns)
-            if self.iw == "" or "local" in self.context.interwikimap[self.iw]:
-                # check if it is valid namespace
-                self.ns = find_caseless(ns, self.context.namespacenames, from_target=True)
-            elif ns:
-                raise ValueError("tried to assign non-empty namespace '{}' to an interwiki link".format(ns))
-            else:
-                self.ns = ns
-        except ValueError:
-            raise ValueError("tried to assign invalid namespace: {}".format(ns))
+        self.ns = _parse_namespace(self.context, self.iw, ns)
 
     def _set_pagename(self, pagename):
         """
@@ -191,20 +373,7 @@ class Title:
         """
         if not isinstance(pagename, str):
             raise TypeError("pagename must be of type 'str'")
-
-        if pagename.startswith(":"):
-            raise InvalidColonError("The ``pagename`` part cannot start with a colon: '{}'".format(pagename))
-
-        # MediaWiki does not treat encoded underscores as spaces (e.g.
-        # [[Main%5Fpage]] is rendered as <a href="...">Main_page</a>),
-        # but we focus on meaning, not rendering.
-        pagename = urldecode(pagename)
-        # FIXME: how does MediaWiki handle unicode titles?  https://phabricator.wikimedia.org/T139881
-        # as a workaround, any UTF-8 character, which is not an ASCII character, is allowed
-        if re.search("[^{}\\u0100-\\uFFFF]".format(self.context.legaltitlechars), pagename):
-            raise InvalidTitleCharError("Given title contains illegal character(s): '{}'".format(pagename))
-        # canonicalize title
-        self.pure = canonicalize(pagename)
+        self.pure = _parse_pagename(self.context, pagename)
 
     def _set_sectionname(self, sectionname):
         """
@@ -227,53 +396,14 @@ class Title:
             :py:class:`mwparserfromhell.wikicode.Wikicode` object.
         :raises:
             :py:exc:`InvalidTitleCharError` when the page title is not valid
-        """
-        # Wikicode has to be converted to str, but we don't want to convert
-        # numbers or any arbitrary objects.
-        if not isinstance(full_title, str) and not isinstance(full_title, mwparserfromhell.wikicode.Wikicode):
-            raise TypeError("full_title must be either 'str' or 'Wikicode'")
-        full_title = str(full_title)
-
-        if full_title.startswith(":"):
-            self._leading_colon = ":"
 
-        def lstrip_one(text, char):
-            if text.startswith(char):
-                return text.replace(char, "", 1)
-            return text
-
-        # parse interwiki prefix
-        try:
-            iw, _rest = lstrip_one(full_title, ":").split(":", maxsplit=1)
-            self._set_iwprefix(iw)
-        except ValueError:
-            self.iw = ""
-
-        if self.iw:
-            # [[wikipedia::Foo]] is valid
-            _rest = _rest.lstrip(":")
-        else:
-            # reset _rest if the interwiki prefix is empty
-            _rest = lstrip_one(full_title, ":")
-            if _rest.startswith(":"):
-                raise InvalidColonError("The ``pagename`` part cannot start with a colon: '{}'".format(_rest))
-
-        # parse namespace
-        try:
-            ns, _pure = _rest.split(":", maxsplit=1)
-            self._set_namespace(ns)
-        except ValueError:
-            self.ns = ""
-            _pure = _rest
-
-        # split section anchor
-        try:
-            _pure, anchor = _pure.split("#", maxsplit=1)
-        except ValueError:
-            anchor = ""
-
-        self._set_pagename(_pure)
-        self._set_sectionname(anchor)
+        The parsing results are cached by :py:meth:`Context.parse`.
+        """
+        parsed = self.context.parse(full_title)
+        # the leading colon is kept when parsing a title without it
+        if not parsed.leading_colon and self._leading_colon:
+            parsed = parsed._replace(leading_colon=self._leading_colon)
+        self._parsed = parsed
 
     def format(self, *, iwprefix=False, namespace=False, sectionname=False, colon=False):
         """
@@ -0,0 +1,286 @@
+#! /usr/bin/env python3
+
+import bisect
+import datetime
+import itertools
+import logging
+
+from ws import utils
+from ws.cache import CacheDb
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["UserStatsAggregates"]
+
+def _new_streak(revision):
+    return {"first": revision["timestamp"], "last": revision["timestamp"], "editcount": 1}
+
+def _streak_length(streak):
+    delta = streak["last"] - streak["first"]
+    return delta.days + 1
+
+def _add_revision(record, revision):
+    """
+    Update the aggregates of a user with a revision. The revisions have to be
+    added in the order of their timestamps.
+    """
+    timestamp = revision["timestamp"]
+    record["editcount"] += 1
+    if record["first"] is None:
+        record["first"] = timestamp
+    current = record["current"]
+    # edits made on the next day continue the streak
+    if current is None or timestamp.date() - current["last"].date() > datetime.timedelta(days=1):
+        current = record["current"] = _new_streak(revision)
+    else:
+        current["last"] = timestamp
+        current["editcount"] += 1
+    record["last"] = timestamp
+
+    longest = record["longest"]
+    if longest is None or longest["first"] == current["first"] or _streak_length(current) > _streak_length(longest):
+        record["longest"] = dict(current)
+
+def _new_record(user):
+    return {"user": user, "editcount": 0, "first": None, "last": None, "longest": None, "current": None}
+
+class UserStatsAggregates(CacheDb):
+    """
+    Per-user aggregates of the revisions in :py:class:`ws.cache.AllRevisionsProps`:
+    the edit count, the first and last edit and the state of the longest and
+    current streaks. The aggregates are persisted and updated only with the
+    revisions added since the last update, so the update does not depend on the
+    size of the wiki history.
+
+    The methods give the same results as the corresponding methods of
+    :py:class:`ws.statistics.UserStatsModules.UserStatsModules`. When a new
+    revision of a user is older than the user's last known edit (e.g. an
+    imported revision), the aggregates of the user are recomputed from all
+    their revisions.
+
+    The database is a list of the aggregates sorted by the user name. It is
+    updated on the first call of an accessor method (or explicitly with
+    :py:meth:`update`), the following calls only look up the aggregates.
+    """
+
+    record_keys = {
+        None: "user",
+    }
+
+    def __init__(self, db_allrevprops, cache_dir, round_to_midnight=False, autocommit=True, storage="keyed", max_age=None):
+        """
+        :param db_allrevprops:
+            an instance of :py:class:`ws.cache.AllRevisionsProps`
+        :param cache_dir:
+            path to the cache directory
+        :param round_to_midnight:
+            whether to ignore revisions made after the past UTC midnight. The
+            ignored revisions are added in the next update after they become
+            older than the midnight.
+        :param storage:
+            name of the storage backend, see :py:class:`ws.cache.CacheDb`
+        :param max_age:
+            maximum age of the data which is used without an update, see
+            :py:class:`ws.cache.CacheDb`
+        """
+        self.db = db_allrevprops
+        self.round_to_midnight = round_to_midnight
+
+        # current UTC date
+        self.today = datetime.datetime.utcnow()
+        if self.round_to_midnight:
+            # round to midnight, keep the datetime.datetime type
+            self.today = datetime.datetime(*(self.today.timetuple()[:3]))
+
+        # the database depends on the round_to_midnight parameter
+        dbname = "UserStatsAggregates" if round_to_midnight is False else "UserStatsAggregatesMidnight"
+        super().__init__(db_allrevprops.api, cache_dir, dbname, autocommit, storage, max_age)
+        # whether the database was updated by an accessor method
+        self._updated = False
+
+    def init(self, key=None):
+        """
+        :param key: ignored
+        """
+        logger.info("Initializing UserStatsAggregates cache...")
+        self.data = []
+        self.meta["lastrevid"] = 0
+        self.meta["pending"] = []
+        self.update()
+
+    def _is_included(self, revision):
+        if "user" not in revision:
+            # hidden user name
+            return False
+        return self.round_to_midnight is False or revision["timestamp"] <= self.today
+
+    def _new_revisions(self, collections):
+        """
+        Get the revisions added to :py:attr:`db` since the last update and the
+        revisions which were pending due to ``round_to_midnight``.
+
+        :returns: a tuple ``(revisions, lastrevid)``
+        """
+        lastrevid = self.meta["lastrevid"]
+        revisions = []
+        for records in collections:
+            if len(records) == 0:
+                continue
+            last = records[-1]["revid"]
+            if last > self.meta["lastrevid"]:
+                if hasattr(records, "find_range"):
+                    revisions.extend(records.find_range(self.meta["lastrevid"] + 1, last))
+                else:
+                    start = bisect.bisect_right(utils.ListOfDictsAttrWrapper(records, "revid"), self.meta["lastrevid"])
+                    revisions.extend(records[start:])
+                lastrevid = max(lastrevid, last)
+            for revid in self.meta["pending"]:
+                try:
+                    revisions.append(CacheDb._find_record(records, revid, "revid"))
+                except KeyError:
+                    pass
+        return revisions, lastrevid
+
+    def _user_revisions(self, collections, users):
+        """
+        Get all revisions of the given users, sorted by timestamp.
+
+        :returns: a dictionary mapping the user names to lists of revisions
+        """
+        result = dict((user, []) for user in users)
+        for records in collections:
+            if hasattr(records, "select"):
+                for user in users:
+                    result[user].extend(records.select("user = ?", (user, )))
+            else:
+                for revision in records:
+                    if revision.get("user") in result:
+                        result[revision["user"]].append(revision)
+        for revisions in result.values():
+            revisions.sort(key=lambda r: (r["timestamp"], r["revid"]))
+        return result
+
+    def update(self, key=None):
+        """
+        :param key: ignored
+        """
+        # NOTE: access to database triggers an update
+        collections = [self.db["revisions"], self.db["deletedrevisions"]]
+        revisions, lastrevid = self._new_revisions(collections)
+        pending = sorted(r["revid"] for r in revisions if "user" in r and not self._is_included(r))
+        revisions = [r for r in revisions if self._is_included(r)]
+        if lastrevid == self.meta["lastrevid"] and pending == self.meta["pending"]:
+            return
+        logger.info("Updating the aggregates with {} revisions...".format(len(revisions)))
+
+        revisions.sort(key=lambda r: (r["user"], r["timestamp"], r["revid"]))
+        users = self._find_records(set(r["user"] for r in revisions))
+        records = []
+        outdated = []
+        for user, user_revisions in itertools.groupby(revisions, key=lambda r: r["user"]):
+            user_revisions = list(user_revisions)
+            record = users.get(user)
+            if record is None:
+                record = _new_record(user)
+            elif user_revisions[0]["timestamp"] < record["last"]:
+                outdated.append(user)
+                continue
+            for revision in user_revisions:
+                _add_revision(record, revision)
+            records.append(record)
+
+        if outdated:
+            logger.info("Recomputing the aggregates of {} users...".format(len(outdated)))
+            for user, user_revisions in self._user_revisions(collections, outdated).items():
+                record = _new_record(user)
+                for revision in user_revisions:
+                    if self._is_included(revision):
+                        _add_revision(record, revision)
+                records.append(record)
+
+        self._merge_records(self.data, records, "user")
+        for record in records:
+            self._record_change(None, record)
+        self.meta["lastrevid"] = lastrevid
+        self.meta["pending"] = pending
+        self._update_timestamp()
+
+        if self.autocommit is True:
+            self.dump()
+
+    def _find_records(self, users):
+        # like find_many, but without triggering an update
+        records = {}
+        for user in users:
+            try:
+                records[user] = self._find_record(self.data, user, "user")
+            except KeyError:
+                pass
+        return records
+
+    def _find_user(self, user):
+        # like find, but the database is updated only on the first call
+        if self._updated is False:
+            self._load_and_update()
+            self._updated = True
+        return self._find_record(self.data, user, "user")
+
+    def get_streaks(self, user):
+        """
+        Get the longest and current streaks for given user, see
+        :py:meth:`ws.statistics.UserStatsModules.UserStatsModules.get_streaks`.
+
+        :param user: the user name
+        :raises KeyError: when the user has no revisions
+        """
+        record = self._find_user(user)
+
+        def _format(streak):
+            return {
+                "length": _streak_length(streak),
+                "start": streak["first"].date(),
+                "end": streak["last"].date(),
+                "editcount": streak["editcount"],
+            }
+
+        longest = _format(record["longest"])
+        # check if the last edit has been made at most 24 hours ago (or, when
+        # round_to_midnight is True, at most on the previous UTC day)
+        if self.today - record["current"]["last"] <= datetime.timedelta(days=1):
+            current = _format(record["current"])
+        else:
+            current = None
+        return longest, current
+
+    def edits_per_day(self, user, registration_timestamp):
+        """
+        :param user: the user name
+        :param registration_timestamp:
+            a :py:class`datetime.datetime` object representing the user's registration time
+            or ``None`` if the registration date is not available for some reason
+        :returns:
+            a ``float`` value of the average edits per day since registration until today,
+            or ``float('nan')`` if ``registration_timestamp`` is ``None``
+        """
+        if registration_timestamp is None:
+            return float('nan')
+        record = self._find_user(user)
+        delta = self.today - registration_timestamp
+        return record["editcount"] / (delta.days + 1)
+
+    def active_edits_per_day(self, user):
+        """
+        :param user: the user name
+        :returns:
+            a ``float`` value of the average edits per day between the first and last edit dates
+        """
+        record = self._find_user(user)
+        delta = record["last"] - record["first"]
+        return record["editcount"] / (delta.days + 1)
+
+    def total_edit_count(self, user):
+        """
+        Return the count of all revisions made by the given user, see
+        :py:meth:`ws.statistics.UserStatsModules.UserStatsModules.total_edit_count`.
+        """
+        return self._find_user(user)["editcount"]
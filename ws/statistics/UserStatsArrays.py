@@ -0,0 +1,242 @@
+#! /usr/bin/env python3
+
+"""
+Vectorized computation of the per-user statistics provided by
+:py:class:`ws.statistics.UserStatsModules.UserStatsModules`. The revisions of
+all users are represented by NumPy arrays of user codes and timestamps sorted
+by ``(user, timestamp)``, the streaks are the runs of revisions whose day
+numbers differ by at most one, and all statistics are computed for all users
+in one pass over the arrays.
+"""
+
+import datetime
+
+import numpy as np
+
+__all__ = ["compute_user_stats", "UserStatsArrays"]
+
+_ONE_DAY = np.timedelta64(1, "D")
+
+def _ends(starts, length):
+    """
+    :returns: the indexes of the last elements of the runs starting at ``starts``
+    """
+    if len(starts) == 0:
+        return starts
+    return np.append(starts[1:], length) - 1
+
+def _run_starts(*keys):
+    """
+    :returns: a boolean mask of the elements which differ from the previous
+              element in any of the given arrays
+    """
+    length = len(keys[0])
+    mask = np.zeros(length, dtype=bool)
+    if length > 0:
+        mask[0] = True
+    for key in keys:
+        mask[1:] |= key[1:] != key[:-1]
+    return mask
+
+def compute_user_stats(users, timestamps, today):
+    """
+    Compute the statistics of all users.
+
+    :param users: an array of the user names of the revisions
+    :param timestamps: an array of the timestamps of the revisions (``numpy.datetime64``)
+    :param today:
+        a :py:class:`datetime.datetime` object used to decide whether the last
+        streak of each user is current
+    :returns:
+        a dictionary of arrays, each element corresponds to one user:
+
+        - ``"users"``: the user names, sorted
+        - ``"editcount"``: the number of revisions
+        - ``"activedays"``: the number of distinct days with a revision
+        - ``"first"``, ``"last"``: the timestamps of the first and last revisions
+        - ``"longest_length"``, ``"longest_editcount"``, ``"longest_first"``,
+          ``"longest_last"``: the length in days, the number of revisions and
+          the first and last timestamps of the longest streak (the first one
+          if there are more streaks of the same length)
+        - ``"current_length"``, ``"current_editcount"``, ``"current_first"``,
+          ``"current_last"``: the same for the last streak
+        - ``"is_current"``: whether the last edit has been made at most 24
+          hours before ``today``
+        - ``"active_edits_per_day"``: the average of edits per day between the
+          first and last edits
+    """
+    names, codes = np.unique(np.asarray(users), return_inverse=True)
+    codes = codes.reshape(-1)
+    # microseconds to keep the precision of datetime.datetime objects
+    timestamps = np.asarray(timestamps).astype("datetime64[us]")
+    order = np.lexsort((timestamps, codes))
+    codes = codes[order]
+    timestamps = timestamps[order]
+    days = timestamps.astype("datetime64[D]").astype(np.int64)
+    length = len(codes)
+
+    new_user = _run_starts(codes)
+    user_starts = np.flatnonzero(new_user)
+    user_ends = _ends(user_starts, length)
+
+    # a new streak starts with each user and after each gap of more than one day
+    new_streak = new_user.copy()
+    new_streak[1:] |= (days[1:] - days[:-1]) > 1
+    streak_starts = np.flatnonzero(new_streak)
+    streak_ends = _ends(streak_starts, length)
+    streak_users = codes[streak_starts]
+    # the length is based on the time between the first and last edits
+    streak_lengths = (timestamps[streak_ends] - timestamps[streak_starts]) // _ONE_DAY + 1
+    streak_counts = streak_ends - streak_starts + 1
+
+    # the longest streak of each user: sort by user, length (descending) and
+    # position, take the first streak of each user
+    order = np.lexsort((streak_starts, -streak_lengths, streak_users))
+    longest = order[_run_starts(streak_users[order])]
+    # the current streak is the last streak of each user
+    current = _ends(np.flatnonzero(_run_starts(streak_users)), len(streak_starts))
+
+    first = timestamps[user_starts]
+    last = timestamps[user_ends]
+    editcount = user_ends - user_starts + 1
+    return {
+        "users": names,
+        "editcount": editcount,
+        "activedays": np.bincount(codes[_run_starts(codes, days)], minlength=len(names)),
+        "first": first,
+        "last": last,
+        "longest_length": streak_lengths[longest],
+        "longest_editcount": streak_counts[longest],
+        "longest_first": timestamps[streak_starts[longest]],
+        "longest_last": timestamps[streak_ends[longest]],
+        "current_length": streak_lengths[current],
+        "current_editcount": streak_counts[current],
+        "current_first": timestamps[streak_starts[current]],
+        "current_last": timestamps[streak_ends[current]],
+        "is_current": np.datetime64(today, "us") - last <= _ONE_DAY,
+        "active_edits_per_day": editcount / ((last - first) // _ONE_DAY + 1),
+    }
+
+def _revision_arrays(revisions):
+    """
+    :returns: a tuple ``(users, timestamps)`` of arrays, revisions with a
+              hidden user name are skipped
+    """
+    if hasattr(revisions, "column"):
+        # ws.cache.columnar.RevisionTable
+        users = revisions.user_column()
+        timestamps = revisions.column("timestamp")
+    else:
+        users = np.array([r.get("user") for r in revisions], dtype=object)
+        timestamps = np.array([r["timestamp"] for r in revisions], dtype="datetime64[us]")
+    mask = np.not_equal(users, None) & ~np.isnat(timestamps)
+    return users[mask], timestamps[mask]
+
+class UserStatsArrays:
+    """
+    Vectorized alternative to :py:class:`ws.statistics.UserStatsModules.UserStatsModules`
+    with the same interface and results. All statistics are computed when the
+    object is created, see :py:func:`compute_user_stats`. The arrays are
+    available as :py:attr:`stats`.
+
+    With the ``"columnar"`` storage of :py:class:`ws.cache.AllRevisionsProps`,
+    the revisions are read directly from the columns.
+    """
+    def __init__(self, db_allrevprops, round_to_midnight=False):
+        """
+        :param db_allrevprops:
+            an instance of :py:class:`cache.AllRevisionsProps`
+        :param round_to_midnight:
+            whether to ignore revisions made after the past UTC midnight
+        """
+        self.db = db_allrevprops
+        self.round_to_midnight = round_to_midnight
+
+        # current UTC date
+        self.today = datetime.datetime.utcnow()
+        if self.round_to_midnight:
+            # round to midnight, keep the datetime.datetime type
+            self.today = datetime.datetime(*(self.today.timetuple()[:3]))
+
+        # NOTE: access to database triggers an update
+        arrays = [_revision_arrays(self.db[name]) for name in ["revisions", "deletedrevisions"]]
+        users = np.concatenate([a[0] for a in arrays])
+        timestamps = np.concatenate([a[1].astype("datetime64[us]") for a in arrays])
+        if self.round_to_midnight is True:
+            mask = timestamps <= np.datetime64(self.today, "us")
+            users = users[mask]
+            timestamps = timestamps[mask]
+
+        #: the arrays computed by :py:func:`compute_user_stats`
+        self.stats = compute_user_stats(users, timestamps, self.today)
+        self._index = dict((user, i) for i, user in enumerate(self.stats["users"]))
+
+    def _get(self, user, name):
+        return self.stats[name][self._index[user]]
+
+    @staticmethod
+    def _timestamp(value):
+        return value.astype(datetime.datetime)
+
+    def _streak(self, i, prefix):
+        return {
+            "length": int(self.stats[prefix + "_length"][i]),
+            "start": self._timestamp(self.stats[prefix + "_first"][i]).date(),
+            "end": self._timestamp(self.stats[prefix + "_last"][i]).date(),
+            "editcount": int(self.stats[prefix + "_editcount"][i]),
+        }
+
+    def get_streaks(self, user):
+        """
+        Get the longest and current streaks for given user, see
+        :py:meth:`ws.statistics.UserStatsModules.UserStatsModules.get_streaks`.
+
+        :param user: the user name
+        :raises KeyError: when the user has no revisions
+        """
+        i = self._index[user]
+        longest = self._streak(i, "longest")
+        # check if the last edit has been made at most 24 hours ago (or, when
+        # round_to_midnight is True, at most on the previous UTC day)
+        if self.today - self._timestamp(self.stats["current_last"][i]) <= datetime.timedelta(days=1):
+            current = self._streak(i, "current")
+        else:
+            current = None
+        return longest, current
+
+    def edits_per_day(self, user, registration_timestamp):
+        """
+        :param user: the user name
+        :param registration_timestamp:
+            a :py:class`datetime.datetime` object representing the user's registration time
+            or ``None`` if the registration date is not available for some reason
+        :returns:
+            a ``float`` value of the average edits per day since registration until today,
+            or ``float('nan')`` if ``registration_timestamp`` is ``None``
+        """
+        if registration_timestamp is None:
+            return float('nan')
+        delta = self.today - registration_timestamp
+        return int(self._get(user, "editcount")) / (delta.days + 1)
+
+    def active_edits_per_day(self, user):
+        """
+        :param user: the user name
+        :returns:
+            a ``float`` value of the average edits per day between the first and last edit dates
+        """
+        return float(self._get(user, "active_edits_per_day"))
+
+    def active_days(self, user):
+        """
+        :param user: the user name
+        :returns: the number of distinct UTC days on which the user made an edit
+        """
+        return int(self._get(user, "activedays"))
+
+    def total_edit_count(self, user):
+        """
+        Return the count of all revisions made by the given user, see
+        :py:meth:`ws.statistics.UserStatsModules.UserStatsModules.total_edit_count`.
+        """
+        return int(self._get(user, "editcount"))
@@ -1,11 +1,52 @@
 #! /usr/bin/env python3
 
+import collections.abc
 import datetime
 import itertools
 import heapq
 
 __all__ = ["UserStatsModules"]
 
+class _IndexedRevisionsGroups(collections.abc.Mapping):
+    """
+    A mapping of user names to the lists of their revisions sorted by
+    timestamp, backed by the indexed queries of the ``"sqlite"`` storage
+    (see :py:class:`ws.cache.sqlite.SQLiteRecords`). Only the revisions of
+    the requested user are read from the database.
+    """
+    def __init__(self, collections_, today=None):
+        self.collections = collections_
+        if today is None:
+            self.condition = "user = ?"
+            self.params = ()
+        else:
+            from ws.cache.sqlite import format_timestamp
+            self.condition = "user = ? AND timestamp <= ?"
+            self.params = (format_timestamp(today), )
+
+    def __getitem__(self, user):
+        sortkey = lambda revision: (revision["timestamp"], revision["revid"], revision)
+        unwrap = lambda timestamp, revid, revision: revision
+        wrapped_input = [map(sortkey, c.select(self.condition, (user, ) + self.params, order_by="timestamp, key"))
+                         for c in self.collections]
+        revisions = list(itertools.starmap(unwrap, heapq.merge(*wrapped_input)))
+        if not revisions:
+            raise KeyError(user)
+        return revisions
+
+    def _users(self):
+        users = set()
+        for c in self.collections:
+            where = self.condition.replace("user = ?", "user IS NOT NULL")
+            users.update(user for user, count in c.group_by("user", where=where, params=self.params))
+        return sorted(users)
+
+    def __iter__(self):
+        return iter(self._users())
+
+    def __len__(self):
+        return len(self._users())
+
 class UserStatsModules:
     def __init__(self, db_allrevprops, round_to_midnight=False):
         """
@@ -23,6 +64,14 @@ class UserStatsModules:
             # round to midnight, keep the datetime.datetime type
             self.today = datetime.datetime(*(self.today.timetuple()[:3]))
 
+        # NOTE: access to database triggers an update
+        collections_ = [self.db["revisions"], self.db["deletedrevisions"]]
+        if all(hasattr(c, "select") for c in collections_):
+            # the storage has indexes on user and timestamp, no need to sort
+            # all revisions in memory
+            self.revisions_groups = _IndexedRevisionsGroups(collections_, self.today if self.round_to_midnight else None)
+            return
+
         rev_condition = lambda r: True
         if self.round_to_midnight is True:
             rev_condition = lambda r: r["timestamp"] <= self.today
@@ -38,14 +87,14 @@ class UserStatsModules:
         unwrap = lambda sortkey, revision: revision
         # first wrapping: to yield only revisions meeting the rev_condition
         # second wrapping: to specify sorting order for heapq.merge
-        wrapped_input = [map(sortkey, _inner_generator(self.db["revisions"])), map(sortkey, _inner_generator(self.db["deletedrevisions"]))]
+        wrapped_input = [map(sortkey, _inner_generator(c)) for c in collections_]
         # unwrap to get the final generator
         revisions_generator = itertools.starmap(unwrap, heapq.merge(*wrapped_input))
 
         # sort revisions by multiple keys: 1. user, 2. timestamp
         # this way we can group the list by users and iterate through user_revisions to
         # calculate just about everything
-        # NOTE: access to database triggers an update, sorted() creates a shallow copy
+        # NOTE: sorted() creates a shallow copy
         revisions = sorted(revisions_generator, key=lambda r: (r["user"], r["timestamp"]))
         revisions_grouper = itertools.groupby(revisions, key=lambda r: r["user"])
 
@@ -192,7 +241,7 @@ if __name__ == "__main__":
     ws.logging.init(args)
 
     api = API.from_argparser(args)
-    db = ws.cache.AllRevisionsProps(api, args.cache_dir)
+    db = ws.cache.AllRevisionsProps(api, args.cache_dir, max_age=args.cache_max_age)
 
     usm = UserStatsModules(db)
 
@@ -0,0 +1,158 @@
+#! /usr/bin/env python3
+
+"""
+Vectorized histograms of revisions by time periods.
+
+The revisions are binned by calendar days, weeks (starting on Monday) or
+months. For each bin, the number of edits and the number of distinct users
+are counted; the distinct users are counted by finding the unique
+``(bin, user)`` pairs, so the computation does not loop over the bins.
+Optionally, the revisions are split into categories (e.g. by namespace or user
+group) and the counts are computed for each category separately.
+
+The results can be passed directly to ``plot_date_bars`` in the
+``statistics_histograms.py`` script:
+
+.. code-block:: python
+
+    hist = histogram(revisions, period="month")
+    plot_date_bars(hist.edits, hist.bin_edges, ...)
+    plot_date_bars(hist.users, hist.bin_edges, ...)
+"""
+
+import collections
+import datetime
+
+import numpy as np
+
+__all__ = ["PERIODS", "Histogram", "bin_timestamps", "histogram", "histogram_arrays"]
+
+#: supported bin periods
+PERIODS = ("day", "week", "month")
+
+Histogram = collections.namedtuple("Histogram", ["bin_edges", "edits", "users", "categories"])
+Histogram.__doc__ = """
+The result of :py:func:`histogram`.
+
+- ``bin_edges``: an array of the :py:class:`datetime.date` edges of the bins,
+  its length is ``number of bins + 1``
+- ``edits``: an array of the edit counts in each bin
+- ``users``: an array of the counts of distinct users in each bin
+- ``categories``: ``None``, or the sorted array of the categories when the
+  histogram was split. ``edits`` and ``users`` are then two-dimensional arrays
+  with one row per category.
+"""
+
+def bin_timestamps(timestamps, period="month"):
+    """
+    Assign the timestamps into bins.
+
+    :param timestamps: an array of timestamps (``numpy.datetime64``)
+    :param str period: one of :py:data:`PERIODS`
+    :returns:
+        a tuple ``(bin_indexes, bin_edges)``, where ``bin_indexes`` is an
+        array of the 0-based bin indexes of the timestamps and ``bin_edges``
+        is an array of the edges of the bins (``numpy.datetime64[D]``)
+    """
+    days = np.asarray(timestamps).astype("datetime64[D]")
+    if period == "day":
+        numbers = days.astype(np.int64)
+        to_edge = lambda n: n.astype("datetime64[D]")
+    elif period == "week":
+        # 1970-01-01 was Thursday, the week numbers are shifted to start on Monday
+        numbers = (days.astype(np.int64) + 3) // 7
+        to_edge = lambda n: (n * 7 - 3).astype("datetime64[D]")
+    elif period == "month":
+        numbers = days.astype("datetime64[M]").astype(np.int64)
+        to_edge = lambda n: n.astype("datetime64[M]").astype("datetime64[D]")
+    else:
+        raise ValueError("unknown period: {}".format(period))
+
+    if len(numbers) == 0:
+        return numbers, np.empty(0, dtype="datetime64[D]")
+    first = numbers.min()
+    bin_edges = to_edge(np.arange(first, numbers.max() + 2))
+    return numbers - first, bin_edges
+
+def _count_distinct(bins, values, num_bins):
+    """
+    Count the distinct values in each bin.
+    """
+    if len(values) == 0:
+        return np.zeros(num_bins, dtype=np.int64)
+    _, codes = np.unique(values, return_inverse=True)
+    codes = codes.reshape(-1).astype(np.int64)
+    base = codes.max() + 1
+    pairs = np.unique(bins * base + codes)
+    return np.bincount(pairs // base, minlength=num_bins)
+
+def histogram_arrays(timestamps, users, period="month", categories=None):
+    """
+    Compute the histograms of edits and distinct users from arrays.
+
+    :param timestamps: an array of the timestamps of the revisions (``numpy.datetime64``)
+    :param users:
+        an array of the user names or user codes of the revisions. Hidden
+        users (``None`` names or negative codes) are counted only as edits.
+    :param str period: one of :py:data:`PERIODS`
+    :param categories:
+        an optional array of the categories of the revisions (e.g. namespace
+        numbers or user group names) to split the histograms by
+    :returns: a :py:class:`Histogram`
+    """
+    timestamps = np.asarray(timestamps)
+    users = np.asarray(users)
+    # skip revisions without a timestamp
+    valid = ~np.isnat(timestamps)
+    if not valid.all():
+        timestamps = timestamps[valid]
+        users = users[valid]
+        if categories is not None:
+            categories = np.asarray(categories)[valid]
+
+    bins, edges = bin_timestamps(timestamps, period)
+    num_bins = max(len(edges) - 1, 0)
+    bin_edges = edges.astype(datetime.date)
+    if users.dtype == object:
+        visible = np.not_equal(users, None)
+    else:
+        visible = users >= 0
+
+    if categories is None:
+        edits = np.bincount(bins, minlength=num_bins)
+        distinct = _count_distinct(bins[visible], users[visible], num_bins)
+        return Histogram(bin_edges, edits, distinct, None)
+
+    names, codes = np.unique(np.asarray(categories), return_inverse=True)
+    codes = codes.reshape(-1)
+    # the bins of the categories are concatenated
+    split_bins = codes * num_bins + bins
+    size = len(names) * num_bins
+    edits = np.bincount(split_bins, minlength=size).reshape(len(names), num_bins)
+    distinct = _count_distinct(split_bins[visible], users[visible], size).reshape(len(names), num_bins)
+    return Histogram(bin_edges, edits, distinct, names)
+
+def histogram(revisions, period="month", split_by=None):
+    """
+    Compute the histograms of edits and distinct users from a collection of
+    revisions, see :py:func:`histogram_arrays`.
+
+    :param revisions:
+        a list of revision dictionaries or a :py:class:`ws.cache.columnar.RevisionTable`
+    :param str period: one of :py:data:`PERIODS`
+    :param split_by:
+        an optional function taking a revision and returning its category
+        (e.g. ``lambda r: groups.get(r.get("user"), "user")``), or an array
+        of the categories of the revisions
+    :returns: a :py:class:`Histogram`
+    """
+    if hasattr(revisions, "column"):
+        # ws.cache.columnar.RevisionTable, the user codes are enough
+        timestamps = revisions.column("timestamp")
+        users = revisions.column("user")
+    else:
+        timestamps = np.array([r["timestamp"] for r in revisions], dtype="datetime64[s]")
+        users = np.array([r.get("user") for r in revisions], dtype=object)
+    if callable(split_by):
+        split_by = np.array([split_by(r) for r in revisions])
+    return histogram_arrays(timestamps, users, period, split_by)
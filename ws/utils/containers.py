@@ -54,6 +54,60 @@ def bisect_insert_or_replace(data_list, key, data_element=None, index_list=None)
     else:
         data_list.insert(i, data_element)
 
+def merge_sorted(data_list, elements, attr=None):
+    """
+    Merge elements into a sorted list in one linear pass. Elements whose key is
+    already present in the list replace the existing elements; if ``elements``
+    contain the same key multiple times, the last one is taken. This is the
+    bulk equivalent of calling :py:func:`bisect_insert_or_replace` for each
+    element, but it does not shift the tail of the list for each insertion.
+
+    When all new keys are greater than the last key in the list, the elements
+    are simply appended.
+
+    :param data_list: sorted list of elements to be merged into (modified in place)
+    :param elements: an iterable of elements to be merged, not necessarily sorted
+    :param attr: an optional attribute (dictionary key) of the elements used
+                 as the sort key, by default the elements themselves are compared
+    """
+    if attr is None:
+        get_key = lambda element: element
+    else:
+        get_key = lambda element: element[attr]
+
+    # the sort is stable, so the last of the duplicates stays last
+    elements = sorted(elements, key=get_key)
+    unique = []
+    for element in elements:
+        if unique and get_key(unique[-1]) == get_key(element):
+            unique[-1] = element
+        else:
+            unique.append(element)
+    if not unique:
+        return
+
+    # fast path for appending
+    if not data_list or get_key(data_list[-1]) < get_key(unique[0]):
+        data_list.extend(unique)
+        return
+
+    # the part of the list before the first new key is not touched
+    index_list = data_list if attr is None else ListOfDictsAttrWrapper(data_list, attr)
+    start = bisect.bisect_left(index_list, get_key(unique[0]))
+    merged = []
+    i = start
+    length = len(data_list)
+    for element in unique:
+        key = get_key(element)
+        while i < length and get_key(data_list[i]) < key:
+            merged.append(data_list[i])
+            i += 1
+        if i < length and get_key(data_list[i]) == key:
+            i += 1
+        merged.append(element)
+    merged.extend(data_list[i:])
+    data_list[start:] = merged
+
 def dmerge(source, destination):
     """
     Deep merging of dictionaries.
@@ -144,3 +198,157 @@ def serialize_timestamps_in_struct(struct):
     for keys, value in gen_nested_values(struct):
         if isinstance(value, datetime.datetime):
             set_ts(struct, keys, format_date(value))
+
+#: Keys holding timestamps in the responses of the API modules. Keys ending
+#: with ``timestamp`` or ``expiry`` (e.g. ``starttimestamp``, ``blockexpiry``)
+#: are recognized automatically and need not be listed. The parameters of log
+#: events (``mergepoint``, ``duration`` of blocks) appear in both
+#: ``list=logevents`` and ``list=recentchanges``. See
+#: :py:func:`api_timestamp_keys` for the selection of the keys for a query.
+API_TIMESTAMP_KEYS = {
+    "allrevisions": {"timestamp"},
+    "alldeletedrevisions": {"timestamp"},
+    "revisions": {"timestamp"},
+    "deletedrevisions": {"timestamp"},
+    "info": {"touched", "starttimestamp", "notificationtimestamp", "expiry"},
+    "logevents": {"timestamp", "expiry", "mergepoint", "duration"},
+    "recentchanges": {"timestamp", "expiry", "mergepoint", "duration"},
+    "usercontribs": {"timestamp"},
+    "users": {"registration", "blockedtimestamp", "blockexpiry", "expiry"},
+    "allusers": {"registration", "blockedtimestamp", "blockexpiry", "expiry"},
+    "userinfo": {"registration", "latestcontrib", "blockedtimestamp", "blockexpiry", "expiry"},
+    "blocks": {"timestamp", "expiry"},
+    "protectedtitles": {"timestamp", "expiry"},
+    "siteinfo": {"time"},
+    "edit": {"newtimestamp"},
+}
+
+def _make_timestamp_key_test(keys):
+    # memoized test for the key names, there are only a few distinct keys
+    cache = {}
+
+    def is_timestamp_key(key):
+        try:
+            return cache[key]
+        except KeyError:
+            result = cache[key] = (key in keys or
+                                   (isinstance(key, str) and key.endswith(("timestamp", "expiry"))))
+            return result
+
+    return is_timestamp_key
+
+_is_api_timestamp_key = _make_timestamp_key_test(set.union(*API_TIMESTAMP_KEYS.values()))
+_timestamp_key_tests = {}
+
+def api_timestamp_keys(params):
+    """
+    Select the keys holding timestamps in the response to an API query, based
+    on the ``action`` and the ``list``, ``prop``, ``meta`` and ``generator``
+    modules of the query.
+
+    :param dict params: parameters of the query
+    :returns:
+        a :py:class:`frozenset` of the keys from :py:data:`API_TIMESTAMP_KEYS`
+        for the queried modules, or ``None`` if some module is not listed in
+        :py:data:`API_TIMESTAMP_KEYS` (the union of all keys has to be
+        considered then)
+    """
+    modules = [params.get("action", "help")]
+    for name in ("list", "prop", "meta", "generator"):
+        value = params.get(name)
+        if not value:
+            continue
+        if isinstance(value, (list, tuple, set)):
+            modules.extend(str(v) for v in value)
+        else:
+            modules.extend(str(value).split("|"))
+    keys = set()
+    for module in modules:
+        if module == "query":
+            continue
+        if module not in API_TIMESTAMP_KEYS:
+            return None
+        keys |= API_TIMESTAMP_KEYS[module]
+    return frozenset(keys)
+
+def _parse_iso_timestamp(value):
+    if (len(value) == 20 and value[4] == "-" and value[7] == "-" and
+            value[10] == "T" and value[13] == ":" and value[16] == ":"
+            and value[19] == "Z"):
+        try:
+            return parse_date(value)
+        except ValueError:
+            pass
+    return value
+
+def _parse_timestamp_value(value):
+    if len(value) == 20:
+        return _parse_iso_timestamp(value)
+    # lengths of the special values below
+    if len(value) not in (8, 9, 10):
+        return value
+    lower = value.lower()
+    if lower == "infinity":
+        return datetime.datetime.max
+    elif lower == "-infinity":
+        return datetime.datetime.min
+    elif lower == "indefinite":
+        return None
+    return value
+
+def parse_api_timestamps(struct, keys=None):
+    """
+    Convert timestamps in an API response from str to datetime.datetime.
+
+    Unlike :py:func:`parse_timestamps_in_struct`, only the values of the keys
+    known to hold timestamps are converted (see :py:data:`API_TIMESTAMP_KEYS`
+    and :py:func:`api_timestamp_keys`) and the structure is traversed in a
+    single pass without building the paths to the values. Strings directly
+    inside lists are converted like by :py:func:`parse_timestamps_in_struct`,
+    i.e. if they have the ISO 8601 format used by the API (e.g.
+    ``"2014-08-25T14:26:59Z"``) or are one of the special values
+    ``"infinity"``, ``"-infinity"`` and ``"indefinite"``.
+
+    :param struct: a nested structure of dicts and lists, modified in place
+    :param keys:
+        a set of keys holding timestamps (e.g. ``api_timestamp_keys(params)``),
+        by default all keys from :py:data:`API_TIMESTAMP_KEYS` are considered
+    """
+    if keys is None:
+        is_timestamp_key = _is_api_timestamp_key
+    else:
+        keys = frozenset(keys)
+        is_timestamp_key = _timestamp_key_tests.get(keys)
+        if is_timestamp_key is None:
+            is_timestamp_key = _timestamp_key_tests[keys] = _make_timestamp_key_test(keys)
+
+    stack = [struct]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if isinstance(value, str):
+                    if is_timestamp_key(key):
+                        node[key] = _parse_timestamp_value(value)
+                elif isinstance(value, (dict, list)):
+                    stack.append(value)
+        else:
+            for i, value in enumerate(node):
+                if isinstance(value, str):
+                    node[i] = _parse_timestamp_value(value)
+                elif isinstance(value, (dict, list)):
+                    stack.append(value)
+
+def serialize_api_params(params):
+    """
+    Create a shallow copy of a dictionary of API parameters with
+    datetime.datetime values (also inside lists and tuples) converted to str.
+    """
+    result = {}
+    for key, value in params.items():
+        if isinstance(value, datetime.datetime):
+            value = format_date(value)
+        elif isinstance(value, (list, tuple)) and any(isinstance(v, datetime.datetime) for v in value):
+            value = type(value)(format_date(v) if isinstance(v, datetime.datetime) else v for v in value)
+        result[key] = value
+    return result
@@ -32,3 +32,68 @@ def datetime_parser(dct):
             elif v.startswith("datetime.timedelta("):
                 dct[k] = datetime.timedelta(*args)
     return dct
+
+try:
+    import ijson
+    _has_ijson = True
+    #: exception raised by :py:func:`iter_json_items` for malformed documents
+    JSONStreamError = ijson.JSONError
+except ImportError:
+    _has_ijson = False
+    JSONStreamError = ValueError
+
+def iter_json_items(stream, path):
+    """
+    Incrementally decode a JSON document and yield the items of the array (or
+    the values of the object) located at ``path``. Only one item is kept in
+    memory at a time. Requires the optional :py:mod:`ijson` library.
+
+    :param stream: a file-like object providing the JSON document
+    :param str path:
+        dot-separated path to the container whose items should be yielded,
+        e.g. ``"query.allrevisions"``
+    :yields: the decoded items
+    :returns:
+        the rest of the document, with the container at ``path`` left empty
+        (use ``rest = yield from iter_json_items(...)`` to obtain it)
+    """
+    if not _has_ijson:
+        raise ImportError("the ijson module is required for incremental JSON decoding")
+
+    rest = ijson.common.ObjectBuilder()
+    builder = None
+    depth = 0
+    in_container = False
+
+    for prefix, event, value in ijson.parse(stream, use_float=True):
+        if builder is not None:
+            # inside an item
+            builder.event(event, value)
+            if event in ("start_map", "start_array"):
+                depth += 1
+            elif event in ("end_map", "end_array"):
+                depth -= 1
+            if depth == 0:
+                yield builder.value
+                builder = None
+        elif in_container:
+            if prefix == path and event in ("end_map", "end_array"):
+                in_container = False
+                rest.event(event, value)
+            elif prefix == path and event == "map_key":
+                # key of an item of an object, the item starts with the next event
+                pass
+            else:
+                builder = ijson.common.ObjectBuilder()
+                builder.event(event, value)
+                if event in ("start_map", "start_array"):
+                    depth = 1
+                else:
+                    yield builder.value
+                    builder = None
+        else:
+            rest.event(event, value)
+            if prefix == path and event in ("start_map", "start_array"):
+                in_container = True
+
+    return rest.value
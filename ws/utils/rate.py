@@ -1,15 +1,31 @@
 #! /usr/bin/env python3
 
 """
-:py:func:`RateLimited` is a rate limiting algorithm implemented as Python decorator.
+Rate limiting based on the `token bucket`_ algorithm.
 
-The original algorithm comes from this `StackOverflow answer`_ and has been modified
-to apply longer timeout when the rate limit is exceeded.
+The :py:class:`TokenBucket` class holds the budget for one kind of operation.
+Tokens are refilled continuously at a constant rate up to the bucket capacity,
+which allows short bursts. When the bucket is empty, each caller waits only
+until the next token becomes available (the requests are smoothed instead of
+sleeping for a whole period once the burst is exceeded). Callers reserve the
+tokens under a lock and sleep outside of it, so a bucket can be shared by
+multiple threads as well as :py:mod:`asyncio` tasks.
 
-.. _`StackOverflow answer`: http://stackoverflow.com/a/6415181
+The :py:class:`RateLimiter` class manages a set of buckets keyed by the host
+name and an *action class* (``"read"``, ``"edit"``, ``"create"``, ``"move"``).
+All :py:class:`ws.client.connection.Connection` instances share the
+:py:data:`default_rate_limiter` unless a different limiter is passed to them,
+so multiple connections to the same host share the same budget:
 
+.. code-block:: python
+
+    limiter = RateLimiter()
+    # allow at most 10 calls in 2 seconds to wiki.example.org
+    limiter.set_limit("read", 10, 2, host="wiki.example.org")
+    limiter.acquire("wiki.example.org", "read")
 
-Usage as Python decorator:
+The :py:func:`RateLimited` decorator is a simple wrapper around a
+:py:class:`TokenBucket` for functions not related to a particular host:
 
 .. code-block:: python
 
@@ -18,15 +34,12 @@ Usage as Python decorator:
     def PrintNumber(num):
         print(num)
 
-Or at runtime by wrapping the function call:
-
-.. code-block:: python
-
-    # allow at most 10 calls in 2 seconds
-    wrapped = RateLimited(10, 2)(PrintNumber)
+.. _`token bucket`: https://en.wikipedia.org/wiki/Token_bucket
 """
 
 from functools import wraps
+import asyncio
+import threading
 import time
 import logging
 
@@ -34,14 +47,359 @@ import ws
 
 logger = logging.getLogger(__name__)
 
-__all__ = ["RateLimited"]
+__all__ = ["TokenBucket", "RateLimiter", "default_rate_limiter", "AdaptiveThrottle", "RateLimited"]
+
+class TokenBucket:
+    """
+    A thread-safe token bucket.
+
+    :param float rate: number of tokens refilled per ``per`` seconds
+    :param float per: length of the period in seconds
+    :param float burst:
+        capacity of the bucket, i.e. the maximum number of calls allowed in a
+        burst (``rate`` by default)
+    """
+
+    def __init__(self, rate, per, burst=None):
+        if rate <= 0 or per <= 0:
+            raise ValueError("rate and per must be positive numbers")
+        self.rate = rate
+        #: the configured rate, which is not changed by :py:meth:`set_rate`
+        self.base_rate = rate
+        self.per = per
+        self.capacity = rate if burst is None else burst
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._throttled_time = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def fill_rate(self):
+        """
+        Number of tokens refilled per second.
+        """
+        return self.rate / self.per
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.fill_rate)
+        self._last = now
+
+    def set_rate(self, rate):
+        """
+        Change the refill rate of the bucket. The tokens refilled so far are
+        accounted with the old rate. The capacity is not changed.
+
+        :param float rate: new number of tokens refilled per ``per`` seconds
+        """
+        if rate <= 0:
+            raise ValueError("rate must be a positive number")
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+
+    def reserve(self, tokens=1):
+        """
+        Take ``tokens`` from the bucket and compute how long the caller has to
+        wait before it may proceed. The tokens are taken even when the bucket
+        is empty, so that concurrent callers are served in order.
+
+        :returns: the delay in seconds (``0`` if the caller may proceed immediately)
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0
+            delay = -self._tokens / self.fill_rate
+            self._throttled_time += delay
+            return delay
+
+    def acquire(self, tokens=1):
+        """
+        Take ``tokens`` from the bucket, sleeping in the current thread if
+        necessary.
+
+        :returns: the time spent sleeping in seconds
+        """
+        delay = self.reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    async def acquire_async(self, tokens=1):
+        """
+        Like :py:meth:`acquire`, but sleeps with :py:func:`asyncio.sleep`.
+
+        :returns: the time spent sleeping in seconds
+        """
+        delay = self.reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+    @property
+    def budget(self):
+        """
+        Number of tokens currently available. A negative value means that
+        there are callers waiting for the tokens.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+    @property
+    def throttled_time(self):
+        """
+        Total time in seconds that the callers were delayed by this bucket.
+        """
+        return self._throttled_time
+
+class RateLimiter:
+    """
+    A collection of :py:class:`TokenBucket` objects keyed by the host name and
+    the action class. The buckets are created on demand from the limits
+    configured with :py:meth:`set_limit` (host-specific limits take precedence
+    over the global ones).
+
+    :param dict limits:
+        a mapping of action classes to ``(rate, per)`` tuples, defaults to
+        :py:attr:`default_limits`
+    """
+
+    #: default ``(rate, per)`` limits for each action class
+    default_limits = {
+        "read": (10, 3),
+        "edit": (1, 3),
+        "create": (1, 10),
+        "move": (1, 10),
+    }
+
+    def __init__(self, limits=None):
+        self._limits = dict(self.default_limits if limits is None else limits)
+        self._host_limits = {}
+        self._buckets = {}
+        self._throttles = {}
+        self._lock = threading.Lock()
+
+    def set_limit(self, action_class, rate, per, host=None):
+        """
+        Set the limit for an action class, either globally or for a specific
+        host. Existing buckets affected by the change are reset.
+
+        :param str action_class: the action class
+        :param float rate: number of calls allowed per ``per`` seconds
+        :param float per: length of the period in seconds
+        :param str host: the host name (``None`` for the global limit)
+        """
+        with self._lock:
+            if host is None:
+                self._limits[action_class] = (rate, per)
+                for key in list(self._buckets):
+                    if key[1] == action_class and key not in self._host_limits:
+                        del self._buckets[key]
+                        self._throttles.pop(key, None)
+            else:
+                self._host_limits[host, action_class] = (rate, per)
+                self._buckets.pop((host, action_class), None)
+                self._throttles.pop((host, action_class), None)
+
+    def get_bucket(self, host, action_class):
+        """
+        :returns: the :py:class:`TokenBucket` for given host and action class
+        """
+        key = (host, action_class)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                try:
+                    rate, per = self._host_limits.get(key) or self._limits[action_class]
+                except KeyError:
+                    raise ValueError("unknown action class: {}".format(action_class))
+                bucket = self._buckets[key] = TokenBucket(rate, per)
+            return bucket
+
+    def get_throttle(self, host, action_class, **kwargs):
+        """
+        :returns:
+            the :py:class:`AdaptiveThrottle` adjusting the bucket for given
+            host and action class, which is shared by all callers of this
+            method
+        :param kwargs:
+            passed to :py:class:`AdaptiveThrottle` when the throttle is created
+        """
+        bucket = self.get_bucket(host, action_class)
+        key = (host, action_class)
+        with self._lock:
+            throttle = self._throttles.get(key)
+            if throttle is None or throttle.bucket is not bucket:
+                throttle = self._throttles[key] = AdaptiveThrottle(bucket, **kwargs)
+            return throttle
+
+    def acquire(self, host, action_class):
+        """
+        Wait until a call of given action class to the host is allowed.
+
+        :returns: the time spent sleeping in seconds
+        """
+        # no rate-limiting inside tests
+        if hasattr(ws, "_tests_are_running"):
+            return 0
+        delay = self.get_bucket(host, action_class).acquire()
+        if delay > 0:
+            logger.debug("rate limit for '{}' requests to {} exceeded, slept for {:0.3f} seconds"
+                         .format(action_class, host, delay))
+        return delay
+
+    async def acquire_async(self, host, action_class):
+        """
+        Like :py:meth:`acquire`, but sleeps with :py:func:`asyncio.sleep`.
+        """
+        # no rate-limiting inside tests
+        if hasattr(ws, "_tests_are_running"):
+            return 0
+        return await self.get_bucket(host, action_class).acquire_async()
+
+    def budget(self, host, action_class):
+        """
+        :returns: number of calls of given action class to the host that can
+                  be made right now without waiting
+        """
+        return self.get_bucket(host, action_class).budget
+
+    def throttled_time(self, host=None, action_class=None):
+        """
+        Total time in seconds spent waiting for the rate limits, optionally
+        filtered by the host and/or action class.
+        """
+        with self._lock:
+            buckets = list(self._buckets.items())
+        return sum(bucket.throttled_time for (h, a), bucket in buckets
+                   if (host is None or h == host) and (action_class is None or a == action_class))
+
+#: the rate limiter shared by all :py:class:`ws.client.connection.Connection` instances by default
+default_rate_limiter = RateLimiter()
+
+class AdaptiveThrottle:
+    """
+    Adjusts the rate of a :py:class:`TokenBucket` and the number of concurrent
+    calls based on the observed latency and overload signals, using the
+    *additive increase, multiplicative decrease* scheme.
+
+    Each successful call with an average latency below ``target_latency``
+    increases the rate by a small step and every ``concurrency_step_calls``
+    such calls increase the concurrency limit by one. Slow calls decrease the
+    rate and the concurrency slightly, overload signals (e.g. maxlag errors or
+    HTTP 503 responses) cut them in half.
+
+    The bounds are computed from the configured rate of the bucket
+    (``bucket.base_rate``). By default the rate is never raised above it, so
+    the throttle only backs off and recovers; raising it has to be enabled
+    with ``allow_increase``. Only one throttle should be created for each
+    bucket, see :py:meth:`RateLimiter.get_throttle`.
+
+    :param TokenBucket bucket: the bucket whose rate is adjusted
+    :param float target_latency:
+        average latency in seconds above which the rate is decreased
+    :param float min_rate: lower bound for the bucket rate (``bucket.base_rate / 10`` by default)
+    :param float max_rate:
+        upper bound for the bucket rate (``bucket.base_rate * 5`` by default if
+        ``allow_increase`` is ``True``, otherwise ``bucket.base_rate``)
+    :param bool allow_increase: whether the rate may be raised above the configured rate
+    :param int concurrency: initial limit of concurrent calls
+    :param int max_concurrency: upper bound for the number of concurrent calls
+    """
+
+    #: number of fast calls after which the concurrency limit is increased
+    concurrency_step_calls = 20
+    #: weight of the last observation in the exponential moving average of the latency
+    latency_weight = 0.2
+
+    def __init__(self, bucket, target_latency=2.0, min_rate=None, max_rate=None, allow_increase=False,
+                 concurrency=4, max_concurrency=8):
+        self.bucket = bucket
+        self.target_latency = target_latency
+        self.min_rate = bucket.base_rate / 10 if min_rate is None else min_rate
+        if max_rate is None:
+            max_rate = bucket.base_rate * 5 if allow_increase is True else bucket.base_rate
+        self.max_rate = max_rate
+        self.max_concurrency = max_concurrency
+
+        #: current limit of concurrent calls
+        self.concurrency = max(1, min(max_concurrency, concurrency))
+        #: exponential moving average of the latency
+        self.latency = None
+
+        self._in_flight = 0
+        self._fast_calls = 0
+        # the lock is reentrant, it protects also the state updated in
+        # on_success and on_overload
+        self._cond = threading.Condition(threading.RLock())
+
+    def __enter__(self):
+        with self._cond:
+            while self._in_flight >= self.concurrency:
+                self._cond.wait()
+            self._in_flight += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    def _set_concurrency(self, value):
+        with self._cond:
+            self.concurrency = max(1, min(self.max_concurrency, value))
+            self._cond.notify_all()
+
+    def _set_rate(self, rate):
+        rate = max(self.min_rate, min(self.max_rate, rate))
+        if rate != self.bucket.rate:
+            self.bucket.set_rate(rate)
+
+    def on_success(self, latency):
+        """
+        Record a successful call.
+
+        :param float latency: duration of the call in seconds
+        """
+        with self._cond:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += self.latency_weight * (latency - self.latency)
+
+            if self.latency <= self.target_latency:
+                self._set_rate(self.bucket.rate + self.min_rate)
+                self._fast_calls += 1
+                if self._fast_calls >= self.concurrency_step_calls:
+                    self._fast_calls = 0
+                    self._set_concurrency(self.concurrency + 1)
+            else:
+                self._fast_calls = 0
+                self._set_rate(self.bucket.rate * 0.9)
+                if self.concurrency > 1:
+                    self._set_concurrency(self.concurrency - 1)
+
+    def on_overload(self):
+        """
+        Record an overload signal from the server.
+        """
+        with self._cond:
+            self._fast_calls = 0
+            self._set_rate(self.bucket.rate / 2)
+            self._set_concurrency(self.concurrency // 2)
+        logger.debug("server overloaded, rate decreased to {:0.2f} calls per {} seconds, concurrency to {}"
+                     .format(self.bucket.rate, self.bucket.per, self.concurrency))
 
 def RateLimited(rate, per):
+    """
+    Decorator limiting the rate of calls of the wrapped function to ``rate``
+    calls per ``per`` seconds. The budget is shared by all calls of the
+    function, including calls from other threads.
+    """
     def decorator(func):
-        # globals for the decorator
-        # defined as lists to avoid problems with the 'global' keyword
-        allowance = [rate]
-        last_check = [time.time()]
+        bucket = TokenBucket(rate, per)
 
         @wraps(func)
         def rate_limit_func(*args, **kargs):
@@ -49,25 +407,12 @@ def RateLimited(rate, per):
             if hasattr(ws, "_tests_are_running"):
                 return func(*args, **kargs)
 
-            current = time.time()
-            time_passed = current - last_check[0]
-            last_check[0] = current
-            allowance[0] += time_passed * (rate / per)
-            if allowance[0] > rate:
-                allowance[0] = rate    # throttle
-            if allowance[0] < 1.0:
-                # the original used    to_sleep = (1 - allowance[0]) * (per / rate)
-                # but we want longer timeout after burst limit is exceeded
-                to_sleep = (1 - allowance[0]) * per
-                logger.info("rate limit for function {} exceeded, sleeping for {:0.3f} seconds".format(func.__qualname__, to_sleep))
-                time.sleep(to_sleep)
-                ret = func(*args, **kargs)
-                allowance[0] = rate
-            else:
-                ret = func(*args, **kargs)
-                allowance[0] -= 1.0
-            return ret
+            delay = bucket.acquire()
+            if delay > 0:
+                logger.debug("rate limit for function {} exceeded, slept for {:0.3f} seconds".format(func.__qualname__, delay))
+            return func(*args, **kargs)
 
+        rate_limit_func.bucket = bucket
         return rate_limit_func
 
     return decorator